@@ -34,6 +34,10 @@ async def lifespan(app: FastAPI):
     logger.info("应用启动中...")
     
     try:
+        # Postgres查询耗时埋点（需在数据库初始化前安装，覆盖启动期查询）
+        from app.core.instrumentation import instrument_postgres
+        instrument_postgres()
+        
         # 初始化数据库和数据
         logger.info("初始化数据库...")
         await init_data()
@@ -76,6 +80,14 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning(f"⚠️ 权限系统性能优化失败: {e}")
         
+        # 未读通知计数跨 worker 同步 (可选，依赖Redis)
+        try:
+            from app.services.notification_counter import unread_counter
+            if await unread_counter.start_sync():
+                logger.info("✅ 未读通知计数跨worker同步已启动")
+        except Exception as e:
+            logger.warning(f"⚠️ 未读通知计数同步启动失败: {e}")
+        
         # 初始化工作流调度器 (可选)
         logger.info("检查工作流调度器配置...")
         try:
@@ -104,6 +116,11 @@ async def lifespan(app: FastAPI):
                             tags=["AI监测 v2"]
                         )
                     logger.info("✅ AI模块初始化完成")
+                    
+                    # 预加载已部署模型到推理注册表
+                    from app.services.ai.model_registry import model_registry
+                    warmed = await model_registry.warm_up()
+                    logger.info(f"✅ 已预加载 {warmed} 个已部署模型")
                 else:
                     logger.warning("⚠️ AI模块初始化失败，核心功能不受影响")
             else:
@@ -135,6 +152,12 @@ async def lifespan(app: FastAPI):
         try:
             from app.ai_module.loader import ai_loader
             ai_loader.unload_module()
+            
+            from app.services.ai.model_registry import model_registry
+            await model_registry.shutdown()
+
+            from app.core.cpu_executor import cpu_executor
+            await cpu_executor.shutdown()
         except Exception as e:
             logger.warning(f"⚠️ AI模块卸载失败: {e}")
         
@@ -143,7 +166,21 @@ async def lifespan(app: FastAPI):
         from app.services.external_api import shutdown_external_api_service
         await shutdown_external_api_service()
         logger.info("✅ 外部API服务已关闭")
-        
+
+        # 停止未读通知计数同步
+        try:
+            from app.services.notification_counter import unread_counter
+            await unread_counter.stop_sync()
+        except Exception as e:
+            logger.warning(f"⚠️ 未读通知计数同步停止失败: {e}")
+
+        # 关闭共享的TDengine连接器
+        try:
+            from app.services.tdengine_table_resolver import tdengine_table_resolver
+            await tdengine_table_resolver.close()
+        except Exception as e:
+            logger.warning(f"⚠️ TDengine连接器关闭失败: {e}")
+
         # 关闭Tortoise ORM连接
         logger.info("关闭数据库连接...")
         await Tortoise.close_connections()
@@ -327,6 +364,11 @@ token: <your-token>""",
         ],
     )
     
+    # 路由耗时直方图（最后添加，位于最外层，覆盖全部中间件耗时）
+    if settings.METRICS_ENABLED:
+        from app.core.middlewares import RouteMetricsMiddleware
+        app.add_middleware(RouteMetricsMiddleware)
+    
     register_exceptions(app)
     register_routers(app, prefix="/api")
 
@@ -194,6 +194,9 @@ async def update_device_type(
             if update_data:
                 await device_type.update_from_dict(update_data)
                 await device_type.save()
+            if "tdengine_stable_name" in update_data:
+                from app.services.tdengine_table_resolver import tdengine_table_resolver
+                await tdengine_table_resolver.invalidate()
             
             return success(msg="设备类型更新成功")
     
@@ -12,9 +12,11 @@ from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel, Field
 import logging
 
+from app.core.cpu_executor import run_cpu
 from app.core.response_formatter_v2 import create_formatter
 from app.core.dependency import DependAuth
 from app.services.ai.anomaly_detection import AnomalyDetector
+from app.services.ai.streaming_anomaly import streaming_anomaly_detector
 from app.models.ai_monitoring import AIAnomalyRecord
 from app.core.exceptions import APIException
 from app.schemas.base import APIResponse
@@ -150,8 +152,8 @@ async def detect_anomalies(
         # 创建异常检测器
         detector = AnomalyDetector(threshold=request.threshold)
         
-        # 执行检测
-        result = detector.detect(request.data, method=request.method)
+        # 执行检测（进程池中计算，不阻塞事件循环）
+        result = await run_cpu(detector.detect, request.data, method=request.method)
         
         # 构建响应
         anomalies = []
@@ -267,7 +269,7 @@ async def batch_detect_anomalies(
                     continue
                 
                 # 检测异常
-                result = detector.detect(data, method=request.method)
+                result = await run_cpu(detector.detect, data, method=request.method)
                 
                 results[device_id] = {
                     "is_anomaly": result["is_anomaly"],
@@ -308,6 +310,36 @@ async def batch_detect_anomalies(
         )
 
 
+@router.get(
+    "/streaming/recent",
+    summary="流式检测最近异常",
+    description="查询设备数据流上在线检测到的最近异常及检测器状态",
+    dependencies=[DependAuth]
+)
+async def get_streaming_anomalies(
+    device_code: Optional[str] = Query(None, description="设备编码"),
+    limit: int = Query(100, ge=1, le=1000, description="返回条数"),
+    current_user=DependAuth
+):
+    """
+    获取流式异常检测结果
+    
+    每帧设备数据到达时按 (设备, 指标) 增量更新统计并评分，此接口只读取内存中的最近异常，不触发计算。
+    """
+    recent = [
+        item for item in reversed(streaming_anomaly_detector.recent)
+        if device_code is None or item["device_code"] == device_code
+    ][:limit]
+    return formatter.success(
+        data={
+            "anomalies": recent,
+            "count": len(recent),
+            "detector": streaming_anomaly_detector.stats()
+        },
+        message="获取流式异常成功"
+    )
+
+
 @router.get(
     "/records",
     summary="获取异常记录",
@@ -11,9 +11,10 @@ from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel, Field
 import logging
 
+from app.core.cpu_executor import run_cpu
 from app.core.response_formatter_v2 import create_formatter
 from app.core.dependency import DependAuth
-from app.services.ai.feature_extraction import FeatureExtractor
+from app.services.ai.feature_extraction import FeatureExtractor, features_to_records, to_matrix
 from app.core.exceptions import APIException
 from app.schemas.base import APIResponse
 
@@ -116,19 +117,19 @@ async def extract_features(
         # 创建特征提取器
         extractor = FeatureExtractor()
         
-        # 提取特征
+        # 提取特征（进程池中计算，不阻塞事件循环）
         features = {}
         
         if "statistical" in request.feature_types:
-            stat_features = extractor.statistical.extract(request.data)
+            stat_features = await run_cpu(extractor.statistical_extractor.extract, request.data)
             features["statistical"] = stat_features
         
         if "time_series" in request.feature_types:
-            ts_features = extractor.time_series.extract(request.data)
+            ts_features = await run_cpu(extractor.timeseries_extractor.extract, request.data)
             features["time_series"] = ts_features
         
         if "frequency" in request.feature_types:
-            freq_features = extractor.frequency.extract(request.data)
+            freq_features = await run_cpu(extractor.frequency_extractor.extract, request.data)
             features["frequency"] = freq_features
         
         # 统计特征数量
@@ -206,38 +207,29 @@ async def batch_extract_features(
         # 创建特征提取器
         extractor = FeatureExtractor()
         
-        # 批量提取
-        results = {}
-        failed_devices = []
-        success_count = 0
+        # 数据点不足的设备跳过，其余设备组装为二维数组一次向量化提取
+        failed_devices = [device_id for device_id, data in request.dataset.items() if len(data) < 2]
+        for device_id in failed_devices:
+            logger.warning(f"设备 {device_id} 数据点数不足，跳过")
+        device_ids = [device_id for device_id, data in request.dataset.items() if len(data) >= 2]
         
-        for device_id, data in request.dataset.items():
-            try:
-                # 验证数据
-                if len(data) < 2:
-                    logger.warning(f"设备 {device_id} 数据点数不足，跳过")
-                    failed_devices.append(device_id)
+        results: Dict[str, Dict[str, Any]] = {device_id: {} for device_id in device_ids}
+        if device_ids:
+            engine = extractor.batch_engine
+            matrix = to_matrix([request.dataset[device_id] for device_id in device_ids])
+            groups = {
+                "statistical": engine.statistical,
+                "time_series": engine.timeseries,
+                "frequency": engine.frequency,
+            }
+            for feature_type, compute in groups.items():
+                if feature_type not in request.feature_types:
                     continue
-                
-                # 提取特征
-                device_features = {}
-                
-                if "statistical" in request.feature_types:
-                    device_features["statistical"] = extractor.statistical.extract(data)
-                
-                if "time_series" in request.feature_types:
-                    device_features["time_series"] = extractor.time_series.extract(data)
-                
-                if "frequency" in request.feature_types:
-                    device_features["frequency"] = extractor.frequency.extract(data)
-                
-                results[device_id] = device_features
-                success_count += 1
-                
-            except Exception as e:
-                logger.error(f"设备 {device_id} 特征提取失败: {str(e)}")
-                failed_devices.append(device_id)
-                continue
+                # 大矩阵经共享内存传给计算进程
+                columns = await run_cpu(compute, matrix)
+                for device_id, features in zip(device_ids, features_to_records(columns)):
+                    results[device_id][feature_type] = features
+        success_count = len(device_ids)
         
         result = BatchFeatureExtractionResponse(
             results=results,
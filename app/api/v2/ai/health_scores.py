@@ -20,10 +20,23 @@ from app.schemas.ai_monitoring import (
 from app.schemas.base import APIResponse, PaginatedResponse
 from app.core.response_formatter_v2 import create_formatter
 from app.core.pagination import get_pagination_params, create_pagination_response
+from app.core.streaming_export import (
+    STREAM_FORMATS,
+    arrow_schema_for_model,
+    keyset_model_batches,
+    streaming_export_response,
+)
 from app.log import logger
 
 
 router = APIRouter(prefix="/health-scores/records", tags=["AI健康-记录管理"])
+response_formatter_v2 = create_formatter()
+
+# 流式导出的字段（与JSON报告一致）
+HEALTH_SCORE_EXPORT_FIELDS = [
+    "id", "score_name", "target_type", "target_id", "overall_score",
+    "dimension_scores", "risk_level", "trend_direction", "calculated_at",
+]
 
 
 @router.get("", response_model=APIResponse[PaginatedResponse[HealthScoreResponse]])
@@ -129,7 +142,7 @@ async def get_health_scores(
         )
 
 
-@router.get("/{score_id}", response_model=APIResponse[HealthScoreResponse])
+@router.get("/{score_id:int}", response_model=APIResponse[HealthScoreResponse])
 async def get_health_score(score_id: int):
     """获取健康评分详情"""
     try:
@@ -246,7 +259,7 @@ async def create_health_score(
         )
 
 
-@router.put("/{score_id}", response_model=APIResponse[HealthScoreResponse])
+@router.put("/{score_id:int}", response_model=APIResponse[HealthScoreResponse])
 async def update_health_score(
     score_id: int,
     score_data: HealthScoreUpdate,
@@ -312,7 +325,7 @@ async def update_health_score(
         )
 
 
-@router.delete("/{score_id}", response_model=APIResponse[dict])
+@router.delete("/{score_id:int}", response_model=APIResponse[dict])
 async def delete_health_score(score_id: int):
     """删除健康评分"""
     try:
@@ -351,9 +364,14 @@ async def export_health_report(
     target_id: Optional[int] = Query(None, description="评分对象ID"),
     date_from: Optional[datetime] = Query(None, description="开始日期"),
     date_to: Optional[datetime] = Query(None, description="结束日期"),
-    format: str = Query("excel", description="导出格式: excel, pdf, json")
+    format: str = Query("excel", description="导出格式: excel, pdf, json；流式导出: csv, ndjson, parquet, arrow"),
+    gzip: bool = Query(True, description="流式导出时是否gzip压缩（parquet自带压缩，忽略此项）")
 ):
-    """导出健康报告"""
+    """导出健康报告
+
+    csv/ndjson/parquet/arrow 格式按 (计算时间, ID) 键集分页逐批读取并流式编码输出，
+    内存占用与导出总量无关。
+    """
     try:
         # 构建查询条件
         filters = {"status": HealthScoreStatus.COMPLETED}
@@ -370,6 +388,19 @@ async def export_health_report(
         if date_to:
             filters["calculated_at__lte"] = date_to
         
+        if format in STREAM_FORMATS or format == "jsonl":
+            queryset = AIHealthScore.filter(**filters)
+            if not await queryset.exists():
+                raise HTTPException(status_code=400, detail="没有符合条件的健康评分数据")
+            return streaming_export_response(
+                keyset_model_batches(queryset, HEALTH_SCORE_EXPORT_FIELDS, "calculated_at"),
+                fmt=format,
+                filename=f"health_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                columns=HEALTH_SCORE_EXPORT_FIELDS,
+                gzip=gzip,
+                arrow_schema=arrow_schema_for_model(AIHealthScore, HEALTH_SCORE_EXPORT_FIELDS)
+            )
+        
         # 查询健康评分数据
         scores = await AIHealthScore.filter(**filters).order_by("-calculated_at")
         
@@ -430,56 +461,60 @@ async def get_health_score_trends(
 ):
     """获取健康评分趋势"""
     try:
-        # 解析目标ID列表
-        if target_ids:
-            target_id_list = [int(id.strip()) for id in target_ids.split(",")]
-        else:
-            # 获取该类型的所有对象
-            target_id_list = await get_target_ids_by_type(target_type)
+        # 解析目标ID列表，未指定时返回该类型全部有评分的对象
+        target_id_list = [int(id.strip()) for id in target_ids.split(",")] if target_ids else None
         
         # 计算时间范围
         end_date = datetime.now()
         start_date = end_date - timedelta(days=period_days)
         
-        trends_responses = []
+        # 一次查询读取全部对象的预计算评分序列（由设备群健康评分任务写入）
+        queryset = AIHealthScore.filter(
+            target_type=target_type,
+            status=HealthScoreStatus.COMPLETED,
+            calculated_at__gte=start_date,
+            calculated_at__lte=end_date
+        )
+        if target_id_list is not None:
+            queryset = queryset.filter(target_id__in=target_id_list)
+        rows = await queryset.order_by("target_id", "calculated_at").values(
+            "target_id", "calculated_at", "overall_score", "risk_level", "dimension_scores"
+        )
         
-        for target_id in target_id_list:
-            # 查询该对象的健康评分历史
-            scores = await AIHealthScore.filter(
+        series: Dict[int, List[dict]] = {}
+        for row in rows:
+            series.setdefault(row["target_id"], []).append(row)
+        
+        trends_responses = []
+        for target_id in (target_id_list if target_id_list is not None else series):
+            scores = series.get(target_id)
+            if not scores:
+                continue
+            
+            trend_data = [
+                {
+                    "date": score["calculated_at"].isoformat(),
+                    "overall_score": score["overall_score"],
+                    "risk_level": score["risk_level"],
+                    "dimension_scores": score["dimension_scores"]
+                }
+                for score in scores
+            ]
+            
+            # 趋势按请求的 period_days 周期内的评分序列计算（预计算的 trend_direction 对应评分任务的固定回看窗口）
+            trend_direction, trend_confidence = calculate_trend_direction(
+                [score["overall_score"] for score in scores if score["overall_score"] is not None]
+            )
+            
+            trends_responses.append(HealthScoreTrendsResponse(
                 target_type=target_type,
                 target_id=target_id,
-                status=HealthScoreStatus.COMPLETED,
-                calculated_at__gte=start_date,
-                calculated_at__lte=end_date
-            ).order_by("calculated_at")
-            
-            if scores:
-                # 构建趋势数据
-                trend_data = []
-                for score in scores:
-                    trend_data.append({
-                        "date": score.calculated_at.isoformat(),
-                        "overall_score": score.overall_score,
-                        "risk_level": score.risk_level,
-                        "dimension_scores": score.dimension_scores
-                    })
-                
-                # 计算趋势方向和置信度
-                trend_direction, trend_confidence = calculate_trend_direction(
-                    [score.overall_score for score in scores]
-                )
-                
-                trends_response = HealthScoreTrendsResponse(
-                    target_type=target_type,
-                    target_id=target_id,
-                    trend_data=trend_data,
-                    trend_direction=trend_direction,
-                    trend_confidence=trend_confidence,
-                    period_start=start_date,
-                    period_end=end_date
-                )
-                
-                trends_responses.append(trends_response)
+                trend_data=trend_data,
+                trend_direction=trend_direction,
+                trend_confidence=trend_confidence,
+                period_start=start_date,
+                period_end=end_date
+            ))
         
         return response_formatter_v2.success(
             data=trends_responses,
@@ -494,6 +529,28 @@ async def get_health_score_trends(
         )
 
 
+@router.post("/fleet-run", response_model=APIResponse[dict])
+async def run_fleet_health_scoring(
+    window_hours: Optional[float] = Query(None, description="数据窗口小时数，默认使用配置", gt=0, le=24 * 30)
+):
+    """立即执行一次设备群健康评分（与定时任务相同）"""
+    try:
+        from app.services.ai.fleet_health_scoring import fleet_health_scoring_service
+        
+        summary = await fleet_health_scoring_service.run(window_hours)
+        return response_formatter_v2.success(
+            data=summary,
+            message=f"设备群健康评分完成，共 {summary.get('devices', 0)} 台设备"
+        )
+        
+    except Exception as e:
+        logger.error(f"设备群健康评分失败: {str(e)}")
+        return response_formatter_v2.error(
+            message="设备群健康评分失败",
+            details={"error": str(e)}
+        )
+
+
 @router.post("/batch-delete", response_model=APIResponse[BatchOperationResponse])
 async def batch_delete_health_scores(batch_data: BatchDeleteRequest):
     """批量删除健康评分"""
@@ -665,21 +722,6 @@ async def generate_health_report_file(scores: list, format: str) -> str:
     return str(file_path)
 
 
-async def get_target_ids_by_type(target_type: str) -> List[int]:
-    """根据目标类型获取目标ID列表"""
-    # TODO: 实现根据目标类型查询目标ID的逻辑
-    # 这里应该根据target_type查询相应的数据表
-    
-    if target_type == "device":
-        # 从设备表查询
-        return [1, 2, 3, 4, 5]  # 模拟数据
-    elif target_type == "system":
-        # 从系统表查询
-        return [1]  # 模拟数据
-    else:
-        return []
-
-
 def calculate_trend_direction(scores: List[float]) -> tuple:
     """计算趋势方向和置信度"""
     if len(scores) < 2:
@@ -710,7 +752,7 @@ def calculate_trend_direction(scores: List[float]) -> tuple:
         direction = "stable"
     
     # 计算置信度（基于R²）
-    y_pred = [x_mean + slope * (x[i] - x_mean) for i in range(n)]
+    y_pred = [y_mean + slope * (x[i] - x_mean) for i in range(n)]
     ss_res = sum((scores[i] - y_pred[i]) ** 2 for i in range(n))
     ss_tot = sum((scores[i] - y_mean) ** 2 for i in range(n))
     
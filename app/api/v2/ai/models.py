@@ -16,12 +16,14 @@ from fastapi.responses import FileResponse
 from app.models.ai_monitoring import AIModel, ModelStatus
 from app.schemas.ai_monitoring import (
     ModelCreate, ModelUpdate, ModelResponse, ModelTrainRequest, ModelMetricsResponse,
-    AIMonitoringQuery, BatchDeleteRequest, BatchOperationResponse
+    ModelPredictRequest, AIMonitoringQuery, BatchDeleteRequest, BatchOperationResponse
 )
 from app.schemas.base import APIResponse, PaginatedResponse
 from app.core.response_formatter_v2 import create_formatter
 from app.core.pagination import get_pagination_params, create_pagination_response
+from app.core.exceptions import APIException
 from app.log import logger
+from app.services.ai.model_registry import model_registry
 from app.services.ai.tasks import train_model as train_model_task_celery
 
 response_formatter_v2 = create_formatter()
@@ -394,6 +396,7 @@ async def update_model(
             update_data["updated_by"] = current_user_id
             await model.update_from_dict(update_data)
             await model.save()
+            model_registry.evict(model_id)
         
         model_response = ModelResponse(
             id=model.id,
@@ -629,11 +632,21 @@ async def deploy_model(
         model.updated_by = current_user_id
         await model.save()
         
+        # 预加载到推理注册表，部署后首个请求无需再从磁盘加载
+        model_registry.evict(model_id)
+        loaded = True
+        try:
+            await model_registry.get(model_id)
+        except Exception as e:
+            loaded = False
+            logger.warning(f"部署后预加载模型失败: model_id={model_id}, 错误: {str(e)}")
+        
         return response_formatter_v2.success(
             data={
                 "model_id": model_id,
                 "status": "deployed",
-                "deployed_at": model.deployed_at.isoformat()
+                "deployed_at": model.deployed_at.isoformat(),
+                "loaded": loaded
             },
             message="部署模型成功"
         )
@@ -646,6 +659,47 @@ async def deploy_model(
         )
 
 
+@router.post("/{model_id}/predict", response_model=APIResponse[dict])
+async def predict_with_model(model_id: int, request: ModelPredictRequest):
+    """使用已部署模型在线推理（并发请求自动合并为批量预测）"""
+    try:
+        start = datetime.now()
+        result = await model_registry.predict(model_id, request.features, method=request.method)
+        
+        return response_formatter_v2.success(
+            data={
+                "model_id": model_id,
+                "method": request.method,
+                "predictions": result.tolist(),
+                "count": len(result),
+                "latency_ms": round((datetime.now() - start).total_seconds() * 1000, 3)
+            },
+            message="推理成功"
+        )
+        
+    except APIException as e:
+        return response_formatter_v2.error(message=e.message, code=e.code)
+    except Exception as e:
+        logger.error(f"模型推理失败: model_id={model_id}, 错误: {str(e)}")
+        return response_formatter_v2.error(
+            message="模型推理失败",
+            details={"error": str(e)}
+        )
+
+
+@router.get("/{model_id}/inference-stats", response_model=APIResponse[dict])
+async def get_model_inference_stats(model_id: int):
+    """获取模型在线推理的批次延迟统计（按批大小分桶）与注册表状态"""
+    return response_formatter_v2.success(
+        data={
+            "model_id": model_id,
+            "latency_by_batch_size": model_registry.latency_stats(model_id),
+            "registry": model_registry.stats()
+        },
+        message="获取推理统计成功"
+    )
+
+
 @router.post("/batch-delete", response_model=APIResponse[BatchOperationResponse])
 async def batch_delete_models(batch_data: BatchDeleteRequest):
     """批量删除模型"""
@@ -20,6 +20,7 @@ from app.schemas.ai_monitoring import (
 from app.schemas.base import APIResponse, PaginatedResponse
 from app.core.response_formatter_v2 import create_formatter
 from app.core.pagination import get_pagination_params, create_pagination_response
+from app.core.streaming_export import STREAM_FORMATS, chunked, streaming_export_response
 from app.log import logger
 
 
@@ -349,9 +350,15 @@ async def delete_prediction(prediction_id: int):
 @router.get("/{prediction_id}/export")
 async def export_prediction_report(
     prediction_id: int,
-    format: str = Query("json", description="导出格式: json, csv, excel")
+    format: str = Query("json", description="导出格式: json, csv, excel；流式导出: ndjson, parquet, arrow"),
+    stream: bool = Query(False, description="是否流式导出预测点（csv格式时生效，其余流式格式始终流式）"),
+    gzip: bool = Query(True, description="流式导出时是否gzip压缩（parquet自带压缩，忽略此项）")
 ):
-    """导出预测报告"""
+    """导出预测报告
+
+    流式导出只输出预测点序列（每行一个预测点），分批编码后直接写入响应，
+    不再生成落盘的临时文件。
+    """
     try:
         prediction = await AIPrediction.get_or_none(id=prediction_id)
         if not prediction:
@@ -363,6 +370,15 @@ async def export_prediction_report(
         if not prediction.result_data:
             raise HTTPException(status_code=400, detail="预测结果为空，无法导出")
         
+        if format in ("ndjson", "jsonl", "parquet", "arrow") or (stream and format in STREAM_FORMATS):
+            points = (prediction.result_data or {}).get("predictions") or []
+            return streaming_export_response(
+                chunked(points),
+                fmt=format,
+                filename=f"prediction_{prediction_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                gzip=gzip
+            )
+        
         # 生成导出文件
         file_path = await generate_prediction_export_file(prediction, format)
         
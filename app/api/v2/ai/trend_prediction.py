@@ -12,8 +12,10 @@ from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel, Field
 import logging
 
+from app.core.cpu_executor import run_cpu
 from app.core.response_formatter_v2 import create_formatter
 from app.core.dependency import DependAuth
+from app.services.ai.forecast_service import forecast_service
 from app.services.ai.prediction import TrendPredictor
 from app.core.exceptions import APIException
 from app.schemas.base import APIResponse
@@ -63,6 +65,10 @@ class TrendPredictionResponse(BaseModel):
 class BatchTrendPredictionRequest(BaseModel):
     """批量趋势预测请求"""
     dataset: Dict[str, List[float]] = Field(..., description="设备数据集")
+    metric_name: Optional[str] = Field(
+        default=None,
+        description="指标名称，与设备一起作为ARIMA模型缓存键；未提供时每次重新拟合，不复用缓存模型"
+    )
     steps: int = Field(..., description="预测步数", ge=1, le=100)
     method: str = Field(default="auto", description="预测方法")
     confidence_level: float = Field(default=0.95, description="置信水平")
@@ -146,25 +152,26 @@ async def predict_trend(
         # 验证数据
         if len(request.data) < 10:
             raise APIException(
-                status_code=400,
-                code="INSUFFICIENT_DATA",
-                message="数据点数至少需要10个才能进行趋势预测"
+                message="数据点数至少需要10个才能进行趋势预测",
+                code=400,
+                error_code="INSUFFICIENT_DATA"
             )
         
         # 验证预测方法
         valid_methods = {"arima", "ma", "ema", "lr", "auto"}
         if request.method not in valid_methods:
             raise APIException(
-                status_code=400,
-                code="INVALID_METHOD",
-                message=f"无效的预测方法。有效方法: {', '.join(valid_methods)}"
+                message=f"无效的预测方法。有效方法: {', '.join(valid_methods)}",
+                code=400,
+                error_code="INVALID_METHOD"
             )
         
         # 创建趋势预测器
         predictor = TrendPredictor()
         
-        # 执行预测
-        result = predictor.predict(
+        # 执行预测（进程池中计算，不阻塞事件循环）
+        result = await run_cpu(
+            predictor.predict,
             data=request.data,
             steps=request.steps,
             method=request.method,
@@ -202,9 +209,9 @@ async def predict_trend(
     except Exception as e:
         logger.error(f"趋势预测失败: {str(e)}", exc_info=True)
         raise APIException(
-            status_code=500,
-            code="TREND_PREDICTION_ERROR",
-            message=f"趋势预测失败: {str(e)}"
+            message=f"趋势预测失败: {str(e)}",
+            code=500,
+            error_code="TREND_PREDICTION_ERROR"
         )
 
 
@@ -237,47 +244,49 @@ async def batch_predict_trend(
         
         if not request.dataset:
             raise APIException(
-                status_code=400,
-                code="EMPTY_DATASET",
-                message="数据集不能为空"
+                message="数据集不能为空",
+                code=400,
+                error_code="EMPTY_DATASET"
             )
         
-        # 创建趋势预测器
-        predictor = TrendPredictor()
+        # 数据点不足的设备跳过，其余设备并行预测（ARIMA 复用缓存模型）
+        failed_devices = [device_id for device_id, data in request.dataset.items() if len(data) < 10]
+        for device_id in failed_devices:
+            logger.warning(f"设备 {device_id} 数据点数不足，跳过")
+        series = {
+            (device_id, request.metric_name): data
+            for device_id, data in request.dataset.items()
+            if len(data) >= 10
+        }
         
-        # 批量预测
-        results = {}
-        failed_devices = []
-        success_count = 0
+        try:
+            outputs = await forecast_service.predict_many(
+                series,
+                steps=request.steps,
+                method=request.method,
+                confidence_level=request.confidence_level
+            )
+        except ValueError:
+            raise APIException(
+                message=f"无效的预测方法: {request.method}",
+                code=400,
+                error_code="INVALID_METHOD"
+            )
         
-        for device_id, data in request.dataset.items():
-            try:
-                if len(data) < 10:
-                    logger.warning(f"设备 {device_id} 数据点数不足，跳过")
-                    failed_devices.append(device_id)
-                    continue
-                
-                # 执行预测
-                result = predictor.predict(
-                    data=data,
-                    steps=request.steps,
-                    method=request.method,
-                    confidence_level=request.confidence_level
-                )
-                
-                results[device_id] = {
-                    "predictions": result["predictions"],
-                    "method": result["method"],
-                    "trend": result["trend"],
-                    "evaluation": result.get("evaluation")
-                }
-                
-                success_count += 1
-                
-            except Exception as e:
-                logger.error(f"设备 {device_id} 趋势预测失败: {str(e)}")
+        results = {}
+        for (device_id, _), result in outputs.items():
+            if not result.get("success"):
+                logger.error(f"设备 {device_id} 趋势预测失败: {result.get('error')}")
                 failed_devices.append(device_id)
                 continue
+            results[device_id] = {
+                "predictions": result["predictions"],
+                "method": result["method"],
+                "trend": result["trend"],
+                "confidence_interval": result.get("confidence_interval"),
+                "evaluation": result.get("evaluation")
+            }
+        success_count = len(results)
         
         response = BatchTrendPredictionResponse(
             results=results,
@@ -298,9 +307,9 @@ async def batch_predict_trend(
     except Exception as e:
         logger.error(f"批量趋势预测失败: {str(e)}", exc_info=True)
         raise APIException(
-            status_code=500,
-            code="BATCH_TREND_PREDICTION_ERROR",
-            message=f"批量趋势预测失败: {str(e)}"
+            message=f"批量趋势预测失败: {str(e)}",
+            code=500,
+            error_code="BATCH_TREND_PREDICTION_ERROR"
         )
 
 
@@ -342,9 +351,9 @@ async def compare_prediction_methods(
         # 验证数据
         if len(request.data) < 10:
             raise APIException(
-                status_code=400,
-                code="INSUFFICIENT_DATA",
-                message="数据点数至少需要10个才能进行方法对比"
+                message="数据点数至少需要10个才能进行方法对比",
+                code=400,
+                error_code="INSUFFICIENT_DATA"
             )
         
         # 验证方法
@@ -352,9 +361,9 @@ async def compare_prediction_methods(
         invalid_methods = set(request.methods) - valid_methods
         if invalid_methods:
             raise APIException(
-                status_code=400,
-                code="INVALID_METHOD",
-                message=f"无效的预测方法: {', '.join(invalid_methods)}"
+                message=f"无效的预测方法: {', '.join(invalid_methods)}",
+                code=400,
+                error_code="INVALID_METHOD"
             )
         
         # 创建趋势预测器
@@ -368,7 +377,8 @@ async def compare_prediction_methods(
         for method in request.methods:
             try:
                 # 执行预测
-                result = predictor.predict(
+                result = await run_cpu(
+                    predictor.predict,
                     data=request.data,
                     steps=request.steps,
                     method=method
@@ -400,9 +410,9 @@ async def compare_prediction_methods(
         
         if not best_method:
             raise APIException(
-                status_code=500,
-                code="ALL_METHODS_FAILED",
-                message="所有预测方法均失败"
+                message="所有预测方法均失败",
+                code=500,
+                error_code="ALL_METHODS_FAILED"
             )
         
         response = ModelComparisonResponse(
@@ -423,9 +433,9 @@ async def compare_prediction_methods(
     except Exception as e:
         logger.error(f"预测方法对比失败: {str(e)}", exc_info=True)
         raise APIException(
-            status_code=500,
-            code="METHOD_COMPARISON_ERROR",
-            message=f"预测方法对比失败: {str(e)}"
+            message=f"预测方法对比失败: {str(e)}",
+            code=500,
+            error_code="METHOD_COMPARISON_ERROR"
         )
 
 
@@ -495,8 +505,8 @@ async def get_prediction_methods(current_user=DependAuth):
     except Exception as e:
         logger.error(f"获取预测方法失败: {str(e)}", exc_info=True)
         raise APIException(
-            status_code=500,
-            code="GET_METHODS_ERROR",
-            message=f"获取预测方法失败: {str(e)}"
+            message=f"获取预测方法失败: {str(e)}",
+            code=500,
+            error_code="GET_METHODS_ERROR"
         )
 
@@ -14,6 +14,7 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 
 from app.services.alarm_websocket import alarm_ws_manager, websocket_auth
 from app.services.alarm_detection import alarm_engine
+from app.services.notification_counter import unread_counter
 from app.core.response_formatter_v2 import create_formatter
 from app.log import logger
 
@@ -30,8 +31,9 @@ async def alarm_websocket_endpoint(
     报警WebSocket端点
     
     连接后会实时接收报警通知：
-    - type: "alarm" - 新报警触发
+    - type: "alarm" / "alarms" - 新报警触发（同一推送周期内的多条报警合并为 alarms 数组）
     - type: "statistics_update" - 统计数据更新
+    - type: "unread_count" - 未读通知数量变化
     - type: "ping" - 心跳
     """
     # 认证
@@ -57,7 +59,18 @@ async def alarm_websocket_endpoint(
             "message": "报警WebSocket连接成功",
             "subscribed_types": device_type_list or "all"
         }, ensure_ascii=False)
-        await websocket.send_text(welcome_msg)
+        await alarm_ws_manager.send_text(websocket, welcome_msg)
+        
+        # 推送当前未读通知数量，之后随通知变化推送，前端无需轮询
+        try:
+            unread = await unread_counter.get(user.id)
+            await alarm_ws_manager.send_text(websocket, json.dumps({
+                "type": "unread_count",
+                "timestamp": datetime.now().isoformat(),
+                "data": unread
+            }, ensure_ascii=False))
+        except Exception as e:
+            logger.warning(f"获取未读通知数量失败: {str(e)}")
         
         # 保持连接
         while True:
@@ -75,18 +88,18 @@ async def alarm_websocket_endpoint(
                             "type": "pong",
                             "timestamp": datetime.now().isoformat()
                         })
-                        await websocket.send_text(pong_msg)
+                        await alarm_ws_manager.send_text(websocket, pong_msg)
                         
                     elif msg_type == "subscribe":
                         # 更新订阅
                         new_types = msg.get("device_types", [])
-                        alarm_ws_manager.subscriptions[websocket]["device_types"] = new_types
+                        alarm_ws_manager.update_subscription(websocket, new_types)
                         ack_msg = json.dumps({
                             "type": "subscribed",
                             "timestamp": datetime.now().isoformat(),
                             "device_types": new_types or "all"
                         })
-                        await websocket.send_text(ack_msg)
+                        await alarm_ws_manager.send_text(websocket, ack_msg)
                         
                 except json.JSONDecodeError:
                     pass
@@ -97,7 +110,7 @@ async def alarm_websocket_endpoint(
                     "type": "ping",
                     "timestamp": datetime.now().isoformat()
                 })
-                await websocket.send_text(ping_msg)
+                await alarm_ws_manager.send_text(websocket, ping_msg)
                 
     except WebSocketDisconnect:
         pass
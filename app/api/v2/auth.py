@@ -14,6 +14,7 @@ from app.utils.password import verify_password, get_password_hash
 from app.settings import settings
 from app.core.dependency import DependAuth
 from app.core.response_formatter_v2 import ResponseFormatterV2
+from app.services.menu_tree_service import menu_tree_service
 from app.models.admin import SysApiEndpoint, Role, User
 from app.core.unified_logger import get_logger
 
@@ -224,56 +225,23 @@ async def get_user_menus(request: Request, current_user=DependAuth):
         if not user_obj:
             return formatter.not_found("用户不存在", "user")
         
-        # 获取用户菜单权限（包含按钮类型）
-        if user_obj.is_superuser:
-            # 超级管理员获取所有菜单（包括按钮）
-            from app.models.admin import Menu
-            all_menus = await Menu.all().order_by("order_num", "id")
-            menus = [{
-                "id": menu.id,
-                "name": menu.name,
-                "path": menu.path or "",
-                "component": menu.component or "",
-                "redirect": menu.redirect,
-                "icon": menu.icon,
-                "order": menu.order,
-                "isHidden": menu.is_hidden,
-                "keepalive": menu.keepalive,
-                "menuType": menu.menu_type,  # 包含 'button' 类型
-                "parentId": menu.parent_id,
-                "perms": menu.perms,  # 按钮权限标识
-                "type": menu.menu_type  # 前端兼容字段
-            } for menu in all_menus]
-        else:
-            # 普通用户通过角色获取菜单（包括按钮）
-            roles = await user_obj.roles.all()
-            menu_ids = set()
-            
-            for role in roles:
-                role_menus = await role.menus.all()
-                for menu in role_menus:
-                    menu_ids.add(menu.id)
-            
-            if menu_ids:
-                from app.models.admin import Menu
-                user_menus = await Menu.filter(id__in=menu_ids).order_by("order_num", "id")
-                menus = [{
-                    "id": menu.id,
-                    "name": menu.name,
-                    "path": menu.path or "",
-                    "component": menu.component or "",
-                    "redirect": menu.redirect,
-                    "icon": menu.icon,
-                    "order": menu.order,
-                    "isHidden": menu.is_hidden,
-                    "keepalive": menu.keepalive,
-                    "menuType": menu.menu_type,  # 包含 'button' 类型
-                    "parentId": menu.parent_id,
-                    "perms": menu.perms,  # 按钮权限标识
-                    "type": menu.menu_type  # 前端兼容字段
-                } for menu in user_menus]
-            else:
-                menus = []
+        # 获取用户菜单权限（包含按钮类型）：超级管理员为全部菜单，普通用户为各角色菜单缓存的并集
+        rows = await menu_tree_service.get_user_menu_rows(user_obj)
+        menus = [{
+            "id": row["id"],
+            "name": row["name"],
+            "path": row["path"] or "",
+            "component": row["component"] or "",
+            "redirect": row["query"],
+            "icon": row["icon"],
+            "order": row["order_num"],
+            "isHidden": not row["visible"],
+            "keepalive": row["is_cache"],
+            "menuType": row["menu_type"],  # 包含 'button' 类型
+            "parentId": row["parent_id"],
+            "perms": row["perms"],  # 按钮权限标识
+            "type": row["menu_type"]  # 前端兼容字段
+        } for row in rows]
         
         # 构建树形结构
         menu_tree = build_menu_tree(menus)
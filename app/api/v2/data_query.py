@@ -45,6 +45,10 @@ class RealtimeQueryRequest(BaseModel):
     page: int = Field(1, ge=1, description="页码")
     page_size: int = Field(100, ge=1, le=1000, description="每页记录数")
     apply_transform: bool = Field(True, description="是否应用数据转换")
+    cursor: Optional[str] = Field(None, description="续页游标（上一页返回的 next_cursor），提供时忽略 page")
+    count_mode: Optional[str] = Field(None, description="总数统计方式: exact/estimate/none，续页默认 none")
+    max_points: Optional[int] = Field(None, ge=10, le=20000, description="图表最大点数，提供时返回降采样后的数据（忽略分页）")
+    resolution: Optional[str] = Field(None, description="降采样方式: auto/raw/lttb/minmax/interval")
 
 
 class StatisticsQueryRequest(BaseModel):
@@ -160,10 +164,18 @@ async def query_realtime_data(
             page=query_request.page,
             page_size=query_request.page_size,
             apply_transform=query_request.apply_transform,
-            log_execution=True
+            log_execution=True,
+            cursor=query_request.cursor,
+            count_mode=query_request.count_mode,
+            max_points=query_request.max_points,
+            resolution=query_request.resolution
         )
         
         logger.info(f"[API] Realtime Query Result: total={result['total']}, rows={len(result['data'])}")
+        if result['total'] is None:
+            summary = f"返回 {len(result['data'])} 条记录"
+        else:
+            summary = f"共 {'约 ' if result['total_estimated'] else ''}{result['total']} 条记录"
 
         # Custom response format to match frontend expectations (Flattened Structure)
         # Frontend expects response.data to be an array and response.total to be at top level
@@ -175,12 +187,17 @@ async def query_realtime_data(
             "total": result['total'],
             "meta": {
                 "total": result['total'],
+                "total_estimated": result['total_estimated'],
                 "page": result['page'],
-                "page_size": result['page_size']
+                "page_size": result['page_size'],
+                "next_cursor": result['next_cursor'],
+                "has_more": result['has_more'],
+                "downsample": result['downsample']
             },
             "page": result['page'],
             "page_size": result['page_size'],
-            "message": f"查询成功，共 {result['total']} 条记录，耗时 {result['execution_time_ms']} ms",
+            "next_cursor": result['next_cursor'],
+            "message": f"查询成功，{summary}，耗时 {result['execution_time_ms']} ms",
             "generated_sql": result.get('generated_sql')
         }))
         
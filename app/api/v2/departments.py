@@ -14,19 +14,13 @@ from app.models.admin import User, Dept
 from app.core.batch_delete_decorators import require_batch_delete_permission
 from app.controllers.dept import dept_controller
 from app.schemas.depts import DeptCreate, DeptUpdate, DeptPatch
+from app.services.department_tree_service import build_tree, department_tree_service
 
 router = APIRouter()
 
 def build_dept_tree(depts: List[dict], parent_id: int = 0) -> List[dict]:
-    """构建部门树结构"""
-    tree = []
-    for dept in depts:
-        if dept.get("parent_id") == parent_id:
-            children = build_dept_tree(depts, dept["id"])
-            if children:
-                dept["children"] = children
-            tree.append(dept)
-    return tree
+    """构建部门树结构（按parent_id索引，线性时间）"""
+    return build_tree(depts, parent_id)
 
 @router.get("", summary="获取部门列表", description="获取部门列表 - 支持搜索、过滤和树形视图")
 @router.get("/", summary="获取部门列表", description="获取部门列表 - 支持搜索、过滤和树形视图")
@@ -55,37 +49,13 @@ async def get_departments(
     try:
         # 如果请求树形视图，直接返回树形结构
         if view == "tree":
-            # 构建查询条件
-            q = Q()
-            query_params = {}
-            if name:
-                q &= Q(dept_name__icontains=name)
-                query_params['name'] = name
-            if parent_id is not None:
-                q &= Q(parent_id=parent_id)
-                query_params['parent_id'] = parent_id
-            if not include_deleted:
-                q &= Q(del_flag="0")
-            query_params['include_deleted'] = include_deleted
-            
-            # 获取所有部门
-            depts = await Dept.filter(q).order_by("parent_id", "order_num").all()
-            
-            # 转换为字典格式
-            dept_dicts = []
-            for dept in depts:
-                dept_dict = await dept.to_dict()
-                
-                if include_stats:
-                    # 添加统计信息
-                    dept_dict["stats"] = {
-                        "children_count": await Dept.filter(parent_id=dept.id, del_flag="0").count(),
-                        "users_count": await User.filter(dept_id=dept.id).count(),
-                        "total_descendants": await get_descendants_count(dept.id)
-                    }
-                    dept_dict["level"] = await get_dept_level(dept.id)
-                
-                dept_dicts.append(dept_dict)
+            # 从物化的部门快照中筛选（统计信息由快照与一次分组COUNT提供）
+            dept_dicts = await department_tree_service.get_dept_dicts(
+                include_deleted=include_deleted,
+                include_stats=include_stats,
+                name=name,
+                parent_id=parent_id
+            )
             
             # 构建树形结构
             tree_data = build_dept_tree(dept_dicts)
@@ -134,20 +104,16 @@ async def get_departments(
             )
             total, dept_objs = result
             
+            # 批量获取统计与层级信息
+            stats_map = await department_tree_service.get_stats_map([dept.id for dept in dept_objs])
+            
             # 转换数据格式
             dept_data = []
             for dept in dept_objs:
                 dept_dict = await dept.to_dict()
                 
-                # 添加v2版本增强字段
-                dept_dict["stats"] = {
-                    "children_count": await Dept.filter(parent_id=dept.id, del_flag="0").count(),
-                    "users_count": await User.filter(dept_id=dept.id).count(),
-                    "total_descendants": await get_descendants_count(dept.id)
-                }
-                
-                # 添加层级信息
-                dept_dict["level"] = await get_dept_level(dept.id)
+                # 添加v2版本增强字段与层级信息
+                department_tree_service.apply_stats(dept_dict, stats_map[dept.id])
                 
                 dept_data.append(dept_dict)
             
@@ -182,29 +148,11 @@ async def get_department_tree(
     formatter = ResponseFormatterV2(request)
     
     try:
-        # 构建查询条件
-        q = Q()
-        if not include_deleted:
-            q &= Q(del_flag="0")
-        
-        # 获取所有部门
-        depts = await Dept.filter(q).order_by("parent_id", "order_num").all()
-        
-        # 转换为字典格式
-        dept_dicts = []
-        for dept in depts:
-            dept_dict = await dept.to_dict()
-            
-            if include_stats:
-                # 添加统计信息
-                dept_dict["stats"] = {
-                    "children_count": await Dept.filter(parent_id=dept.id, del_flag="0").count(),
-                    "users_count": await User.filter(dept_id=dept.id).count(),
-                    "total_descendants": await get_descendants_count(dept.id)
-                }
-                dept_dict["level"] = await get_dept_level(dept.id)
-            
-            dept_dicts.append(dept_dict)
+        # 从物化的部门快照中获取（统计信息由快照与一次分组COUNT提供）
+        dept_dicts = await department_tree_service.get_dept_dicts(
+            include_deleted=include_deleted,
+            include_stats=include_stats
+        )
         
         # 构建树形结构
         tree_data = build_dept_tree(dept_dicts)
@@ -256,15 +204,9 @@ async def get_department(
         # 获取部门详细信息
         dept_dict = await dept.to_dict()
         
-        # 添加v2版本增强字段
-        dept_dict["stats"] = {
-            "children_count": await Dept.filter(parent_id=dept.id, del_flag="0").count(),
-            "users_count": await User.filter(dept_id=dept.id).count(),
-            "total_descendants": await get_descendants_count(dept.id)
-        }
-        
-        # 添加层级信息
-        dept_dict["level"] = await get_dept_level(dept.id)
+        # 添加v2版本增强字段与层级信息
+        stats_map = await department_tree_service.get_stats_map([dept.id])
+        department_tree_service.apply_stats(dept_dict, stats_map[dept.id])
         
         # 获取父部门信息
         if dept.parent_id and dept.parent_id > 0:
@@ -280,13 +222,14 @@ async def get_department(
         
         # 获取子部门列表
         children = await Dept.filter(parent_id=dept.id, del_flag="0").order_by("order_num").all()
+        child_user_counts = await department_tree_service.get_user_counts([child.id for child in children])
         dept_dict["children"] = [
             {
                 "id": child.id,
                 "name": child.dept_name,
                 "desc": child.desc,
                 "order_num": child.order_num,
-                "users_count": await User.filter(dept_id=child.id).count()
+                "users_count": child_user_counts.get(child.id, 0)
             }
             for child in children
         ]
@@ -374,10 +317,11 @@ async def create_department(
         
         # 创建部门
         new_dept = await dept_controller.create_dept(obj_in=dept_data)
+        await department_tree_service.invalidate()
         
         # 获取创建后的部门信息
         dept_dict = await new_dept.to_dict()
-        dept_dict["level"] = await get_dept_level(new_dept.id)
+        dept_dict["level"] = (await department_tree_service.get_hierarchy()).get(new_dept.id, {}).get("level", 0)
         dept_dict["stats"] = {
             "children_count": 0,
             "users_count": 0,
@@ -509,6 +453,8 @@ async def batch_create_departments(
                     print(f"[ERROR] 第{i+1}个部门创建失败: {str(e)}")
                     print(f"[ERROR] 异常堆栈: {traceback.format_exc()}")
                     raise
+        await department_tree_service.invalidate()
+        hierarchy = await department_tree_service.get_hierarchy()
         
         # 构建响应数据
         result_data = []
@@ -518,7 +464,7 @@ async def batch_create_departments(
                 fresh_dept = await dept_controller.get(id=dept.id)
                 # to_dict方法是异步的，需要await
                 dept_dict = await fresh_dept.to_dict()
-                dept_dict["level"] = await get_dept_level(dept.id)
+                dept_dict["level"] = hierarchy.get(dept.id, {}).get("level", 0)
                 dept_dict["stats"] = {
                     "children_count": 0,
                     "users_count": 0,
@@ -531,7 +477,7 @@ async def batch_create_departments(
                 result_data.append({
                     "id": dept.id,
                     "dept_name": getattr(dept, 'dept_name', getattr(dept, 'name', 'Unknown')),
-                    "level": await get_dept_level(dept.id),
+                    "level": hierarchy.get(dept.id, {}).get("level", 0),
                     "stats": {
                         "children_count": 0,
                         "users_count": 0,
@@ -636,15 +582,12 @@ async def update_department(
         # 更新部门
         dept_data.id = dept_id  # 确保ID正确
         updated_dept = await dept_controller.update(id=dept_id, obj_in=dept_data)
+        await department_tree_service.invalidate()
         
         # 获取更新后的部门信息
         dept_dict = await updated_dept.to_dict()
-        dept_dict["level"] = await get_dept_level(updated_dept.id)
-        dept_dict["stats"] = {
-            "children_count": await Dept.filter(parent_id=dept_id, del_flag="0").count(),
-            "users_count": await User.filter(dept_id=dept_id).count(),
-            "total_descendants": await get_descendants_count(dept_id)
-        }
+        stats_map = await department_tree_service.get_stats_map([dept_id])
+        department_tree_service.apply_stats(dept_dict, stats_map[dept_id])
         
         return formatter.success(
             data=dept_dict,
@@ -766,15 +709,12 @@ async def patch_department(
                 setattr(dept, field, value)
         
         await dept.save()
+        await department_tree_service.invalidate()
         
         # 获取更新后的部门信息
         dept_dict = await dept.to_dict()
-        dept_dict["level"] = await get_dept_level(dept.id)
-        dept_dict["stats"] = {
-            "children_count": await Dept.filter(parent_id=dept_id, del_flag="0").count(),
-            "users_count": await User.filter(dept_id=dept_id).count(),
-            "total_descendants": await get_descendants_count(dept_id)
-        }
+        stats_map = await department_tree_service.get_stats_map([dept_id])
+        department_tree_service.apply_stats(dept_dict, stats_map[dept_id])
         
         return formatter.success(
             data=dept_dict,
@@ -825,6 +765,8 @@ async def batch_delete_departments(
                 ids=dept_ids,
                 force=force
             )
+            if result.deleted_count:
+                await department_tree_service.invalidate()
             
             # 生成用户友好的响应消息
             if result.failed_count == 0:
@@ -912,6 +854,7 @@ async def delete_department(
             # 软删除
             dept.del_flag = "2"
             await dept.save()
+        await department_tree_service.invalidate()
         
         # 构建删除结果数据（与批量删除格式一致）
         deleted_department = {
@@ -1077,6 +1020,7 @@ async def delete_department(
                     "name": dept.dept_name,
                     "deletion_type": "permanent" if force else "soft"
                 })
+        await department_tree_service.invalidate()
         
         operation_type = "permanently deleted" if force else "marked as deleted"
         
@@ -1135,6 +1079,9 @@ async def get_department_children(
         offset = (page - 1) * page_size
         children = await Dept.filter(q).order_by("order_num", "dept_name").offset(offset).limit(page_size).all()
         
+        # 批量获取统计与层级信息
+        stats_map = await department_tree_service.get_stats_map([child.id for child in children]) if include_stats else {}
+        
         # 转换数据格式
         children_data = []
         for child in children:
@@ -1142,12 +1089,7 @@ async def get_department_children(
             
             if include_stats:
                 # 添加统计信息
-                child_dict["stats"] = {
-                    "children_count": await Dept.filter(parent_id=child.id, del_flag="0").count(),
-                    "users_count": await User.filter(dept_id=child.id).count(),
-                    "total_descendants": await get_descendants_count(child.id)
-                }
-                child_dict["level"] = await get_dept_level(child.id)
+                department_tree_service.apply_stats(child_dict, stats_map[child.id])
             
             children_data.append(child_dict)
         
@@ -1429,32 +1371,13 @@ async def remove_user_from_department(
 # 辅助函数
 async def get_dept_level(dept_id: int) -> int:
     """获取部门层级"""
-    level = 0
-    current_id = dept_id
-    
-    while current_id:
-        dept = await Dept.get_or_none(id=current_id)
-        if not dept or dept.parent_id == 0:
-            break
-        current_id = dept.parent_id
-        level += 1
-        
-        # 防止无限循环
-        if level > 10:
-            break
-    
-    return level
+    hierarchy = await department_tree_service.get_hierarchy()
+    return hierarchy.get(dept_id, {}).get("level", 0)
 
 async def get_descendants_count(dept_id: int) -> int:
     """获取所有后代部门数量"""
-    count = 0
-    children = await Dept.filter(parent_id=dept_id, del_flag="0").all()
-    
-    for child in children:
-        count += 1
-        count += await get_descendants_count(child.id)
-    
-    return count
+    hierarchy = await department_tree_service.get_hierarchy()
+    return hierarchy.get(dept_id, {}).get("total_descendants", 0)
 
 async def get_all_descendant_ids(dept_id: int) -> List[int]:
     """获取所有后代部门ID"""
@@ -19,6 +19,7 @@ from tortoise.exceptions import DoesNotExist
 from app.controllers.device import device_controller
 from app.core.dependency import DependAuth
 from app.core.response_formatter_v2 import ResponseFormatterV2, create_formatter
+from app.core.exceptions import APIException
 from app.schemas.devices import (
     DeviceCreate,
     DeviceUpdate,
@@ -386,6 +387,9 @@ async def update_device_type(
         if update_data:
             await device_type.update_from_dict(update_data)
             await device_type.save()
+        if "tdengine_stable_name" in update_data:
+            from app.services.tdengine_table_resolver import tdengine_table_resolver
+            await tdengine_table_resolver.invalidate()
         
         return formatter.success(
             message="设备类型更新成功",
@@ -1578,6 +1582,10 @@ async def get_device_monitoring(
     end_time: Optional[datetime] = Query(None, description="结束时间"),
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=2000, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="续页游标（上一页返回的 meta.next_cursor）"),
+    count: Optional[str] = Query(None, description="总数统计方式: exact/estimate/none"),
+    max_points: Optional[int] = Query(None, ge=10, le=20000, description="图表最大点数，提供时返回降采样后的曲线数据"),
+    resolution: Optional[str] = Query(None, description="降采样方式: auto/raw/lttb/minmax/interval"),
     current_user: User = DependAuth
 ):
     """
@@ -1588,6 +1596,10 @@ async def get_device_monitoring(
     - **end_time**: 结束时间（可选）
     - **page**: 页码
     - **page_size**: 每页数量
+    - **cursor**: 续页游标，提供时按时间键集续页并忽略 page
+    - **count**: 总数统计方式，续页默认 none，其余默认 exact
+    - **max_points**: 图表最大点数，提供时忽略分页，返回时间范围内保留峰谷的降采样数据
+    - **resolution**: 降采样方式，auto 按数据量在原始返回、LTTB 与 TDengine INTERVAL 聚合间选择
     """
     try:
         formatter = create_formatter(request)
@@ -1601,19 +1613,23 @@ async def get_device_monitoring(
         from app.controllers.device_data import DeviceDataController
         data_controller = DeviceDataController()
         
-        # 调用 get_device_history_data (支持 device_id)
-        total, history_data = await data_controller.get_device_history_data(
+        # 调用 get_device_history_page (支持 device_id 与时间游标)
+        result = await data_controller.get_device_history_page(
             device_id=device_id,
             device_code=device_obj.device_code, # 传入 device_code 以便查找表名
             start_time=start_time,
             end_time=end_time,
             page=page,
-            page_size=page_size
+            page_size=page_size,
+            cursor=cursor,
+            count_mode=count,
+            max_points=max_points,
+            resolution_mode=resolution
         )
         
         # 转换为响应格式
         # 注意：TDengine 返回的数据字段已经是扁平的字典
-        data = history_data
+        data = result["items"]
 
         # 构建查询参数
         query_params = {}
@@ -1622,16 +1638,23 @@ async def get_device_monitoring(
         if end_time:
             query_params['end_time'] = end_time.isoformat()
 
-        return formatter.paginated_success(
+        return formatter.cursor_paginated_success(
             data=data,
-            total=total,
-            page=page,
             page_size=page_size,
+            next_cursor=result["next_cursor"],
+            total=result["total"],
+            total_estimated=result["total_estimated"],
+            page=None if cursor else page,
+            has_prev=bool(cursor),
             message="获取设备监控数据成功",
             resource_type=f"devices/{device_id}/monitoring",
-            query_params=query_params
+            query_params=query_params,
+            downsample=result.get("downsample")
         )
 
+    except APIException as e:
+        formatter = create_formatter(request)
+        return formatter.error(message=e.message, code=e.code, error_type=e.error_code)
     except Exception as e:
         logger.error(f"获取设备监控数据失败: {str(e)}", exc_info=True)
         formatter = create_formatter(request)
@@ -2233,6 +2256,10 @@ async def get_device_history_data(
     status: Optional[str] = Query(None, description="设备状态筛选"),
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=10000, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="续页游标（上一页返回的 meta.next_cursor）"),
+    count: Optional[str] = Query(None, description="总数统计方式: exact/estimate/none"),
+    max_points: Optional[int] = Query(None, ge=10, le=20000, description="图表最大点数，提供时返回降采样后的曲线数据"),
+    resolution: Optional[str] = Query(None, description="降采样方式: auto/raw/lttb/minmax/interval"),
     current_user: User = DependAuth
 ):
     """
@@ -2244,6 +2271,10 @@ async def get_device_history_data(
     - **status**: 设备状态筛选（可选）
     - **page**: 页码
     - **page_size**: 每页数量（图表模式可以设置为10000获取所有数据）
+    - **cursor**: 续页游标，提供时按时间键集续页并忽略 page，深翻页代价与第一页相同
+    - **count**: 总数统计方式，续页默认 none，其余默认 exact
+    - **max_points**: 图表最大点数，提供时忽略分页，返回时间范围内保留峰谷的降采样数据
+    - **resolution**: 降采样方式，auto 按数据量在原始返回、LTTB 与 TDengine INTERVAL 聚合间选择
     """
     logger.info(f"🔍 [历史数据API] 收到请求: device_id={device_id}, start_time={start_time}, end_time={end_time}, page={page}, page_size={page_size}")
     try:
@@ -2260,17 +2291,22 @@ async def get_device_history_data(
         # 调用控制器方法从TDengine查询历史数据
         from app.controllers.device_data import device_data_controller
         
-        total, history_data = await device_data_controller.get_device_history_data(
+        result = await device_data_controller.get_device_history_page(
             device_id=device_id,
             device_code=device_code,
             start_time=start_time,
             end_time=end_time,
             status=status,
             page=page,
-            page_size=page_size
+            page_size=page_size,
+            cursor=cursor,
+            count_mode=count,
+            max_points=max_points,
+            resolution_mode=resolution
         )
+        history_data = result["items"]
         
-        logger.info(f"查询到 {len(history_data)} 条历史数据，总数: {total}")
+        logger.info(f"查询到 {len(history_data)} 条历史数据，总数: {result['total']}")
 
         # 构建查询参数
         query_params = {}
@@ -2281,22 +2317,87 @@ async def get_device_history_data(
         if status:
             query_params['status'] = status
 
-        return formatter.paginated_success(
+        return formatter.cursor_paginated_success(
             data=history_data,
-            total=total,
-            page=page,
             page_size=page_size,
+            next_cursor=result["next_cursor"],
+            total=result["total"],
+            total_estimated=result["total_estimated"],
+            page=None if cursor else page,
+            has_prev=bool(cursor),
             message="获取设备历史数据成功",
             resource_type=f"devices/{device_id}/history",
-            query_params=query_params
+            query_params=query_params,
+            downsample=result.get("downsample")
         )
 
+    except APIException as e:
+        formatter = create_formatter(request)
+        return formatter.error(message=e.message, code=e.code, error_type=e.error_code)
     except Exception as e:
         logger.error(f"获取设备历史数据失败: {str(e)}", exc_info=True)
         formatter = create_formatter(request)
         return formatter.internal_error(f"获取设备历史数据失败: {str(e)}")
 
 
+@router.get("/{device_id}/history/export", summary="流式导出设备历史数据", response_model=None)
+async def export_device_history_data(
+    request: Request,
+    device_id: int,
+    start_time: Optional[datetime] = Query(None, description="开始时间"),
+    end_time: Optional[datetime] = Query(None, description="结束时间"),
+    status: Optional[str] = Query(None, description="设备状态筛选"),
+    format: str = Query("csv", description="导出格式: csv, ndjson, parquet, arrow"),
+    gzip: bool = Query(True, description="是否gzip压缩（parquet自带压缩，忽略此项）"),
+    batch_size: int = Query(5000, ge=1000, le=50000, description="每批读取行数"),
+    current_user: User = DependAuth
+):
+    """
+    流式导出设备历史数据（从TDengine查询）
+    
+    按时间游标逐批读取（不统计总数、不使用OFFSET），逐批编码后直接写入响应，
+    内存占用只与 batch_size 有关，可导出任意长时间范围的数据。
+    """
+    from app.controllers.device_data import device_data_controller
+    from app.core.streaming_export import normalize_stream_format, streaming_export_response
+
+    formatter = create_formatter(request)
+    device_obj = await device_controller.get(id=device_id)
+    if not device_obj:
+        return formatter.not_found("设备不存在", "device")
+    try:
+        normalize_stream_format(format)
+    except HTTPException as e:
+        return formatter.bad_request(e.detail)
+
+    async def history_batches():
+        cursor = None
+        while True:
+            result = await device_data_controller.get_device_history_page(
+                device_id=device_id,
+                device_code=device_obj.device_code,
+                start_time=start_time,
+                end_time=end_time,
+                status=status,
+                page_size=batch_size,
+                cursor=cursor,
+                count_mode="none"
+            )
+            if result["items"]:
+                yield result["items"]
+            cursor = result["next_cursor"]
+            if not cursor:
+                return
+
+    logger.info(f"流式导出设备历史数据: device_id={device_id}, format={format}, start_time={start_time}, end_time={end_time}")
+    return streaming_export_response(
+        history_batches(),
+        fmt=format,
+        filename=f"device_{device_obj.device_code}_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        gzip=gzip
+    )
+
+
 @router.get("/monitoring/overview", summary="设备监控概览", response_model=None)
 async def get_monitoring_overview(
     request: Request,
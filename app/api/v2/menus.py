@@ -10,24 +10,15 @@ from tortoise.transactions import in_transaction
 from app.core.response_formatter_v2 import ResponseFormatterV2, APIv2ErrorDetail
 from app.schemas.base import BatchDeleteRequest
 from app.core.dependency import DependAuth
+from app.core.permission_events import permission_event_manager
 from app.models.admin import User, Menu
 from app.core.batch_delete_decorators import require_batch_delete_permission
 from app.controllers.menu import menu_controller
 from app.schemas.menus import MenuCreate, MenuUpdate
+from app.services.menu_tree_service import build_menu_tree, menu_tree_service
 
 router = APIRouter()
 
-def build_menu_tree(menus: List[dict], parent_id: int = 0) -> List[dict]:
-    """构建菜单树结构"""
-    tree = []
-    for menu in menus:
-        if menu.get("parent_id") == parent_id:
-            children = build_menu_tree(menus, menu["id"])
-            if children:
-                menu["children"] = children
-            tree.append(menu)
-    return tree
-
 @router.get("/", summary="获取菜单列表", description="获取菜单列表 - 支持搜索、过滤和树形视图")
 async def get_menus(
     request: Request,
@@ -74,24 +65,12 @@ async def get_menus(
             # 获取所有菜单（不分页）
             all_menus = await Menu.filter(q).order_by('order_num', 'id')
             
-            # 转换为字典格式并添加增强字段
-            menu_data = []
-            for menu in all_menus:
-                menu_dict = await menu.to_dict()
-                
-                # 添加v2版本增强字段
-                children_count = await Menu.filter(parent_id=menu.id).count()
-                roles_count = await menu.roles.all().count() if hasattr(menu, 'roles') else 0
-                
-                menu_dict["stats"] = {
-                    "children_count": children_count,
-                    "roles_count": roles_count
-                }
-                
-                # 添加层级信息
-                menu_dict["level"] = await get_menu_level(menu.id)
-                
-                menu_data.append(menu_dict)
+            # 转换为字典格式并添加增强字段（层级、子菜单数、角色数批量计算）
+            stats_map = await menu_tree_service.get_menu_stats_map()
+            menu_data = [
+                menu_tree_service.apply_stats(await menu.to_dict(), stats_map.get(menu.id))
+                for menu in all_menus
+            ]
             
             # 构建树形结构
             tree_data = build_menu_tree(menu_data)
@@ -335,6 +314,11 @@ async def batch_create_menus(
             }
         }
         
+        if created_menus:
+            await permission_event_manager.emit_menu_changed(
+                [menu["id"] for menu in created_menus], "batch_create", current_user.id
+            )
+        
         if failed_menus:
             return formatter.partial_success(
                 data=response_data,
@@ -500,6 +484,11 @@ async def batch_update_menus(
             }
         }
         
+        if updated_menus:
+            await permission_event_manager.emit_menu_changed(
+                [menu["id"] for menu in updated_menus], "batch_update", current_user.id
+            )
+        
         if failed_updates:
             return formatter.partial_success(
                 data=response_data,
@@ -559,6 +548,9 @@ async def batch_delete_menus(
                 force=force
             )
             
+            if result.deleted_count:
+                await permission_event_manager.emit_menu_changed(menu_ids, "batch_delete", current_user.id)
+            
             # 生成用户友好的响应消息
             if result.failed_count == 0:
                 message = f"成功删除 {result.deleted_count} 个菜单"
@@ -603,23 +595,12 @@ async def get_menu_tree(
         # 获取所有菜单
         menus = await Menu.filter(q).order_by("parent_id", "order_num").all()
         
-        # 转换为字典格式
-        menu_dicts = []
-        for menu in menus:
-            menu_dict = await menu.to_dict()
-            
-            # 添加增强信息
-            children_count = await Menu.filter(parent_id=menu.id).count()
-            # 统计关联的角色数量
-            roles_count = await menu.roles.all().count() if hasattr(menu, 'roles') else 0
-            
-            menu_dict["stats"] = {
-                "children_count": children_count,
-                "roles_count": roles_count
-            }
-            menu_dict["level"] = await get_menu_level(menu.id)
-            
-            menu_dicts.append(menu_dict)
+        # 转换为字典格式（层级、子菜单数、角色数批量计算）
+        stats_map = await menu_tree_service.get_menu_stats_map()
+        menu_dicts = [
+            menu_tree_service.apply_stats(await menu.to_dict(), stats_map.get(menu.id))
+            for menu in menus
+        ]
         
         # 构建树形结构
         tree_data = build_menu_tree(menu_dicts)
@@ -816,6 +797,7 @@ async def create_menu(
     try:
         # 创建菜单
         new_menu = await menu_controller.create(obj_in=menu_in)
+        await permission_event_manager.emit_menu_changed([new_menu.id], "create", current_user.id)
         
         # 获取创建后的菜单信息
         menu_dict = await new_menu.to_dict()
@@ -932,6 +914,7 @@ async def update_menu(
         
         # 更新菜单
         updated_menu = await menu_controller.update(id=menu_id, obj_in=menu_in)
+        await permission_event_manager.emit_menu_changed([menu_id], "update", current_user.id)
         
         # 获取更新后的菜单信息
         menu_dict = await updated_menu.to_dict()
@@ -1090,6 +1073,7 @@ async def delete_menu(
         
         # 删除菜单
         await menu_controller.remove(id=menu_id)
+        await permission_event_manager.emit_menu_changed([menu_id], "delete", current_user.id)
         
         return formatter.success(
             message="Menu deleted successfully",
@@ -12,6 +12,7 @@ from fastapi import APIRouter, Query, Depends
 from pydantic import BaseModel, Field
 
 from app.models.notification import Notification, UserNotification
+from app.services.notification_counter import unread_counter
 from app.core.response_formatter_v2 import create_formatter
 from app.core.pagination import get_pagination_params, create_pagination_response
 from app.log import logger
@@ -163,6 +164,7 @@ async def create_notification(data: NotificationCreate):
             expire_time=data.expire_time,
         )
         
+        unread_counter.on_published([n])
         logger.info(f"创建通知成功: {n.title}")
         
         formatter = create_formatter()
@@ -190,6 +192,12 @@ async def update_notification(notification_id: int, data: NotificationUpdate):
         n.updated_at = datetime.now()
         await n.save()
         
+        # 发布状态或过期时间可能变化
+        if n.is_published:
+            unread_counter.on_published([n])
+        else:
+            unread_counter.on_withdrawn([n.id])
+        
         logger.info(f"更新通知成功: {n.title}")
         
         formatter = create_formatter()
@@ -211,6 +219,7 @@ async def delete_notification(notification_id: int):
             return formatter.error(message="通知不存在", code=404)
         
         await n.delete()
+        unread_counter.on_withdrawn([notification_id])
         
         logger.info(f"删除通知成功: {notification_id}")
         
@@ -236,6 +245,7 @@ async def publish_notification(notification_id: int):
         n.publish_time = datetime.now()
         n.updated_at = datetime.now()
         await n.save()
+        unread_counter.on_published([n])
         
         logger.info(f"发布通知成功: {n.title}")
         
@@ -260,6 +270,7 @@ async def unpublish_notification(notification_id: int):
         n.is_published = False
         n.updated_at = datetime.now()
         await n.save()
+        unread_counter.on_withdrawn([n.id])
         
         logger.info(f"撤回通知成功: {n.title}")
         
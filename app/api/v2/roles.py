@@ -11,6 +11,7 @@ from tortoise.transactions import in_transaction
 from app.core.response_formatter_v2 import ResponseFormatterV2, APIv2ErrorDetail
 from app.schemas.base import BatchDeleteRequest
 from app.core.dependency import DependAuth
+from app.core.permission_cache import permission_cache_manager
 from app.models.admin import User, Role, Menu, SysApiEndpoint
 from app.core.batch_delete_decorators import require_batch_delete_permission
 from app.controllers.role import role_controller
@@ -690,6 +691,9 @@ async def add_role_users(
                     await UserRole.create(user=user.id, role=role.id)
                     added_users.append(await user.to_dict())
         
+        for user in users:
+            await permission_cache_manager.clear_user_cache(user.id)
+        
         return formatter.success(
             data={
                 "role_id": role_id,
@@ -742,6 +746,7 @@ async def remove_role_user(
         
         # 删除用户角色关系
         await user_role.delete()
+        await permission_cache_manager.clear_user_cache(user_id)
         
         return formatter.success(
             data={
@@ -958,6 +963,9 @@ async def update_role(
                     for menu in menus:
                         await updated_role.menus.add(menu)
         
+        # 角色权限或继承关系变更，失效该角色、子角色及相关用户的权限缓存
+        await permission_cache_manager.clear_role_cache(role_id)
+        
         # 获取更新后的角色信息
         role_dict = await updated_role.to_dict(m2m=True)
         
@@ -1011,6 +1019,7 @@ async def delete_role(
         
         # 删除角色
         await role_controller.remove(id=role_id)
+        await permission_cache_manager.clear_role_cache(role_id)
         
         return formatter.success(
             data=None,
@@ -1137,6 +1146,8 @@ async def add_role_permissions(
             "menu_permissions": await asyncio.gather(*[menu.to_dict() for menu in menus]) if menus else []
         }
         
+        await permission_cache_manager.clear_role_cache(role_id)
+        
         return formatter.success(
             data=permissions_data,
             message="Role permissions added successfully",
@@ -1216,6 +1227,8 @@ async def update_role_permissions(
             "menu_permissions": await asyncio.gather(*[menu.to_dict() for menu in menus]) if menus else []
         }
         
+        await permission_cache_manager.clear_role_cache(role_id)
+        
         return formatter.success(
             data=permissions_data,
             message="Role permissions updated successfully",
@@ -1309,6 +1322,8 @@ async def delete_role_permissions(
             "menus": await asyncio.gather(*[menu.to_dict() for menu in deleted_menus]) if deleted_menus else []
         }
         
+        await permission_cache_manager.clear_role_cache(role_id)
+        
         return formatter.success(
             data=permissions_data,
             message="Permissions removed from role successfully",
@@ -1347,6 +1362,7 @@ async def patch_role(
         update_data = role_in.dict(exclude_unset=True)
         if update_data:
             updated_role = await role_controller.update(id=role_id, obj_in=update_data)
+            await permission_cache_manager.clear_role_cache(role_id)
             role_data = await updated_role.to_dict(m2m=True)
         else:
             role_data = await role.to_dict(m2m=True)
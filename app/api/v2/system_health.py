@@ -2,11 +2,20 @@
 # -*- coding: utf-8 -*-
 """系统健康检查API"""
 
+import hmac
 from datetime import datetime
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.auth_dependencies import DependOptionalAuth
+from app.core.instrumentation import metrics, profile_worker
+from app.settings.config import settings
 from app.settings.ai_settings import ai_settings
 from app.ai_module.loader import ai_loader
 from app.core.response_formatter_v2 import create_formatter
+from app.models.admin import User
 
 router = APIRouter(prefix="/system", tags=["系统健康 v2"])
 
@@ -72,6 +81,12 @@ async def get_ai_module_resources():
         # 获取资源统计
         stats = AIResourceMonitor.get_resource_stats()
         
+        from app.core.cpu_executor import cpu_executor
+        stats["cpu_executor"] = cpu_executor.stats()
+        
+        from app.services.ai.forecast_service import forecast_service
+        stats["forecast_models"] = forecast_service.stats()
+        
         # 添加时间戳
         stats["timestamp"] = datetime.now().isoformat()
         
@@ -88,3 +103,62 @@ async def get_ai_module_resources():
             detail=f"获取资源信息失败: {str(e)}"
         )
 
+
+def _authorize_metrics(request: Request, user: Optional[User], allow_token: bool = False) -> Optional[str]:
+    """校验埋点接口访问权限，返回拒绝原因；Prometheus 可使用静态令牌，其余仅限超级管理员"""
+    if allow_token and settings.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if authorization.startswith("Bearer ") and hmac.compare_digest(
+            authorization[7:], settings.METRICS_TOKEN
+        ):
+            return None
+    if user is None:
+        return "未认证"
+    if not user.is_superuser:
+        return "需要超级管理员权限"
+    return None
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics(request: Request, current_user: Optional[User] = DependOptionalAuth):
+    """当前 worker 的路由 / TDengine / Postgres 耗时直方图（Prometheus 文本格式）"""
+    reason = _authorize_metrics(request, current_user, allow_token=True)
+    if reason:
+        formatter = create_formatter(request)
+        return formatter.unauthorized(reason) if reason == "未认证" else formatter.forbidden(reason)
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@router.get("/metrics/summary")
+async def get_metrics_summary(
+    request: Request,
+    name: Optional[str] = Query(None, description="指标名，如 http_request_duration_seconds"),
+    top: int = Query(20, ge=1, le=200, description="每个指标按累计耗时返回的序列数"),
+    current_user: Optional[User] = DependOptionalAuth,
+):
+    """按累计耗时排序的热点路由与查询模板"""
+    formatter = create_formatter(request)
+    reason = _authorize_metrics(request, current_user)
+    if reason:
+        return formatter.unauthorized(reason) if reason == "未认证" else formatter.forbidden(reason)
+    return formatter.success(data=metrics.snapshot(name=name, top=top))
+
+
+@router.post("/profile")
+async def profile_current_worker(
+    request: Request,
+    seconds: float = Query(10, ge=1, le=60, description="分析时长（秒）"),
+    mode: str = Query("sample", pattern="^(sample|cprofile)$", description="sample：栈采样；cprofile：确定性分析"),
+    top: int = Query(30, ge=1, le=200, description="返回的热点函数数量"),
+    interval_ms: float = Query(5, ge=1, le=100, description="采样间隔（毫秒），仅 sample 模式"),
+    current_user: Optional[User] = DependOptionalAuth,
+):
+    """对处理本请求的 worker 进程进行按需性能分析"""
+    formatter = create_formatter(request)
+    reason = _authorize_metrics(request, current_user)
+    if reason:
+        return formatter.unauthorized(reason) if reason == "未认证" else formatter.forbidden(reason)
+    report = await profile_worker(seconds, mode=mode, top=top, interval=interval_ms / 1000)
+    return formatter.success(data=report, message="性能分析完成")
@@ -13,6 +13,7 @@ from tortoise.expressions import Q, RawSQL
 from tortoise import Tortoise
 
 from app.models.notification import Notification, UserNotification
+from app.services.notification_counter import unread_counter
 from app.core.response_formatter_v2 import create_formatter
 from app.core.pagination import get_pagination_params, create_pagination_response
 from app.log import logger
@@ -91,32 +92,12 @@ async def get_my_notifications(
 
 @router.get("/unread-count", summary="获取未读通知数量")
 async def get_unread_count(user_id: int = Query(..., description="用户ID")):
-    """获取当前用户的未读通知数量"""
+    """获取当前用户的未读通知数量（内存计数；在线时变化通过报警WebSocket推送）"""
     try:
-        now = datetime.now()
-        now_str = now.strftime('%Y-%m-%d %H:%M:%S.%f')
-        
-        # 使用RawSQL绕过Tortoise的timezone转换问题
-        # 配置 use_tz=True 与 asyncpg + TIMESTAMP(naive) 列冲突
-        total_notifications = await Notification.filter(is_published=True).filter(
-            Q(expire_time__isnull=True) | Q(expire_time__gt=RawSQL(f"'{now_str}'"))
-        ).count()
-        
-        read_count = await UserNotification.filter(
-            user_id=user_id, is_read=True, is_deleted=False
-        ).count()
-        
-        deleted_count = await UserNotification.filter(
-            user_id=user_id, is_deleted=True
-        ).count()
-        
-        unread_count = max(0, total_notifications - read_count - deleted_count)
+        count = await unread_counter.get(user_id)
         
         formatter = create_formatter()
-        return formatter.success(
-            data={"unread_count": unread_count, "total": total_notifications},
-            message="获取未读数量成功"
-        )
+        return formatter.success(data=count, message="获取未读数量成功")
         
     except Exception as e:
         logger.error(f"获取未读数量失败: {str(e)}", exc_info=True)
@@ -146,6 +127,7 @@ async def mark_as_read(notification_id: int, user_id: int = Query(..., descripti
         """
         # 参数: user_id, notification_id, is_read=True, read_time=now, is_deleted=False, created_at=now
         await conn.execute_query(sql, [user_id, notification_id, True, now, False, now])
+        unread_counter.on_consumed(user_id, [notification_id])
         
         formatter = create_formatter()
         return formatter.success(message="标记已读成功")
@@ -177,6 +159,7 @@ async def mark_all_as_read(user_id: int = Query(..., description="用户ID")):
         """
         
         await conn.execute_query(sql, [user_id, now])
+        unread_counter.on_all_read(user_id)
         
         formatter = create_formatter()
         return formatter.success(message="全部标记已读成功")
@@ -200,6 +183,7 @@ async def delete_user_notification(notification_id: int, user_id: int = Query(..
         if not created:
             un.is_deleted = True
             await un.save()
+        unread_counter.on_consumed(user_id, [notification_id])
         
         formatter = create_formatter()
         return formatter.success(message="删除通知成功")
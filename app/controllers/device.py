@@ -15,6 +15,7 @@ from app.models.device import (
 )
 from app.schemas.devices import DeviceCreate, DeviceUpdate
 from app.core.query_optimizer import monitor_performance, cached_query
+from app.services.tdengine_table_resolver import tdengine_table_resolver
 
 
 class DeviceController(OptimizedCRUDBase[DeviceInfo, DeviceCreate, DeviceUpdate]):
@@ -68,7 +69,9 @@ class DeviceController(OptimizedCRUDBase[DeviceInfo, DeviceCreate, DeviceUpdate]
             device_type_obj.device_count += 1
             await device_type_obj.save()
 
-            return device
+        # 5. 新设备需要重新解析TDengine表映射
+        await tdengine_table_resolver.invalidate()
+        return device
 
     async def get_related_counts(self, id: int) -> dict:
         """获取设备关联数据的数量"""
@@ -123,6 +126,8 @@ class DeviceController(OptimizedCRUDBase[DeviceInfo, DeviceCreate, DeviceUpdate]
             # 3. 删除设备
             await self.remove(id)
 
+        await tdengine_table_resolver.invalidate()
+
     async def update_device(self, id: int, obj_in: DeviceUpdate) -> DeviceInfo:
         """更新设备信息，并处理设备类型变更时的计数值维护
 
@@ -178,7 +183,12 @@ class DeviceController(OptimizedCRUDBase[DeviceInfo, DeviceCreate, DeviceUpdate]
 
                 # 更新记录
                 await self.model.filter(id=id).update(**update_data)
-                return await self.model.filter(id=id).first()
+                updated_device = await self.model.filter(id=id).first()
+
+            # 设备编号或设备类型变更后，TDengine表映射需要重新解析
+            if updated_device.device_code != device.device_code or updated_device.device_type != old_device_type:
+                await tdengine_table_resolver.invalidate()
+            return updated_device
         except HTTPException:
             raise
         except Exception as e:
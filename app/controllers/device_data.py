@@ -8,6 +8,7 @@ from loguru import logger
 from tortoise.expressions import Q
 
 from app.core.crud import CRUDBase
+from app.core.exceptions import APIException
 from app.models.device import DeviceInfo, DeviceType, DeviceRealTimeData
 from app.models.system import SysDictData
 from app.schemas.devices import DeviceRealTimeDataCreate, DeviceRealtimeQuery
@@ -181,41 +182,92 @@ class DeviceDataController(CRUDBase[DeviceInfo, DeviceRealTimeDataCreate, dict])
         Returns:
             元组(总数量, 历史数据列表)
         """
-        from app.core.tdengine_connector import TDengineConnector
-        from app.models.device import DeviceInfo, DeviceType
-        from datetime import datetime, timezone
+        result = await self.get_device_history_page(
+            device_id=device_id,
+            device_code=device_code,
+            start_time=start_time,
+            end_time=end_time,
+            status=status,
+            page=page,
+            page_size=page_size,
+        )
+        return result["total"] or 0, result["items"]
+
+    async def get_device_history_page(
+        self,
+        device_id: Optional[int] = None,
+        device_code: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        status: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 10,
+        cursor: Optional[str] = None,
+        count_mode: Optional[str] = None,
+        max_points: Optional[int] = None,
+        resolution_mode: Optional[str] = None,
+    ) -> dict:
+        """查询设备历史数据（支持时间游标分页）
+
+        提供 cursor 时按上一页最后一行的时间戳续页（键集分页），忽略 page；
+        未提供时仍兼容 page/OFFSET 分页。每页都会返回 next_cursor。
+
+        Args:
+            device_id: 设备ID
+            device_code: 设备编号
+            start_time: 开始时间
+            end_time: 结束时间
+            status: 设备状态
+            page: 页码（未使用游标时有效）
+            page_size: 每页数量
+            cursor: 上一页返回的续页游标
+            count_mode: 总数统计方式 exact/estimate/none，续页默认 none
+            max_points: 图表最大点数，提供时返回时间范围内降采样后的全部数据（忽略分页）
+            resolution_mode: 降采样方式 auto/raw/lttb/minmax/interval
+
+        Returns:
+            {"items", "total", "total_estimated", "next_cursor", "has_more"}，
+            降采样时额外包含 "downsample"
+        """
+        from app.services.tdengine_table_resolver import tdengine_table_resolver
+        from app.core.tdengine_pagination import (
+            COUNT_ESTIMATE,
+            COUNT_EXACT,
+            COUNT_NONE,
+            TimeCursor,
+            estimate_row_count,
+            keyset_condition,
+            keyset_order_clause,
+            normalize_count_mode,
+            split_page,
+        )
 
         logger.info(
-            f"🔍 [历史数据查询] 开始查询: device_id={device_id}, device_code={device_code}, start_time={start_time}, end_time={end_time}, status={status}, page={page}, page_size={page_size}"
+            f"🔍 [历史数据查询] 开始查询: device_id={device_id}, device_code={device_code}, start_time={start_time}, end_time={end_time}, status={status}, page={page}, page_size={page_size}, cursor={bool(cursor)}"
         )
 
+        empty = {"items": [], "total": 0, "total_estimated": False, "next_cursor": None, "has_more": False}
+        if not device_code:
+            logger.warning("❌ 未提供设备编号，无法查询历史数据")
+            return empty  # 设备编号是必须的
+
+        # 解析游标与计数模式（参数错误直接返回400）
+        time_cursor = TimeCursor.decode(cursor) if cursor else None
+        chart_mode = page_size >= 1000
+        if count_mode is None and chart_mode:
+            # 图表模式：跳过Count查询以提高性能
+            count_mode = COUNT_NONE
+        count_mode = normalize_count_mode(count_mode, has_cursor=time_cursor is not None)
+
+        # 从缓存的设备-表映射解析物理表，不再逐个探测表名；
+        # SELECT * 需要返回 device_code 等标签列，因此有超级表时查询超级表 + 标签过滤
+        resolution = await tdengine_table_resolver.resolve(device_code, include_tags=True)
+        if not resolution:
+            logger.warning(f"❌ 设备编号 {device_code} 不存在或未找到可查询的表 (超级表或子表)")
+            return empty
+
         # 构建查询条件
         conditions = []
-        table_name = None
-        device_info = None
-
-        if device_code:
-            # 验证设备编号是否存在
-            device_info = await DeviceInfo.filter(device_code=device_code).first()
-            if not device_info:
-                logger.warning(f"❌ 设备编号 {device_code} 不存在，无法查询历史数据")
-                return 0, []
-            
-            # 准备可能的表名列表，稍后连接数据库时验证
-            potential_table_names = [
-                f"device_{device_code}",
-                f"device_{device_code.lower()}",
-                f"tb_{device_code.lower()}",
-                f"record_{device_code}",
-                device_code.lower(),
-                device_code
-            ]
-            # 默认使用第一个，如果没有找到合适的，将在后续逻辑中处理
-            table_name = potential_table_names[0]
-            logger.info(f"✅ 设备信息: device_code={device_code}, device_type={device_info.device_type}, 待验证表名={potential_table_names}")
-        else:
-            logger.warning("❌ 未提供设备编号，无法查询历史数据")
-            return 0, []  # 设备编号是必须的
 
         if start_time:
             # TDengine REST API 最好使用 ISO 8601 格式 (UTC) 以避免时区歧义
@@ -238,100 +290,34 @@ class DeviceDataController(CRUDBase[DeviceInfo, DeviceRealTimeDataCreate, dict])
         if status:
             conditions.append(f"device_status = '{status}'")
 
-        # 添加 device_code 作为过滤条件 (用于超级表查询)
-        if device_code:
-             conditions.append(f"device_code = '{device_code}'")
+        # 超级表查询需要 device_code 标签过滤，具体子表不需要
+        device_condition = resolution.device_condition(device_code)
+        if device_condition:
+            conditions.append(device_condition)
 
         where_clause = " AND ".join(conditions) if conditions else "1=1"
 
-        # 获取TDengine配置并初始化连接器
-        from app.settings.config import settings, TDengineCredentials
+        # 对于历史曲线图 (page_size >= 1000)，按时间正序排列；表格视图按时间倒序排列
+        order = "asc" if chart_mode else "desc"
+        if time_cursor:
+            order = time_cursor.order
+        # 超级表中不同子表可能存在相同时间戳，以 tbname 作为次序保证续页不重不漏
+        with_tbname = resolution.needs_device_filter
 
-        tdengine_creds = TDengineCredentials()
-        td_connector = TDengineConnector(
-            host=tdengine_creds.host,
-            port=tdengine_creds.port,
-            user=tdengine_creds.user,
-            password=tdengine_creds.password,
-            database=tdengine_creds.database,
-        )
+        # 复用共享连接器（连接池由解析服务管理，这里不关闭）
+        td_connector = tdengine_table_resolver.get_connector()
         try:
-            target_table = None
-            
-            # 1. 优先尝试从设备类型配置中获取超级表名
-            if device_info and device_info.device_type:
-                device_type_obj = await DeviceType.filter(type_code=device_info.device_type).first()
-                if device_type_obj and device_type_obj.tdengine_stable_name:
-                    # 使用反引号包裹表名，防止大小写问题
-                    target_table = f"`{device_type_obj.tdengine_stable_name}`"
-                    logger.info(f"✅ 从设备类型配置获取到超级表: {target_table}")
-            
-            # 2. 如果没找到配置的超级表，尝试之前的逻辑 (作为回退)
-            if not target_table:
-                # 尝试获取超级表 (旧逻辑，可能不准确)
-                try:
-                    stables_res = await td_connector.query_data("SHOW STABLES")
-                    if stables_res and stables_res.get('data'):
-                        for stable in stables_res['data']:
-                            # stable[0] 是表名
-                            if isinstance(stable, list) and len(stable) > 0 and isinstance(stable[0], str) and 'meters' in stable[0]:
-                                target_table = f"`{stable[0]}`"
-                                break
-                        if not target_table and stables_res['data'] and isinstance(stables_res['data'][0], list):
-                             target_table = f"`{stables_res['data'][0][0]}`"
-                        
-                        if target_table:
-                            logger.info(f"✅ 自动发现超级表: {target_table}")
-                except Exception as e:
-                    logger.warning(f"⚠️ 获取超级表失败: {e}")
-
-                # 3. 如果没找到超级表，尝试子表逻辑
-                if not target_table:
-                    # 检查表是否存在 (尝试多个可能的表名)
-                    found_table = None
-                    for name in potential_table_names:
-                        # TDengine 表名可能包含特殊字符，需要用反引号包裹
-                        # 但 SHOW TABLES LIKE 不需要包裹，它匹配的是字符串
-                        check_table_sql = f"SHOW TABLES LIKE '{name}'"
-                        logger.info(f"🔍 检查表是否存在: {check_table_sql}")
-                        try:
-                            table_check_result = await td_connector.query_data(check_table_sql)
-                            if table_check_result and table_check_result.get('data'):
-                                # 确保找到的表名是正确的
-                                found_table = name
-                                logger.info(f"✅ 找到表: {found_table}")
-                                break
-                        except Exception as e:
-                            logger.warning(f"⚠️ 检查表 {name} 失败: {e}")
-                    
-                    if found_table:
-                        # 构造查询时，表名必须加反引号，特别是当表名包含连字符时
-                        target_table = f"`{found_table}`"
-                        # 如果是具体子表，不需要 device_code 过滤条件
-                        conditions_sub = [c for c in conditions if not c.startswith("device_code =")]
-                        where_clause = " AND ".join(conditions_sub) if conditions_sub else "1=1"
-            
-            if not target_table:
-                logger.warning(f"❌ 未找到可查询的表 (超级表或子表)")
-                await td_connector.close()
-                return 0, []
-            
-            table_name = target_table
-            logger.info(f"🚀 最终查询表名: {table_name}, 条件: {where_clause}")
-            
-            # 使用 SELECT * 查询所有字段
-            # 对于历史曲线图 (page_size >= 1000)，按时间正序排列，并限制返回数量防止超时
-            # 对于表格视图，按时间倒序排列，支持分页
-            if page_size >= 1000:
-                # 图表模式：跳过Count查询以提高性能，且限制最大返回数量
-                total_count = 0 
-                # 安全限制：即使是图表模式，也限制最大返回数量（例如 page_size 或 5000）
-                # 这里使用传入的 page_size 作为限制，前端应负责传入合适的大小
-                limit = page_size
-                query_sql = f"SELECT * FROM {table_name} WHERE {where_clause} ORDER BY ts ASC LIMIT {limit}"
-                logger.info(f"🔍 执行查询（图表模式 - 限制{limit}条）: {query_sql}")
-            else:
-                # 表格模式：需要Count查询
+            table_name = resolution.from_clause
+            logger.info(f"🚀 最终查询表名: {table_name} ({resolution.kind}), 条件: {where_clause}")
+
+            if max_points:
+                return await self._query_downsampled_history(
+                    td_connector, resolution, device_code, where_clause, max_points, resolution_mode,
+                )
+
+            total_count = None
+            total_estimated = False
+            if count_mode == COUNT_EXACT:
                 count_sql = f"SELECT count(*) FROM {table_name} WHERE {where_clause}"
                 logger.info(f"🔍 查询总数: {count_sql}")
                 count_result = await td_connector.query_data(count_sql)
@@ -340,14 +326,26 @@ class DeviceDataController(CRUDBase[DeviceInfo, DeviceRealTimeDataCreate, dict])
 
                 if total_count == 0:
                     logger.warning(f"⚠️ 没有找到符合条件的历史数据")
-                    await td_connector.close()
-                    return 0, []
-
-                # 构建分页查询
-                offset = (page - 1) * page_size
-                limit = page_size
-                query_sql = f"SELECT * FROM {table_name} WHERE {where_clause} ORDER BY ts DESC LIMIT {limit} OFFSET {offset}"
-                logger.info(f"🔍 执行分页查询（表格模式）: {query_sql}")
+                    return empty
+            elif count_mode == COUNT_ESTIMATE and not with_tbname:
+                # 块元数据只能按物理表估算，超级表+标签过滤时不估算
+                total_count = await estimate_row_count(td_connector, table_name, start_time, end_time)
+                total_estimated = total_count is not None
+
+            # 使用 SELECT * 查询所有字段，多取一行用于判断是否还有下一页
+            select_clause = "SELECT *, tbname" if with_tbname else "SELECT *"
+            page_where = where_clause
+            offset_clause = ""
+            if time_cursor:
+                page_where = f"{where_clause} AND {keyset_condition(time_cursor, with_tbname)}"
+            elif page > 1 and not chart_mode:
+                # 兼容旧的页码分页（图表模式始终从头读取）
+                offset_clause = f" OFFSET {(page - 1) * page_size}"
+            query_sql = (
+                f"{select_clause} FROM {table_name} WHERE {page_where} "
+                f"{keyset_order_clause(order, with_tbname)} LIMIT {page_size + 1}{offset_clause}"
+            )
+            logger.info(f"🔍 执行分页查询（{'游标' if time_cursor else '页码'}）: {query_sql}")
 
             query_result = await td_connector.query_data(query_sql)
             
@@ -373,15 +371,64 @@ class DeviceDataController(CRUDBase[DeviceInfo, DeviceRealTimeDataCreate, dict])
             else:
                 logger.warning(f"⚠️ 查询结果为空或格式不正确: {query_result}")
 
-            await td_connector.close()
+            result_list, next_cursor = split_page(result_list, page_size, order, with_tbname)
             logger.info(f"✅ 历史数据查询完成: 返回 {len(result_list)} 条记录")
-            return total_count, result_list
+            return {
+                "items": result_list,
+                "total": total_count,
+                "total_estimated": total_estimated,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None,
+            }
 
+        except APIException:
+            # 参数错误（如降采样方式无效）保持原状态码
+            raise
         except Exception as e:
             logger.error(f"❌ 查询设备历史数据失败: {e}", exc_info=True)
-            await td_connector.close()
             raise HTTPException(status_code=500, detail=f"查询设备历史数据失败: {e}")
 
+    async def _query_downsampled_history(
+        self,
+        td_connector: TDengineConnector,
+        resolution,
+        device_code: str,
+        where_clause: str,
+        max_points: int,
+        resolution_mode: Optional[str],
+    ) -> dict:
+        """按 max_points 返回降采样后的历史曲线数据
+
+        auto 模式先用 count(*)（TDengine 可直接利用块统计信息）判断原始点数：
+        不超过 max_points 原样返回；不超过原始数据上限时取回原始数据做 LTTB；
+        否则由 TDengine INTERVAL 聚合每个窗口的 MIN/MAX，只返回包络点。
+        """
+        from app.services.downsampling_service import downsampling_service
+
+        items, info = await downsampling_service.query(
+            td_connector,
+            resolution.from_clause,
+            where_clause,
+            max_points,
+            resolution_mode,
+            extra={"device_code": device_code},
+        )
+        info.pop("sql", None)
+        logger.info(f"📉 历史数据降采样: 原始 {info['source_points']} 点, max_points={max_points}, 方式={info['method']}")
+
+        for item in items:
+            if "ts" in item:
+                item["data_timestamp"] = item["ts"]
+
+        return {
+            "items": items,
+            "total": info["source_points"],
+            "total_estimated": False,
+            "next_cursor": None,
+            "has_more": False,
+            "downsample": info,
+        }
+
     async def update_device_realtime_data(self, device_id: int, data: dict) -> DeviceRealTimeData:
         """更新设备实时数据（覆盖式更新）
 
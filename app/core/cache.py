@@ -5,7 +5,7 @@
 """
 import json
 import logging
-from typing import Any, Callable, Optional, Union
+from typing import Any, Callable, List, Optional, Union
 from datetime import datetime, timedelta
 import redis.asyncio as redis
 from app.settings import settings
@@ -20,6 +20,9 @@ class CacheManager:
         self.redis_client: Optional[redis.Redis] = None
         self.default_ttl = 3600  # 1小时默认过期时间
         self.permission_ttl = 1800  # 权限缓存30分钟
+        self.tag_prefix = "tag:"
+        self.tag_ttl = 86400  # 标签集合TTL，需不短于任何被标记缓存的TTL
+        self.scan_batch_size = 500
         
     async def init_redis(self):
         """初始化Redis连接"""
@@ -61,13 +64,21 @@ class CacheManager:
             logger.error(f"获取缓存失败 key={key}: {e}")
             return None
     
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """设置缓存值"""
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> bool:
+        """设置缓存值，tags 用于按标签失效"""
         try:
             if self.redis_client:
                 ttl = ttl or self.default_ttl
                 serialized_value = json.dumps(value, default=str, ensure_ascii=False)
-                await self.redis_client.setex(key, ttl, serialized_value)
+                if tags:
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    pipe.setex(key, ttl, serialized_value)
+                    for tag in tags:
+                        pipe.sadd(f"{self.tag_prefix}{tag}", key)
+                        pipe.expire(f"{self.tag_prefix}{tag}", max(ttl, self.tag_ttl))
+                    await pipe.execute()
+                else:
+                    await self.redis_client.setex(key, ttl, serialized_value)
                 return True
             return False
         except Exception as e:
@@ -86,19 +97,48 @@ class CacheManager:
             return False
     
     async def delete_pattern(self, pattern: str) -> int:
-        """批量删除匹配模式的缓存"""
+        """批量删除匹配模式的缓存（SCAN+UNLINK，不阻塞Redis）"""
         try:
             if self.redis_client:
-                keys = await self.redis_client.keys(pattern)
-                if keys:
-                    deleted_count = await self.redis_client.delete(*keys)
+                deleted_count = 0
+                batch = []
+                async for key in self.redis_client.scan_iter(match=pattern, count=self.scan_batch_size):
+                    batch.append(key)
+                    if len(batch) >= self.scan_batch_size:
+                        deleted_count += await self.redis_client.unlink(*batch)
+                        batch = []
+                if batch:
+                    deleted_count += await self.redis_client.unlink(*batch)
+                if deleted_count:
                     logger.info(f"批量删除缓存: {deleted_count} 个key")
-                    return deleted_count
+                return deleted_count
             return 0
         except Exception as e:
             logger.error(f"批量删除缓存失败 pattern={pattern}: {e}")
             return 0
     
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        """按标签失效缓存：分批UNLINK标签集合成员及集合本身"""
+        try:
+            if not self.redis_client:
+                return 0
+            deleted_count = 0
+            for tag in tags:
+                tag_key = f"{self.tag_prefix}{tag}"
+                batch = []
+                async for member in self.redis_client.sscan_iter(tag_key, count=self.scan_batch_size):
+                    batch.append(member)
+                    if len(batch) >= self.scan_batch_size:
+                        deleted_count += await self.redis_client.unlink(*batch)
+                        batch = []
+                if batch:
+                    deleted_count += await self.redis_client.unlink(*batch)
+                await self.redis_client.unlink(tag_key)
+            return deleted_count
+        except Exception as e:
+            logger.error(f"按标签失效缓存失败 tags={tags}: {e}")
+            return 0
+    
     async def get_or_set(self, key: str, func: Callable, ttl: Optional[int] = None) -> Any:
         """获取缓存或设置缓存"""
         # 先尝试从缓存获取
@@ -154,7 +194,12 @@ class PermissionCache:
         self.permission_prefix = "perm"
         self.user_roles_prefix = "user_roles"
         self.role_permissions_prefix = "role_perms"
+        self.permission_tag = "perm"
         
+    def _user_tags(self, user_id: int) -> List[str]:
+        """用户级权限缓存的失效标签"""
+        return [self.permission_tag, f"user:{user_id}"]
+    
     def _get_user_permission_key(self, user_id: int, resource: str, action: str) -> str:
         """获取用户权限缓存key"""
         return f"{self.permission_prefix}:user:{user_id}:{resource}:{action}"
@@ -179,7 +224,7 @@ class PermissionCache:
     async def set_user_permission(self, user_id: int, resource: str, action: str, has_permission: bool) -> bool:
         """设置用户权限缓存"""
         key = self._get_user_permission_key(user_id, resource, action)
-        return await self.cache.set(key, has_permission, self.cache.permission_ttl)
+        return await self.cache.set(key, has_permission, self.cache.permission_ttl, tags=self._user_tags(user_id))
     
     async def get_user_roles(self, user_id: int) -> Optional[list]:
         """获取用户角色缓存"""
@@ -189,7 +234,7 @@ class PermissionCache:
     async def set_user_roles(self, user_id: int, roles: list) -> bool:
         """设置用户角色缓存"""
         key = self._get_user_roles_key(user_id)
-        return await self.cache.set(key, roles, self.cache.permission_ttl)
+        return await self.cache.set(key, roles, self.cache.permission_ttl, tags=self._user_tags(user_id))
     
     async def get_user_api_permissions(self, user_id: int) -> Optional[list]:
         """获取用户API权限缓存"""
@@ -199,51 +244,36 @@ class PermissionCache:
     async def set_user_api_permissions(self, user_id: int, permissions: list) -> bool:
         """设置用户API权限缓存"""
         key = self._get_user_api_permissions_key(user_id)
-        return await self.cache.set(key, permissions, self.cache.permission_ttl)
+        return await self.cache.set(key, permissions, self.cache.permission_ttl, tags=self._user_tags(user_id))
     
     async def invalidate_user_permissions(self, user_id: int) -> int:
         """清除用户所有权限缓存"""
-        patterns = [
-            f"{self.permission_prefix}:user:{user_id}:*",
-            f"{self.permission_prefix}:api:user:{user_id}",
-            f"{self.user_roles_prefix}:user:{user_id}"
-        ]
-        
-        total_deleted = 0
-        for pattern in patterns:
-            deleted = await self.cache.delete_pattern(pattern)
-            total_deleted += deleted
+        total_deleted = await self.cache.invalidate_tags([f"user:{user_id}"])
         
         logger.info(f"清除用户 {user_id} 的权限缓存，共删除 {total_deleted} 个缓存项")
         return total_deleted
     
     async def invalidate_role_permissions(self, role_id: int) -> int:
         """清除角色相关的权限缓存"""
-        # 这里需要找到所有拥有该角色的用户，然后清除他们的权限缓存
-        # 为简化实现，我们清除所有权限缓存
-        patterns = [
-            f"{self.permission_prefix}:*",
-            f"{self.user_roles_prefix}:*",
-            f"{self.role_permissions_prefix}:role:{role_id}"
-        ]
-        
-        total_deleted = 0
-        for pattern in patterns:
-            deleted = await self.cache.delete_pattern(pattern)
-            total_deleted += deleted
+        # 用户级缓存未记录角色信息，角色变更时失效全部权限标签（集合删除，无需KEYS扫描）
+        total_deleted = await self.cache.invalidate_tags([self.permission_tag])
+        if await self.cache.delete(self._get_role_permissions_key(role_id)):
+            total_deleted += 1
         
         logger.info(f"清除角色 {role_id} 相关的权限缓存，共删除 {total_deleted} 个缓存项")
         return total_deleted
     
     async def clear_all_permissions(self) -> int:
         """清除所有权限缓存"""
+        total_deleted = await self.cache.invalidate_tags([self.permission_tag])
+        
+        # 未登记标签的旧版键，使用SCAN兜底
         patterns = [
             f"{self.permission_prefix}:*",
             f"{self.user_roles_prefix}:*",
             f"{self.role_permissions_prefix}:*"
         ]
         
-        total_deleted = 0
         for pattern in patterns:
             deleted = await self.cache.delete_pattern(pattern)
             total_deleted += deleted
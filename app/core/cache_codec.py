@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+缓存编解码器
+
+为Redis缓存提供带类型标记的二进制序列化：
+- 首字节为格式标记（低3位为编码格式，第3/4位为压缩算法）
+- 普通数据优先使用 msgpack / orjson，pickle 仅在显式指定时使用
+- 超过阈值的负载可选 zstd / lz4 压缩
+- 拒绝缓存ORM实例，避免把整个模型对象图序列化进Redis
+- 按键前缀统计负载大小与编解码耗时
+
+类型还原约定：
+- msgpack 以扩展类型保留 tuple / set / frozenset；orjson（JSON）格式中三者解码为 list
+- Decimal、UUID、日期时间编码为字符串（与旧版 json.dumps(default=str) 一致，日期时间为ISO格式）
+- Enum 编码为其值，pydantic 模型编码为 model_dump(mode="json")
+- 其他无法编码的对象记录警告后按 str() 缓存（兼容旧版行为），不再整体失败
+"""
+
+import io
+import json
+import pickle
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Optional, Set, Tuple
+from uuid import UUID
+
+import orjson
+
+from app.log import logger
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - 可选依赖
+    lz4_frame = None
+
+try:
+    from tortoise.models import Model as _OrmModel
+except ImportError:  # pragma: no cover
+    _OrmModel = None
+
+
+# 编码格式（低3位）
+FORMAT_ORJSON = 0x01
+FORMAT_MSGPACK = 0x02
+FORMAT_PICKLE = 0x03
+FORMAT_TEXT = 0x04
+
+# 压缩算法（第3/4位）
+COMPRESS_NONE = 0x00
+COMPRESS_ZSTD = 0x08
+COMPRESS_LZ4 = 0x10
+
+_FORMAT_MASK = 0x07
+_COMPRESS_MASK = 0x18
+
+# 标记字节全部小于0x20，不会与旧版JSON文本（可打印字符）或pickle（0x80）冲突
+_MAX_TAG = 0x1F
+
+# msgpack 扩展类型编号：负载为元素列表
+EXT_TUPLE = 1
+EXT_SET = 2
+EXT_FROZENSET = 3
+
+_EXT_CONTAINERS = {EXT_TUPLE: tuple, EXT_SET: set, EXT_FROZENSET: frozenset}
+
+_warned_types: Set[type] = set()
+
+
+class CacheCodecError(TypeError):
+    """缓存值无法编码"""
+
+
+def _reject_orm(obj: Any) -> None:
+    if _OrmModel is not None and isinstance(obj, _OrmModel):
+        raise CacheCodecError(
+            f"不允许缓存ORM实例 {type(obj).__name__}，请先转换为字典或仅缓存主键"
+        )
+
+
+def _fallback(obj: Any) -> Any:
+    """通用类型转换；其余对象按 str() 缓存，每种类型只警告一次"""
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (Decimal, UUID)):
+        return str(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "tolist"):  # numpy 数组/标量
+        return obj.tolist()
+    if type(obj) not in _warned_types:
+        _warned_types.add(type(obj))
+        logger.warning(f"缓存值类型 {type(obj).__name__} 无法直接编码，已按字符串缓存")
+    return str(obj)
+
+
+def _orjson_default(obj: Any) -> Any:
+    _reject_orm(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return _fallback(obj)
+
+
+def _msgpack_pack(value: Any) -> bytes:
+    # strict_types: tuple 及 dict/list/int/str 的子类交给 default 处理，tuple 才能保留类型
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True, strict_types=True)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    """与orjson保持一致：日期时间编码为ISO字符串，Decimal/UUID编码为字符串；tuple/set 保留类型"""
+    _reject_orm(obj)
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(EXT_TUPLE, _msgpack_pack(list(obj)))
+    if isinstance(obj, frozenset):
+        return msgpack.ExtType(EXT_FROZENSET, _msgpack_pack(list(obj)))
+    if isinstance(obj, set):
+        return msgpack.ExtType(EXT_SET, _msgpack_pack(list(obj)))
+    if isinstance(obj, (datetime, date, dt_time)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    # 内置类型的子类（如 OrderedDict、defaultdict）按基础类型编码
+    for base in (int, float, str, bytes, dict, list):
+        if isinstance(obj, base):
+            return base(obj)
+    return _fallback(obj)
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    container = _EXT_CONTAINERS.get(code)
+    if container is None:
+        return msgpack.ExtType(code, data)
+    return container(_msgpack_unpack(data))
+
+
+def _msgpack_unpack(payload) -> Any:
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False, ext_hook=_msgpack_ext_hook)
+
+
+class _OrmRejectingPickler(pickle.Pickler):
+    """显式pickle时同样拒绝ORM实例"""
+
+    def reducer_override(self, obj):
+        _reject_orm(obj)
+        return NotImplemented
+
+
+@dataclass
+class CodecPrefixStats:
+    """单个键前缀的编解码统计"""
+
+    encode_count: int = 0
+    decode_count: int = 0
+    total_bytes: int = 0
+    max_bytes: int = 0
+    compressed_count: int = 0
+    encode_time: float = 0.0
+    decode_time: float = 0.0
+    formats: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "encode_count": self.encode_count,
+            "decode_count": self.decode_count,
+            "avg_bytes": round(self.total_bytes / self.encode_count, 1) if self.encode_count else 0,
+            "max_bytes": self.max_bytes,
+            "total_bytes": self.total_bytes,
+            "compressed_count": self.compressed_count,
+            "avg_encode_ms": round(self.encode_time * 1000 / self.encode_count, 3) if self.encode_count else 0,
+            "avg_decode_ms": round(self.decode_time * 1000 / self.decode_count, 3) if self.decode_count else 0,
+            "formats": dict(self.formats),
+        }
+
+
+_FORMAT_NAMES = {
+    FORMAT_ORJSON: "orjson",
+    FORMAT_MSGPACK: "msgpack",
+    FORMAT_PICKLE: "pickle",
+    FORMAT_TEXT: "text",
+}
+
+_KEY_PREFIX_PATTERN = re.compile(r"[_:]")
+
+
+def key_prefix_of(key: str) -> str:
+    """提取用于统计的键前缀：截断到第一个包含数字的片段之前"""
+    parts = _KEY_PREFIX_PATTERN.split(key)
+    prefix = []
+    for part in parts:
+        if any(ch.isdigit() for ch in part):
+            break
+        prefix.append(part)
+    return "_".join(prefix) or key
+
+
+class CacheCodec:
+    """带类型标记的缓存编解码器"""
+
+    def __init__(
+        self,
+        prefer: str = "msgpack",
+        compression: str = "auto",
+        compress_threshold: int = 4096,
+        compress_level: int = 3,
+    ):
+        self.prefer = prefer if prefer != "msgpack" or msgpack is not None else "orjson"
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.compression = self._resolve_compression(compression)
+        self._zstd_compressor = zstandard.ZstdCompressor(level=compress_level) if zstandard else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+        self._stats: Dict[str, CodecPrefixStats] = {}
+
+    @staticmethod
+    def _resolve_compression(compression: str) -> int:
+        if compression == "auto":
+            if zstandard is not None:
+                return COMPRESS_ZSTD
+            if lz4_frame is not None:
+                return COMPRESS_LZ4
+            return COMPRESS_NONE
+        if compression == "zstd" and zstandard is not None:
+            return COMPRESS_ZSTD
+        if compression == "lz4" and lz4_frame is not None:
+            return COMPRESS_LZ4
+        if compression not in ("none", "zstd", "lz4"):
+            logger.warning(f"未知的缓存压缩算法 {compression}，已禁用压缩")
+        return COMPRESS_NONE
+
+    def _stats_for(self, key: Optional[str]) -> CodecPrefixStats:
+        prefix = key_prefix_of(key) if key else "-"
+        stats = self._stats.get(prefix)
+        if stats is None:
+            stats = self._stats[prefix] = CodecPrefixStats()
+        return stats
+
+    def _serialize(self, value: Any, method: str) -> Tuple[int, bytes]:
+        if method == "pickle":
+            buffer = io.BytesIO()
+            _OrmRejectingPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(value)
+            return FORMAT_PICKLE, buffer.getvalue()
+        if method not in ("json", "msgpack", "orjson"):
+            return FORMAT_TEXT, str(value).encode("utf-8")
+        if method != "orjson" and self.prefer == "msgpack":
+            return FORMAT_MSGPACK, _msgpack_pack(value)
+        try:
+            return FORMAT_ORJSON, orjson.dumps(
+                value, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
+        except orjson.JSONEncodeError as e:
+            # orjson 会把 default 中抛出的异常包装为 JSONEncodeError
+            if isinstance(e.__cause__, CacheCodecError):
+                raise e.__cause__ from None
+            raise CacheCodecError(f"缓存值无法编码为JSON: {e}") from e
+
+    def _compress(self, payload: bytes) -> Tuple[int, bytes]:
+        if self.compression == COMPRESS_NONE or len(payload) < self.compress_threshold:
+            return COMPRESS_NONE, payload
+        if self.compression == COMPRESS_ZSTD:
+            return COMPRESS_ZSTD, self._zstd_compressor.compress(payload)
+        return COMPRESS_LZ4, lz4_frame.compress(payload, compression_level=self.compress_level)
+
+    def _decompress(self, compress: int, payload: bytes) -> bytes:
+        if compress == COMPRESS_ZSTD:
+            if self._zstd_decompressor is None:
+                raise CacheCodecError("缓存值使用zstd压缩，但未安装zstandard")
+            return self._zstd_decompressor.decompress(payload)
+        if compress == COMPRESS_LZ4:
+            if lz4_frame is None:
+                raise CacheCodecError("缓存值使用lz4压缩，但未安装lz4")
+            return lz4_frame.decompress(payload)
+        return payload
+
+    def encode(self, value: Any, serialize_method: str = "json", key: Optional[str] = None) -> bytes:
+        """编码缓存值，ORM实例抛出 CacheCodecError"""
+        start = time.perf_counter()
+        fmt, payload = self._serialize(value, serialize_method)
+        compress, payload = self._compress(payload)
+        data = bytes((fmt | compress,)) + payload
+
+        stats = self._stats_for(key)
+        stats.encode_count += 1
+        stats.encode_time += time.perf_counter() - start
+        stats.total_bytes += len(data)
+        stats.max_bytes = max(stats.max_bytes, len(data))
+        if compress:
+            stats.compressed_count += 1
+        fmt_name = _FORMAT_NAMES[fmt]
+        stats.formats[fmt_name] = stats.formats.get(fmt_name, 0) + 1
+        return data
+
+    def decode(self, data: Any, key: Optional[str] = None) -> Any:
+        """解码缓存值，兼容旧版JSON文本与pickle数据"""
+        start = time.perf_counter()
+        try:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if not data or data[0] > _MAX_TAG or not data[0] & _FORMAT_MASK:
+                return self._decode_legacy(data)
+
+            tag = data[0]
+            fmt = tag & _FORMAT_MASK
+            payload = self._decompress(tag & _COMPRESS_MASK, memoryview(data)[1:])
+            if fmt == FORMAT_MSGPACK:
+                if msgpack is None:
+                    raise CacheCodecError("缓存值为msgpack格式，但未安装msgpack")
+                return _msgpack_unpack(payload)
+            if fmt == FORMAT_ORJSON:
+                return orjson.loads(payload)
+            if fmt == FORMAT_PICKLE:
+                return pickle.loads(payload)
+            if fmt == FORMAT_TEXT:
+                return bytes(payload).decode("utf-8")
+            raise CacheCodecError(f"未知的缓存格式标记 0x{tag:02x}")
+        finally:
+            stats = self._stats_for(key)
+            stats.decode_count += 1
+            stats.decode_time += time.perf_counter() - start
+
+    @staticmethod
+    def _decode_legacy(data: bytes) -> Any:
+        """旧版缓存值：JSON文本，其次pickle，最后原始字符串"""
+        try:
+            return json.loads(data)
+        except (json.JSONDecodeError, UnicodeDecodeError, TypeError):
+            try:
+                return pickle.loads(data)
+            except Exception:
+                return data.decode("utf-8", errors="replace")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """按键前缀返回编解码统计，按总字节数降序"""
+        ordered = sorted(self._stats.items(), key=lambda item: item[1].total_bytes, reverse=True)
+        return {
+            "prefer": self.prefer,
+            "compression": {COMPRESS_NONE: "none", COMPRESS_ZSTD: "zstd", COMPRESS_LZ4: "lz4"}[self.compression],
+            "compress_threshold": self.compress_threshold,
+            "prefixes": {prefix: stats.to_dict() for prefix, stats in ordered},
+        }
+
+    def reset_stats(self) -> None:
+        self._stats.clear()
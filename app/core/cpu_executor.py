@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+CPU密集计算进程池
+
+ARIMA拟合、孤立森林检测、FFT特征等纯计算任务在 async 处理函数中直接执行会阻塞事件循环，
+同一 worker 上的其他请求（包括 WebSocket）都会随之停顿。本模块提供受管的 ProcessPoolExecutor：
+
+- await run_cpu(fn, *args, **kwargs)：在子进程中执行，事件循环只等待结果
+- 有界排队：执行中 + 排队的任务数超过 workers + max_queue 时直接拒绝（503），不无限堆积
+- 超时：超过 timeout 返回 504；已在子进程中运行的任务无法中断，会继续占用名额直至结束
+- 共享内存：超过阈值的 NumPy 数组参数放入 multiprocessing.shared_memory，
+  子进程按 (名称, 形状, dtype) 直接映射，不经过 pickle 复制
+- 指标：排队等待时间、计算时间、拒绝/超时/失败次数
+
+fn 及参数需可被 pickle（模块级函数、静态方法或可序列化实例的绑定方法）。
+"""
+
+import asyncio
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.exceptions import ComputeTimeoutException, ServiceBusyException
+from app.core.instrumentation import metrics
+from app.log import logger
+from app.settings.ai_settings import ai_settings
+
+
+class SharedArray:
+    """共享内存中的数组句柄，跨进程只传递名称、形状与 dtype"""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __reduce__(self):
+        return SharedArray, (self.name, self.shape, self.dtype)
+
+
+def _share_array(array: np.ndarray) -> Tuple[SharedArray, shared_memory.SharedMemory]:
+    """父进程：将数组复制进新建的共享内存段"""
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return SharedArray(shm.name, array.shape, array.dtype.str), shm
+
+
+def _open_shared(name: str) -> shared_memory.SharedMemory:
+    try:
+        # 子进程只读映射，生命周期由父进程管理（Python 3.13+ 可关闭资源跟踪）
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _resolve(value: Any, segments: List[shared_memory.SharedMemory]) -> Any:
+    if isinstance(value, SharedArray):
+        shm = _open_shared(value.name)
+        segments.append(shm)
+        array = np.ndarray(value.shape, dtype=np.dtype(value.dtype), buffer=shm.buf)
+        array.flags.writeable = False
+        return array
+    return value
+
+
+def _invoke(fn: Callable, args: tuple, kwargs: dict) -> Tuple[bytes, float, float]:
+    """子进程入口：映射共享数组、执行并返回 (序列化结果, 开始时刻, 计算耗时)"""
+    started_at = time.perf_counter()
+    segments: List[shared_memory.SharedMemory] = []
+    try:
+        args = tuple(_resolve(arg, segments) for arg in args)
+        kwargs = {key: _resolve(value, segments) for key, value in kwargs.items()}
+        # 结果可能引用映射区（如返回输入的视图），须在解除映射前序列化
+        payload = pickle.dumps(fn(*args, **kwargs), protocol=pickle.HIGHEST_PROTOCOL)
+        return payload, started_at, time.perf_counter() - started_at
+    finally:
+        del args, kwargs
+        for shm in segments:
+            shm.close()
+
+
+class CPUExecutor:
+    """受管的CPU计算进程池"""
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queue: int = 32,
+        timeout: float = 60.0,
+        share_threshold_bytes: int = 1024 * 1024,
+        start_method: str = "spawn",
+    ):
+        """
+        初始化进程池（子进程在首次提交时才创建）
+
+        Args:
+            max_workers: 子进程数
+            max_queue: 除正在执行的任务外允许排队的任务数
+            timeout: 默认超时秒数（含排队时间）
+            share_threshold_bytes: 超过该大小的 NumPy 数组参数走共享内存
+            start_method: 子进程启动方式；默认 spawn，避免在持有锁的多线程进程中 fork
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.share_threshold_bytes = share_threshold_bytes
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self.queue_wait = metrics.histogram(
+            "cpu_executor_queue_wait_seconds", "CPU计算进程池排队等待时间"
+        ).labels()
+        self.compute = metrics.histogram("cpu_executor_compute_seconds", "CPU计算进程池子进程计算时间").labels()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.shared_bytes = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+            )
+            logger.info(f"CPU计算进程池已创建: workers={self.max_workers}, start_method={self.start_method}")
+        return self._pool
+
+    def _pack(self, value: Any, segments: List[shared_memory.SharedMemory]) -> Any:
+        if isinstance(value, np.ndarray) and value.dtype != object and value.nbytes >= self.share_threshold_bytes:
+            handle, shm = _share_array(value)
+            segments.append(shm)
+            self.shared_bytes += value.nbytes
+            return handle
+        return value
+
+    def _release(self, segments: List[shared_memory.SharedMemory]) -> None:
+        self._in_flight -= 1
+        for shm in segments:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    async def run(self, fn: Callable, *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """
+        在进程池中执行 fn(*args, **kwargs)
+
+        Raises:
+            ServiceBusyException: 排队已满
+            ComputeTimeoutException: 超时
+        """
+        if self._in_flight >= self.capacity:
+            self.rejected += 1
+            raise ServiceBusyException(
+                message="计算队列已满，请稍后重试",
+                details={"in_flight": self._in_flight, "capacity": self.capacity},
+            )
+
+        loop = asyncio.get_running_loop()
+        segments: List[shared_memory.SharedMemory] = []
+        try:
+            packed_args = tuple(self._pack(arg, segments) for arg in args)
+            packed_kwargs = {key: self._pack(value, segments) for key, value in kwargs.items()}
+            submitted_at = time.perf_counter()
+            future = self._get_pool().submit(_invoke, fn, packed_args, packed_kwargs)
+        except BaseException as e:
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+            raise
+        # 名额与共享内存在子进程真正结束后才释放：超时返回时任务可能仍在运行
+        self._in_flight += 1
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, segments))
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            payload, started_at, compute_seconds = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            future.cancel()  # 尚未开始的任务直接取消
+            raise ComputeTimeoutException(
+                message=f"计算超时（{timeout:g}秒）",
+                details={"function": getattr(fn, "__qualname__", repr(fn))},
+            )
+        except BrokenProcessPool:
+            self.failed += 1
+            self._pool = None
+            logger.error("CPU计算进程池异常终止，将在下次提交时重建")
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+        self.completed += 1
+        self.queue_wait.record(max(started_at - submitted_at, 0.0))
+        self.compute.record(compute_seconds)
+        return pickle.loads(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "started": self._pool is not None,
+            "in_flight": self._in_flight,
+            "capacity": self.capacity,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "shared_mb": round(self.shared_bytes / 1024 / 1024, 2),
+            "queue_wait": self.queue_wait.snapshot(),
+            "compute": self.compute.snapshot(),
+        }
+
+    async def shutdown(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.get_running_loop().run_in_executor(None, lambda: pool.shutdown(cancel_futures=True))
+            logger.info("CPU计算进程池已关闭")
+
+
+# 创建全局实例
+cpu_executor = CPUExecutor(
+    max_workers=ai_settings.ai_cpu_workers,
+    max_queue=ai_settings.ai_cpu_max_queue,
+    timeout=ai_settings.ai_cpu_task_timeout,
+    share_threshold_bytes=ai_settings.ai_cpu_share_threshold_kb * 1024,
+    start_method=ai_settings.ai_cpu_start_method,
+)
+
+
+async def run_cpu(fn: Callable, *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+    """在CPU计算进程池中执行 fn，不阻塞事件循环"""
+    return await cpu_executor.run(fn, *args, timeout=timeout, **kwargs)
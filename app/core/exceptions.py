@@ -108,6 +108,26 @@ class ExternalServiceException(APIException):
             error_code="EXTERNAL_SERVICE_ERROR"
         )
 
+class ServiceBusyException(APIException):
+    """服务繁忙异常"""
+    def __init__(self, message: str = "服务繁忙，请稍后重试", details: dict = None):
+        super().__init__(
+            message=message,
+            code=503,
+            details=details,
+            error_code="SERVICE_BUSY"
+        )
+
+class ComputeTimeoutException(APIException):
+    """计算超时异常"""
+    def __init__(self, message: str = "计算超时", details: dict = None):
+        super().__init__(
+            message=message,
+            code=504,
+            details=details,
+            error_code="COMPUTE_TIMEOUT"
+        )
+
 
 # 标准化异常处理器
 async def api_exception_handler(request: Request, exc: APIException) -> JSONResponse:
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+统一性能埋点
+
+- LatencyHistogram：HDR 风格的对数-线性直方图，按微秒记录，
+  每个 2 的幂区间再等分为 2^(significant_bits-1) 个子桶，相对误差约 1/2^(significant_bits-1)，
+  稀疏存储，记录为 O(1)，分位数在读取时计算
+- MetricsRegistry：按指标名 + 标签组织直方图族，导出 Prometheus 文本格式
+  （histogram 的 le 桶 + 分位数 gauge），每个族的序列数有上限，超出部分归入 "__other__"
+- 内置指标：HTTP 路由、TDengine 查询模板、Postgres 查询模板
+- 采样分析：cProfile 或线程栈采样（py-spy 风格，输出折叠栈），按需对当前 worker 运行 N 秒
+"""
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.exceptions import ServiceBusyException
+from app.log import logger
+from app.settings.config import settings
+
+# Prometheus histogram 的 le 边界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXPORT_QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+OTHER_LABEL = "__other__"
+
+
+class LatencyHistogram:
+    """HDR 风格耗时直方图（单位：秒，内部按微秒分桶）"""
+
+    __slots__ = ("significant_bits", "counts", "count", "total", "min", "max")
+
+    def __init__(self, significant_bits: int = 7):
+        self.significant_bits = significant_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def _index(self, micros: int) -> int:
+        shift = micros.bit_length() - self.significant_bits
+        if shift <= 0:
+            return micros
+        return (shift << self.significant_bits) | (micros >> shift)
+
+    def _bounds(self, index: int) -> Tuple[int, int]:
+        """桶的微秒区间 [lower, upper)"""
+        shift = index >> self.significant_bits
+        if shift == 0:
+            return index, index + 1
+        mantissa = index & ((1 << self.significant_bits) - 1)
+        return mantissa << shift, (mantissa + 1) << shift
+
+    def record(self, seconds: float) -> None:
+        if seconds < 0:
+            seconds = 0.0
+        index = self._index(int(seconds * 1_000_000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def _buckets(self) -> List[Tuple[float, int]]:
+        """按值排序的 (桶中点秒数, 计数)"""
+        buckets = []
+        for index in sorted(self.counts):
+            lower, upper = self._bounds(index)
+            buckets.append(((lower + upper - 1) / 2 / 1_000_000, self.counts[index]))
+        return buckets
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        if not self.count:
+            return [0.0] * len(qs)
+        buckets = self._buckets()
+        results = []
+        for q in qs:
+            rank = max(1, int(q * self.count + 0.999999))
+            seen = 0
+            value = self.max
+            for midpoint, count in buckets:
+                seen += count
+                if seen >= rank:
+                    value = midpoint
+                    break
+            results.append(min(max(value, self.min), self.max))
+        return results
+
+    def cumulative(self, bounds: Sequence[float]) -> List[int]:
+        """各 le 边界以下的累计计数（按桶中点归属，误差在桶宽以内）"""
+        results = []
+        buckets = self._buckets()
+        position = 0
+        seen = 0
+        for bound in bounds:
+            while position < len(buckets) and buckets[position][0] <= bound:
+                seen += buckets[position][1]
+                position += 1
+            results.append(seen)
+        return results
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95, p99 = self.quantiles((0.5, 0.95, 0.99))
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(p50 * 1000, 3),
+            "p95_ms": round(p95 * 1000, 3),
+            "p99_ms": round(p99 * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class HistogramFamily:
+    """同名直方图按标签值分序列"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), max_series: int = 500):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.max_series = max_series
+        self.series: Dict[Tuple[str, ...], LatencyHistogram] = {}
+        self.dropped = 0
+
+    def labels(self, *values: str) -> LatencyHistogram:
+        histogram = self.series.get(values)
+        if histogram is None:
+            if len(self.series) >= self.max_series:
+                # 限制基数：超出上限的标签组合合并统计
+                self.dropped += 1
+                values = (OTHER_LABEL,) * len(self.label_names)
+                histogram = self.series.get(values)
+            if histogram is None:
+                histogram = self.series[values] = LatencyHistogram()
+        return histogram
+
+    def observe(self, seconds: float, *values: str) -> None:
+        self.labels(*values).record(seconds)
+
+    def time(self, *values: str) -> Callable:
+        """异步函数耗时装饰器"""
+
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *values)
+
+            return wrapper
+
+        return decorator
+
+    def clear(self) -> None:
+        self.series.clear()
+        self.dropped = 0
+
+    def total(self) -> LatencyHistogram:
+        merged = LatencyHistogram()
+        for histogram in self.series.values():
+            merged.merge(histogram)
+        return merged
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_float(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """直方图注册表"""
+
+    def __init__(self, namespace: str = "app", max_series: int = 500, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.max_series = max_series
+        self.buckets = tuple(buckets)
+        self.families: Dict[str, HistogramFamily] = {}
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> HistogramFamily:
+        """获取或创建直方图族"""
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = HistogramFamily(
+                f"{self.namespace}_{name}", help_text, label_names, self.max_series
+            )
+        return family
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines: List[str] = []
+        for family in self.families.values():
+            if not family.series:
+                continue
+            quantile_name = f"{family.name}_quantile"
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} histogram")
+            quantile_lines = [
+                f"# HELP {quantile_name} {family.help}（分位数，当前进程）",
+                f"# TYPE {quantile_name} gauge",
+            ]
+            for values, histogram in list(family.series.items()):
+                labels = ",".join(f'{key}="{_escape(value)}"' for key, value in zip(family.label_names, values))
+                prefix = f"{labels}," if labels else ""
+                for bound, count in zip(self.buckets, histogram.cumulative(self.buckets)):
+                    lines.append(f'{family.name}_bucket{{{prefix}le="{_format_float(bound)}"}} {count}')
+                lines.append(f'{family.name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{family.name}_sum{suffix} {_format_float(histogram.total)}")
+                lines.append(f"{family.name}_count{suffix} {histogram.count}")
+                for q, value in zip(EXPORT_QUANTILES, histogram.quantiles(EXPORT_QUANTILES)):
+                    quantile_lines.append(f'{quantile_name}{{{prefix}quantile="{q}"}} {_format_float(value)}')
+            lines.extend(quantile_lines)
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, name: Optional[str] = None, top: int = 20) -> Dict[str, Any]:
+        """按累计耗时排序的各序列摘要"""
+        result = {}
+        for family_name, family in self.families.items():
+            if name and family_name != name:
+                continue
+            ranked = sorted(family.series.items(), key=lambda item: item[1].total, reverse=True)[:top]
+            result[family_name] = {
+                "series": len(family.series),
+                "dropped": family.dropped,
+                "top": [
+                    {
+                        "labels": dict(zip(family.label_names, values)),
+                        "total_ms": round(histogram.total * 1000, 3),
+                        **histogram.snapshot(),
+                    }
+                    for values, histogram in ranked
+                ],
+            }
+        return result
+
+
+# ---------- SQL 模板 ----------
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LIST = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_WHITESPACE = re.compile(r"\s+")
+_IDENTIFIER_DIGITS = re.compile(r"(?<=[A-Za-z_])\d+")
+_template_cache: Dict[str, str] = {}
+
+
+def sql_template(sql: str, max_length: int = 200) -> str:
+    """
+    SQL 归一化为模板：字面量与占位符替换为 ?，IN 列表与多行 VALUES 折叠，
+    标识符中的数字（如按设备分的子表 d_1001）替换为 ?，用作指标标签
+    """
+    template = _template_cache.get(sql)
+    if template is not None:
+        return template
+    template = _STRING_LITERAL.sub("?", sql)
+    template = _PLACEHOLDER.sub("?", template)
+    template = _NUMBER.sub("?", template)
+    template = _IDENTIFIER_DIGITS.sub("?", template)
+    template = _VALUES_LIST.sub(r"\1...", template)
+    template = _IN_LIST.sub("(?...)", template)
+    template = _WHITESPACE.sub(" ", template).strip()
+    if len(template) > max_length:
+        template = template[:max_length] + "..."
+    if len(_template_cache) >= 4096:
+        _template_cache.clear()
+    _template_cache[sql] = template
+    return template
+
+
+# ---------- 全局注册表与内置指标 ----------
+
+metrics = MetricsRegistry(max_series=settings.METRICS_MAX_SERIES)
+
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时（按路由模板）", ("method", "route", "status")
+)
+tdengine_query_seconds = metrics.histogram(
+    "tdengine_query_duration_seconds", "TDengine REST查询耗时（按SQL模板）", ("template",)
+)
+postgres_query_seconds = metrics.histogram(
+    "postgres_query_duration_seconds", "Postgres查询耗时（按SQL模板）", ("template",)
+)
+
+_in_db_query: ContextVar[bool] = ContextVar("in_db_query", default=False)
+_INSTRUMENTED_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many")
+
+
+def _timed_client_method(method: Callable) -> Callable:
+    @wraps(method)
+    async def wrapper(self, query, *args, **kwargs):
+        if _in_db_query.get():
+            return await method(self, query, *args, **kwargs)
+        token = _in_db_query.set(True)
+        started = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            postgres_query_seconds.observe(time.perf_counter() - started, sql_template(query))
+            _in_db_query.reset(token)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def instrument_postgres() -> bool:
+    """为 Tortoise asyncpg 客户端（含事务包装类）的执行方法加上耗时统计"""
+    if not settings.METRICS_ENABLED:
+        return False
+    try:
+        from tortoise.backends.asyncpg.client import AsyncpgDBClient
+    except ImportError:
+        logger.warning("未安装asyncpg后端，跳过Postgres查询埋点")
+        return False
+
+    for klass in (AsyncpgDBClient, *AsyncpgDBClient.__subclasses__()):
+        for name in _INSTRUMENTED_METHODS:
+            method = vars(klass).get(name)
+            if method is not None and not getattr(method, "__instrumented__", False):
+                setattr(klass, name, _timed_client_method(method))
+    return True
+
+
+# ---------- 采样分析 ----------
+
+_profile_lock = asyncio.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """后台线程定期采样目标线程调用栈，汇总为折叠栈与函数自身/累计采样数"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._switch_interval = sys.getswitchinterval()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def start(self) -> None:
+        # 进程内采样需要先拿到 GIL：缩短切换间隔，否则采样点会偏向目标线程主动释放 GIL 的位置（如 select）
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 10))
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def report(self, top: int) -> Dict[str, Any]:
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        samples = self.samples or 1
+        return {
+            "samples": self.samples,
+            "top_self": [
+                {"function": label, "samples": count, "percent": round(count / samples * 100, 2)}
+                for label, count in self_counts.most_common(top)
+            ],
+            "top_total": [
+                {"function": label, "samples": count, "percent": round(count / samples * 100, 2)}
+                for label, count in total_counts.most_common(top)
+            ],
+            # 折叠栈格式，可直接交给 flamegraph.pl / speedscope
+            "folded": "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()),
+        }
+
+
+async def profile_worker(seconds: float, mode: str = "sample", top: int = 30, interval: float = 0.005) -> Dict[str, Any]:
+    """
+    对当前 worker 的事件循环线程分析 seconds 秒
+
+    Args:
+        seconds: 分析时长
+        mode: sample（栈采样，开销低）或 cprofile（确定性分析，开销较高）
+        top: 返回的热点函数数量
+        interval: 采样间隔（秒），仅 sample 模式
+
+    Raises:
+        ServiceBusyException: 已有分析在进行
+    """
+    if _profile_lock.locked():
+        raise ServiceBusyException(message="已有性能分析正在进行，请稍后重试")
+
+    async with _profile_lock:
+        started = time.perf_counter()
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            output = io.StringIO()
+            stats = pstats.Stats(profiler, stream=output)
+            stats.sort_stats("cumulative").print_stats(top)
+            report = {"stats": output.getvalue()}
+        else:
+            sampler = StackSampler(threading.get_ident(), interval)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                sampler.stop()
+            report = sampler.report(top)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"性能分析完成: mode={mode}, seconds={elapsed:.1f}, pid={os.getpid()}")
+    return {"mode": mode, "pid": os.getpid(), "seconds": round(elapsed, 3), **report}
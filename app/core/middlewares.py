@@ -1,5 +1,6 @@
 import json
 import re
+import time
 from datetime import datetime
 from typing import Any, AsyncGenerator
 
@@ -12,6 +13,7 @@ from starlette.types import ASGIApp, Receive, Scope, Send
 from loguru import logger
 
 from app.core.dependency import AuthControl
+from app.core.instrumentation import http_request_seconds
 from app.models.admin import HttpAuditLog, User
 
 from .bgtask import BgTasks
@@ -61,6 +63,36 @@ class BackGroundTaskMiddleware(SimpleBaseMiddleware):
         await BgTasks.execute_tasks()
 
 
+class RouteMetricsMiddleware:
+    """按路由模板记录请求耗时直方图（纯ASGI，不缓冲响应体）"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 路由匹配后 FastAPI 会把 APIRoute 写入 scope，用模板路径避免路径参数造成标签膨胀
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_request_seconds.observe(
+                time.perf_counter() - started, scope["method"], route, f"{status_code // 100}xx"
+            )
+
+
 class HttpAuditLogMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, methods: list[str], exclude_paths: list[str]):
         super().__init__(app)
@@ -14,6 +14,7 @@ from dataclasses import dataclass, asdict
 from collections import defaultdict
 from contextlib import asynccontextmanager
 
+from app.core.permission_matcher import PermissionGrants, compiled_matcher_cache
 from app.core.redis_cache import redis_cache_manager
 from app.core.unified_logger import get_logger
 
@@ -90,6 +91,11 @@ class PermissionCacheManager:
         self.api_permissions_prefix = "perm:api_permissions:"
         self.batch_permissions_prefix = "perm:batch_permissions:"
         
+        # 失效标签（缓存键登记在Redis集合中，失效时按集合删除，避免KEYS扫描）
+        self.all_permissions_tag = "perm"
+        self.menu_tag = "menu"
+        self.unknown_role_tag = "role:unknown"
+        
         # 统计信息
         self.stats = CacheStats()
         self.metrics_history: List[CacheMetrics] = []
@@ -160,8 +166,37 @@ class PermissionCacheManager:
         if len(self.metrics_history) > self.max_metrics_history:
             self.metrics_history = self.metrics_history[-self.max_metrics_history:]
     
+    def _user_tags(self, user_id: int, role_ids: Optional[List[int]] = None) -> List[str]:
+        """用户级缓存的失效标签
+        
+        未提供角色ID时登记到 role:unknown，任意角色变更都会失效该缓存。
+        """
+        tags = [self.all_permissions_tag, f"user:{user_id}"]
+        if role_ids is None:
+            tags.append(self.unknown_role_tag)
+        else:
+            tags.extend(f"role:{role_id}" for role_id in role_ids)
+        return tags
+    
+    @staticmethod
+    def _pack_grants(grants: PermissionGrants) -> Dict[str, Any]:
+        """权限列表与版本一起写入缓存，读取时无需重新计算版本"""
+        return {"version": grants.version, "permissions": grants.permissions}
+    
+    @staticmethod
+    def _unpack_grants(cached: Any) -> PermissionGrants:
+        """解析缓存中的权限（兼容升级前只存列表的旧条目）"""
+        if isinstance(cached, dict) and "version" in cached:
+            return PermissionGrants(cached["version"], cached.get("permissions") or [])
+        return PermissionGrants.build(cached)
+    
     async def get_user_permissions(self, user_id: int) -> Optional[List[str]]:
         """获取用户权限缓存"""
+        grants = await self.get_user_grants(user_id)
+        return grants.permissions if grants is not None else None
+    
+    async def get_user_grants(self, user_id: int) -> Optional[PermissionGrants]:
+        """获取带版本的用户权限缓存"""
         cache_key = f"{self.user_permissions_prefix}{user_id}"
         
         async with self._track_operation("get_user_permissions", cache_key) as set_hit:
@@ -170,7 +205,7 @@ class PermissionCacheManager:
                 if cached_permissions is not None:
                     set_hit(True)
                     logger.debug(f"用户权限缓存命中: user_id={user_id}")
-                    return cached_permissions
+                    return self._unpack_grants(cached_permissions)
                 else:
                     set_hit(False)
                     return None
@@ -179,16 +214,21 @@ class PermissionCacheManager:
                 set_hit(False)
                 return None
     
-    async def set_user_permissions(self, user_id: int, permissions: List[str]) -> bool:
-        """设置用户权限缓存"""
+    async def set_user_permissions(
+        self, user_id: int, permissions: Union[List[str], PermissionGrants], role_ids: Optional[List[int]] = None
+    ) -> bool:
+        """设置用户权限缓存，role_ids 用于按角色失效"""
         cache_key = f"{self.user_permissions_prefix}{user_id}"
+        grants = permissions if isinstance(permissions, PermissionGrants) else PermissionGrants.build(permissions)
+        permissions = grants.permissions
         
         async with self._track_operation("set_user_permissions", cache_key) as set_hit:
             try:
                 result = await self.cache_manager.set(
                     cache_key.replace(f"{self.cache_manager.key_prefix}", ""),
-                    permissions,
-                    ttl=self.user_permissions_ttl
+                    self._pack_grants(grants),
+                    ttl=self.user_permissions_ttl,
+                    tags=self._user_tags(user_id, role_ids)
                 )
                 if result:
                     self.stats.sets += 1
@@ -228,7 +268,11 @@ class PermissionCacheManager:
                 result = await self.cache_manager.set(
                     cache_key.replace(f"{self.cache_manager.key_prefix}", ""),
                     roles,
-                    ttl=self.user_roles_ttl
+                    ttl=self.user_roles_ttl,
+                    tags=self._user_tags(
+                        user_id,
+                        [role["id"] for role in roles if isinstance(role, dict) and "id" in role] or None
+                    )
                 )
                 if result:
                     self.stats.sets += 1
@@ -259,8 +303,10 @@ class PermissionCacheManager:
                 set_hit(False)
                 return None
     
-    async def set_user_menus(self, user_id: int, menus: List[Dict]) -> bool:
-        """设置用户菜单缓存"""
+    async def set_user_menus(
+        self, user_id: int, menus: List[Dict], role_ids: Optional[List[int]] = None
+    ) -> bool:
+        """设置用户菜单缓存，role_ids 用于按角色失效"""
         cache_key = f"{self.user_menus_prefix}{user_id}"
         
         async with self._track_operation("set_user_menus", cache_key) as set_hit:
@@ -268,7 +314,8 @@ class PermissionCacheManager:
                 result = await self.cache_manager.set(
                     cache_key.replace(f"{self.cache_manager.key_prefix}", ""),
                     menus,
-                    ttl=self.user_menus_ttl
+                    ttl=self.user_menus_ttl,
+                    tags=self._user_tags(user_id, role_ids) + [self.menu_tag]
                 )
                 if result:
                     self.stats.sets += 1
@@ -282,6 +329,11 @@ class PermissionCacheManager:
     
     async def get_role_permissions(self, role_id: int) -> Optional[List[str]]:
         """获取角色权限缓存"""
+        grants = await self.get_role_grants(role_id)
+        return grants.permissions if grants is not None else None
+    
+    async def get_role_grants(self, role_id: int) -> Optional[PermissionGrants]:
+        """获取带版本的角色权限缓存"""
         cache_key = f"{self.role_permissions_prefix}{role_id}"
         
         async with self._track_operation("get_role_permissions", cache_key) as set_hit:
@@ -290,7 +342,7 @@ class PermissionCacheManager:
                 if cached_permissions is not None:
                     set_hit(True)
                     logger.debug(f"角色权限缓存命中: role_id={role_id}")
-                    return cached_permissions
+                    return self._unpack_grants(cached_permissions)
                 else:
                     set_hit(False)
                     return None
@@ -299,16 +351,21 @@ class PermissionCacheManager:
                 set_hit(False)
                 return None
     
-    async def set_role_permissions(self, role_id: int, permissions: List[str]) -> bool:
-        """设置角色权限缓存"""
+    async def set_role_permissions(
+        self, role_id: int, permissions: Union[List[str], PermissionGrants], ancestor_ids: Optional[List[int]] = None
+    ) -> bool:
+        """设置角色权限缓存，ancestor_ids 为继承链上的角色，任一角色变更时失效该缓存"""
         cache_key = f"{self.role_permissions_prefix}{role_id}"
+        grants = permissions if isinstance(permissions, PermissionGrants) else PermissionGrants.build(permissions)
+        permissions = grants.permissions
         
         async with self._track_operation("set_role_permissions", cache_key) as set_hit:
             try:
                 result = await self.cache_manager.set(
                     cache_key.replace(f"{self.cache_manager.key_prefix}", ""),
-                    permissions,
-                    ttl=self.role_permissions_ttl
+                    self._pack_grants(grants),
+                    ttl=self.role_permissions_ttl,
+                    tags=[self.all_permissions_tag, *(f"role:{rid}" for rid in dict.fromkeys([role_id, *(ancestor_ids or [])]))]
                 )
                 if result:
                     self.stats.sets += 1
@@ -397,28 +454,26 @@ class PermissionCacheManager:
                 logger.error(f"清除用户缓存失败: cache_key={cache_key}, error={e}")
                 success = False
         
+        # 删除登记在用户标签下的其他缓存
+        deleted_count += await self.cache_manager.invalidate_tags([f"user:{user_id}"])
+        compiled_matcher_cache.invalidate(f"user:{user_id}")
+        
         logger.debug(f"清除用户缓存: user_id={user_id}, 删除数量={deleted_count}")
         return success
     
     async def clear_role_cache(self, role_id: int) -> bool:
-        """清除角色相关缓存"""
+        """清除角色相关缓存
+        
+        按 role:ID 标签删除该角色及以其为祖先的子角色的权限缓存、持有这些角色的用户缓存，
+        未记录角色信息的用户缓存通过 role:unknown 标签一并失效。
+        """
         try:
-            # 清除角色权限缓存
-            role_cache_key = f"{self.role_permissions_prefix}{role_id}"
-            await self.cache_manager.delete(role_cache_key.replace(f"{self.cache_manager.key_prefix}", ""))
-            
-            # 清除所有用户权限缓存（因为角色权限变更会影响所有拥有该角色的用户）
-            patterns = [
-                f"{self.user_permissions_prefix}*",
-                f"{self.user_roles_prefix}*",
-                f"{self.user_menus_prefix}*"
-            ]
-            
-            total_deleted = 0
-            for pattern in patterns:
-                deleted_count = await self.cache_manager.clear_pattern(pattern.replace(f"{self.cache_manager.key_prefix}", ""))
-                total_deleted += deleted_count
-                self.stats.deletes += deleted_count
+            total_deleted = await self.cache_manager.invalidate_tags(
+                [f"role:{role_id}", self.unknown_role_tag]
+            )
+            self.stats.deletes += total_deleted
+            # 持有该角色的用户无法逐一定位，进程内编译结果整体清空
+            compiled_matcher_cache.clear()
             
             logger.info(f"清除角色缓存: role_id={role_id}, 删除数量={total_deleted}")
             return True
@@ -427,9 +482,19 @@ class PermissionCacheManager:
             logger.error(f"清除角色缓存失败: role_id={role_id}, error={e}")
             return False
     
+    async def clear_menu_cache(self) -> int:
+        """清除所有用户菜单缓存"""
+        deleted_count = await self.cache_manager.invalidate_tags([self.menu_tag])
+        self.stats.deletes += deleted_count
+        return deleted_count
+    
     async def clear_all_permission_cache(self) -> bool:
         """清除所有权限相关缓存"""
         try:
+            total_deleted = await self.cache_manager.invalidate_tags([self.all_permissions_tag])
+            compiled_matcher_cache.clear()
+            
+            # 未登记标签的旧版键，使用SCAN兜底
             patterns = [
                 f"{self.user_permissions_prefix}*",
                 f"{self.user_roles_prefix}*",
@@ -439,11 +504,10 @@ class PermissionCacheManager:
                 f"{self.batch_permissions_prefix}*"
             ]
             
-            total_deleted = 0
             for pattern in patterns:
                 deleted_count = await self.cache_manager.clear_pattern(pattern.replace(f"{self.cache_manager.key_prefix}", ""))
                 total_deleted += deleted_count
-                self.stats.deletes += deleted_count
+            self.stats.deletes += total_deleted
             
             logger.info(f"清除所有权限缓存完成, 删除数量={total_deleted}")
             return True
@@ -516,12 +580,8 @@ class PermissionCacheManager:
             
             for prefix, name in patterns:
                 try:
-                    # 获取匹配的键数量
-                    pattern = f"{prefix}*"
-                    keys = await self.cache_manager.redis_manager.redis.keys(
-                        f"{self.cache_manager.key_prefix}{pattern}"
-                    )
-                    key_count = len(keys)
+                    # 获取匹配的键数量（SCAN，不阻塞Redis）
+                    key_count = await self.cache_manager.count_pattern(f"{prefix}*")
                     cache_key_stats[name] = key_count
                     total_keys += key_count
                 except Exception as e:
@@ -552,6 +612,7 @@ class PermissionCacheManager:
                     "error_rate": round(error_rate * 100, 2),
                     "slow_query_threshold_ms": self.slow_query_threshold
                 },
+                "compiled_matchers": compiled_matcher_cache.stats(),
                 "configuration": {
                     "user_permissions_ttl": self.user_permissions_ttl,
                     "user_roles_ttl": self.user_roles_ttl,
@@ -23,6 +23,7 @@ class PermissionEventType(Enum):
     USER_STATUS_CHANGED = "user_status_changed"    # 用户状态变更
     ROLE_STATUS_CHANGED = "role_status_changed"    # 角色状态变更
     API_PERMISSION_CHANGED = "api_permission_changed"  # API权限变更
+    MENU_CHANGED = "menu_changed"                  # 菜单增删改
 
 
 class PermissionEvent:
@@ -58,6 +59,7 @@ class PermissionEventHandler:
             PermissionEventType.USER_STATUS_CHANGED: self._handle_user_status_changed,
             PermissionEventType.ROLE_STATUS_CHANGED: self._handle_role_status_changed,
             PermissionEventType.API_PERMISSION_CHANGED: self._handle_api_permission_changed,
+            PermissionEventType.MENU_CHANGED: self._handle_menu_changed,
         }
     
     async def handle_event(self, event: PermissionEvent):
@@ -76,46 +78,37 @@ class PermissionEventHandler:
     async def _handle_user_role_assigned(self, event: PermissionEvent):
         """处理用户角色分配事件"""
         if event.user_id:
-            role_ids = event.details.get("role_ids", [])
-            await permission_cache_event_handler.on_user_role_changed(
-                event.user_id, [], role_ids
-            )
+            await permission_cache_manager.clear_user_cache(event.user_id)
             logger.info(f"用户 {event.user_id} 分配角色后清除权限缓存")
     
     async def _handle_user_role_removed(self, event: PermissionEvent):
         """处理用户角色移除事件"""
         if event.user_id:
-            role_ids = event.details.get("role_ids", [])
-            await permission_cache_event_handler.on_user_role_changed(
-                event.user_id, role_ids, []
-            )
+            await permission_cache_manager.clear_user_cache(event.user_id)
             logger.info(f"用户 {event.user_id} 移除角色后清除权限缓存")
     
     async def _handle_role_permission_assigned(self, event: PermissionEvent):
         """处理角色权限分配事件"""
         if event.role_id:
-            await permission_cache_event_handler.on_role_permission_changed(event.role_id)
+            await permission_cache_manager.clear_role_cache(event.role_id)
             logger.info(f"角色 {event.role_id} 分配权限后清除相关权限缓存")
     
     async def _handle_role_permission_removed(self, event: PermissionEvent):
         """处理角色权限移除事件"""
         if event.role_id:
-            await permission_cache_event_handler.on_role_permission_changed(event.role_id)
+            await permission_cache_manager.clear_role_cache(event.role_id)
             logger.info(f"角色 {event.role_id} 移除权限后清除相关权限缓存")
     
     async def _handle_user_status_changed(self, event: PermissionEvent):
         """处理用户状态变更事件"""
         if event.user_id:
-            new_status = event.details.get("new_status", True)
-            await permission_cache_event_handler.on_user_status_changed(
-                event.user_id, new_status
-            )
+            await permission_cache_manager.clear_user_cache(event.user_id)
             logger.info(f"用户 {event.user_id} 状态变更后清除权限缓存")
     
     async def _handle_role_status_changed(self, event: PermissionEvent):
         """处理角色状态变更事件"""
         if event.role_id:
-            await permission_cache_event_handler.on_role_permission_changed(event.role_id)
+            await permission_cache_manager.clear_role_cache(event.role_id)
             logger.info(f"角色 {event.role_id} 状态变更后清除相关权限缓存")
     
     async def _handle_api_permission_changed(self, event: PermissionEvent):
@@ -125,6 +118,11 @@ class PermissionEventHandler:
         await cache_invalidation_manager.invalidate_by_type("permission")
         logger.info("API权限变更后清除所有权限缓存")
     
+    async def _handle_menu_changed(self, event: PermissionEvent):
+        """处理菜单变更事件：失效全部菜单、角色菜单与用户菜单缓存"""
+        deleted = await permission_cache_manager.clear_menu_cache()
+        logger.info(f"菜单变更后清除菜单缓存: 删除数量={deleted}")
+    
     async def _log_permission_change(self, event: PermissionEvent):
         """记录权限变更日志"""
         try:
@@ -283,6 +281,20 @@ class PermissionEventManager:
             operator_id=operator_id
         )
         await self.emit_event(event)
+    
+    async def emit_menu_changed(
+        self, 
+        menu_ids: List[int], 
+        action: str, 
+        operator_id: Optional[int] = None
+    ):
+        """发出菜单变更事件"""
+        event = PermissionEvent(
+            event_type=PermissionEventType.MENU_CHANGED,
+            details={"menu_ids": menu_ids, "action": action},
+            operator_id=operator_id
+        )
+        await self.emit_event(event)
 
 
 # 全局权限事件管理器实例
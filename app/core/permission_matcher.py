@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编译型权限匹配器
+
+将用户/角色的 "METHOD /path" 权限列表编译为按HTTP方法分组的路径前缀树：
+- 字面量路径段为普通子节点
+- {id}、{name} 等参数占位符与单段通配符 * 合并为一个通配子节点
+- 以 /* 结尾的权限按字面前缀建分支并标记前缀通配，匹配其后任意段；
+  前缀中的 {id}、* 与原逻辑一样按字面比较（原逻辑对不同段数做字符串前缀匹配）
+
+与原逻辑的唯一差异：前缀通配按整段匹配，/users/* 不再匹配 /usersX/...，只会收窄不会放宽。
+一次检查只沿请求路径逐段下行，代价与路径段数成正比，与权限数量无关。
+编译结果按权限版本缓存在进程内，版本在权限写入缓存时计算一次，随用户/角色失效一并清除。
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+API_PERMISSION_PATTERN = re.compile(r'^(GET|POST|PUT|DELETE|PATCH)\s+(.+)$')
+
+
+class _TrieNode:
+    """路径前缀树节点"""
+    __slots__ = ("children", "wildcard", "terminal", "tail")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.wildcard: Optional["_TrieNode"] = None  # {param} 或 * 单段匹配
+        self.terminal = False  # 路径在此结束即匹配
+        self.tail = False  # 以 /* 结尾，匹配其后任意段
+
+
+def _is_wildcard_segment(segment: str) -> bool:
+    return segment == '*' or (segment.startswith('{') and segment.endswith('}'))
+
+
+class CompiledPermissionMatcher:
+    """权限集合编译后的匹配器（只读，可在协程间共享）"""
+    __slots__ = ("exact", "_roots", "size")
+
+    def __init__(self, permissions: Iterable[str]):
+        self.exact = frozenset(permissions)
+        self._roots: Dict[str, _TrieNode] = {}
+        self.size = len(self.exact)
+        for permission in self.exact:
+            match = API_PERMISSION_PATTERN.match(permission)
+            if match:
+                self._insert(*match.groups())
+
+    def _insert(self, method: str, path: str) -> None:
+        node = self._roots.get(method)
+        if node is None:
+            node = self._roots[method] = _TrieNode()
+
+        segments = path.split('/')
+        if len(segments) > 1 and segments[-1] == '*':
+            # 与原逻辑一致：/* 结尾时，同段数按单段通配匹配，不同段数按字面前缀匹配
+            self._walk_create(node, segments[:-1], literal=True).tail = True
+        self._walk_create(node, segments).terminal = True
+
+    @staticmethod
+    def _walk_create(node: _TrieNode, segments: Sequence[str], literal: bool = False) -> _TrieNode:
+        for segment in segments:
+            if not literal and _is_wildcard_segment(segment):
+                if node.wildcard is None:
+                    node.wildcard = _TrieNode()
+                node = node.wildcard
+            else:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _TrieNode()
+                node = child
+        return node
+
+    def matches(self, permission: str) -> bool:
+        """检查 "METHOD /path" 是否被权限集合覆盖"""
+        if permission in self.exact:
+            return True
+        match = API_PERMISSION_PATTERN.match(permission)
+        if not match:
+            return False
+        method, path = match.groups()
+        root = self._roots.get(method)
+        if root is None:
+            return False
+        return self._match(root, path.split('/'), 0)
+
+    def _match(self, node: _TrieNode, segments: List[str], index: int) -> bool:
+        # 字面量优先，其次通配；每层至多两条分支
+        while True:
+            if node.tail:
+                return True
+            if index == len(segments):
+                return node.terminal
+            child = node.children.get(segments[index])
+            if child is not None:
+                if node.wildcard is not None and self._match(node.wildcard, segments, index + 1):
+                    return True
+                node = child
+            elif node.wildcard is not None:
+                node = node.wildcard
+            else:
+                return False
+            index += 1
+
+
+def compile_permissions(permissions: Iterable[str]) -> CompiledPermissionMatcher:
+    return CompiledPermissionMatcher(permissions)
+
+
+def permission_version(permissions: Iterable[str]) -> str:
+    """权限集合的内容指纹（与顺序、重复无关），在权限加载/写入缓存时计算一次"""
+    digest = hashlib.blake2b(digest_size=16)
+    for permission in sorted(set(permissions)):
+        digest.update(permission.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class PermissionGrants(NamedTuple):
+    """带版本的权限列表"""
+    version: str
+    permissions: List[str]
+
+    @classmethod
+    def build(cls, permissions: Iterable[str]) -> "PermissionGrants":
+        permissions = list(permissions)
+        return cls(permission_version(permissions), permissions)
+
+
+class CompiledMatcherCache:
+    """编译结果的进程内有界LRU缓存
+
+    键为 user:ID / role:ID，条目同时保存编译时的权限版本；
+    命中判断只比较版本字符串，与权限数量无关。版本随权限一起存放在Redis权限缓存中，
+    因此其他进程更新权限缓存后本进程读到新版本，也不会使用过期的编译结果。
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[str, CompiledPermissionMatcher]]" = OrderedDict()
+        self.hits = 0
+        self.compiles = 0
+
+    def get(self, key: str, grants: PermissionGrants) -> CompiledPermissionMatcher:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] == grants.version:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        matcher = CompiledPermissionMatcher(grants.permissions)
+        self.compiles += 1
+        self._data[key] = (grants.version, matcher)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return matcher
+
+    def invalidate(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "max_size": self.maxsize, "hits": self.hits, "compiles": self.compiles}
+
+
+compiled_matcher_cache = CompiledMatcherCache()
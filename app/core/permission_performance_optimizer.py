@@ -10,7 +10,7 @@ import time
 from typing import Dict, List, Optional, Set, Any, Tuple
 from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 import weakref
 
 from app.core.permission_validator import permission_validator
@@ -38,6 +38,101 @@ class PerformanceMetrics:
         return (self.cache_hits / self.total_requests) * 100
 
 
+class _L1Entry:
+    """L1缓存条目（过期时间为单调时钟纳秒整数）"""
+    __slots__ = ("value", "expires_at")
+    
+    def __init__(self, value: Any, expires_at: int):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class LRUTTLCache:
+    """有界LRU+TTL缓存
+    
+    基于OrderedDict，读写与淘汰均为O(1)；过期判断使用单调时钟，
+    不受系统时间调整影响。过期条目在读取时惰性删除，
+    purge_expired() 供后台任务批量回收。
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, _L1Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+    
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic_ns():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry.value
+    
+    def peek(self, key: str) -> Any:
+        """只读查看条目：不计入命中/未命中统计，也不调整LRU顺序"""
+        entry = self._data.get(key)
+        if entry is None or entry.expires_at <= time.monotonic_ns():
+            return None
+        return entry.value
+    
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.monotonic_ns() + int(self.ttl * 1_000_000_000)
+        entry = self._data.get(key)
+        if entry is not None:
+            entry.value = value
+            entry.expires_at = expires_at
+            self._data.move_to_end(key)
+            return
+        while len(self._data) >= self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        self._data[key] = _L1Entry(value, expires_at)
+    
+    def purge_expired(self) -> int:
+        """删除所有已过期条目，返回删除数量"""
+        now = time.monotonic_ns()
+        expired_keys = [key for key, entry in self._data.items() if entry.expires_at <= now]
+        for key in expired_keys:
+            del self._data[key]
+        self.expirations += len(expired_keys)
+        return len(expired_keys)
+    
+    def clear(self) -> None:
+        self._data.clear()
+    
+    def reset_stats(self) -> None:
+        self.hits = self.misses = self.evictions = self.expirations = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0
+        }
+
+
 class PermissionPerformanceOptimizer:
     """权限验证性能优化器"""
     
@@ -46,9 +141,7 @@ class PermissionPerformanceOptimizer:
         self.cache_manager = permission_cache_manager
         
         # 多级缓存配置
-        self.l1_cache = {}  # 内存缓存（最快）
-        self.l1_cache_size = 500
-        self.l1_cache_ttl = 30  # 30秒
+        self.l1_cache = LRUTTLCache(maxsize=500, ttl=30)  # 内存缓存（最快），30秒
         
         # 预加载配置
         self.preload_enabled = True
@@ -75,6 +168,24 @@ class PermissionPerformanceOptimizer:
         self._background_tasks = []
         self._tasks_started = False
     
+    @property
+    def l1_cache_size(self) -> int:
+        """L1缓存容量"""
+        return self.l1_cache.maxsize
+    
+    @l1_cache_size.setter
+    def l1_cache_size(self, value: int):
+        self.l1_cache.maxsize = value
+    
+    @property
+    def l1_cache_ttl(self) -> float:
+        """L1缓存TTL（秒）"""
+        return self.l1_cache.ttl
+    
+    @l1_cache_ttl.setter
+    def l1_cache_ttl(self, value: float):
+        self.l1_cache.ttl = value
+    
     async def _ensure_background_tasks(self):
         """确保后台任务已启动"""
         if self._tasks_started:
@@ -194,8 +305,8 @@ class PermissionPerformanceOptimizer:
             results.update(cache_hits)
             
             # 2. 批量Redis缓存检查
+            redis_hits = {}
             if cache_misses:
-                redis_hits = {}
                 redis_misses = []
                 
                 # 并发检查Redis缓存
@@ -240,15 +351,12 @@ class PermissionPerformanceOptimizer:
                     else:
                         logger.error(f"批量权限检查异常: {batch_result}")
             
-            # 4. 更新性能指标
+            # 4. 更新性能指标（每个请求只计一次：L1或Redis命中计为命中，其余计为未命中）
             total_time = (time.time() - start_time) * 1000
             avg_time = total_time / len(requests) if requests else 0
             
-            for _ in cache_hits:
-                self._update_metrics(True, avg_time)
-            for _ in results:
-                if (_, _) not in cache_hits:
-                    self._update_metrics(False, avg_time)
+            for request in results:
+                self._update_metrics(request in cache_hits or request in redis_hits, avg_time)
             
             return results
             
@@ -595,60 +703,18 @@ class PermissionPerformanceOptimizer:
     
     def _get_from_l1_cache(self, key: str) -> Optional[bool]:
         """从L1缓存获取"""
-        try:
-            if key in self.l1_cache:
-                item = self.l1_cache[key]
-                expires_at = item['expires_at']
-                # 如果expires_at是字符串，转换为datetime对象
-                if isinstance(expires_at, str):
-                    expires_at = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-                
-                if datetime.now() < expires_at:
-                    return item['value']
-                else:
-                    del self.l1_cache[key]
-            return None
-        except Exception:
-            return None
+        return self.l1_cache.get(key)
     
     def _set_to_l1_cache(self, key: str, value: bool):
-        """设置L1缓存"""
-        try:
-            # 清理过期项
-            if len(self.l1_cache) >= self.l1_cache_size:
-                self._cleanup_l1_cache()
-            
-            self.l1_cache[key] = {
-                'value': value,
-                'expires_at': datetime.now() + timedelta(seconds=self.l1_cache_ttl)
-            }
-        except Exception as e:
-            logger.error(f"设置L1缓存失败: {str(e)}")
+        """设置L1缓存（容量满时按LRU淘汰）"""
+        self.l1_cache.set(key, value)
     
     def _cleanup_l1_cache(self):
-        """清理L1缓存"""
+        """清理L1缓存中的过期条目"""
         try:
-            current_time = datetime.now()
-            expired_keys = [
-                key for key, item in self.l1_cache.items()
-                if current_time >= item['expires_at']
-            ]
-            
-            for key in expired_keys:
-                del self.l1_cache[key]
-            
-            # 如果还是太满，删除最旧的
-            if len(self.l1_cache) >= self.l1_cache_size:
-                sorted_items = sorted(
-                    self.l1_cache.items(),
-                    key=lambda x: x[1]['expires_at']
-                )
-                
-                items_to_delete = len(sorted_items) // 4
-                for i in range(items_to_delete):
-                    key = sorted_items[i][0]
-                    del self.l1_cache[key]
-                    
+            expired_count = self.l1_cache.purge_expired()
+            if expired_count:
+                logger.debug(f"L1缓存清理过期条目: {expired_count}")
         except Exception as e:
             logger.error(f"清理L1缓存失败: {str(e)}")
     
@@ -890,9 +956,9 @@ class PermissionPerformanceOptimizer:
             
             for user in active_users:
                 for permission in hot_permissions:
-                    # 检查是否已缓存
+                    # 检查是否已缓存（只读查看，真正的查找由 optimize_permission_check 计数）
                     cache_key = f"perm_{user.id}_{hash(permission)}"
-                    if self._get_from_l1_cache(cache_key) is None:
+                    if self.l1_cache.peek(cache_key) is None:
                         # 异步预加载
                         asyncio.create_task(
                             self.optimize_permission_check(user.id, permission, use_prediction=False)
@@ -940,6 +1006,7 @@ class PermissionPerformanceOptimizer:
                     "l1_cache_size": len(self.l1_cache),
                     "l1_cache_max_size": self.l1_cache_size,
                     "l1_cache_usage": f"{len(self.l1_cache) / self.l1_cache_size * 100:.1f}%",
+                    "l1_cache_stats": self.l1_cache.stats(),
                     "pattern_cache_size": len(self.permission_patterns),
                     "weak_cache_size": len(self.weak_cache)
                 },
@@ -1071,6 +1138,7 @@ class PermissionPerformanceOptimizer:
                         "error_count": self.metrics.error_count
                     },
                     "cache_metrics": cache_stats,
+                    "l1_cache": self.l1_cache.stats(),
                     "memory_usage": {
                         "l1_cache_items": len(self.l1_cache),
                         "pattern_cache_items": len(self.permission_patterns),
@@ -1232,6 +1300,7 @@ class PermissionPerformanceOptimizer:
     def reset_metrics(self):
         """重置性能指标"""
         self.metrics = PerformanceMetrics()
+        self.l1_cache.reset_stats()
         self.performance_history.clear()
         logger.info("权限性能指标已重置")
     
@@ -16,6 +16,7 @@ from tortoise.expressions import Q
 from tortoise.models import Model
 from tortoise.queryset import QuerySet
 
+from app.core.instrumentation import metrics
 from app.log import logger
 
 ModelType = TypeVar("ModelType", bound=Model)
@@ -27,6 +28,9 @@ class QueryOptimizer:
     def __init__(self):
         self.query_stats = {}
         self.slow_query_threshold = 1.0  # 慢查询阈值（秒）
+        self.latency = metrics.histogram(
+            "db_function_duration_seconds", "monitor_query装饰的数据访问函数耗时", ("function",)
+        )
     
     def monitor_query(self, func: Callable) -> Callable:
         """查询监控装饰器"""
@@ -82,10 +86,16 @@ class QueryOptimizer:
             stats['success_calls'] += 1
         else:
             stats['failed_calls'] += 1
+        
+        self.latency.observe(execution_time, query_name)
     
     def get_query_stats(self) -> Dict[str, Any]:
-        """获取查询统计信息"""
-        return self.query_stats.copy()
+        """获取查询统计信息（含耗时分位数）"""
+        result = {}
+        for query_name, stats in self.query_stats.items():
+            p50, p95, p99 = self.latency.labels(query_name).quantiles((0.5, 0.95, 0.99))
+            result[query_name] = {**stats, 'p50_time': p50, 'p95_time': p95, 'p99_time': p99}
+        return result
 
 
 class OptimizedQueryMixin:
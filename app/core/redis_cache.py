@@ -6,15 +6,22 @@ Redis缓存管理器
 """
 
 import json
-import pickle
+import time
+import uuid
 import asyncio
-from typing import Any, Dict, List, Optional, Union
-from datetime import datetime, timedelta
-from functools import wraps
+import hashlib
+import inspect
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+from datetime import date, datetime, timedelta
+from datetime import time as dt_time
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache, wraps
 
 import redis.asyncio as redis
 from redis.asyncio import Redis
 
+from app.core.cache_codec import CacheCodec, CacheCodecError
 from app.log import logger
 
 
@@ -115,13 +122,26 @@ class RedisManager:
         return self._redis
 
 
+# 仅删除自己持有的锁，避免误删其他worker续上的锁
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
 class RedisCacheManager:
     """Redis缓存管理器"""
     
-    def __init__(self, redis_manager: RedisManager = None):
+    def __init__(self, redis_manager: RedisManager = None, codec: CacheCodec = None):
         self.redis_manager = redis_manager or RedisManager()
+        self.codec = codec or CacheCodec()
         self.default_ttl = 300  # 5分钟默认TTL
         self.key_prefix = "device_monitor:"
+        self.tag_prefix = "tag:"
+        self.tag_ttl = 86400  # 标签集合TTL，需不短于任何被标记缓存的TTL
+        self.scan_batch_size = 500  # SCAN/SSCAN每批数量及UNLINK批大小
     
     async def initialize(self) -> None:
         """初始化缓存管理器"""
@@ -135,6 +155,10 @@ class RedisCacheManager:
         """构建缓存键"""
         return f"{self.key_prefix}{key}"
     
+    def _build_tag_key(self, tag: str) -> str:
+        """构建标签集合键"""
+        return f"{self.key_prefix}{self.tag_prefix}{tag}"
+    
     async def get(self, key: str, default: Any = None) -> Any:
         """获取缓存值"""
         try:
@@ -147,16 +171,8 @@ class RedisCacheManager:
             if value is None:
                 return default
             
-            # 尝试JSON反序列化
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                # 如果JSON反序列化失败，尝试pickle
-                try:
-                    return pickle.loads(value)
-                except (pickle.PickleError, TypeError):
-                    # 如果都失败，返回原始字符串
-                    return value.decode('utf-8') if isinstance(value, bytes) else value
+            # 按首字节类型标记解码（兼容旧版JSON/pickle数据）
+            return self.codec.decode(value, key=key)
         
         except Exception as e:
             logger.error(f"获取缓存失败 {key}: {str(e)}")
@@ -167,9 +183,14 @@ class RedisCacheManager:
         key: str, 
         value: Any, 
         ttl: Optional[int] = None,
-        serialize_method: str = "json"
+        serialize_method: str = "json",
+        tags: Optional[List[str]] = None
     ) -> bool:
-        """设置缓存值"""
+        """设置缓存值
+        
+        tags 用于基于标签的失效（如 user:1、role:2、menu、device_type:X），
+        缓存键会登记到每个标签对应的Redis集合中。
+        """
         try:
             await self.redis_manager.ensure_connection()
             redis_client = self.redis_manager.redis
@@ -177,26 +198,30 @@ class RedisCacheManager:
             full_key = self._build_key(key)
             ttl = ttl or self.default_ttl
             
-            # 序列化值
-            if serialize_method == "json":
-                try:
-                    serialized_value = json.dumps(value, default=str, ensure_ascii=False)
-                except (TypeError, ValueError):
-                    # JSON序列化失败，使用pickle
-                    serialized_value = pickle.dumps(value)
-            elif serialize_method == "pickle":
-                serialized_value = pickle.dumps(value)
+            # 序列化值（json/msgpack/orjson走二进制编解码器，pickle需显式指定）
+            serialized_value = self.codec.encode(value, serialize_method, key=key)
+            
+            # 设置缓存（带标签时与标签登记合并为一次管道往返）
+            if tags:
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.setex(full_key, ttl, serialized_value)
+                tag_ttl = max(ttl, self.tag_ttl)
+                for tag in tags:
+                    tag_key = self._build_tag_key(tag)
+                    pipe.sadd(tag_key, full_key)
+                    pipe.expire(tag_key, tag_ttl)
+                result = (await pipe.execute())[0]
             else:
-                serialized_value = str(value)
-            
-            # 设置缓存
-            result = await redis_client.setex(full_key, ttl, serialized_value)
+                result = await redis_client.setex(full_key, ttl, serialized_value)
             
             if result:
                 logger.debug(f"缓存设置成功 {key}, TTL: {ttl}s")
             
             return bool(result)
         
+        except CacheCodecError as e:
+            logger.error(f"缓存值无法序列化 {key}: {str(e)}")
+            return False
         except Exception as e:
             logger.error(f"设置缓存失败 {key}: {str(e)}")
             return False
@@ -264,21 +289,112 @@ class RedisCacheManager:
             logger.error(f"获取缓存TTL失败 {key}: {str(e)}")
             return -1
     
+    async def acquire_lock(self, name: str, timeout: float = 10.0) -> Optional[str]:
+        """获取分布式锁，成功返回锁令牌，失败返回None"""
+        try:
+            await self.redis_manager.ensure_connection()
+            redis_client = self.redis_manager.redis
+            
+            token = uuid.uuid4().hex
+            acquired = await redis_client.set(
+                self._build_key(name), token, nx=True, px=max(int(timeout * 1000), 1)
+            )
+            return token if acquired else None
+        
+        except Exception as e:
+            logger.error(f"获取分布式锁失败 {name}: {str(e)}")
+            return None
+    
+    async def release_lock(self, name: str, token: str) -> bool:
+        """释放分布式锁（仅当令牌匹配时）"""
+        try:
+            await self.redis_manager.ensure_connection()
+            redis_client = self.redis_manager.redis
+            
+            result = await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, self._build_key(name), token)
+            return bool(result)
+        
+        except Exception as e:
+            logger.error(f"释放分布式锁失败 {name}: {str(e)}")
+            return False
+    
+    async def _unlink_keys(self, redis_client: Redis, keys: List[Any]) -> int:
+        """分批管道化UNLINK（后台释放内存，不阻塞Redis）"""
+        deleted_count = 0
+        for i in range(0, len(keys), self.scan_batch_size):
+            batch = keys[i:i + self.scan_batch_size]
+            deleted_count += await redis_client.unlink(*batch)
+        return deleted_count
+    
+    async def _scan_unlink(self, redis_client: Redis, full_pattern: str) -> int:
+        """SCAN遍历匹配的键并分批UNLINK"""
+        deleted_count = 0
+        batch: List[Any] = []
+        async for key in redis_client.scan_iter(match=full_pattern, count=self.scan_batch_size):
+            batch.append(key)
+            if len(batch) >= self.scan_batch_size:
+                deleted_count += await redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted_count += await redis_client.unlink(*batch)
+        return deleted_count
+    
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        """按标签失效缓存：删除标签集合中的所有成员及集合本身"""
+        if not tags:
+            return 0
+        try:
+            await self.redis_manager.ensure_connection()
+            redis_client = self.redis_manager.redis
+            
+            deleted_count = 0
+            for tag in tags:
+                tag_key = self._build_tag_key(tag)
+                members: List[Any] = []
+                async for member in redis_client.sscan_iter(tag_key, count=self.scan_batch_size):
+                    members.append(member)
+                    if len(members) >= self.scan_batch_size:
+                        deleted_count += await self._unlink_keys(redis_client, members)
+                        members = []
+                if members:
+                    deleted_count += await self._unlink_keys(redis_client, members)
+                await redis_client.unlink(tag_key)
+            
+            logger.debug(f"按标签失效缓存: {tags}, 清理数量: {deleted_count}")
+            return deleted_count
+        
+        except Exception as e:
+            logger.error(f"按标签失效缓存失败 {tags}: {str(e)}")
+            return 0
+    
+    async def count_pattern(self, pattern: str) -> int:
+        """统计匹配模式的键数量（SCAN，不阻塞Redis）"""
+        try:
+            await self.redis_manager.ensure_connection()
+            redis_client = self.redis_manager.redis
+            
+            count = 0
+            async for _ in redis_client.scan_iter(match=self._build_key(pattern), count=self.scan_batch_size):
+                count += 1
+            return count
+        
+        except Exception as e:
+            logger.error(f"统计缓存键失败 {pattern}: {str(e)}")
+            return 0
+    
     async def clear_pattern(self, pattern: str) -> int:
-        """清理匹配模式的缓存"""
+        """清理匹配模式的缓存（旧版模式失效，使用SCAN+UNLINK）"""
         try:
             await self.redis_manager.ensure_connection()
             redis_client = self.redis_manager.redis
             
             full_pattern = self._build_key(pattern)
-            keys = await redis_client.keys(full_pattern)
+            deleted_count = await self._scan_unlink(redis_client, full_pattern)
             
-            if keys:
-                deleted_count = await redis_client.delete(*keys)
+            if deleted_count:
                 logger.debug(f"批量清理缓存: {pattern}, 清理数量: {deleted_count}")
-                return deleted_count
             
-            return 0
+            return deleted_count
         
         except Exception as e:
             logger.error(f"批量清理缓存失败 {pattern}: {str(e)}")
@@ -292,10 +408,9 @@ class RedisCacheManager:
             
             # 只清理带有前缀的键
             pattern = f"{self.key_prefix}*"
-            keys = await redis_client.keys(pattern)
+            deleted_count = await self._scan_unlink(redis_client, pattern)
             
-            if keys:
-                deleted_count = await redis_client.delete(*keys)
+            if deleted_count:
                 logger.info(f"清理所有缓存完成, 清理数量: {deleted_count}")
             
             return True
@@ -304,6 +419,10 @@ class RedisCacheManager:
             logger.error(f"清理所有缓存失败: {str(e)}")
             return False
     
+    def get_codec_stats(self) -> Dict[str, Any]:
+        """获取按键前缀统计的序列化大小与耗时"""
+        return self.codec.get_stats()
+    
     async def get_cache_info(self) -> Dict[str, Any]:
         """获取缓存信息"""
         try:
@@ -314,17 +433,17 @@ class RedisCacheManager:
             info = await redis_client.info()
             
             # 获取我们的键数量
-            pattern = f"{self.key_prefix}*"
-            keys = await redis_client.keys(pattern)
+            total_keys = await self.count_pattern("*")
             
             return {
                 "redis_version": info.get("redis_version", "unknown"),
                 "connected_clients": info.get("connected_clients", 0),
                 "used_memory": info.get("used_memory", 0),
                 "used_memory_human": info.get("used_memory_human", "0B"),
-                "total_keys": len(keys),
+                "total_keys": total_keys,
                 "key_prefix": self.key_prefix,
-                "default_ttl": self.default_ttl
+                "default_ttl": self.default_ttl,
+                "codec": self.codec.get_stats()
             }
         
         except Exception as e:
@@ -371,45 +490,222 @@ class RedisCacheManager:
 
 
 # 缓存装饰器
+_CACHE_ENVELOPE_TAG = "__rc__"
+
+# 进程内正在回源的缓存键 -> 回源任务（single-flight）
+_inflight_loads: Dict[str, asyncio.Task] = {}
+
+
+class UncacheableArgumentError(TypeError):
+    """参数无法生成稳定且唯一的缓存键"""
+
+
+def _canonical_default(obj: Any) -> Any:
+    """规范化编码无法直接JSON化的参数
+
+    结果在不同进程/重启之间保持稳定，不依赖 hash() 或对象内存地址。
+    无法区分取值的对象抛出 UncacheableArgumentError，而不是按类型合并成同一个键。
+    """
+    if hasattr(obj, "__cache_key__"):
+        return obj.__cache_key__()
+    if isinstance(obj, (datetime, date, dt_time)):
+        return obj.isoformat()
+    if isinstance(obj, (Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, bytes):
+        return obj.hex()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(_canonical_encode(item) for item in obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, type):
+        return f"<type:{obj.__module__}.{obj.__qualname__}>"
+    obj_type = f"{type(obj).__module__}.{type(obj).__qualname__}"
+    pk = getattr(obj, "pk", None)
+    if pk is not None:
+        # ORM实例按类型+主键区分
+        return f"<{obj_type}:{pk}>"
+    raise UncacheableArgumentError(
+        f"参数类型 {obj_type} 无法生成缓存键，请实现 __cache_key__ 或为装饰器传入 key_func"
+    )
+
+
+@lru_cache(maxsize=None)
+def _has_bound_receiver(func: Callable) -> bool:
+    """函数的第一个参数是否为方法的 self/cls"""
+    try:
+        params = list(inspect.signature(func).parameters)
+    except (TypeError, ValueError):
+        return False
+    return bool(params) and params[0] in ("self", "cls")
+
+
+def _canonical_encode(value: Any) -> str:
+    """参数的规范化JSON编码（键排序、紧凑分隔符）"""
+    try:
+        return json.dumps(
+            value, default=_canonical_default, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+    except UncacheableArgumentError:
+        raise
+    except TypeError:
+        # 字典键类型混杂无法排序时，退化为按条目编码后排序
+        if isinstance(value, dict):
+            items = sorted(_canonical_encode([k, v]) for k, v in value.items())
+            return "{" + ",".join(items) + "}"
+        raise
+
+
+def make_cache_key(func: Callable, args: tuple, kwargs: dict, key_prefix: str = "") -> str:
+    """根据函数与参数生成跨进程稳定的缓存键
+
+    方法的 self/cls 只按类型参与键（控制器/服务实例）；其他无法区分取值的参数抛出
+    UncacheableArgumentError。
+    """
+    if args and _has_bound_receiver(func):
+        receiver = args[0] if isinstance(args[0], type) else type(args[0])
+        args = (f"<{receiver.__module__}.{receiver.__qualname__}>", *args[1:])
+    payload = _canonical_encode(
+        [f"{func.__module__}.{func.__qualname__}", list(args), kwargs]
+    )
+    digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    return "_".join(filter(None, [key_prefix, func.__name__, digest]))
+
+
+def _single_flight(cache_key: str, loader: Callable[[], Awaitable[Any]]) -> "asyncio.Task":
+    """同一进程内对同一缓存键的并发回源合并为一次"""
+    task = _inflight_loads.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(loader())
+        _inflight_loads[cache_key] = task
+
+        def _cleanup(done: asyncio.Task) -> None:
+            if _inflight_loads.get(cache_key) is done:
+                _inflight_loads.pop(cache_key, None)
+
+        task.add_done_callback(_cleanup)
+    return task
+
+
+def _log_refresh_failure(task: asyncio.Task) -> None:
+    """后台刷新任务的异常记录"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"缓存后台刷新失败: {task.exception()}")
+
+
 def redis_cache(
     ttl: int = 300,
     key_prefix: str = "",
-    serialize_method: str = "json"
+    serialize_method: str = "json",
+    key_func: Optional[Callable[..., str]] = None,
+    stale_ttl: int = 0,
+    distributed_lock: bool = False,
+    lock_timeout: float = 10.0,
+    tags: Union[List[str], Callable[..., List[str]], None] = None,
 ):
-    """Redis缓存装饰器"""
+    """Redis缓存装饰器
+
+    Args:
+        ttl: 缓存新鲜期（秒）
+        key_prefix: 缓存键前缀
+        serialize_method: 序列化方式，透传给 RedisCacheManager.set
+        key_func: 自定义缓存键函数，签名与被装饰函数一致，返回键后缀；
+            未提供时参数中有无法生成缓存键的对象（见 make_cache_key）则该次调用不走缓存
+        stale_ttl: 过期后仍可返回旧值的时长（秒），期间后台异步刷新
+        distributed_lock: 是否使用Redis锁在多个worker之间合并回源
+        lock_timeout: 分布式锁的持有上限及等待其他worker回源的最长时间（秒）
+        tags: 失效标签列表，或签名与被装饰函数一致、返回标签列表的函数
+    """
     def decorator(func):
+        uncacheable_warned = False
+
+        def build_key(*args, **kwargs) -> str:
+            if key_func is not None:
+                return "_".join(filter(None, [key_prefix, func.__name__, str(key_func(*args, **kwargs))]))
+            return make_cache_key(func, args, kwargs, key_prefix)
+
+        def unwrap(envelope: Any) -> Optional[tuple]:
+            """解析缓存信封，返回 (值, 是否新鲜)；非本装饰器写入的值视为未命中"""
+            if not isinstance(envelope, dict) or envelope.get(_CACHE_ENVELOPE_TAG) != 1:
+                return None
+            return envelope.get("v"), envelope.get("exp", 0) > time.time()
+
+        async def wait_for_peer(cache_key: str) -> Optional[tuple]:
+            """其他worker持有回源锁时，轮询等待其写入新值"""
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                cached = unwrap(await redis_cache_manager.get(cache_key))
+                if cached is not None and cached[1]:
+                    return cached
+            return None
+
+        async def load(cache_key: str, args: tuple, kwargs: dict) -> Any:
+            lock_token = None
+            if distributed_lock:
+                lock_name = f"lock:{cache_key}"
+                lock_token = await redis_cache_manager.acquire_lock(lock_name, lock_timeout)
+                if lock_token is None:
+                    cached = await wait_for_peer(cache_key)
+                    if cached is not None:
+                        return cached[0]
+            try:
+                result = await func(*args, **kwargs)
+                envelope = {_CACHE_ENVELOPE_TAG: 1, "v": result, "exp": time.time() + ttl}
+                await redis_cache_manager.set(
+                    cache_key,
+                    envelope,
+                    ttl=ttl + max(stale_ttl, 0),
+                    serialize_method=serialize_method,
+                    tags=tags(*args, **kwargs) if callable(tags) else tags
+                )
+                return result
+            finally:
+                if lock_token is not None:
+                    await redis_cache_manager.release_lock(f"lock:{cache_key}", lock_token)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # 生成缓存键
-            cache_key_parts = [key_prefix, func.__name__]
-            
-            # 添加参数到缓存键
-            if args:
-                cache_key_parts.append(str(hash(str(args))))
-            if kwargs:
-                cache_key_parts.append(str(hash(str(sorted(kwargs.items())))))
-            
-            cache_key = "_".join(filter(None, cache_key_parts))
-            
+            try:
+                cache_key = build_key(*args, **kwargs)
+            except UncacheableArgumentError as e:
+                # 不同参数可能合并成同一个键，宁可不缓存也不返回其他调用的结果
+                nonlocal uncacheable_warned
+                if not uncacheable_warned:
+                    uncacheable_warned = True
+                    logger.warning(f"{func.__qualname__} 未使用缓存: {e}")
+                return await func(*args, **kwargs)
+
             # 尝试从缓存获取
-            cached_result = await redis_cache_manager.get(cache_key)
-            if cached_result is not None:
-                logger.debug(f"缓存命中: {cache_key}")
-                return cached_result
-            
-            # 执行函数
-            result = await func(*args, **kwargs)
-            
-            # 缓存结果
-            await redis_cache_manager.set(
-                cache_key, 
-                result, 
-                ttl=ttl, 
-                serialize_method=serialize_method
-            )
-            
-            return result
-        
+            cached = unwrap(await redis_cache_manager.get(cache_key))
+            if cached is not None:
+                value, fresh = cached
+                if fresh:
+                    logger.debug(f"缓存命中: {cache_key}")
+                    return value
+                # 过期但仍在stale窗口内：返回旧值并后台刷新
+                if cache_key not in _inflight_loads:
+                    task = _single_flight(cache_key, lambda: load(cache_key, args, kwargs))
+                    task.add_done_callback(_log_refresh_failure)
+                logger.debug(f"缓存过期，返回旧值并后台刷新: {cache_key}")
+                return value
+
+            # 未命中：同键并发请求只回源一次
+            task = _single_flight(cache_key, lambda: load(cache_key, args, kwargs))
+            return await asyncio.shield(task)
+
+        async def invalidate(*args, **kwargs) -> bool:
+            """删除指定参数对应的缓存"""
+            try:
+                cache_key = build_key(*args, **kwargs)
+            except UncacheableArgumentError:
+                return False
+            return await redis_cache_manager.delete(cache_key)
+
+        wrapper.cache_key = build_key
+        wrapper.invalidate = invalidate
         return wrapper
     return decorator
 
@@ -420,7 +716,11 @@ redis_cache_manager = RedisCacheManager()
 
 # 缓存失效管理器
 class CacheInvalidationManager:
-    """缓存失效管理器"""
+    """缓存失效管理器
+    
+    优先按标签集合失效（user:ID、role:ID、menu、device_type:X），
+    旧版键模式通过 SCAN+UNLINK 兜底，不再使用阻塞的 KEYS。
+    """
     
     def __init__(self, cache_manager: RedisCacheManager):
         self.cache_manager = cache_manager
@@ -435,6 +735,10 @@ class CacheInvalidationManager:
             "permission": ["permission_*", "user_*", "role_*"],
         }
     
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        """按标签失效缓存"""
+        return await self.cache_manager.invalidate_tags(tags)
+    
     async def invalidate_by_type(self, cache_type: str) -> int:
         """根据类型失效缓存"""
         patterns = self.invalidation_patterns.get(cache_type, [])
@@ -449,6 +753,9 @@ class CacheInvalidationManager:
     
     async def invalidate_user_cache(self, user_id: int) -> None:
         """失效特定用户的缓存"""
+        await self.cache_manager.invalidate_tags([f"user:{user_id}"])
+        
+        # 旧版按用户前缀写入的键
         patterns = [
             f"user_{user_id}_*",
             f"auth_{user_id}_*",
@@ -459,15 +766,13 @@ class CacheInvalidationManager:
             await self.cache_manager.clear_pattern(pattern)
     
     async def invalidate_role_cache(self, role_id: int) -> None:
-        """失效特定角色的缓存"""
-        patterns = [
-            f"role_{role_id}_*",
-            "permission_*",  # 角色变更影响所有权限缓存
-            "user_*"  # 角色变更可能影响用户权限
-        ]
+        """失效特定角色的缓存
         
-        for pattern in patterns:
-            await self.cache_manager.clear_pattern(pattern)
+        只删除登记在该角色标签下的缓存（持有该角色的用户权限、菜单等），
+        以及未记录角色信息的用户级缓存（role:unknown），不再清空全部权限缓存。
+        """
+        await self.cache_manager.invalidate_tags([f"role:{role_id}", "role:unknown"])
+        await self.cache_manager.clear_pattern(f"role_{role_id}_*")
 
 
 # 全局缓存失效管理器
@@ -3,6 +3,10 @@
 """
 API v2 响应格式标准化器
 提供增强的响应格式，包含HATEOAS支持、请求追踪等功能
+
+响应体由 orjson 一次编码为字节：信封结构直接构建为字典，data 中的
+datetime/date/UUID/Enum/numpy 由 orjson 原生处理，Decimal 转为浮点数，
+Pydantic 模型按 exclude_none 转换，不再经过 model_dump → json.dumps → json.loads → 再次编码。
 """
 
 import time
@@ -13,6 +17,7 @@ from datetime import datetime
 from typing import Any, Optional, Dict, List, Union
 from urllib.parse import urlencode
 
+import orjson
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, ConfigDict
@@ -28,6 +33,36 @@ class DecimalEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _orjson_default(obj: Any) -> Any:
+    """orjson 无法原生编码的类型"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(exclude_none=True)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def encode_v2_json(content: Any) -> bytes:
+    """将响应内容一次编码为JSON字节"""
+    return orjson.dumps(content, default=_orjson_default, option=_ORJSON_OPTIONS)
+
+
+class V2JSONResponse(JSONResponse):
+    """单次编码的v2 JSON响应"""
+
+    def render(self, content: Any) -> bytes:
+        return encode_v2_json(content)
+
+
+def _dump_model(model: Optional[BaseModel]) -> Optional[Dict[str, Any]]:
+    return model.model_dump(exclude_none=True) if model is not None else None
+
+
 class HATEOASLinks(BaseModel):
     """HATEOAS链接模型"""
     self: Optional[str] = None
@@ -49,6 +84,9 @@ class ResponseMeta(BaseModel):
     timestamp: str
     request_id: str
     execution_time: Optional[int] = None  # 执行时间(毫秒)
+    next_cursor: Optional[str] = None  # 时间游标分页的续页令牌
+    total_estimated: Optional[bool] = None  # total 是否为估算值
+    downsample: Optional[Dict[str, Any]] = None  # 图表降采样信息
 
 
 class APIv2Response(BaseModel):
@@ -229,6 +267,26 @@ class ResponseFormatterV2:
         
         return links
     
+    @staticmethod
+    def _success_response(
+        code: int,
+        message: str,
+        data: Any,
+        meta: ResponseMeta,
+        links: Optional[HATEOASLinks] = None,
+        generated_sql: Optional[str] = None
+    ) -> V2JSONResponse:
+        """按 APIv2Response 的字段顺序构建信封（省略空值字段），由响应类一次编码"""
+        content = {"success": True, "code": code, "message": message}
+        if data is not None:
+            content["data"] = data
+        content["meta"] = _dump_model(meta)
+        if links is not None:
+            content["links"] = _dump_model(links)
+        if generated_sql is not None:
+            content["generated_sql"] = generated_sql
+        return V2JSONResponse(content=content, status_code=code)
+    
     def success(
         self,
         data: Optional[Any] = None,
@@ -250,38 +308,7 @@ class ResponseFormatterV2:
                 related_resources=related_resources
             )
         
-        response_data = APIv2Response(
-            success=True,
-            code=code,
-            message=message,
-            data=data,
-            meta=meta,
-            links=links,
-            generated_sql=generated_sql
-        )
-        
-        # 移除调试信息以避免Content-Length问题
-        
-        import json
-        from datetime import datetime
-        from decimal import Decimal
-        
-        def datetime_serializer(obj):
-            if isinstance(obj, datetime):
-                return obj.isoformat()
-            if isinstance(obj, Decimal):
-                return float(obj)
-            raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
-        
-        try:
-            content = response_data.model_dump(exclude_none=True)
-        except AttributeError as e:
-            raise
-        
-        return JSONResponse(
-            content=json.loads(json.dumps(content, default=datetime_serializer)),
-            status_code=code
-        )
+        return self._success_response(code, message, data, meta, links, generated_sql)
     
     def paginated_success(
         self,
@@ -309,20 +336,41 @@ class ResponseFormatterV2:
                 query_params=query_params
             )
         
-        response_data = APIv2Response(
-            success=True,
-            code=code,
-            message=message,
-            data=data,
-            meta=meta,
-            links=links,
-            generated_sql=generated_sql
-        )
-        
-        return JSONResponse(
-            content=response_data.model_dump(mode='json', exclude_none=True),
-            status_code=code
-        )
+        return self._success_response(code, message, data, meta, links, generated_sql)
+    
+    def cursor_paginated_success(
+        self,
+        data: List[Any],
+        page_size: int,
+        next_cursor: Optional[str] = None,
+        total: Optional[int] = None,
+        total_estimated: bool = False,
+        page: Optional[int] = None,
+        has_prev: bool = False,
+        message: str = "success",
+        code: int = 200,
+        resource_type: Optional[str] = None,
+        query_params: Optional[Dict[str, Any]] = None,
+        downsample: Optional[Dict[str, Any]] = None
+    ) -> JSONResponse:
+        """创建游标分页成功响应（总数可为空或估算值）"""
+        meta = self._build_meta(total=total, page=page, page_size=page_size)
+        meta.has_next = next_cursor is not None
+        meta.has_prev = has_prev or bool(page and page > 1)
+        meta.next_cursor = next_cursor
+        meta.total_estimated = total_estimated if total is not None else None
+        meta.downsample = downsample
+
+        links = None
+        if self.request and resource_type:
+            base_url = f"/api/v2/{resource_type}"
+            params = {**(query_params or {}), 'page_size': page_size}
+            links = HATEOASLinks(self=str(self.request.url))
+            if next_cursor:
+                links.next = f"{base_url}?{urlencode({**params, 'cursor': next_cursor})}"
+            links.first = f"{base_url}?{urlencode(params)}"
+
+        return self._success_response(code, message, data, meta, links)
     
     def error(
         self,
@@ -407,16 +455,8 @@ class ResponseFormatterV2:
         else:
             http_status = 400
         
-        try:
-            content = response_data.model_dump(exclude_none=True)
-        except AttributeError as e:
-            # 调试信息：如果 response_data 不是 Pydantic 模型
-            print(f"DEBUG: response_data type: {type(response_data)}")
-            print(f"DEBUG: response_data value: {response_data}")
-            raise e
-        
-        return JSONResponse(
-            content=content,
+        return V2JSONResponse(
+            content=response_data.model_dump(exclude_none=True),
             status_code=http_status
         )
     
@@ -622,7 +662,7 @@ class ResponseFormatterV2:
                 "help": "/api/v2/docs/batch-operations"
             }
         
-        return JSONResponse(
+        return V2JSONResponse(
             content=response_data,
             status_code=code
         )
@@ -114,6 +114,12 @@ class ApplicationStartup:
                 replace_existing=True
             )
             
+            # 添加设备群健康评分任务（AI健康评分启用时）
+            self._add_fleet_health_scoring_job()
+            
+            # 添加ARIMA定时定阶任务（AI趋势预测启用时）
+            self._add_forecast_order_selection_job()
+            
             self.task_scheduler_initialized = True
             logger.info("异步任务调度器初始化成功")
         except Exception as e:
@@ -121,6 +127,44 @@ class ApplicationStartup:
             # 任务调度器初始化失败不应该阻止应用启动
             self.task_scheduler_initialized = False
     
+    def _add_fleet_health_scoring_job(self) -> None:
+        """注册设备群健康评分定时任务"""
+        try:
+            from app.settings.ai_settings import ai_settings
+            if not ai_settings.is_feature_enabled('health_scoring'):
+                return
+            
+            from app.services.ai.fleet_health_scoring import fleet_health_scoring_service
+            scheduler_manager.add_job(
+                fleet_health_scoring_service.run,
+                IntervalTrigger(minutes=ai_settings.ai_health_scoring_interval_minutes),
+                id='ai_fleet_health_scoring',
+                name='设备群健康评分',
+                replace_existing=True,
+                max_instances=1
+            )
+        except Exception as e:
+            logger.warning(f"设备群健康评分任务注册失败: {str(e)}")
+    
+    def _add_forecast_order_selection_job(self) -> None:
+        """注册ARIMA定时定阶任务，请求路径只复用已选定的阶数"""
+        try:
+            from app.settings.ai_settings import ai_settings
+            if not ai_settings.is_feature_enabled('trend_prediction'):
+                return
+            
+            from app.services.ai.forecast_service import forecast_service
+            scheduler_manager.add_job(
+                forecast_service.select_orders,
+                IntervalTrigger(minutes=ai_settings.ai_forecast_order_selection_interval_minutes),
+                id='ai_forecast_order_selection',
+                name='ARIMA定时定阶',
+                replace_existing=True,
+                max_instances=1
+            )
+        except Exception as e:
+            logger.warning(f"ARIMA定时定阶任务注册失败: {str(e)}")
+    
     async def _initialize_device_collector(self) -> None:
         """初始化设备采集器"""
         try:
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式导出工具
+
+数据源以异步批次（每批若干行字典）按游标分页产出，编码器逐批增量编码为
+CSV / NDJSON / Parquet / Arrow IPC，可选 gzip 压缩后通过 StreamingResponse 输出，
+内存占用只与单批大小有关，与导出总量无关。
+"""
+
+import csv
+import io
+import zlib
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+from uuid import UUID
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from tortoise.expressions import Q
+
+from app.log import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 可选依赖
+    pa = None
+    pa_ipc = None
+    pq = None
+
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+STREAM_FORMATS = (FORMAT_CSV, FORMAT_NDJSON, FORMAT_PARQUET, FORMAT_ARROW)
+
+_MEDIA_TYPES = {
+    FORMAT_CSV: "text/csv; charset=utf-8",
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_PARQUET: "application/vnd.apache.parquet",
+    FORMAT_ARROW: "application/vnd.apache.arrow.stream",
+}
+
+_FILE_EXTENSIONS = {
+    FORMAT_CSV: "csv",
+    FORMAT_NDJSON: "ndjson",
+    FORMAT_PARQUET: "parquet",
+    FORMAT_ARROW: "arrows",
+}
+
+RowBatches = AsyncIterator[List[Dict[str, Any]]]
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, (Decimal, UUID)):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"类型 {type(obj).__name__} 无法编码为JSON")
+
+
+def _scalar(value: Any) -> Any:
+    """CSV/列式格式的单元格值：嵌套结构编码为JSON字符串"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (dict, list, tuple)):
+        return orjson.dumps(value, default=_json_default).decode("utf-8")
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def _csv_cell(value: Any) -> Any:
+    value = _scalar(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+class _ChunkSink(io.RawIOBase):
+    """供 pyarrow 写入的内存缓冲，每批写完后取走已编码的字节"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def encode_csv(batches: RowBatches, columns: Optional[List[str]] = None) -> AsyncIterator[bytes]:
+    """逐批编码CSV，表头取自显式列或第一批数据；首块带BOM便于Excel识别UTF-8"""
+    header = list(columns) if columns else None
+    first = True
+    async for rows in batches:
+        if not rows:
+            continue
+        if header is None:
+            header = list(rows[0].keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if first:
+            buffer.write("\ufeff")
+            writer.writerow(header)
+            first = False
+        writer.writerows([_csv_cell(row.get(col)) for col in header] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+    if first and header:
+        yield ("\ufeff" + ",".join(header) + "\r\n").encode("utf-8")
+
+
+async def encode_ndjson(batches: RowBatches, columns: Optional[List[str]] = None) -> AsyncIterator[bytes]:
+    """逐行编码NDJSON"""
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+    async for rows in batches:
+        if columns:
+            rows = [{col: row.get(col) for col in columns} for row in rows]
+        if rows:
+            yield b"".join(orjson.dumps(row, default=_json_default, option=option) for row in rows)
+
+
+def _arrow_type_for(py_type: Any):
+    """Python 类型到 Arrow 类型（嵌套结构、Decimal、UUID 与单元格编码一致，按字符串输出）"""
+    if not isinstance(py_type, type):
+        return pa.string()
+    if issubclass(py_type, Enum):
+        return pa.int64() if issubclass(py_type, int) else pa.string()
+    if issubclass(py_type, bool):
+        return pa.bool_()
+    if issubclass(py_type, int):
+        return pa.int64()
+    if issubclass(py_type, float):
+        return pa.float64()
+    if issubclass(py_type, datetime):
+        return pa.timestamp("us", tz="UTC")
+    if issubclass(py_type, date):
+        return pa.date32()
+    if issubclass(py_type, dt_time):
+        return pa.time64("us")
+    return pa.string()
+
+
+def arrow_schema_for_model(model, fields: List[str]):
+    """按 Tortoise 模型字段定义生成 Arrow 模式，避免首批全为空的列被推断为 null 类型
+
+    未安装 pyarrow 时返回 None（导出格式校验会先行拒绝 Parquet/Arrow）。
+    """
+    if pa is None:
+        return None
+    fields_map = model._meta.fields_map
+    return pa.schema([
+        pa.field(name, _arrow_type_for(getattr(fields_map.get(name), "field_type", None)))
+        for name in fields
+    ])
+
+
+def _stringify(values: List[Any]) -> List[Any]:
+    return [None if v is None else (v.isoformat() if isinstance(v, (datetime, date, dt_time)) else str(v)) for v in values]
+
+
+def _to_arrow_table(rows: List[Dict[str, Any]], names: List[str], schema=None):
+    data = {name: [_scalar(row.get(name)) for row in rows] for name in names}
+    if schema is None:
+        return pa.Table.from_pydict(data)
+    for field in schema:
+        if pa.types.is_string(field.type):
+            data[field.name] = _stringify(data[field.name])
+    return pa.Table.from_pydict(data, schema=schema)
+
+
+def _promote_null_columns(schema):
+    """仍无法确定类型的全空列按字符串输出（后续批次的值转为字符串写入）"""
+    return pa.schema([
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    ])
+
+
+async def encode_arrow(
+    batches: RowBatches,
+    columns: Optional[List[str]] = None,
+    parquet: bool = False,
+    schema=None,
+    max_pending_rows: int = 50000,
+) -> AsyncIterator[bytes]:
+    """逐批编码 Arrow IPC 流或 Parquet（每批一个行组）
+
+    模式优先取调用方给出的列定义（如模型字段）；否则按数据推断，
+    推断出 null 类型的列（前几批全为空）会继续缓存后续批次等待其出现非空值，
+    缓存超过 max_pending_rows 行仍为空的列按字符串输出，保证后续批次可以写入同一模式。
+    """
+    if pa is None:
+        raise HTTPException(status_code=400, detail="服务器未安装pyarrow，不支持Parquet/Arrow导出")
+
+    sink = _ChunkSink()
+    writer = None
+    names = list(columns) if columns else None
+    pending: List[Dict[str, Any]] = []
+
+    def open_writer(resolved):
+        if parquet:
+            return pq.ParquetWriter(sink, resolved, compression="zstd")
+        return pa_ipc.new_stream(sink, resolved)
+
+    try:
+        async for rows in batches:
+            if not rows:
+                continue
+            if names is None:
+                names = list(schema.names) if schema is not None else list(rows[0].keys())
+            if writer is None:
+                if schema is None:
+                    pending.extend(rows)
+                    inferred = _to_arrow_table(pending, names).schema
+                    if any(pa.types.is_null(field.type) for field in inferred) and len(pending) < max_pending_rows:
+                        continue
+                    schema = _promote_null_columns(inferred)
+                    rows, pending = pending, []
+                writer = open_writer(schema)
+            writer.write_table(_to_arrow_table(rows, names, schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        if writer is None and pending:
+            schema = _promote_null_columns(_to_arrow_table(pending, names).schema)
+            writer = open_writer(schema)
+            writer.write_table(_to_arrow_table(pending, names, schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """增量gzip压缩"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def normalize_stream_format(fmt: str) -> str:
+    fmt = (fmt or FORMAT_CSV).lower()
+    if fmt == "jsonl":
+        fmt = FORMAT_NDJSON
+    if fmt not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的流式导出格式: {fmt}，可选 {', '.join(STREAM_FORMATS)}")
+    if fmt in (FORMAT_PARQUET, FORMAT_ARROW) and pa is None:
+        raise HTTPException(status_code=400, detail="服务器未安装pyarrow，不支持Parquet/Arrow导出")
+    return fmt
+
+
+def encode_batches(
+    batches: RowBatches,
+    fmt: str,
+    columns: Optional[List[str]] = None,
+    arrow_schema=None,
+) -> AsyncIterator[bytes]:
+    if fmt == FORMAT_CSV:
+        return encode_csv(batches, columns)
+    if fmt == FORMAT_NDJSON:
+        return encode_ndjson(batches, columns)
+    return encode_arrow(batches, columns, parquet=fmt == FORMAT_PARQUET, schema=arrow_schema)
+
+
+async def _logged(chunks: AsyncIterator[bytes], name: str) -> AsyncIterator[bytes]:
+    total = 0
+    try:
+        async for chunk in chunks:
+            total += len(chunk)
+            yield chunk
+    except Exception as e:
+        # 响应头已发送，只能中断连接并记录
+        logger.error(f"流式导出中断 {name}: {e}")
+        raise
+    logger.info(f"流式导出完成 {name}: {total} 字节")
+
+
+def streaming_export_response(
+    batches: RowBatches,
+    fmt: str,
+    filename: str,
+    columns: Optional[List[str]] = None,
+    gzip: bool = True,
+    arrow_schema=None,
+) -> StreamingResponse:
+    """构建流式导出响应
+
+    Parquet 自带列压缩，不再叠加gzip；其他格式在 gzip=True 时输出 .gz 文件。
+    arrow_schema 为 Parquet/Arrow 的列定义（pyarrow Schema，可由 arrow_schema_for_model 生成），缺省时按数据推断。
+    """
+    fmt = normalize_stream_format(fmt)
+    chunks = encode_batches(batches, fmt, columns, arrow_schema)
+    full_name = f"{filename}.{_FILE_EXTENSIONS[fmt]}"
+    media_type = _MEDIA_TYPES[fmt]
+    if gzip and fmt != FORMAT_PARQUET:
+        chunks = gzip_stream(chunks)
+        full_name += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        _logged(chunks, full_name),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{full_name}"',
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+async def chunked(items: Iterable[Dict[str, Any]], batch_size: int = 1000) -> RowBatches:
+    """将内存中已有的行序列按批产出（用于单条记录内的大型JSON结果）"""
+    batch: List[Dict[str, Any]] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def keyset_model_batches(
+    queryset,
+    fields: List[str],
+    order_field: str,
+    batch_size: int = 1000,
+) -> RowBatches:
+    """按 (时间字段, id) 倒序键集分页读取ORM数据，每批一次查询，续页代价与深度无关"""
+    fields = list(dict.fromkeys([*fields, "id", order_field]))
+    last_row = None
+    while True:
+        page = queryset
+        if last_row is not None:
+            page = page.filter(
+                Q(**{f"{order_field}__lt": last_row[order_field]})
+                | Q(**{order_field: last_row[order_field], "id__lt": last_row["id"]})
+            )
+        rows = await page.order_by(f"-{order_field}", "-id").limit(batch_size).values(*fields)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_row = rows[-1]
@@ -1,8 +1,11 @@
+import time
+
 import httpx
 from typing import Optional
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
 from app.log import logger
 from app.core.tdengine_config import tdengine_config_manager, TDengineServerConfig
+from app.core.instrumentation import sql_template, tdengine_query_seconds
 
 
 class TDengineConnector:
@@ -88,7 +91,12 @@ class TDengineConnector:
                 final_sql = sql
 
         logger.info(f"Executing SQL: {final_sql} on path {path}")
-        return await self._request("POST", path, data=final_sql)
+        started = time.perf_counter()
+        try:
+            return await self._request("POST", path, data=final_sql)
+        finally:
+            # 含重试在内的实际耗时，按SQL模板归类
+            tdengine_query_seconds.observe(time.perf_counter() - started, sql_template(sql))
 
     async def create_database(self, db_name: str, if_not_exists: bool = True):
         sql = f"CREATE DATABASE {'IF NOT EXISTS ' if if_not_exists else ''}{db_name}"
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TDengine 时间游标分页工具
+
+以上一页最后一行的 ts（超级表查询附带 tbname）作为不透明的续页令牌，
+续页查询改为 `WHERE ts < 上次ts` 的键集条件，代价与页深无关；
+总数可精确统计、按块元数据估算或直接跳过。
+"""
+
+import base64
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.exceptions import APIException
+from app.log import logger
+
+
+COUNT_EXACT = "exact"
+COUNT_ESTIMATE = "estimate"
+COUNT_NONE = "none"
+COUNT_MODES = (COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE)
+
+_TOTAL_ROWS_PATTERN = re.compile(r"Total_Rows=\[?(\d+)\]?", re.IGNORECASE)
+
+
+class InvalidCursorError(APIException):
+    """续页令牌无法解析"""
+
+    def __init__(self, message: str = "无效的分页游标"):
+        super().__init__(message=message, code=400, error_code="INVALID_CURSOR")
+
+
+@dataclass(frozen=True)
+class TimeCursor:
+    """时间游标：上一页最后一行的时间戳与子表名"""
+
+    ts: str
+    tbname: Optional[str] = None
+    order: str = "desc"
+
+    def encode(self) -> str:
+        payload = {"t": self.ts, "o": self.order}
+        if self.tbname is not None:
+            payload["b"] = self.tbname
+        raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+    @classmethod
+    def decode(cls, token: str) -> "TimeCursor":
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            ts = payload["t"]
+            order = payload.get("o", "desc")
+            tbname = payload.get("b")
+        except Exception:
+            raise InvalidCursorError()
+        if not isinstance(ts, str) or order not in ("asc", "desc") or (tbname is not None and not isinstance(tbname, str)):
+            raise InvalidCursorError()
+        return cls(ts=ts, tbname=tbname, order=order)
+
+
+def normalize_count_mode(count_mode: Optional[str], has_cursor: bool) -> str:
+    """续页请求默认不再统计总数（首页已返回），其余默认精确统计以保持兼容"""
+    if count_mode is None:
+        return COUNT_NONE if has_cursor else COUNT_EXACT
+    count_mode = count_mode.lower()
+    if count_mode not in COUNT_MODES:
+        raise APIException(message=f"不支持的计数模式: {count_mode}，可选 {', '.join(COUNT_MODES)}", code=400)
+    return count_mode
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def keyset_condition(cursor: TimeCursor, with_tbname: bool = False, ts_column: str = "ts") -> str:
+    """生成续页的键集条件；超级表查询以 tbname 作为相同时间戳的次序"""
+    op = "<" if cursor.order == "desc" else ">"
+    ts_value = _quote(cursor.ts)
+    if with_tbname and cursor.tbname is not None:
+        return (
+            f"({ts_column} {op} '{ts_value}' OR "
+            f"({ts_column} = '{ts_value}' AND tbname {op} '{_quote(cursor.tbname)}'))"
+        )
+    return f"{ts_column} {op} '{ts_value}'"
+
+
+def keyset_order_clause(order: str, with_tbname: bool = False, ts_column: str = "ts") -> str:
+    direction = "ASC" if order == "asc" else "DESC"
+    if with_tbname:
+        return f"ORDER BY {ts_column} {direction}, tbname {direction}"
+    return f"ORDER BY {ts_column} {direction}"
+
+
+def split_page(
+    rows: List[Dict[str, Any]],
+    page_size: int,
+    order: str,
+    with_tbname: bool = False,
+    ts_column: str = "ts",
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """按多取一行的结果切分当前页并生成下一页游标
+
+    查询应使用 LIMIT page_size + 1，多出的一行仅用于判断是否还有下一页。
+    游标使用的 tbname 列会从返回行中移除，保持原有响应字段不变。
+    """
+    has_more = len(rows) > page_size
+    page_rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more and page_rows:
+        last = page_rows[-1]
+        ts = last.get(ts_column)
+        if ts is not None:
+            next_cursor = TimeCursor(
+                ts=ts.isoformat() if isinstance(ts, datetime) else str(ts),
+                tbname=last.get("tbname") if with_tbname else None,
+                order=order,
+            ).encode()
+
+    if with_tbname:
+        for row in page_rows:
+            row.pop("tbname", None)
+    return page_rows, next_cursor
+
+
+def _parse_ts(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value) / 1000
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_total_rows(result: Optional[Dict[str, Any]]) -> Optional[int]:
+    """从 SHOW TABLE DISTRIBUTED 的输出中提取 Total_Rows"""
+    for row in (result or {}).get("data") or []:
+        for cell in row if isinstance(row, list) else [row]:
+            match = _TOTAL_ROWS_PATTERN.search(str(cell))
+            if match:
+                return int(match.group(1))
+    return None
+
+
+async def estimate_row_count(
+    connector,
+    table: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    db_name: Optional[str] = None,
+) -> Optional[int]:
+    """按块元数据估算表在时间范围内的行数
+
+    SHOW TABLE DISTRIBUTED 只读取数据块的元信息得到总行数，再按查询时间窗口
+    与数据首末时间的重叠比例折算；其他筛选条件不参与估算。无法估算时返回None。
+    """
+    try:
+        total = parse_total_rows(await connector.query_data(f"SHOW TABLE DISTRIBUTED {table}", db_name=db_name))
+        if total is None or not (start_time or end_time) or total == 0:
+            return total
+
+        span = await connector.query_data(f"SELECT FIRST(ts), LAST(ts) FROM {table}", db_name=db_name)
+        data = (span or {}).get("data") or []
+        if not data:
+            return 0
+        first, last = _parse_ts(data[0][0]), _parse_ts(data[0][1])
+    except Exception as e:
+        logger.warning(f"估算TDengine行数失败 {table}: {e}")
+        return None
+
+    if first is None or last is None:
+        return total
+    window_start = max(first, start_time.timestamp()) if start_time else first
+    window_end = min(last, end_time.timestamp()) if end_time else last
+    if window_end < window_start:
+        return 0
+    if last == first:
+        return total
+    return int(round(total * (window_end - window_start) / (last - first)))
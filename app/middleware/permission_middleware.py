@@ -16,6 +16,7 @@ from starlette.responses import JSONResponse
 
 from app.services.auth_service import auth_service
 from app.services.permission_service import permission_service
+from app.core.instrumentation import metrics
 from app.core.unified_logger import get_logger
 
 logger = get_logger(__name__)
@@ -77,6 +78,9 @@ class PermissionMiddleware(BaseHTTPMiddleware):
             "avg_response_time": 0.0,
             "slow_requests": 0
         }
+        self.latency = metrics.histogram(
+            "permission_middleware_duration_seconds", "权限中间件请求耗时", ("authenticated", "denied")
+        )
     
     def _is_whitelisted_path(self, path: str) -> bool:
         """检查路径是否在白名单中"""
@@ -247,9 +251,10 @@ class PermissionMiddleware(BaseHTTPMiddleware):
         if response_time > self.slow_request_threshold:
             self.request_stats["slow_requests"] += 1
         
-        # 更新平均响应时间
-        total_time = self.request_stats["avg_response_time"] * (self.request_stats["total_requests"] - 1)
-        self.request_stats["avg_response_time"] = (total_time + response_time) / self.request_stats["total_requests"]
+        # 耗时分布记入统一直方图（response_time 单位为毫秒）
+        self.latency.observe(
+            response_time / 1000, str(is_authenticated).lower(), str(permission_denied).lower()
+        )
     
     async def dispatch(self, request: Request, call_next) -> Response:
         """中间件主要逻辑"""
@@ -336,8 +341,12 @@ class PermissionMiddleware(BaseHTTPMiddleware):
     
     def get_stats(self) -> Dict[str, Any]:
         """获取性能统计"""
+        latency = self.latency.total().snapshot()
         return {
             **self.request_stats,
+            "avg_response_time": latency["avg_ms"],
+            "p95_response_time": latency["p95_ms"],
+            "p99_response_time": latency["p99_ms"],
             "timestamp": datetime.now().isoformat()
         }
 
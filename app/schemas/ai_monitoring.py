@@ -303,6 +303,12 @@ class ModelTrainRequest(BaseModel):
     validation_split: float = Field(0.2, description="验证集比例", ge=0.1, le=0.5)
 
 
+class ModelPredictRequest(BaseModel):
+    """模型在线推理请求模式"""
+    features: List[List[float]] = Field(..., description="特征矩阵，每行一个样本", min_items=1)
+    method: str = Field("predict", description="预测方法: predict/predict_proba/decision_function/score_samples")
+
+
 class ModelMetricsResponse(BaseModel):
     """模型指标响应模式"""
     accuracy: Optional[float] = Field(None, description="准确率")
@@ -66,54 +66,32 @@ class StatisticalAnomalyDetector:
             return []
         
         try:
-            arr = np.array(data, dtype=float)
-            
-            # 移除NaN
-            valid_mask = ~np.isnan(arr)
-            valid_indices = np.where(valid_mask)[0]
-            valid_arr = arr[valid_mask]
-            
-            if len(valid_arr) < 3:
-                logger.warning("有效数据点太少")
+            result = self.detect_mask(data)
+            if result is None:
                 return []
+            mask, z_scores, center, _ = result
+            arr = np.asarray(data, dtype=float)
             
-            # 计算中心和离散度
-            if self.use_mad:
-                # 使用中位数和MAD（更鲁棒）
-                center = np.median(valid_arr)
-                mad = np.median(np.abs(valid_arr - center))
-                scale = mad * 1.4826  # MAD到标准差的转换因子
-            else:
-                # 使用均值和标准差
-                center = np.mean(valid_arr)
-                scale = np.std(valid_arr)
-            
-            if scale == 0:
-                logger.warning("数据无变化，无法检测异常")
-                return []
-            
-            # 计算偏离程度（标准分数）
-            z_scores = np.abs((valid_arr - center) / scale)
-            
-            # 找出异常点
+            # 只为异常点构造结果字典
             anomalies = []
-            for i, (idx, value, z_score) in enumerate(zip(valid_indices, valid_arr, z_scores)):
-                if z_score > self.threshold_sigma:
-                    severity = self._calculate_severity(z_score)
-                    anomaly = {
-                        'index': int(idx),
-                        'value': float(value),
-                        'expected_value': float(center),
-                        'deviation': float(value - center),
-                        'z_score': float(z_score),
-                        'severity': severity.value,
-                        'severity_code': severity.name,
-                    }
-                    
-                    if return_scores:
-                        anomaly['anomaly_score'] = float(z_score / self.threshold_sigma)
-                    
-                    anomalies.append(anomaly)
+            for idx in np.flatnonzero(mask):
+                z_score = z_scores[idx]
+                value = arr[idx]
+                severity = self._calculate_severity(z_score)
+                anomaly = {
+                    'index': int(idx),
+                    'value': float(value),
+                    'expected_value': float(center),
+                    'deviation': float(value - center),
+                    'z_score': float(z_score),
+                    'severity': severity.value,
+                    'severity_code': severity.name,
+                }
+                
+                if return_scores:
+                    anomaly['anomaly_score'] = float(z_score / self.threshold_sigma)
+                
+                anomalies.append(anomaly)
             
             logger.info(f"统计方法检测到 {len(anomalies)} 个异常点（共{len(data)}个数据点）")
             return anomalies
@@ -122,6 +100,42 @@ class StatisticalAnomalyDetector:
             logger.error(f"统计异常检测失败: {e}")
             return []
     
+    def detect_mask(
+        self,
+        data: Any
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, float, float]]:
+        """
+        向量化检测，返回 (异常掩码, |Z分数|, 中心, 尺度)，数组与输入等长
+        
+        NaN 位置的Z分数为0且不判定为异常；有效数据不足3个或无变化时返回None。
+        """
+        arr = np.asarray(data, dtype=float)
+        valid_mask = ~np.isnan(arr)
+        valid_arr = arr[valid_mask]
+        
+        if len(valid_arr) < 3:
+            logger.warning("有效数据点太少")
+            return None
+        
+        # 计算中心和离散度
+        if self.use_mad:
+            # 使用中位数和MAD（更鲁棒）
+            center = np.median(valid_arr)
+            mad = np.median(np.abs(valid_arr - center))
+            scale = mad * 1.4826  # MAD到标准差的转换因子
+        else:
+            # 使用均值和标准差
+            center = np.mean(valid_arr)
+            scale = np.std(valid_arr)
+        
+        if scale == 0:
+            logger.warning("数据无变化，无法检测异常")
+            return None
+        
+        # 计算偏离程度（标准分数）
+        z_scores = np.where(valid_mask, np.abs((arr - center) / scale), 0.0)
+        return z_scores > self.threshold_sigma, z_scores, float(center), float(scale)
+    
     def _calculate_severity(self, z_score: float) -> AnomalySeverity:
         """
         根据Z分数计算异常严重程度
@@ -220,7 +234,8 @@ class IsolationForestDetector:
     def detect(
         self,
         data: List[float],
-        return_scores: bool = False
+        return_scores: bool = False,
+        refit: bool = True
     ) -> List[Dict[str, Any]]:
         """
         使用孤立森林检测异常
@@ -228,6 +243,7 @@ class IsolationForestDetector:
         Args:
             data: 数值数据列表
             return_scores: 是否返回异常分数
+            refit: 是否重新训练；为False且已有模型时直接复用已训练模型评分
         
         Returns:
             异常点列表
@@ -252,33 +268,37 @@ class IsolationForestDetector:
             # 转换为二维数组（sklearn要求）
             X = valid_arr.reshape(-1, 1)
             
-            # 训练模型
-            self._model = IsolationForest(
-                contamination=self.contamination,
-                n_estimators=self.n_estimators,
-                random_state=self.random_state,
-                n_jobs=-1  # 使用所有CPU核心
-            )
+            if refit or self._model is None:
+                # 训练模型
+                self._model = IsolationForest(
+                    contamination=self.contamination,
+                    n_estimators=self.n_estimators,
+                    random_state=self.random_state,
+                    n_jobs=-1  # 使用所有CPU核心
+                )
+                self._model.fit(X)
             
-            predictions = self._model.fit_predict(X)
+            predictions = self._model.predict(X)
             scores = -self._model.score_samples(X)  # 负分数转为正（分数越高越异常）
+            sorted_scores = np.sort(scores)
             
             # 提取异常点（prediction == -1）
             anomalies = []
-            for idx, pred, score in zip(valid_indices, predictions, scores):
-                if pred == -1:
-                    severity = self._calculate_severity(score, scores)
-                    anomaly = {
-                        'index': int(idx),
-                        'value': float(data[idx]),
-                        'severity': severity.value,
-                        'severity_code': severity.name,
-                    }
-                    
-                    if return_scores:
-                        anomaly['anomaly_score'] = float(score)
-                    
-                    anomalies.append(anomaly)
+            for pos in np.flatnonzero(predictions == -1):
+                idx = valid_indices[pos]
+                score = scores[pos]
+                severity = self._calculate_severity(score, scores, sorted_scores)
+                anomaly = {
+                    'index': int(idx),
+                    'value': float(arr[idx]),
+                    'severity': severity.value,
+                    'severity_code': severity.name,
+                }
+                
+                if return_scores:
+                    anomaly['anomaly_score'] = float(score)
+                
+                anomalies.append(anomaly)
             
             logger.info(f"孤立森林检测到 {len(anomalies)} 个异常点（共{len(data)}个数据点）")
             return anomalies
@@ -293,7 +313,8 @@ class IsolationForestDetector:
     def _calculate_severity(
         self,
         score: float,
-        all_scores: np.ndarray
+        all_scores: np.ndarray,
+        sorted_scores: Optional[np.ndarray] = None
     ) -> AnomalySeverity:
         """
         根据异常分数计算严重程度
@@ -301,12 +322,17 @@ class IsolationForestDetector:
         Args:
             score: 当前异常分数
             all_scores: 所有分数（用于归一化）
+            sorted_scores: 已排序的分数，提供时以二分查找计算百分位
         
         Returns:
             异常严重程度
         """
         # 计算分数的百分位数
-        percentile = (all_scores < score).sum() / len(all_scores) * 100
+        if sorted_scores is not None:
+            below = np.searchsorted(sorted_scores, score, side='left')
+        else:
+            below = (all_scores < score).sum()
+        percentile = below / len(all_scores) * 100
         
         if percentile < 90:
             return AnomalySeverity.NORMAL
@@ -1,51 +1,192 @@
 import pandas as pd
-from typing import Optional, List
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+from app.models.device import DeviceInfo, DeviceType
+from app.services.downsampling_service import downsampling_service
 from app.services.tdengine_service import TDengineService
+from app.services.tdengine_table_resolver import (
+    TableResolution,
+    candidate_table_names,
+    guess_stable,
+    resolve_device_table,
+)
+from app.core.tdengine_pagination import TimeCursor, keyset_condition
 import logging
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def result_to_frame(result: Optional[dict]) -> pd.DataFrame:
+    """Convert a TDengine REST result (v3 column_meta or v2 head) to a DataFrame."""
+    if not result or not result.get('data'):
+        return pd.DataFrame()
+    if result.get('column_meta'):
+        columns = [col[0] for col in result['column_meta']]
+    else:
+        columns = result.get('head') or []
+    return pd.DataFrame(result['data'], columns=columns or None)
+
+
+def _quote(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("'", "\\'")
+
+
 class TDengineLoader:
-    def __init__(self):
+    """
+    Streams multi-device feature matrices from TDengine.
+
+    Each device is resolved to its physical table (sub-table, or super table
+    filtered by the device_code tag) with one batched lookup, then read in
+    ts-ordered keyset chunks so memory is bounded by the chunk size rather
+    than by the training window.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        # A dedicated connector per loader: Celery runs each task on its own event loop
         self.td_service = TDengineService()
+        self.chunk_size = chunk_size
+
+    async def resolve_tables(self, device_codes: Sequence[str]) -> Dict[str, TableResolution]:
+        """Resolve the data table of every device with one information_schema query."""
+        if not device_codes:
+            return {}
+        connector = await self.td_service.get_connector()
+        database = _quote(connector.database)
+
+        candidates = sorted({name for code in device_codes for name in candidate_table_names(code)})
+        names = ", ".join(f"'{_quote(name)}'" for name in candidates)
+        tables = await connector.query_data(
+            "SELECT table_name, stable_name FROM information_schema.ins_tables "
+            f"WHERE db_name = '{database}' AND table_name IN ({names})"
+        )
+        table_index = {row[0]: row[1] or None for row in (tables or {}).get('data') or [] if row}
+        stables = await connector.query_data(
+            f"SELECT stable_name FROM information_schema.ins_stables WHERE db_name = '{database}'"
+        )
+        fallback = guess_stable(row[0] for row in (stables or {}).get('data') or [] if row)
+
+        devices = await DeviceInfo.filter(device_code__in=list(device_codes)).values('device_code', 'device_type')
+        device_types = {row['device_code']: row['device_type'] for row in devices}
+        type_stables = {
+            row['type_code']: row['tdengine_stable_name'] or None
+            for row in await DeviceType.filter(type_code__in=list(set(device_types.values()))).values(
+                'type_code', 'tdengine_stable_name'
+            )
+        }
+
+        resolutions = {}
+        for code in device_codes:
+            resolution = resolve_device_table(code, type_stables.get(device_types.get(code)), table_index, fallback)
+            if resolution:
+                resolutions[code] = resolution
+            else:
+                logger.warning(f"No TDengine table found for device {code}")
+        return resolutions
+
+    async def feature_columns(self, resolution: TableResolution) -> List[str]:
+        """Numeric (non-tag) columns of the device table."""
+        connector = await self.td_service.get_connector()
+        return await downsampling_service.numeric_columns(connector, resolution.from_clause)
+
+    @staticmethod
+    def _where(resolution: TableResolution, device_code: str, start_time: str, end_time: str) -> List[str]:
+        conditions = [f"ts >= '{_quote(start_time)}'", f"ts <= '{_quote(end_time)}'"]
+        device_condition = resolution.device_condition(_quote(device_code))
+        if device_condition:
+            conditions.append(device_condition)
+        return conditions
+
+    async def count_rows(
+        self,
+        device_codes: Sequence[str],
+        start_time: str,
+        end_time: str,
+        resolutions: Optional[Dict[str, TableResolution]] = None,
+    ) -> int:
+        """Total rows in the training window, used to report loading progress."""
+        resolutions = resolutions if resolutions is not None else await self.resolve_tables(device_codes)
+        total = 0
+        for code, resolution in resolutions.items():
+            where = " AND ".join(self._where(resolution, code, start_time, end_time))
+            result = await self.td_service.execute_query(
+                f"SELECT COUNT(*) FROM {resolution.from_clause} WHERE {where}"
+            )
+            data = (result or {}).get('data') or []
+            total += int(data[0][0] or 0) if data else 0
+        return total
+
+    async def iter_chunks(
+        self,
+        device_codes: Sequence[str],
+        start_time: str,
+        end_time: str,
+        columns: Optional[Sequence[str]] = None,
+        resolutions: Optional[Dict[str, TableResolution]] = None,
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        Yield DataFrame chunks of at most chunk_size rows per query.
+
+        Args:
+            device_codes: Devices to load; rows carry a device_code column.
+            start_time: Start time string (e.g. '2023-01-01 00:00:00').
+            end_time: End time string.
+            columns: Columns to select; defaults to each table's numeric columns.
+            resolutions: Pre-resolved device tables (from resolve_tables).
+        """
+        resolutions = resolutions if resolutions is not None else await self.resolve_tables(device_codes)
+        for code in device_codes:
+            resolution = resolutions.get(code)
+            if resolution is None:
+                continue
+            device_columns = list(columns) if columns else await self.feature_columns(resolution)
+            if not device_columns:
+                logger.warning(f"Device {code} has no numeric columns in {resolution.table}")
+                continue
+            select = ", ".join(f"`{col}`" for col in device_columns)
+            base_conditions = self._where(resolution, code, start_time, end_time)
+
+            cursor = None
+            while True:
+                conditions = base_conditions + ([keyset_condition(cursor)] if cursor else [])
+                sql = (
+                    f"SELECT ts, {select} FROM {resolution.from_clause} "
+                    f"WHERE {' AND '.join(conditions)} ORDER BY ts ASC LIMIT {self.chunk_size}"
+                )
+                df = result_to_frame(await self.td_service.execute_query(sql))
+                if df.empty:
+                    break
+                df[device_columns] = df[device_columns].apply(pd.to_numeric, errors='coerce')
+                df['device_code'] = code
+                yield df
+                if len(df) < self.chunk_size:
+                    break
+                cursor = TimeCursor(ts=str(df['ts'].iloc[-1]), order='asc')
 
     async def load(self, device_id: str, start_time: str, end_time: str) -> pd.DataFrame:
         """
         Load data from TDengine for a specific device within a time range.
-        
+
         Args:
-            device_id: The ID of the device to fetch data for.
+            device_id: The device code to fetch data for.
             start_time: Start time string (e.g. '2023-01-01 00:00:00').
             end_time: End time string.
-            
+
         Returns:
             pd.DataFrame: DataFrame containing the queried data.
         """
-        # Assuming query on 'device_data' supertable or similar.
-        # We need to ensure we select relevant columns.
-        # For now, let's select 'ts' and 'value'.
-        # TODO: Make columns configurable or dynamic based on model requirements.
-        
-        sql = f"""
-            SELECT ts, value 
-            FROM device_data 
-            WHERE device_id = '{device_id}' 
-            AND ts >= '{start_time}' AND ts <= '{end_time}'
-        """
-        
         try:
-            result = await self.td_service.execute_query(sql)
-            
-            if result and 'data' in result and 'head' in result:
-                df = pd.DataFrame(result['data'], columns=result['head'])
-                return df
-            else:
-                logger.warning(f"No data found or invalid format for device {device_id}")
-                return pd.DataFrame()
-                
+            chunks = [chunk async for chunk in self.iter_chunks([device_id], start_time, end_time)]
         except Exception as e:
             logger.error(f"Error loading data from TDengine: {e}")
             raise
+        if not chunks:
+            logger.warning(f"No data found for device {device_id}")
+            return pd.DataFrame()
+        return pd.concat(chunks, ignore_index=True)
+
+    async def close(self):
+        await self.td_service.close()
 
     async def preprocess(self, df: pd.DataFrame, strategy: str = 'standard') -> pd.DataFrame:
         """
@@ -53,9 +194,9 @@ class TDengineLoader:
         """
         if df.empty:
             return df
-            
+
         # Example preprocessing
         if strategy == 'fill_na':
             df = df.fillna(method='ffill').fillna(method='bfill')
-        
+
         return df
@@ -3,13 +3,254 @@
 """
 特征提取服务
 从设备数据中提取统计、时序和频域特征
+
+BatchFeatureEngine 对 (序列数 × 样本数) 的二维数组一次向量化计算全部序列的特征，
+单序列提取器与批量接口均委托该引擎。
 """
 
-from typing import List, Dict, Optional, Any
+import warnings
+from typing import List, Dict, Optional, Any, Sequence, Tuple, Union
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from loguru import logger
 
 
+TREND_UP = "上升"
+TREND_DOWN = "下降"
+TREND_FLAT = "平稳"
+TREND_UNKNOWN = "未知"
+
+
+def to_matrix(series: Sequence[Sequence[float]]) -> np.ndarray:
+    """将多条序列组装为 (序列数 × 样本数) 的二维数组，长度不足的行以NaN补齐"""
+    if isinstance(series, np.ndarray) and series.ndim == 2:
+        return series.astype(float, copy=False)
+    rows = [np.asarray(row, dtype=float).ravel() for row in series]
+    width = max((len(row) for row in rows), default=0)
+    matrix = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        matrix[i, :len(row)] = row
+    return matrix
+
+
+def compact_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    将每行的有效值稳定地移到行首（等价于逐行移除NaN），返回 (压缩矩阵, 每行有效长度)
+    """
+    missing = np.isnan(matrix)
+    order = np.argsort(missing, axis=1, kind="stable")
+    return np.take_along_axis(matrix, order, axis=1), (~missing).sum(axis=1)
+
+
+def features_to_records(features: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """列式特征 {特征名: 每条序列的值} 转为逐序列的特征字典，未定义（NaN）的特征不输出"""
+    columns = {name: values.tolist() for name, values in features.items()}
+    n_series = len(next(iter(features.values()))) if features else 0
+    return [
+        {
+            name: values[i] for name, values in columns.items()
+            if values[i] is not None and values[i] == values[i]
+        }
+        for i in range(n_series)
+    ]
+
+
+class BatchFeatureEngine:
+    """
+    向量化批量特征引擎
+
+    输入为 (序列数 × 样本数) 的二维数组（NaN补齐），每类特征对全部序列一次向量化计算，
+    返回列式结果 {特征名: 长度为序列数的数组}。单序列提取器与批量接口均委托本引擎，
+    特征定义与逐序列实现一致（NaN视为缺失并移除）。
+    """
+
+    @staticmethod
+    def statistical(matrix: np.ndarray, prefix: str = "") -> Dict[str, np.ndarray]:
+        """统计特征：一次 nanpercentile 得到三个分位数，偏度/峰度由中心矩直接计算（与scipy有偏估计一致）"""
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean = np.nanmean(matrix, axis=1)
+            centered = matrix - mean[:, None]
+            m2 = np.nanmean(centered ** 2, axis=1)
+            m3 = np.nanmean(centered ** 3, axis=1)
+            m4 = np.nanmean(centered ** 4, axis=1)
+            maximum = np.nanmax(matrix, axis=1)
+            minimum = np.nanmin(matrix, axis=1)
+            q25, median, q75 = np.nanpercentile(matrix, [25, 50, 75], axis=1)
+            return {
+                f"{prefix}mean": mean,
+                f"{prefix}std": np.sqrt(m2),
+                f"{prefix}var": m2,
+                f"{prefix}max": maximum,
+                f"{prefix}min": minimum,
+                f"{prefix}range": maximum - minimum,
+                f"{prefix}median": median,
+                f"{prefix}q25": q25,
+                f"{prefix}q75": q75,
+                f"{prefix}iqr": q75 - q25,
+                f"{prefix}skewness": m3 / m2 ** 1.5,
+                f"{prefix}kurtosis": m4 / m2 ** 2 - 3.0,
+            }
+
+    @staticmethod
+    def timeseries(matrix: np.ndarray, prefix: str = "", max_lag: int = 3) -> Dict[str, np.ndarray]:
+        """时序特征：趋势（最小二乘斜率）、变化率与自相关，按每行有效长度计算"""
+        compact, lengths = compact_rows(matrix)
+        n_series, width = compact.shape
+        features: Dict[str, np.ndarray] = {}
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean = np.nanmean(compact, axis=1)
+            centered = compact - mean[:, None]
+
+            # 趋势：x 为有效点序号，斜率 = Σ(x-x̄)(y-ȳ) / Σ(x-x̄)²
+            x_centered = np.arange(width) - (lengths[:, None] - 1) / 2.0
+            slope = np.nansum(x_centered * centered, axis=1) / (lengths * (lengths ** 2 - 1) / 12.0)
+            data_range = np.nanmax(compact, axis=1) - np.nanmin(compact, axis=1)
+            normalized = slope / data_range * lengths
+            trend = np.full(n_series, TREND_UNKNOWN, dtype=object)
+            valid = lengths >= 2
+            trend[valid & (data_range == 0)] = TREND_FLAT
+            moving = valid & (data_range > 0)
+            trend[moving] = np.select(
+                [normalized[moving] > 0.1, normalized[moving] < -0.1],
+                [TREND_UP, TREND_DOWN],
+                default=TREND_FLAT,
+            )
+            features[f"{prefix}trend"] = trend
+
+            # 变化率：压缩后相邻有效点之差，尾部补齐位置自然为NaN
+            changes = np.diff(compact, axis=1)
+            change_rates = changes / (compact[:, :-1] + 1e-10)
+            for name, values in (
+                ("avg_change", np.nanmean(changes, axis=1)),
+                ("max_change", np.nanmax(changes, axis=1)),
+                ("min_change", np.nanmin(changes, axis=1)),
+                ("avg_change_rate", np.nanmean(change_rates, axis=1)),
+                ("max_change_rate", np.nanmax(change_rates, axis=1)),
+                ("volatility", np.nanstd(changes, axis=1)),
+            ):
+                features[f"{prefix}{name}"] = np.where(valid, values, np.nan)
+
+            # 自相关：有效长度不足 max_lag+1 的序列不输出，常数序列为0
+            variance = np.nanmean(centered ** 2, axis=1)
+            enough = lengths >= max_lag + 1
+            for lag in range(1, max_lag + 1):
+                covariance = np.nanmean(centered[:, :-lag] * centered[:, lag:], axis=1)
+                acf = np.where(variance == 0, 0.0, covariance / variance)
+                features[f"{prefix}acf_lag_{lag}"] = np.where(enough, acf, np.nan)
+        return features
+
+    @staticmethod
+    def frequency(matrix: np.ndarray, sampling_rate: float = 1.0, prefix: str = "") -> Dict[str, np.ndarray]:
+        """
+        频域特征：按有效长度分组，每组沿时间轴做一次 rfft
+
+        实数序列的频谱共轭对称，rfft 的 1..(n-1)//2 项即完整FFT的正频率部分。
+        """
+        compact, lengths = compact_rows(matrix)
+        names = (
+            "dominant_frequency", "dominant_magnitude", "total_energy", "spectral_entropy",
+            "low_freq_energy", "mid_freq_energy", "high_freq_energy",
+            "low_freq_ratio", "mid_freq_ratio", "high_freq_ratio",
+        )
+        features = {f"{prefix}{name}": np.full(len(compact), np.nan) for name in names}
+
+        for length in np.unique(lengths[lengths >= 4]):
+            length = int(length)
+            rows = np.flatnonzero(lengths == length)
+            block = compact[rows, :length]
+            block = block - block.mean(axis=1, keepdims=True)
+            n_positive = (length - 1) // 2
+            magnitudes = np.abs(np.fft.rfft(block, axis=1))[:, 1:n_positive + 1]
+            frequencies = np.fft.rfftfreq(length, d=1 / sampling_rate)[1:n_positive + 1]
+
+            energy = magnitudes ** 2
+            total = energy.sum(axis=1)
+            dominant = magnitudes.argmax(axis=1)
+            low = energy[:, :n_positive // 3].sum(axis=1)
+            mid = energy[:, n_positive // 3:2 * n_positive // 3].sum(axis=1)
+            high = energy[:, 2 * n_positive // 3:].sum(axis=1)
+            has_energy = total > 0
+            with np.errstate(invalid="ignore", divide="ignore"):
+                power = energy / total[:, None]
+                entropy = -np.sum(np.where(power > 0, power * np.log2(power), 0.0), axis=1)
+
+            for name, values in (
+                ("dominant_frequency", frequencies[dominant]),
+                ("dominant_magnitude", magnitudes[np.arange(len(rows)), dominant]),
+                ("total_energy", total),
+                ("spectral_entropy", np.where(has_energy, entropy, np.nan)),
+                ("low_freq_energy", low),
+                ("mid_freq_energy", mid),
+                ("high_freq_energy", high),
+                ("low_freq_ratio", np.where(has_energy, low / np.where(has_energy, total, 1), np.nan)),
+                ("mid_freq_ratio", np.where(has_energy, mid / np.where(has_energy, total, 1), np.nan)),
+                ("high_freq_ratio", np.where(has_energy, high / np.where(has_energy, total, 1), np.nan)),
+            ):
+                features[f"{prefix}{name}"][rows] = values
+        return features
+
+    @staticmethod
+    def rolling(
+        matrix: np.ndarray,
+        window: int,
+        step: int = 1,
+        prefix: str = "",
+    ) -> Dict[str, np.ndarray]:
+        """
+        滚动窗口特征：以 stride tricks 构造 (序列数 × 窗口数 × 窗口长度) 的只读视图，不复制数据
+
+        Returns:
+            {特征名: (序列数 × 窗口数) 数组}，窗口按时间位置对齐（不压缩NaN）
+        """
+        if window < 1 or step < 1:
+            raise ValueError("window 与 step 必须为正整数")
+        if window > matrix.shape[1]:
+            raise ValueError(f"窗口长度 {window} 超过序列长度 {matrix.shape[1]}")
+        windows = sliding_window_view(matrix, window, axis=1)[:, ::step]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            return {
+                f"{prefix}rolling_mean": np.nanmean(windows, axis=2),
+                f"{prefix}rolling_std": np.nanstd(windows, axis=2),
+                f"{prefix}rolling_min": np.nanmin(windows, axis=2),
+                f"{prefix}rolling_max": np.nanmax(windows, axis=2),
+            }
+
+    def extract(
+        self,
+        series: Union[np.ndarray, Sequence[Sequence[float]]],
+        include_statistical: bool = True,
+        include_timeseries: bool = True,
+        include_frequency: bool = False,
+        sampling_rate: float = 1.0,
+        prefixes: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        一次调用提取全部序列的特征
+
+        Args:
+            series: 二维数组（NaN补齐）或序列列表
+            prefixes: 各类特征的名称前缀，键为 statistical / timeseries / frequency
+
+        Returns:
+            {特征名: 长度为序列数的数组}
+        """
+        matrix = to_matrix(series)
+        prefixes = prefixes or {}
+        features: Dict[str, np.ndarray] = {}
+        if matrix.size == 0:
+            return features
+        if include_statistical:
+            features.update(self.statistical(matrix, prefixes.get("statistical", "")))
+        if include_timeseries:
+            features.update(self.timeseries(matrix, prefixes.get("timeseries", "")))
+        if include_frequency:
+            features.update(self.frequency(matrix, sampling_rate, prefixes.get("frequency", "")))
+        return features
+
+
 class StatisticalFeatureExtractor:
     """统计特征提取器"""
     
@@ -30,39 +271,11 @@ class StatisticalFeatureExtractor:
             return {}
         
         try:
-            arr = np.array(data, dtype=float)
-            
-            # 移除NaN值
-            arr = arr[~np.isnan(arr)]
-            
-            if len(arr) == 0:
+            matrix = to_matrix([data])
+            if np.isnan(matrix).all():
                 logger.warning("移除NaN后数据为空")
                 return {}
-            
-            features = {
-                f'{prefix}mean': float(np.mean(arr)),
-                f'{prefix}std': float(np.std(arr)),
-                f'{prefix}var': float(np.var(arr)),
-                f'{prefix}max': float(np.max(arr)),
-                f'{prefix}min': float(np.min(arr)),
-                f'{prefix}range': float(np.ptp(arr)),  # peak to peak
-                f'{prefix}median': float(np.median(arr)),
-                f'{prefix}q25': float(np.percentile(arr, 25)),
-                f'{prefix}q75': float(np.percentile(arr, 75)),
-                f'{prefix}iqr': float(np.percentile(arr, 75) - np.percentile(arr, 25)),
-            }
-            
-            # 计算偏度和峰度（需要scipy）
-            try:
-                from scipy import stats
-                features[f'{prefix}skewness'] = float(stats.skew(arr))
-                features[f'{prefix}kurtosis'] = float(stats.kurtosis(arr))
-            except ImportError:
-                logger.debug("scipy未安装，跳过偏度和峰度计算")
-            except Exception as e:
-                logger.warning(f"计算偏度和峰度时出错: {e}")
-            
-            return features
+            return features_to_records(BatchFeatureEngine.statistical(matrix, prefix))[0]
             
         except Exception as e:
             logger.error(f"提取统计特征时出错: {e}")
@@ -247,64 +460,8 @@ class FrequencyFeatureExtractor:
             return {}
         
         try:
-            arr = np.array(data, dtype=float)
-            arr = arr[~np.isnan(arr)]
-            
-            if len(arr) < 4:
-                return {}
-            
-            # 去均值
-            arr = arr - np.mean(arr)
-            
-            # FFT变换
-            fft_result = np.fft.fft(arr)
-            frequencies = np.fft.fftfreq(len(arr), d=1/sampling_rate)
-            
-            # 只取正频率部分
-            positive_freq_idx = frequencies > 0
-            frequencies = frequencies[positive_freq_idx]
-            fft_magnitudes = np.abs(fft_result[positive_freq_idx])
-            
-            if len(fft_magnitudes) == 0:
-                return {}
-            
-            # 计算特征
-            features = {}
-            
-            # 主频率（最大幅值对应的频率）
-            dominant_freq_idx = np.argmax(fft_magnitudes)
-            features[f'{prefix}dominant_frequency'] = float(frequencies[dominant_freq_idx])
-            features[f'{prefix}dominant_magnitude'] = float(fft_magnitudes[dominant_freq_idx])
-            
-            # 总能量
-            total_energy = float(np.sum(fft_magnitudes ** 2))
-            features[f'{prefix}total_energy'] = total_energy
-            
-            # 频谱熵（频率分布的均匀程度）
-            if total_energy > 0:
-                power = (fft_magnitudes ** 2) / total_energy
-                # 避免log(0)
-                power = power[power > 0]
-                spectral_entropy = -float(np.sum(power * np.log2(power)))
-                features[f'{prefix}spectral_entropy'] = spectral_entropy
-            
-            # 频率带能量分布（低、中、高频）
-            n_freq = len(frequencies)
-            low_freq_energy = float(np.sum(fft_magnitudes[:n_freq//3] ** 2))
-            mid_freq_energy = float(np.sum(fft_magnitudes[n_freq//3:2*n_freq//3] ** 2))
-            high_freq_energy = float(np.sum(fft_magnitudes[2*n_freq//3:] ** 2))
-            
-            features[f'{prefix}low_freq_energy'] = low_freq_energy
-            features[f'{prefix}mid_freq_energy'] = mid_freq_energy
-            features[f'{prefix}high_freq_energy'] = high_freq_energy
-            
-            # 能量比例
-            if total_energy > 0:
-                features[f'{prefix}low_freq_ratio'] = low_freq_energy / total_energy
-                features[f'{prefix}mid_freq_ratio'] = mid_freq_energy / total_energy
-                features[f'{prefix}high_freq_ratio'] = high_freq_energy / total_energy
-            
-            return features
+            features = BatchFeatureEngine.frequency(to_matrix([data]), sampling_rate, prefix)
+            return features_to_records(features)[0]
             
         except Exception as e:
             logger.error(f"提取频域特征时出错: {e}")
@@ -318,6 +475,7 @@ class FeatureExtractor:
         self.statistical_extractor = StatisticalFeatureExtractor()
         self.timeseries_extractor = TimeSeriesFeatureExtractor()
         self.frequency_extractor = FrequencyFeatureExtractor()
+        self.batch_engine = BatchFeatureEngine()
     
     def extract_all_features(
         self,
@@ -377,21 +535,28 @@ class FeatureExtractor:
         
         Args:
             data_dict: {指标名: 数据列表} 的字典
-            **kwargs: 传递给extract_all_features的参数
+            **kwargs: 传递给 BatchFeatureEngine.extract 的参数
         
         Returns:
             {指标名: 特征字典} 的字典
         """
-        results = {}
-        for metric_name, data in data_dict.items():
-            try:
-                features = self.extract_all_features(data, **kwargs)
-                results[metric_name] = features
-                logger.debug(f"指标 {metric_name} 提取了 {len(features)} 个特征")
-            except Exception as e:
-                logger.error(f"提取指标 {metric_name} 的特征时出错: {e}")
-                results[metric_name] = {}
+        if not data_dict:
+            return {}
+        kwargs.setdefault("prefixes", {"statistical": "stat_", "timeseries": "ts_", "frequency": "freq_"})
+        names = list(data_dict.keys())
+        try:
+            features = self.batch_engine.extract(list(data_dict.values()), **kwargs)
+        except Exception as e:
+            logger.error(f"批量提取特征时出错: {e}")
+            return {name: {} for name in names}
         
+        records = features_to_records(features) if features else [{} for _ in names]
+        # 与逐条提取一致：空序列不输出任何特征
+        results = {
+            name: record if len(data) else {}
+            for (name, data), record in zip(data_dict.items(), records)
+        }
+        logger.debug(f"批量提取 {len(names)} 个指标的特征")
         return results
 
 
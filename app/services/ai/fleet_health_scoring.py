@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备群健康评分任务
+定时为全部设备计算健康评分并写入 AIHealthScore：
+
+- 输入以少量批量查询获取：设备清单、窗口内历史数据的指标均值与状态分布（按设备分组聚合）、
+  AIAnomalyRecord 异常计数（按设备分组）、设备字段的目标范围、近期已计算评分（趋势）
+- 各维度以 NumPy 数组一次评分（ColumnarHealthScorer），不逐台调用 calculate
+- 结果一次 bulk_create 写入，/health-scores/records/trends 直接读取预计算序列
+"""
+
+import asyncio
+import time
+import warnings
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from tortoise.functions import Avg, Count
+
+from app.models.ai_monitoring import AIAnomalyRecord, AIHealthScore, HealthScoreStatus
+from app.models.device import DeviceField, DeviceHistoryData, DeviceInfo
+from app.settings.ai_settings import ai_settings
+from app.services.ai.health_scoring import (
+    ColumnarHealthScorer,
+    HealthDimension,
+    HealthScoreCalculator,
+    TREND_CODES,
+    health_score_calculator,
+)
+
+# 参与性能评分的历史数据列（与设备字段 field_code 对应以取目标范围）
+PERFORMANCE_METRICS = ("voltage", "current", "power", "temperature", "pressure", "vibration")
+# 计入运行时长的设备状态
+RUNNING_STATUSES = frozenset({"online", "running"})
+
+TARGET_TYPE = "device"
+SCORING_ALGORITHM = "fleet_weighted"
+
+# 与 calculate_health_score_task 一致的风险等级分界（升序）
+RISK_EDGES = np.array([70.0, 80.0, 90.0])
+RISK_LEVELS = ["critical", "high", "medium", "low"]
+
+# 趋势方向（与 calculate_trend_direction 一致）及其对应的 TrendScorer 方向
+TREND_INCREASING, TREND_DECREASING, TREND_STABLE = "increasing", "decreasing", "stable"
+TREND_SCORER_DIRECTIONS = {TREND_INCREASING: "上升", TREND_DECREASING: "下降", TREND_STABLE: "平稳"}
+TREND_SLOPE_THRESHOLD = 0.5
+DEFAULT_TREND_STABILITY = 0.8
+
+
+@dataclass
+class FleetInputs:
+    """按设备对齐的评分输入（数组长度均为设备数）"""
+    device_ids: List[int]
+    device_names: List[str]
+    metric_values: np.ndarray
+    metric_lower: np.ndarray
+    metric_upper: np.ndarray
+    total_counts: np.ndarray
+    anomaly_counts: np.ndarray
+    running_counts: np.ndarray
+    score_history: np.ndarray
+
+
+def score_trends(history: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """
+    由近期评分序列（设备数 × 次数，NaN补齐）向量化计算趋势方向与置信度
+
+    斜率与R²的定义与 calculate_trend_direction 相同；少于2次评分的设备为 stable / 0。
+    """
+    counts = (~np.isnan(history)).sum(axis=1).astype(float)
+    width = history.shape[1]
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        y_centered = history - np.nanmean(history, axis=1, keepdims=True)
+        x_centered = np.arange(width) - (counts[:, None] - 1) / 2.0
+        sxx = counts * (counts ** 2 - 1) / 12.0
+        slope = np.nansum(x_centered * y_centered, axis=1) / sxx
+        ss_tot = np.nansum(y_centered ** 2, axis=1)
+        r_squared = np.where(ss_tot == 0, 1.0, np.clip(slope ** 2 * sxx / ss_tot, 0.0, 1.0))
+
+    enough = counts >= 2
+    directions = np.where(
+        enough & (slope > TREND_SLOPE_THRESHOLD), TREND_INCREASING,
+        np.where(enough & (slope < -TREND_SLOPE_THRESHOLD), TREND_DECREASING, TREND_STABLE),
+    )
+    return directions.tolist(), np.where(enough, r_squared, 0.0)
+
+
+class FleetHealthScoringService:
+    """设备群健康评分服务"""
+
+    def __init__(
+        self,
+        calculator: Optional[HealthScoreCalculator] = None,
+        window_hours: float = 24.0,
+        trend_days: int = 7,
+        batch_size: int = 500,
+    ):
+        """
+        初始化设备群健康评分服务
+
+        Args:
+            calculator: 健康评分计算器（提供权重）
+            window_hours: 评分数据窗口（小时），同时作为期望运行时长
+            trend_days: 趋势维度回看的已计算评分天数
+            batch_size: 批量写入的单批记录数
+        """
+        self.calculator = calculator or health_score_calculator
+        self.window_hours = window_hours
+        self.trend_days = trend_days
+        self.batch_size = batch_size
+        self.last_run: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    async def load_inputs(self, start: datetime, end: datetime) -> Optional[FleetInputs]:
+        """以批量查询获取全部设备的评分输入，只保留窗口内有数据的设备"""
+        history_window = DeviceHistoryData.filter(data_timestamp__gte=start, data_timestamp__lt=end)
+        devices, metrics, statuses, anomalies, fields, history = await asyncio.gather(
+            DeviceInfo.all().values("id", "device_code", "device_name", "device_type"),
+            history_window.annotate(
+                total=Count("id"), **{f"avg_{name}": Avg(name) for name in PERFORMANCE_METRICS}
+            ).group_by("device_id").values("device_id", "total", *(f"avg_{name}" for name in PERFORMANCE_METRICS)),
+            history_window.annotate(count=Count("id")).group_by("device_id", "status").values(
+                "device_id", "status", "count"
+            ),
+            AIAnomalyRecord.filter(detection_time__gte=start, detection_time__lt=end).annotate(
+                count=Count("id")
+            ).group_by("device_code").values("device_code", "count"),
+            DeviceField.filter(is_active=True, field_code__in=PERFORMANCE_METRICS, data_range__isnull=False).values(
+                "device_type_code", "field_code", "data_range"
+            ),
+            AIHealthScore.filter(
+                target_type=TARGET_TYPE,
+                status=HealthScoreStatus.COMPLETED,
+                calculated_at__gte=end - timedelta(days=self.trend_days),
+            ).order_by("target_id", "calculated_at").values("target_id", "overall_score"),
+        )
+
+        metric_rows = {row["device_id"]: row for row in metrics if row["total"]}
+        devices = [device for device in devices if device["id"] in metric_rows]
+        if not devices:
+            return None
+        row_index = {device["id"]: i for i, device in enumerate(devices)}
+        n_devices, n_metrics = len(devices), len(PERFORMANCE_METRICS)
+
+        metric_values = np.array(
+            [[metric_rows[device["id"]][f"avg_{name}"] for name in PERFORMANCE_METRICS] for device in devices],
+            dtype=float,
+        )
+        total_counts = np.array([metric_rows[device["id"]]["total"] for device in devices], dtype=float)
+
+        # 目标范围按设备类型广播到设备行
+        type_ranges: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        for row in fields:
+            data_range = row["data_range"] or {}
+            if data_range.get("min") is not None and data_range.get("max") is not None:
+                type_ranges.setdefault(row["device_type_code"], {})[row["field_code"]] = (
+                    float(data_range["min"]), float(data_range["max"])
+                )
+        metric_lower = np.full((n_devices, n_metrics), np.nan)
+        metric_upper = np.full((n_devices, n_metrics), np.nan)
+        for i, device in enumerate(devices):
+            for j, name in enumerate(PERFORMANCE_METRICS):
+                bounds = type_ranges.get(device["device_type"], {}).get(name)
+                if bounds:
+                    metric_lower[i, j], metric_upper[i, j] = bounds
+
+        running_counts = np.zeros(n_devices)
+        for row in statuses:
+            i = row_index.get(row["device_id"])
+            if i is not None and row["status"] in RUNNING_STATUSES:
+                running_counts[i] += row["count"]
+
+        anomaly_by_code = {row["device_code"]: row["count"] for row in anomalies}
+        anomaly_counts = np.array([anomaly_by_code.get(device["device_code"], 0) for device in devices], dtype=float)
+
+        series: Dict[int, List[float]] = {}
+        for row in history:
+            if row["target_id"] in row_index and row["overall_score"] is not None:
+                series.setdefault(row["target_id"], []).append(row["overall_score"])
+        score_history = np.full((n_devices, max((len(s) for s in series.values()), default=0)), np.nan)
+        for target_id, scores in series.items():
+            score_history[row_index[target_id], :len(scores)] = scores
+
+        return FleetInputs(
+            device_ids=[device["id"] for device in devices],
+            device_names=[device["device_name"] or device["device_code"] for device in devices],
+            metric_values=metric_values,
+            metric_lower=metric_lower,
+            metric_upper=metric_upper,
+            total_counts=total_counts,
+            anomaly_counts=anomaly_counts,
+            running_counts=running_counts,
+            score_history=score_history,
+        )
+
+    def score(self, inputs: FleetInputs, window_hours: float) -> Dict[str, Any]:
+        """对全部设备向量化评分，返回列式结果"""
+        trend_directions, trend_confidence = score_trends(inputs.score_history)
+        has_history = (~np.isnan(inputs.score_history)).sum(axis=1) >= 2
+        trend_codes = np.array([TREND_CODES[TREND_SCORER_DIRECTIONS[d]] for d in trend_directions])
+        uptime_hours = window_hours * inputs.running_counts / inputs.total_counts
+
+        dimensions = {
+            HealthDimension.PERFORMANCE.value: ColumnarHealthScorer.performance(
+                inputs.metric_values, inputs.metric_lower, inputs.metric_upper
+            ),
+            HealthDimension.ANOMALY.value: ColumnarHealthScorer.anomaly(inputs.anomaly_counts, inputs.total_counts),
+            HealthDimension.TREND.value: ColumnarHealthScorer.trend(
+                trend_codes, np.where(has_history, trend_confidence, DEFAULT_TREND_STABILITY)
+            ),
+            HealthDimension.UPTIME.value: ColumnarHealthScorer.uptime(uptime_hours, expected_uptime_hours=window_hours),
+        }
+        totals = self.calculator.score_columns(dimensions)
+        risk_levels = [RISK_LEVELS[i] for i in np.searchsorted(RISK_EDGES, totals, side="right").tolist()]
+        return {
+            "totals": np.round(totals, 2),
+            "dimensions": {key: np.round(values, 2) for key, values in dimensions.items()},
+            "grades": self.calculator.grades(totals),
+            "risk_levels": risk_levels,
+            "trend_directions": trend_directions,
+            "trend_confidence": np.round(trend_confidence, 4),
+        }
+
+    async def run(self, window_hours: Optional[float] = None) -> Dict[str, Any]:
+        """
+        执行一次设备群健康评分
+
+        Args:
+            window_hours: 数据窗口（小时），默认使用服务配置
+
+        Returns:
+            本次执行摘要
+        """
+        if self._lock.locked():
+            logger.info("设备群健康评分正在执行，跳过本次调度")
+            return {"skipped": True, **self.last_run}
+
+        async with self._lock:
+            window_hours = window_hours or self.window_hours
+            started = time.perf_counter()
+            end = datetime.now()
+            start = end - timedelta(hours=window_hours)
+
+            inputs = await self.load_inputs(start, end)
+            load_seconds = time.perf_counter() - started
+            if inputs is None:
+                logger.info("设备群健康评分: 窗口内没有设备数据")
+                self.last_run = {"devices": 0, "calculated_at": end.isoformat()}
+                return self.last_run
+
+            result = self.score(inputs, window_hours)
+            weights = {
+                key.value if isinstance(key, HealthDimension) else key: value
+                for key, value in self.calculator.weights.items()
+            }
+            totals = result["totals"].tolist()
+            dimensions = {key: values.tolist() for key, values in result["dimensions"].items()}
+            confidence = result["trend_confidence"].tolist()
+            records = [
+                AIHealthScore(
+                    score_name=f"{name}健康评分",
+                    target_type=TARGET_TYPE,
+                    target_id=device_id,
+                    scoring_algorithm=SCORING_ALGORITHM,
+                    weight_config=weights,
+                    threshold_config={},
+                    overall_score=totals[i],
+                    dimension_scores={key: values[i] for key, values in dimensions.items()},
+                    risk_level=result["risk_levels"][i],
+                    status=HealthScoreStatus.COMPLETED,
+                    calculated_at=end,
+                    data_period_start=start,
+                    data_period_end=end,
+                    trend_direction=result["trend_directions"][i],
+                    trend_confidence=confidence[i],
+                )
+                for i, (device_id, name) in enumerate(zip(inputs.device_ids, inputs.device_names))
+            ]
+            await AIHealthScore.bulk_create(records, batch_size=self.batch_size)
+
+            grade_distribution: Dict[str, int] = {}
+            for grade in result["grades"]:
+                grade_distribution[grade.name] = grade_distribution.get(grade.name, 0) + 1
+            self.last_run = {
+                "devices": len(records),
+                "calculated_at": end.isoformat(),
+                "window_hours": window_hours,
+                "average_score": round(float(np.mean(totals)), 2),
+                "grade_distribution": grade_distribution,
+                "load_seconds": round(load_seconds, 3),
+                "total_seconds": round(time.perf_counter() - started, 3),
+            }
+            logger.info(
+                f"设备群健康评分完成: {len(records)} 台设备, 平均 {self.last_run['average_score']}, "
+                f"耗时 {self.last_run['total_seconds']}s"
+            )
+            return self.last_run
+
+
+# 创建全局实例
+fleet_health_scoring_service = FleetHealthScoringService(window_hours=ai_settings.ai_health_scoring_window_hours)
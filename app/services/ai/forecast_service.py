@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多序列趋势预测服务
+按 (设备, 指标, 方法) 缓存已拟合的 ARIMA 参数，避免每次请求重新估计：
+
+- 复用（apply）：新数据是缓存序列的延续（尾部重合）时，用已估计参数对当前窗口滤波后直接预测，
+  等价于 statsmodels 的 results.append/apply(refit=False)，不做极大似然优化
+- 热启动重估：累计新增点数超过 refit_ratio × 拟合样本数，或序列不再重合时，以旧参数为初值重新估计
+- 定阶：order 网格搜索只在定时任务中执行（select_orders），请求路径只使用已选定的阶数
+
+各序列的拟合经 run_cpu 在进程池中并行执行，并发数受信号量限制。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.cpu_executor import cpu_executor, run_cpu
+from app.services.ai.prediction import PredictionMethod, TrendPredictor
+from app.settings.ai_settings import ai_settings
+
+DEFAULT_ORDER = (1, 1, 1)
+# 定时定阶的候选 (p, d, q)
+ORDER_CANDIDATES = [(p, d, q) for d in (0, 1) for p in range(3) for q in range(3)]
+TAIL_SIZE = 8
+
+# 接口使用的方法简写
+METHOD_ALIASES = {
+    "arima": PredictionMethod.ARIMA,
+    "auto": PredictionMethod.ARIMA,
+    "ma": PredictionMethod.MOVING_AVERAGE,
+    "ema": PredictionMethod.EXPONENTIAL_SMOOTHING,
+    "lr": PredictionMethod.LINEAR_REGRESSION,
+}
+
+MODE_FIT = "fit"
+MODE_REFIT = "refit"
+MODE_APPLY = "apply"
+
+TREND_UP = "上升"
+TREND_DOWN = "下降"
+TREND_STABLE = "平稳"
+
+
+def resolve_method(method: Any) -> PredictionMethod:
+    if isinstance(method, PredictionMethod):
+        return method
+    alias = METHOD_ALIASES.get(str(method).lower())
+    return alias or PredictionMethod(method)
+
+
+def trend_direction(history: np.ndarray, predictions: List[float], tolerance: float = 0.1) -> str:
+    """预测末值相对最新观测的变化超过 tolerance 倍历史标准差时判定为上升/下降"""
+    if not predictions or not len(history):
+        return TREND_STABLE
+    change = predictions[-1] - float(history[-1])
+    scale = float(np.std(history)) or 1.0
+    if change > tolerance * scale:
+        return TREND_UP
+    if change < -tolerance * scale:
+        return TREND_DOWN
+    return TREND_STABLE
+
+
+def fit_arima(
+    data: np.ndarray,
+    steps: int,
+    order: Tuple[int, int, int],
+    params: Optional[np.ndarray] = None,
+    refit: bool = True,
+    confidence_level: float = 0.95,
+) -> Dict[str, Any]:
+    """
+    进程池中执行的 ARIMA 拟合与预测
+
+    refit=False 时用给定参数直接滤波（不优化）；refit=True 时估计参数，params 作为初值。
+    """
+    import warnings
+
+    from statsmodels.tsa.arima.model import ARIMA
+
+    model = ARIMA(data, order=order)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if params is not None and not refit:
+            results = model.filter(params)
+        else:
+            results = model.fit(start_params=params)
+    forecast = results.get_forecast(steps=steps)
+    conf_int = np.asarray(forecast.conf_int(alpha=1 - confidence_level))
+    return {
+        "predictions": np.asarray(forecast.predicted_mean).tolist(),
+        "lower": conf_int[:, 0].tolist(),
+        "upper": conf_int[:, 1].tolist(),
+        "params": np.asarray(results.params),
+        "aic": float(results.aic),
+    }
+
+
+def select_order(data: np.ndarray, candidates: Iterable[Tuple[int, int, int]] = ORDER_CANDIDATES) -> Dict[str, Any]:
+    """进程池中执行：按 AIC 选择 ARIMA 阶数，返回最优阶数及其参数"""
+    import warnings
+
+    from statsmodels.tsa.arima.model import ARIMA
+
+    best: Dict[str, Any] = {"order": DEFAULT_ORDER, "params": None, "aic": float("inf")}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for order in candidates:
+            try:
+                results = ARIMA(data, order=order).fit()
+            except Exception:
+                continue
+            if np.isfinite(results.aic) and results.aic < best["aic"]:
+                best = {"order": order, "params": np.asarray(results.params), "aic": float(results.aic)}
+    return best
+
+
+@dataclass
+class CachedModel:
+    """单个 (设备, 指标, 方法) 的缓存模型"""
+    order: Tuple[int, int, int]
+    params: Optional[np.ndarray] = None
+    fit_nobs: int = 0              # 估计参数时的样本数
+    appended: int = 0              # 复用参数后累计新增的点数
+    history: np.ndarray = field(default_factory=lambda: np.empty(0))
+    fitted_at: float = 0.0
+    updated_at: float = 0.0
+    order_selected_at: float = 0.0
+
+
+def new_points(cached: np.ndarray, data: np.ndarray) -> Optional[int]:
+    """
+    判断 data 是否为缓存序列的延续：在 data 中查找缓存尾部最后一次出现的位置
+
+    Returns:
+        新增点数；不重合时返回 None
+    """
+    tail = cached[-TAIL_SIZE:]
+    if len(tail) == 0 or len(data) < len(tail):
+        return None
+    windows = np.lib.stride_tricks.sliding_window_view(data, len(tail))
+    hits = np.flatnonzero((windows == tail).all(axis=1))
+    if not len(hits):
+        return None
+    return len(data) - (int(hits[-1]) + len(tail))
+
+
+class ForecastService:
+    """带模型缓存的多序列趋势预测服务"""
+
+    def __init__(
+        self,
+        cache_size: int = 5000,
+        max_history: int = 2000,
+        refit_ratio: float = 0.25,
+        concurrency: Optional[int] = None,
+    ):
+        """
+        初始化预测服务
+
+        Args:
+            cache_size: 最多缓存的序列数，超出按最久未使用淘汰
+            max_history: 每个序列参与拟合的最大点数（取最近部分）
+            refit_ratio: 复用参数后新增点数超过拟合样本数的该比例时重新估计
+            concurrency: 同时提交到进程池的序列数，默认等于进程池 worker 数
+        """
+        self.cache_size = cache_size
+        self.max_history = max_history
+        self.refit_ratio = refit_ratio
+        self.concurrency = concurrency or cpu_executor.max_workers
+        self.predictor = TrendPredictor()
+        self._models: "OrderedDict[Tuple[str, str, str], CachedModel]" = OrderedDict()
+        self._locks: Dict[Tuple[str, str, str], asyncio.Lock] = {}
+        self.counters = {MODE_FIT: 0, MODE_REFIT: 0, MODE_APPLY: 0, "failed": 0}
+        self.last_order_selection: Optional[Dict[str, Any]] = None
+
+    def _entry(self, key: Tuple[str, str, str]) -> Optional[CachedModel]:
+        entry = self._models.get(key)
+        if entry is not None:
+            self._models.move_to_end(key)
+        return entry
+
+    def _store(self, key: Tuple[str, str, str], entry: CachedModel) -> None:
+        self._models[key] = entry
+        self._models.move_to_end(key)
+        while len(self._models) > self.cache_size:
+            evicted, _ = self._models.popitem(last=False)
+            self._locks.pop(evicted, None)
+
+    def _plan(self, entry: Optional[CachedModel], data: np.ndarray) -> Tuple[str, int]:
+        """决定复用/重估/首次拟合，返回 (模式, 新增点数)"""
+        if entry is None or entry.params is None:
+            return MODE_FIT, len(data)
+        added = new_points(entry.history, data)
+        if added is None:
+            return MODE_REFIT, len(data)
+        if entry.appended + added > max(entry.fit_nobs * self.refit_ratio, TAIL_SIZE):
+            return MODE_REFIT, added
+        return MODE_APPLY, added
+
+    async def predict(
+        self,
+        device_code: str,
+        metric: Optional[str],
+        data: List[float],
+        steps: int = 10,
+        method: Any = PredictionMethod.ARIMA,
+        confidence_level: float = 0.95,
+    ) -> Dict[str, Any]:
+        """
+        预测单个序列；ARIMA 使用缓存模型，其他方法计算量小，直接在当前进程执行
+
+        metric 为空时无法确认序列身份（同一设备的不同指标会共用缓存），只做一次性拟合，不读写模型缓存。
+        """
+        method = resolve_method(method)
+        arr = np.asarray(data, dtype=float)
+        arr = arr[~np.isnan(arr)][-self.max_history:]
+
+        if method != PredictionMethod.ARIMA:
+            result = self.predictor.predict(arr.tolist(), steps, method)
+            result["trend"] = trend_direction(arr, result.get("predictions", []))
+            return result
+
+        if len(arr) < 10:
+            return {"predictions": [], "success": False, "method": method.value, "error": "有效数据点少于10个"}
+
+        if metric is None:
+            return await self._predict_uncached(device_code, arr, steps, confidence_level)
+
+        key = (device_code, metric, method.value)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entry(key)
+            mode, added = self._plan(entry, arr)
+            order = entry.order if entry is not None else DEFAULT_ORDER
+            params = entry.params if entry is not None else None
+            try:
+                output = await run_cpu(
+                    fit_arima, arr, steps, order,
+                    params=params,
+                    refit=mode != MODE_APPLY,
+                    confidence_level=confidence_level,
+                )
+            except Exception as e:
+                self.counters["failed"] += 1
+                logger.error(f"ARIMA预测失败 {device_code}/{metric}: {e}")
+                return {"predictions": [], "success": False, "method": method.value, "error": str(e)}
+
+            now = time.time()
+            if entry is None:
+                entry = CachedModel(order=order)
+            entry.params = output["params"]
+            entry.history = arr
+            entry.updated_at = now
+            if mode == MODE_APPLY:
+                entry.appended += added
+            else:
+                entry.fit_nobs = len(arr)
+                entry.appended = 0
+                entry.fitted_at = now
+            self._store(key, entry)
+            self.counters[mode] += 1
+
+        return self._arima_result(arr, steps, output, order, mode, entry.fit_nobs)
+
+    async def _predict_uncached(
+        self, device_code: str, arr: np.ndarray, steps: int, confidence_level: float
+    ) -> Dict[str, Any]:
+        try:
+            output = await run_cpu(
+                fit_arima, arr, steps, DEFAULT_ORDER, params=None, refit=True, confidence_level=confidence_level
+            )
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.error(f"ARIMA预测失败 {device_code}: {e}")
+            return {"predictions": [], "success": False, "method": PredictionMethod.ARIMA.value, "error": str(e)}
+        self.counters[MODE_FIT] += 1
+        return self._arima_result(arr, steps, output, DEFAULT_ORDER, MODE_FIT, len(arr))
+
+    @staticmethod
+    def _arima_result(
+        arr: np.ndarray, steps: int, output: Dict[str, Any], order, mode: str, fit_nobs: int
+    ) -> Dict[str, Any]:
+        predictions = output["predictions"]
+        return {
+            "predictions": predictions,
+            "success": True,
+            "method": PredictionMethod.ARIMA.value,
+            "steps": steps,
+            "trend": trend_direction(arr, predictions),
+            "confidence_interval": {"lower": output["lower"], "upper": output["upper"]},
+            "model": {"order": list(order), "mode": mode, "fit_nobs": fit_nobs, "aic": output["aic"]},
+        }
+
+    async def predict_many(
+        self,
+        series: Dict[Tuple[str, Optional[str]], List[float]],
+        steps: int = 10,
+        method: Any = PredictionMethod.ARIMA,
+        confidence_level: float = 0.95,
+    ) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+        """
+        并行预测多个序列
+
+        Args:
+            series: {(设备编码, 指标名): 历史数据}，指标名为 None 的序列不使用模型缓存
+
+        Returns:
+            {(设备编码, 指标名): 预测结果}
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(key: Tuple[str, Optional[str]], data: List[float]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.predict(key[0], key[1], data, steps, method, confidence_level)
+
+        keys = list(series)
+        results = await asyncio.gather(*(one(key, series[key]) for key in keys))
+        return dict(zip(keys, results))
+
+    async def select_orders(self, min_points: int = 30) -> Dict[str, Any]:
+        """
+        定时任务：为缓存中的 ARIMA 序列重新定阶
+
+        选出的阶数与参数写回缓存，后续请求直接复用；请求路径不做定阶。
+        """
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        keys = [
+            key for key, entry in self._models.items()
+            if key[2] == PredictionMethod.ARIMA.value and len(entry.history) >= min_points
+        ]
+        changed = 0
+
+        async def one(key: Tuple[str, str, str]) -> None:
+            nonlocal changed
+            async with semaphore:
+                entry = self._models.get(key)
+                if entry is None:
+                    return
+                history = entry.history
+                try:
+                    best = await run_cpu(select_order, history)
+                except Exception as e:
+                    logger.warning(f"ARIMA定阶失败 {key[0]}/{key[1]}: {e}")
+                    return
+            if best["params"] is None:
+                return
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                entry = self._models.get(key)
+                if entry is None or entry.history is not history:
+                    # 定阶期间序列已更新，本轮结果作废
+                    return
+                if tuple(best["order"]) != entry.order:
+                    changed += 1
+                entry.order = tuple(best["order"])
+                entry.params = best["params"]
+                entry.fit_nobs = len(history)
+                entry.appended = 0
+                entry.fitted_at = entry.order_selected_at = time.time()
+
+        await asyncio.gather(*(one(key) for key in keys))
+        self.last_order_selection = {
+            "series": len(keys),
+            "order_changed": changed,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": time.time(),
+        }
+        logger.info(f"ARIMA定时定阶完成: {self.last_order_selection}")
+        return self.last_order_selection
+
+    def invalidate(self, device_code: Optional[str] = None) -> None:
+        """清除全部或指定设备的缓存模型"""
+        if device_code is None:
+            self._models.clear()
+            self._locks.clear()
+            return
+        for key in [key for key in self._models if key[0] == device_code]:
+            del self._models[key]
+            self._locks.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_models": len(self._models),
+            "cache_size": self.cache_size,
+            "max_history": self.max_history,
+            "refit_ratio": self.refit_ratio,
+            "counters": dict(self.counters),
+            "last_order_selection": self.last_order_selection,
+        }
+
+
+# 创建全局实例
+forecast_service = ForecastService(
+    cache_size=ai_settings.ai_forecast_cache_size,
+    max_history=ai_settings.ai_forecast_max_history,
+    refit_ratio=ai_settings.ai_forecast_refit_ratio,
+)
@@ -3,9 +3,13 @@
 """
 健康评分服务
 基于多维度指标综合评估设备健康状况
+
+ColumnarHealthScorer 以 NumPy 数组对整个设备群逐维度一次评分，分段规则与各评分器一致，
+供批量评分与定时的设备群评分任务使用。
 """
 
-from typing import List, Dict, Optional, Any
+import warnings
+from typing import List, Dict, Optional, Any, Union
 from enum import Enum
 from datetime import datetime, timedelta
 import numpy as np
@@ -254,6 +258,79 @@ class UptimeScorer:
             return 0.0
 
 
+# 与 AnomalyScorer / UptimeScorer 分段线性规则对应的折点
+ANOMALY_RATE_POINTS = np.array([0.0, 0.01, 0.05, 0.10, 0.20, 0.50])
+ANOMALY_SCORE_POINTS = np.array([100.0, 95.0, 80.0, 60.0, 30.0, 0.0])
+UPTIME_RATIO_POINTS = np.array([0.50, 0.70, 0.80, 0.90, 0.95, 1.0])
+UPTIME_SCORE_POINTS = np.array([0.0, 50.0, 70.0, 85.0, 95.0, 100.0])
+
+# 趋势方向编码
+TREND_FLAT, TREND_UP, TREND_DOWN, TREND_UNKNOWN = 0, 1, -1, 2
+TREND_CODES = {"平稳": TREND_FLAT, "上升": TREND_UP, "下降": TREND_DOWN}
+
+# 等级分界（升序），searchsorted 的结果即 GRADES_ASCENDING 的下标
+GRADE_EDGES = np.array([60.0, 70.0, 80.0, 90.0])
+
+
+class ColumnarHealthScorer:
+    """向量化维度评分器：每个参数为长度等于设备数的数组"""
+
+    @staticmethod
+    def performance(values: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """
+        性能评分
+
+        Args:
+            values: (设备数 × 指标数) 指标值，缺失为NaN
+            lower: 同形状的目标下限，无目标范围为NaN
+            upper: 同形状的目标上限，无目标范围为NaN
+
+        Returns:
+            每台设备可评分指标的平均分，无可评分指标的设备为80分
+        """
+        scorable = ~(np.isnan(values) | np.isnan(lower) | np.isnan(upper))
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            deviation = np.where(values < lower, lower - values, values - upper)
+            penalty = np.minimum(100.0, deviation / (upper - lower) * 50)
+            scores = np.where((values >= lower) & (values <= upper), 100.0, np.maximum(0.0, 100.0 - penalty))
+            mean = np.nanmean(np.where(scorable, scores, np.nan), axis=1)
+        return np.where(scorable.any(axis=1), mean, 80.0)
+
+    @staticmethod
+    def anomaly(anomaly_counts: np.ndarray, total_counts: np.ndarray) -> np.ndarray:
+        """异常频率评分，总数据点数为0的设备为100分"""
+        totals = np.asarray(total_counts, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = np.asarray(anomaly_counts, dtype=float) / totals
+        scores = np.interp(rate, ANOMALY_RATE_POINTS, ANOMALY_SCORE_POINTS)
+        return np.where(totals > 0, np.clip(scores, 0, 100), 100.0)
+
+    @staticmethod
+    def trend(
+        trend_codes: np.ndarray,
+        trend_stability: np.ndarray,
+        is_increasing_good: Union[bool, np.ndarray] = True,
+    ) -> np.ndarray:
+        """趋势评分，trend_codes 取 TREND_FLAT / TREND_UP / TREND_DOWN / TREND_UNKNOWN"""
+        codes = np.asarray(trend_codes)
+        good = np.asarray(is_increasing_good, dtype=bool)
+        base = np.select(
+            [codes == TREND_FLAT, codes == TREND_UP, codes == TREND_DOWN],
+            [90.0, np.where(good, 80.0, 40.0), np.where(good, 40.0, 80.0)],
+            default=60.0,
+        )
+        return np.clip(base * (0.5 + 0.5 * np.asarray(trend_stability, dtype=float)), 0, 100)
+
+    @staticmethod
+    def uptime(uptime_hours: np.ndarray, expected_uptime_hours: float = 720.0) -> np.ndarray:
+        """运行时长评分，运行时长为0的设备为0分"""
+        hours = np.asarray(uptime_hours, dtype=float)
+        ratio = hours / expected_uptime_hours
+        scores = np.where(ratio < 0.5, ratio * 100, np.interp(ratio, UPTIME_RATIO_POINTS, UPTIME_SCORE_POINTS))
+        return np.where(hours > 0, np.clip(scores, 0, 100), 0.0)
+
+
 class HealthScoreCalculator:
     """健康评分计算器"""
     
@@ -336,22 +413,9 @@ class HealthScoreCalculator:
                 dimension_key = dimension.value if isinstance(dimension, HealthDimension) else dimension
                 total_score += scores.get(dimension_key, 0) * weight
             
-            # 确定健康等级
+            result = self._build_result(total_score, scores)
             grade = self._get_grade(total_score)
             
-            result = {
-                'total_score': round(total_score, 2),
-                'grade': grade.value,
-                'grade_code': grade.name,
-                'dimension_scores': {
-                    'performance': round(scores.get(HealthDimension.PERFORMANCE.value, 0), 2),
-                    'anomaly': round(scores.get(HealthDimension.ANOMALY.value, 0), 2),
-                    'trend': round(scores.get(HealthDimension.TREND.value, 0), 2),
-                    'uptime': round(scores.get(HealthDimension.UPTIME.value, 0), 2),
-                },
-                'weights': {k.value if isinstance(k, HealthDimension) else k: v for k, v in self.weights.items()}
-            }
-            
             logger.info(f"健康评分计算完成: {total_score:.2f} ({grade.value})")
             return result
             
@@ -386,12 +450,105 @@ class HealthScoreCalculator:
         else:
             return HealthGrade.F_CRITICAL
     
+    def _build_result(self, total_score: float, scores: Dict[str, float]) -> Dict[str, Any]:
+        """构建单台设备的评分结果字典"""
+        grade = self._get_grade(total_score)
+        return {
+            'total_score': round(total_score, 2),
+            'grade': grade.value,
+            'grade_code': grade.name,
+            'dimension_scores': {
+                'performance': round(scores.get(HealthDimension.PERFORMANCE.value, 0), 2),
+                'anomaly': round(scores.get(HealthDimension.ANOMALY.value, 0), 2),
+                'trend': round(scores.get(HealthDimension.TREND.value, 0), 2),
+                'uptime': round(scores.get(HealthDimension.UPTIME.value, 0), 2),
+            },
+            'weights': {k.value if isinstance(k, HealthDimension) else k: v for k, v in self.weights.items()}
+        }
+    
+    def score_columns(self, dimension_scores: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        按权重合成总分（向量化）
+        
+        Args:
+            dimension_scores: {维度: 每台设备的维度评分数组}
+        
+        Returns:
+            每台设备的总分数组
+        """
+        n_devices = len(next(iter(dimension_scores.values())))
+        total = np.zeros(n_devices)
+        for dimension, weight in self.weights.items():
+            dimension_key = dimension.value if isinstance(dimension, HealthDimension) else dimension
+            if dimension_key in dimension_scores:
+                total += np.asarray(dimension_scores[dimension_key], dtype=float) * weight
+        return total
+    
+    @staticmethod
+    def grades(total_scores: np.ndarray) -> List[HealthGrade]:
+        """向量化确定健康等级"""
+        ascending = [
+            HealthGrade.F_CRITICAL, HealthGrade.D_POOR, HealthGrade.C_NORMAL,
+            HealthGrade.B_GOOD, HealthGrade.A_EXCELLENT,
+        ]
+        return [ascending[i] for i in np.searchsorted(GRADE_EDGES, total_scores, side="right").tolist()]
+    
+    def calculate_columns(self, devices: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        以列式方式批量计算健康评分，参数与 calculate 相同，结果与逐台计算一致
+        
+        Args:
+            devices: 每台设备的 calculate 参数字典
+        
+        Returns:
+            与输入顺序一致的评分结果列表
+        """
+        n_devices = len(devices)
+        if not n_devices:
+            return []
+        
+        # 性能：按全部设备指标的并集组装 (设备数 × 指标数) 数组
+        metric_names = sorted({name for device in devices for name in (device.get('performance_metrics') or {})})
+        metric_index = {name: i for i, name in enumerate(metric_names)}
+        values = np.full((n_devices, len(metric_names)), np.nan)
+        lower = np.full_like(values, np.nan)
+        upper = np.full_like(values, np.nan)
+        for row, device in enumerate(devices):
+            ranges = device.get('target_ranges') or self.performance_scorer.target_ranges
+            for name, value in (device.get('performance_metrics') or {}).items():
+                col = metric_index[name]
+                values[row, col] = value
+                if name in ranges:
+                    lower[row, col], upper[row, col] = ranges[name]
+        
+        scores = {
+            HealthDimension.PERFORMANCE.value: ColumnarHealthScorer.performance(values, lower, upper),
+            HealthDimension.ANOMALY.value: ColumnarHealthScorer.anomaly(
+                np.array([device.get('anomaly_count', 0) for device in devices], dtype=float),
+                np.array([device.get('total_count', 100) for device in devices], dtype=float),
+            ),
+            HealthDimension.TREND.value: ColumnarHealthScorer.trend(
+                np.array([TREND_CODES.get(device.get('trend_direction', "平稳"), TREND_UNKNOWN) for device in devices]),
+                np.array([device.get('trend_stability', 0.8) for device in devices], dtype=float),
+                np.array([device.get('is_increasing_good', True) for device in devices], dtype=bool),
+            ),
+            HealthDimension.UPTIME.value: ColumnarHealthScorer.uptime(
+                np.array([device.get('uptime_hours', 720.0) for device in devices], dtype=float)
+            ),
+        }
+        totals = self.score_columns(scores)
+        columns = {key: column.tolist() for key, column in scores.items()}
+        return [
+            self._build_result(total, {key: column[i] for key, column in columns.items()})
+            for i, total in enumerate(totals.tolist())
+        ]
+    
     def batch_calculate(
         self,
         devices_data: Dict[str, Dict[str, Any]]
     ) -> Dict[str, Dict[str, Any]]:
         """
-        批量计算多个设备的健康评分
+        批量计算多个设备的健康评分（列式向量化，输入异常时退回逐台计算）
         
         Args:
             devices_data: {设备ID: 设备数据} 的字典
@@ -399,6 +556,13 @@ class HealthScoreCalculator:
         Returns:
             {设备ID: 评分结果} 的字典
         """
+        try:
+            results = self.calculate_columns(list(devices_data.values()))
+            logger.debug(f"批量健康评分完成: {len(results)} 台设备")
+            return dict(zip(devices_data.keys(), results))
+        except Exception as e:
+            logger.warning(f"列式批量评分失败，改为逐台计算: {e}")
+        
         results = {}
         for device_id, data in devices_data.items():
             try:
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型制品注册表
+为在线推理常驻已部署的模型：
+
+1. 每个模型文件只 joblib 加载一次（numpy 数组以内存映射方式读取），按模型数与文件大小双重上限做LRU淘汰
+2. 文件被重新训练覆盖（修改时间变化）时自动重新加载
+3. 同一模型的并发预测请求在一个短时间窗口内合并为一次批量 predict，在线程池中执行，不阻塞事件循环
+4. 按批大小分桶记录批次延迟
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from loguru import logger
+
+from app.core.exceptions import APIException
+from app.models.ai_monitoring import AIModel, ModelStatus
+from app.settings.ai_settings import ai_settings
+
+
+PREDICT_METHODS = ("predict", "predict_proba", "decision_function", "score_samples")
+
+
+@dataclass
+class LoadedModel:
+    """已加载到内存的模型"""
+    model_id: int
+    estimator: Any
+    path: str
+    mtime: float
+    size_bytes: int
+    load_ms: float
+    loaded_at: float = field(default_factory=time.time)
+    requests: int = 0
+
+    @property
+    def n_features(self) -> Optional[int]:
+        return getattr(self.estimator, "n_features_in_", None)
+
+
+class BatchLatencyStats:
+    """按批大小分桶（1、2、3-4、5-8 ... 以2的幂为上界）统计批次延迟"""
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self._buckets: Dict[int, Dict[str, Any]] = {}
+
+    @staticmethod
+    def bucket_of(rows: int) -> int:
+        return 1 << max(0, math.ceil(math.log2(max(rows, 1))))
+
+    def record(self, rows: int, requests: int, elapsed_ms: float) -> None:
+        bucket = self._buckets.get(self.bucket_of(rows))
+        if bucket is None:
+            bucket = self._buckets[self.bucket_of(rows)] = {
+                "batches": 0, "rows": 0, "requests": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "samples": deque(maxlen=self.window),
+            }
+        bucket["batches"] += 1
+        bucket["rows"] += rows
+        bucket["requests"] += requests
+        bucket["total_ms"] += elapsed_ms
+        bucket["max_ms"] = max(bucket["max_ms"], elapsed_ms)
+        bucket["samples"].append(elapsed_ms)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        result = []
+        for upper in sorted(self._buckets):
+            bucket = self._buckets[upper]
+            samples = np.asarray(bucket["samples"], dtype=np.float64)
+            result.append({
+                "batch_rows_le": upper,
+                "batches": bucket["batches"],
+                "avg_requests_per_batch": round(bucket["requests"] / bucket["batches"], 2),
+                "avg_ms": round(bucket["total_ms"] / bucket["batches"], 3),
+                "p50_ms": round(float(np.percentile(samples, 50)), 3),
+                "p95_ms": round(float(np.percentile(samples, 95)), 3),
+                "max_ms": round(bucket["max_ms"], 3),
+                "rows_per_sec": round(bucket["rows"] / (bucket["total_ms"] / 1000), 1) if bucket["total_ms"] else None,
+            })
+        return result
+
+
+@dataclass
+class _PendingRequest:
+    features: np.ndarray
+    future: asyncio.Future
+
+
+class _MicroBatcher:
+    """单个模型 + 预测方法的请求合并队列"""
+
+    def __init__(self, registry: "ModelRegistry", model_id: int, method: str):
+        self.registry = registry
+        self.model_id = model_id
+        self.method = method
+        self.queue: "asyncio.Queue[_PendingRequest]" = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def submit(self, features: np.ndarray) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(_PendingRequest(features, future))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return await future
+
+    async def _collect(self) -> List[_PendingRequest]:
+        """取出第一个请求后，在等待窗口内继续收集，直到达到批量行数上限"""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        rows = len(batch[0].features)
+        deadline = loop.time() + self.registry.max_wait_ms / 1000
+        while rows < self.registry.max_batch_rows:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            rows += len(item.features)
+        return batch
+
+    async def _run(self) -> None:
+        while not self.queue.empty():
+            batch = await self._collect()
+            pending = [item for item in batch if not item.future.cancelled()]
+            if not pending:
+                continue
+            try:
+                results = await self.registry._predict_batch(
+                    self.model_id, self.method, [item.features for item in pending]
+                )
+                for item, result in zip(pending, results):
+                    if not item.future.done():
+                        item.future.set_result(result)
+            except Exception as e:
+                for item in pending:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+
+class ModelRegistry:
+    """已部署模型的进程内注册表"""
+
+    def __init__(
+        self,
+        max_models: int = ai_settings.ai_model_cache_size,
+        max_bytes: int = ai_settings.ai_max_memory_mb * 1024 * 1024,
+        max_batch_rows: int = ai_settings.ai_predict_max_batch_rows,
+        max_wait_ms: float = ai_settings.ai_predict_max_wait_ms,
+        worker_threads: int = ai_settings.ai_worker_threads,
+    ):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.max_batch_rows = max_batch_rows
+        self.max_wait_ms = max_wait_ms
+        self.worker_threads = worker_threads
+        self._models: "OrderedDict[int, LoadedModel]" = OrderedDict()
+        self._load_locks: Dict[int, asyncio.Lock] = {}
+        self._batchers: Dict[Tuple[int, str], _MicroBatcher] = {}
+        self._latency: Dict[int, BatchLatencyStats] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.worker_threads, thread_name_prefix="model-infer")
+        return self._executor
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._models.values())
+
+    @staticmethod
+    def _load_file(path: str) -> Any:
+        # 未压缩保存的 numpy 数组以只读内存映射加载，多个worker进程共享页缓存
+        return joblib.load(path, mmap_mode="r")
+
+    async def get(self, model_id: int) -> LoadedModel:
+        """获取已加载的模型，未加载或文件已更新时从磁盘加载"""
+        entry = self._models.get(model_id)
+        if entry is not None and self._is_fresh(entry):
+            self._models.move_to_end(model_id)
+            self.hits += 1
+            return entry
+
+        lock = self._load_locks.setdefault(model_id, asyncio.Lock())
+        async with lock:
+            entry = self._models.get(model_id)
+            if entry is not None and self._is_fresh(entry):
+                self._models.move_to_end(model_id)
+                return entry
+            return await self._load(model_id)
+
+    @staticmethod
+    def _is_fresh(entry: LoadedModel) -> bool:
+        try:
+            return os.path.getmtime(entry.path) == entry.mtime
+        except OSError:
+            return False
+
+    async def _load(self, model_id: int) -> LoadedModel:
+        row = await AIModel.filter(id=model_id).first().values("model_file_path", "status")
+        if not row:
+            raise APIException(message="模型不存在", code=404)
+        if row["status"] != ModelStatus.DEPLOYED:
+            raise APIException(message="只有已部署的模型可以在线推理", code=400)
+        path = row["model_file_path"]
+        if not path or not os.path.exists(path):
+            raise APIException(message="模型文件不存在", code=404)
+
+        start = time.perf_counter()
+        mtime = os.path.getmtime(path)
+        estimator = await asyncio.get_running_loop().run_in_executor(self.executor, self._load_file, path)
+        entry = LoadedModel(
+            model_id=model_id,
+            estimator=estimator,
+            path=path,
+            mtime=mtime,
+            size_bytes=os.path.getsize(path),
+            load_ms=round((time.perf_counter() - start) * 1000, 3),
+        )
+        self._models[model_id] = entry
+        self._models.move_to_end(model_id)
+        self.loads += 1
+        self._evict_over_limit()
+        logger.info(f"模型已加载: model_id={model_id}, 大小={entry.size_bytes}字节, 耗时={entry.load_ms}ms")
+        return entry
+
+    def _evict_over_limit(self) -> None:
+        # 至少保留刚加载的模型
+        while len(self._models) > 1 and (len(self._models) > self.max_models or self.total_bytes > self.max_bytes):
+            model_id, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"模型已从内存淘汰: model_id={model_id}")
+
+    def evict(self, model_id: int) -> None:
+        """模型下线、删除或重新部署时移出内存"""
+        self._models.pop(model_id, None)
+        self._latency.pop(model_id, None)
+
+    async def warm_up(self) -> int:
+        """启动时预加载最近部署的模型，返回加载数量"""
+        model_ids = await AIModel.filter(status=ModelStatus.DEPLOYED).order_by("-deployed_at").limit(
+            self.max_models
+        ).values_list("id", flat=True)
+        loaded = 0
+        for model_id in model_ids:
+            try:
+                await self.get(model_id)
+                loaded += 1
+            except Exception as e:
+                logger.warning(f"预加载模型失败: model_id={model_id}, 错误: {e}")
+        return loaded
+
+    async def predict(self, model_id: int, features: Any, method: str = "predict") -> np.ndarray:
+        """对特征矩阵（行为样本）执行预测，并发请求在等待窗口内合并为一次批量调用"""
+        if method not in PREDICT_METHODS:
+            raise APIException(message=f"不支持的预测方法: {method}，可选 {', '.join(PREDICT_METHODS)}", code=400)
+        matrix = np.asarray(features, dtype=np.float64)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.ndim != 2 or matrix.shape[0] == 0:
+            raise APIException(message="特征矩阵必须为非空二维数组", code=400)
+
+        entry = await self.get(model_id)
+        if not hasattr(entry.estimator, method):
+            raise APIException(message=f"模型不支持 {method}", code=400)
+        if entry.n_features is not None and matrix.shape[1] != entry.n_features:
+            raise APIException(message=f"特征数量不匹配: 期望 {entry.n_features}，实际 {matrix.shape[1]}", code=400)
+        entry.requests += 1
+
+        key = (model_id, method)
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            batcher = self._batchers[key] = _MicroBatcher(self, model_id, method)
+        return await batcher.submit(matrix)
+
+    async def _predict_batch(self, model_id: int, method: str, matrices: List[np.ndarray]) -> List[np.ndarray]:
+        entry = await self.get(model_id)
+        stacked = matrices[0] if len(matrices) == 1 else np.vstack(matrices)
+        start = time.perf_counter()
+        output = await asyncio.get_running_loop().run_in_executor(
+            self.executor, getattr(entry.estimator, method), stacked
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._latency.setdefault(model_id, BatchLatencyStats()).record(len(stacked), len(matrices), elapsed_ms)
+
+        offsets = np.cumsum([len(matrix) for matrix in matrices])[:-1]
+        return np.split(np.asarray(output), offsets)
+
+    def latency_stats(self, model_id: int) -> List[Dict[str, Any]]:
+        stats = self._latency.get(model_id)
+        return stats.snapshot() if stats else []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded_models": [
+                {
+                    "model_id": entry.model_id,
+                    "size_bytes": entry.size_bytes,
+                    "load_ms": entry.load_ms,
+                    "requests": entry.requests,
+                    "n_features": entry.n_features,
+                }
+                for entry in self._models.values()
+            ],
+            "max_models": self.max_models,
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "max_batch_rows": self.max_batch_rows,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
+    async def shutdown(self) -> None:
+        for batcher in self._batchers.values():
+            if batcher.task is not None and not batcher.task.done():
+                batcher.task.cancel()
+        self._batchers.clear()
+        self._models.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 全局实例
+model_registry = ModelRegistry()
@@ -1,111 +1,215 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from app.services.ai.trainer import BaseTrainer
 import joblib
+import math
 import os
+import time
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LogisticRegression, LinearRegression
+from sklearn.base import is_classifier
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.linear_model import LogisticRegression, LinearRegression, SGDClassifier, SGDRegressor
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor, IsolationForest
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, mean_squared_error, r2_score
 
+ALGORITHMS = {
+    'RandomForestClassifier': RandomForestClassifier,
+    'RandomForestRegressor': RandomForestRegressor,
+    'LogisticRegression': LogisticRegression,
+    'LinearRegression': LinearRegression,
+    'IsolationForest': IsolationForest,
+    'SGDClassifier': SGDClassifier,
+    'SGDRegressor': SGDRegressor,
+    'MiniBatchKMeans': MiniBatchKMeans,
+}
+
+# Trained chunk by chunk with partial_fit, so the full window never has to fit in memory
+INCREMENTAL_ALGORITHMS = {'SGDClassifier', 'SGDRegressor', 'MiniBatchKMeans'}
+# No target column required
+UNSUPERVISED_ALGORITHMS = {'IsolationForest', 'MiniBatchKMeans'}
+# Accept n_jobs; defaults to all cores
+PARALLEL_ALGORITHMS = {
+    'RandomForestClassifier', 'RandomForestRegressor', 'IsolationForest', 'LogisticRegression', 'LinearRegression',
+}
+# Grown in warm_start stages so progress reflects estimators actually built
+ENSEMBLE_ALGORITHMS = {'RandomForestClassifier', 'RandomForestRegressor', 'IsolationForest'}
+
+# Columns added by the loader that are never features
+META_COLUMNS = {'ts', 'device_code'}
+
+
 class SklearnTrainer(BaseTrainer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.feature_cols: Optional[List[str]] = None
+        self.target_col: Optional[str] = None
+        self.stats: Dict[str, Any] = {}
+        self._classes = None
+        self._rows_fitted = 0
+        self._fit_seconds = 0.0
+
+    @staticmethod
+    def supports_partial_fit(algorithm: str) -> bool:
+        return algorithm in INCREMENTAL_ALGORITHMS
+
+    @staticmethod
+    def create_model(algorithm: str, hyperparameters: Optional[Dict[str, Any]] = None, n_jobs: int = -1) -> Any:
+        model_cls = ALGORITHMS.get(algorithm)
+        if model_cls is None:
+            raise ValueError(f"Unsupported algorithm: {algorithm}")
+        hyperparameters = dict(hyperparameters or {})
+        if algorithm in PARALLEL_ALGORITHMS:
+            hyperparameters.setdefault('n_jobs', n_jobs)
+        return model_cls(**hyperparameters)
+
+    def resolve_columns(self, data: pd.DataFrame, params: Dict[str, Any]) -> Tuple[List[str], str]:
+        """Fix the feature/target columns from params or the first data seen."""
+        if self.feature_cols is None:
+            target_col = params.get('target_col', 'label')
+            feature_cols = params.get('feature_cols') or [
+                c for c in data.columns if c != target_col and c not in META_COLUMNS
+            ]
+            self.feature_cols = list(feature_cols)
+            self.target_col = target_col
+        return self.feature_cols, self.target_col
+
+    def _xy(self, data: pd.DataFrame, algorithm: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        X = data[self.feature_cols].to_numpy(dtype=np.float32, copy=False)
+        y = data[self.target_col].to_numpy() if self.target_col in data.columns else None
+        if y is None and algorithm not in UNSUPERVISED_ALGORITHMS:
+            raise ValueError(f"Algorithm {algorithm} requires a target column")
+        return X, (None if algorithm in UNSUPERVISED_ALGORITHMS else y)
+
+    def _record_stats(self, rows: int, fit_seconds: float, model: Any, mode: str):
+        self.stats = {
+            'rows': int(rows),
+            'fit_seconds': round(fit_seconds, 3),
+            'fit_rows_per_sec': round(rows / fit_seconds, 1) if fit_seconds > 0 else None,
+            'n_jobs': getattr(model, 'n_jobs', None),
+            'mode': mode,
+        }
+
     def train(self, data: pd.DataFrame, params: Dict[str, Any]) -> Any:
         """
-        Train a Scikit-learn model.
+        Train a Scikit-learn model on an in-memory frame.
+
+        Progress is reported from real work: warm_start stages for forests,
+        partial_fit batches for incremental algorithms.
         """
         algorithm = params.get('algorithm', 'RandomForestClassifier')
-        target_col = params.get('target_col', 'label')
-        feature_cols = params.get('feature_cols', [])
-        hyperparameters = params.get('hyperparameters', {})
-        
-        if not feature_cols:
-            feature_cols = [c for c in data.columns if c != target_col]
-            
-        X = data[feature_cols]
-        # For unsupervised models like IsolationForest, y might not be needed or used
-        y = data[target_col] if target_col in data.columns else None
-        
-        self.feature_cols = feature_cols # Save for evaluation
-        
-        if algorithm == 'RandomForestClassifier':
-            model = RandomForestClassifier(**hyperparameters)
-        elif algorithm == 'RandomForestRegressor':
-            model = RandomForestRegressor(**hyperparameters)
-        elif algorithm == 'LogisticRegression':
-            model = LogisticRegression(**hyperparameters)
-        elif algorithm == 'LinearRegression':
-            model = LinearRegression(**hyperparameters)
-        elif algorithm == 'IsolationForest':
-            model = IsolationForest(**hyperparameters)
-        else:
-            raise ValueError(f"Unsupported algorithm: {algorithm}")
-            
-        # Simulate progress during training
-        # Since sklearn models don't support callbacks easily, we simulate
-        import time
-        steps = 10
+        model = self.create_model(algorithm, params.get('hyperparameters', {}), params.get('n_jobs', -1))
+        self.resolve_columns(data, params)
+        X, y = self._xy(data, algorithm)
+
         self.log(f"Starting training with algorithm: {algorithm}")
-        self.log(f"Training data shape: {X.shape}")
-        
-        for i in range(steps):
-            progress = 10 + (i * (90/steps))
-            self.update_progress(progress, 100)
-            self.log(f"Training step {i+1}/{steps} - Progress: {progress:.1f}%")
-            time.sleep(1.0) # Simulate work (slower to see progress)
-            
-        self.log("Fitting model...")
-        if algorithm == 'IsolationForest':
-            model.fit(X)
+        self.log(f"Training data shape: {X.shape}, n_jobs={getattr(model, 'n_jobs', None)}")
+
+        start = time.perf_counter()
+        if algorithm in ENSEMBLE_ALGORITHMS:
+            self._fit_ensemble(model, X, y, params.get('progress_steps', 10))
+            mode = 'warm_start'
+        elif self.supports_partial_fit(algorithm):
+            batch_rows = max(1, int(params.get('batch_rows', 10000)))
+            total = math.ceil(len(X) / batch_rows)
+            for i in range(total):
+                rows = slice(i * batch_rows, (i + 1) * batch_rows)
+                self._partial_fit(model, X[rows], None if y is None else y[rows], params)
+                self.update_progress(i + 1, total)
+            mode = 'partial_fit'
         else:
-            if y is None:
-                 raise ValueError(f"Algorithm {algorithm} requires a target column")
-            model.fit(X, y)
-            
+            self.log("Fitting model...")
+            self._fit(model, X, y)
+            mode = 'fit'
+        fit_seconds = time.perf_counter() - start
+
+        self._record_stats(len(X), fit_seconds, model, mode)
         self.update_progress(100, 100)
-        self.log("Training completed successfully.")
-        
+        self.log(f"Training completed in {fit_seconds:.2f}s ({self.stats['fit_rows_per_sec']} rows/s).")
         return model
 
+    @staticmethod
+    def _fit(model: Any, X: np.ndarray, y: Optional[np.ndarray]):
+        if y is None:
+            model.fit(X)
+        else:
+            model.fit(X, y)
+
+    def _fit_ensemble(self, model: Any, X: np.ndarray, y: Optional[np.ndarray], steps: int):
+        total = model.n_estimators
+        steps = max(1, min(int(steps), total))
+        model.set_params(warm_start=True)
+        for i in range(1, steps + 1):
+            model.set_params(n_estimators=math.ceil(total * i / steps))
+            self._fit(model, X, y)
+            self.update_progress(i, steps)
+            self.log(f"Built {model.n_estimators}/{total} estimators")
+        model.set_params(warm_start=False)
+
+    def _partial_fit(self, model: Any, X: np.ndarray, y: Optional[np.ndarray], params: Dict[str, Any]):
+        if y is None:
+            model.partial_fit(X)
+        elif is_classifier(model):
+            if self._classes is None:
+                # partial_fit needs every class up front; prefer the configured list
+                self._classes = np.asarray(params.get('classes') or np.unique(y))
+            model.partial_fit(X, y, classes=self._classes)
+        else:
+            model.partial_fit(X, y)
+
+    def partial_fit(self, model: Any, chunk: pd.DataFrame, params: Dict[str, Any]) -> int:
+        """Fit one streamed chunk; returns the number of rows consumed."""
+        algorithm = params.get('algorithm', 'SGDClassifier')
+        self.resolve_columns(chunk, params)
+        X, y = self._xy(chunk, algorithm)
+        start = time.perf_counter()
+        self._partial_fit(model, X, y, params)
+        self._fit_seconds += time.perf_counter() - start
+        self._rows_fitted += len(X)
+        self._record_stats(self._rows_fitted, self._fit_seconds, model, 'partial_fit')
+        return len(X)
+
     def evaluate(self, model: Any, test_data: pd.DataFrame) -> Dict[str, float]:
-        target_col = 'label' # Should be passed or stored
-        if 'label' not in test_data.columns and 'target' in test_data.columns:
+        target_col = self.target_col or 'label'
+        if target_col not in test_data.columns and 'target' in test_data.columns:
             target_col = 'target'
-        
+
         # Try to infer target col if not standard
-        if target_col not in test_data.columns:
+        if target_col not in test_data.columns and self.feature_cols is None:
              # Assume last column
              target_col = test_data.columns[-1]
 
-        feature_cols = getattr(self, 'feature_cols', [c for c in test_data.columns if c != target_col])
-        
+        feature_cols = self.feature_cols or [c for c in test_data.columns if c != target_col and c not in META_COLUMNS]
+
         # Ensure columns exist
         missing_cols = [c for c in feature_cols if c not in test_data.columns]
         if missing_cols:
              raise ValueError(f"Missing columns in test data: {missing_cols}")
 
-        X_test = test_data[feature_cols]
+        X_test = test_data[feature_cols].to_numpy(dtype=np.float32, copy=False)
         y_test = test_data[target_col] if target_col in test_data.columns else None
-        
+
         y_pred = model.predict(X_test)
-        
+
         # Handle IsolationForest predictions (-1 for outlier, 1 for inlier)
         if isinstance(model, IsolationForest):
             # Convert to standard 0 (normal) / 1 (anomaly) if ground truth is in that format
             # Assumption: y_test has 0 for normal, 1 for anomaly
             # Prediction: 1 (normal) -> 0, -1 (anomaly) -> 1
             y_pred = np.where(y_pred == 1, 0, 1)
-        
+
         metrics = {}
-        
-        if y_test is None:
+
+        if y_test is None or isinstance(model, MiniBatchKMeans):
              # Unsupervised evaluation or just returning counts
              if isinstance(model, IsolationForest):
                  metrics['anomaly_count'] = int(np.sum(y_pred))
                  metrics['anomaly_rate'] = float(np.mean(y_pred))
+             elif isinstance(model, MiniBatchKMeans):
+                 metrics['inertia'] = float(-model.score(X_test))
              return metrics
 
         # Check if classification or regression based on model type
-        if hasattr(model, 'predict_proba') or isinstance(model, (LogisticRegression, RandomForestClassifier)) or isinstance(model, IsolationForest):
+        if is_classifier(model) or isinstance(model, IsolationForest):
             metrics['accuracy'] = float(accuracy_score(y_test, y_pred))
             metrics['precision'] = float(precision_score(y_test, y_pred, average='weighted', zero_division=0))
             metrics['recall'] = float(recall_score(y_test, y_pred, average='weighted', zero_division=0))
@@ -113,7 +217,7 @@ class SklearnTrainer(BaseTrainer):
         else:
             metrics['mse'] = float(mean_squared_error(y_test, y_pred))
             metrics['r2'] = float(r2_score(y_test, y_pred))
-            
+
         return metrics
 
     def save(self, model: Any, path: str) -> str:
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式异常检测服务
+按 (设备, 指标) 维护增量统计状态，每个新样本以 O(1) 代价评分后更新状态：
+
+- welford: Welford 在线均值/方差（全历史）
+- ewma:    指数加权均值/方差（跟随工况漂移）
+- mad:     P² 分位数草图近似中位数与MAD（对离群点鲁棒）
+
+批量评分以批前状态向量化计算Z分数，返回 NumPy 掩码与下标，不逐点构造字典；
+状态随后按批合并（Welford 使用并行合并公式）。
+
+异常样本默认截断到 中心 ± 阈值×尺度 后计入统计：单个离群点的影响有界，持续偏移时状态仍能跟上；
+连续 shift_after 个同向异常视为工况切换，以这段数据重建状态，避免阶跃后每个样本都被判为异常。
+"""
+
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.ai.anomaly_detection import AnomalySeverity
+
+MODE_WELFORD = "welford"
+MODE_EWMA = "ewma"
+MODE_MAD = "mad"
+STREAM_MODES = (MODE_WELFORD, MODE_EWMA, MODE_MAD)
+
+# 与 StatisticalAnomalyDetector._calculate_severity 相同的Z分数分级
+SEVERITY_EDGES = np.array([3.0, 4.0, 5.0, 6.0])
+SEVERITY_LEVELS = [
+    AnomalySeverity.NORMAL,
+    AnomalySeverity.SLIGHT,
+    AnomalySeverity.MODERATE,
+    AnomalySeverity.SEVERE,
+    AnomalySeverity.CRITICAL,
+]
+MAD_TO_STD = 1.4826
+
+
+def severity_of(z_score: float) -> AnomalySeverity:
+    return SEVERITY_LEVELS[int(np.searchsorted(SEVERITY_EDGES, abs(z_score), side="right"))]
+
+
+def severity_codes(z_scores: np.ndarray) -> np.ndarray:
+    """向量化分级，返回 SEVERITY_LEVELS 的下标数组"""
+    return np.searchsorted(SEVERITY_EDGES, np.abs(z_scores), side="right")
+
+
+class P2Quantile:
+    """P² 算法（Jain & Chlamtac）：5个标记点在线估计分位数，O(1) 时间与空间"""
+
+    __slots__ = ("p", "heights", "positions", "desired", "increments", "count")
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self.heights: List[float] = []
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+        self.count = 0
+
+    def update(self, x: float) -> None:
+        self.count += 1
+        heights = self.heights
+        if self.count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not heights[i - 1] < candidate < heights[i + 1]:
+                    candidate = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = candidate
+                positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            # 样本不足5个时取精确分位数
+            return float(np.quantile(self.heights, self.p))
+        return self.heights[2]
+
+
+class StreamState:
+    """单个 (设备, 指标) 序列的增量统计状态"""
+
+    __slots__ = ("mode", "alpha", "count", "mean", "m2", "median", "mad", "updated_at", "run", "run_values")
+
+    def __init__(self, mode: str = MODE_WELFORD, alpha: float = 0.05):
+        self.mode = mode
+        self.alpha = alpha
+        self.updated_at = 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # welford: 偏差平方和；ewma: 加权方差
+        self.median = P2Quantile(0.5) if self.mode == MODE_MAD else None
+        self.mad = P2Quantile(0.5) if self.mode == MODE_MAD else None
+        self.run = 0  # 连续异常次数，正负表示方向
+        self.run_values: Optional[List[float]] = None  # 本轮连续异常的原始值
+
+    @property
+    def center(self) -> float:
+        if self.mode == MODE_MAD:
+            return self.median.value or 0.0
+        return self.mean
+
+    @property
+    def scale(self) -> float:
+        if self.mode == MODE_MAD:
+            return (self.mad.value or 0.0) * MAD_TO_STD
+        if self.mode == MODE_EWMA:
+            return math.sqrt(self.m2)
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def z_score(self, x: float) -> float:
+        scale = self.scale
+        return (x - self.center) / scale if scale > 0 else 0.0
+
+    def update(self, x: float) -> None:
+        self.count += 1
+        if self.mode == MODE_WELFORD:
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        elif self.mode == MODE_EWMA:
+            if self.count == 1:
+                self.mean = x
+            else:
+                delta = x - self.mean
+                self.mean += self.alpha * delta
+                self.m2 = (1 - self.alpha) * (self.m2 + self.alpha * delta * delta)
+        else:
+            self.median.update(x)
+            self.mad.update(abs(x - self.median.value))
+        self.updated_at = time.time()
+
+    def update_batch(self, values: np.ndarray) -> None:
+        if not len(values):
+            return
+        if self.mode == MODE_WELFORD:
+            # Chan 等人的并行合并公式：批内统计向量化，再与已有状态合并
+            n_b = len(values)
+            mean_b = float(values.mean())
+            m2_b = float(((values - mean_b) ** 2).sum())
+            n = self.count + n_b
+            delta = mean_b - self.mean
+            self.mean += delta * n_b / n
+            self.m2 += m2_b + delta * delta * self.count * n_b / n
+            self.count = n
+            self.updated_at = time.time()
+        else:
+            for x in values.tolist():
+                self.update(x)
+
+
+@dataclass
+class StreamScore:
+    """单个样本的评分结果"""
+    value: float
+    z_score: float
+    expected_value: float
+    is_anomaly: bool
+    severity: AnomalySeverity
+
+
+@dataclass
+class BatchScores:
+    """批量评分结果：mask/indices 为有效样本中的异常位置（相对输入下标）"""
+    mask: np.ndarray
+    indices: np.ndarray
+    z_scores: np.ndarray
+    severity_codes: np.ndarray
+    center: float
+    scale: float
+
+
+class StreamingAnomalyDetector:
+    """按 (设备, 指标) 维护流式状态的异常检测器"""
+
+    def __init__(
+        self,
+        mode: str = MODE_WELFORD,
+        threshold_sigma: float = 3.0,
+        min_samples: int = 30,
+        alpha: float = 0.05,
+        max_series: int = 50000,
+        update_on_anomaly: bool = False,
+        recent_size: int = 1000,
+        shift_after: int = 20,
+    ):
+        """
+        初始化流式异常检测器
+
+        Args:
+            mode: 统计方式 welford / ewma / mad
+            threshold_sigma: 异常判定阈值（几倍标准差）
+            min_samples: 序列样本数达到该值后才开始判定
+            alpha: EWMA 平滑系数
+            max_series: 最多保留的序列数，超出按最久未更新淘汰
+            update_on_anomaly: 异常样本是否按原值计入统计（默认截断到阈值边界后计入，避免离群点抬高方差）
+            recent_size: 保留最近异常的条数
+            shift_after: 连续同向异常达到该次数时视为工况切换，以这段数据重建状态
+        """
+        if mode not in STREAM_MODES:
+            raise ValueError(f"不支持的流式统计方式: {mode}，可选 {', '.join(STREAM_MODES)}")
+        self.mode = mode
+        self.threshold_sigma = threshold_sigma
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.max_series = max_series
+        self.update_on_anomaly = update_on_anomaly
+        self.shift_after = shift_after
+        self._states: "OrderedDict[Tuple[str, str], StreamState]" = OrderedDict()
+        self.recent: deque = deque(maxlen=recent_size)
+        self.samples = 0
+        self.anomalies = 0
+
+    def _state(self, device_code: str, metric: str) -> StreamState:
+        key = (device_code, metric)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = StreamState(self.mode, self.alpha)
+            if len(self._states) > self.max_series:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+        return state
+
+    def observe(self, device_code: str, metric: str, value: float) -> StreamScore:
+        """对单个新样本评分并更新状态，O(1)"""
+        state = self._state(device_code, metric)
+        z = state.z_score(value) if state.count >= self.min_samples else 0.0
+        is_anomaly = abs(z) > self.threshold_sigma
+        score = StreamScore(
+            value=value,
+            z_score=z,
+            expected_value=state.center,
+            is_anomaly=is_anomaly,
+            severity=severity_of(z),
+        )
+        if is_anomaly and not self.update_on_anomaly:
+            self._absorb_anomaly(state, value, z)
+        else:
+            if state.run:
+                state.run, state.run_values = 0, None
+            state.update(value)
+        self.samples += 1
+        if is_anomaly:
+            self.anomalies += 1
+        return score
+
+    def _absorb_anomaly(self, state: StreamState, value: float, z: float) -> None:
+        """异常样本计入状态：截断后更新；连续同向异常达到 shift_after 时按新工况重建"""
+        direction = 1 if z > 0 else -1
+        if state.run * direction > 0:
+            state.run += direction
+        else:
+            state.run, state.run_values = direction, []
+        state.run_values.append(value)
+        if abs(state.run) >= self.shift_after:
+            self._rebuild(state, state.run_values)
+            return
+        limit = self.threshold_sigma * state.scale
+        state.update(min(max(value, state.center - limit), state.center + limit))
+
+    @staticmethod
+    def _rebuild(state: StreamState, values: List[float]) -> None:
+        """工况切换：丢弃旧统计，以切换后的样本重新开始（样本数达到 min_samples 前不判定）"""
+        state.reset()
+        state.update_batch(np.asarray(values, dtype=np.float64))
+
+    def _merge_batch(
+        self, state: StreamState, arr: np.ndarray, valid: np.ndarray, mask: np.ndarray,
+        z_scores: np.ndarray, center: float, scale: float,
+    ) -> None:
+        """批数据计入状态：异常值截断后合并，末尾的连续同向异常与批前计数累加判断工况切换"""
+        values = arr[valid]
+        directions = (np.sign(z_scores) * mask)[valid]
+        if not len(values):
+            return
+        last = directions[-1]
+        if last == 0:
+            run, run_values = 0, None
+        else:
+            breaks = np.flatnonzero(directions != last)
+            start = int(breaks[-1]) + 1 if len(breaks) else 0
+            run = int(last) * (len(values) - start)
+            run_values = values[start:].tolist()
+            if start == 0 and state.run * last > 0:
+                run += state.run
+                run_values = state.run_values + run_values
+            run_values = run_values[-self.shift_after:]
+        if abs(run) >= self.shift_after:
+            self._rebuild(state, run_values)
+            return
+        if mask.any():
+            limit = self.threshold_sigma * scale
+            values = np.clip(values, center - limit, center + limit)
+        state.update_batch(values)
+        state.run, state.run_values = run, run_values
+
+    def observe_frame(self, device_code: str, data: Dict[str, Any]) -> Dict[str, StreamScore]:
+        """处理一帧设备数据 {指标: 值}，返回判定为异常的指标"""
+        anomalies = {}
+        for metric, value in data.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+                continue
+            score = self.observe(device_code, metric, float(value))
+            if score.is_anomaly:
+                anomalies[metric] = score
+                self.recent.append({
+                    "device_code": device_code,
+                    "metric": metric,
+                    "value": score.value,
+                    "expected_value": score.expected_value,
+                    "z_score": round(score.z_score, 3),
+                    "severity": score.severity.value,
+                    "detected_at": time.time(),
+                })
+        return anomalies
+
+    def score_batch(self, device_code: str, metric: str, values: Any, update: bool = True) -> BatchScores:
+        """
+        向量化批量评分：以批前状态计算全部Z分数，返回异常掩码与下标
+
+        Args:
+            device_code: 设备编码
+            metric: 指标名
+            values: 数值序列（NaN 视为缺失，不判定异常）
+            update: 评分后是否将批数据合并进状态
+        """
+        state = self._state(device_code, metric)
+        arr = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(arr)
+        center, scale = state.center, state.scale
+
+        if state.count >= self.min_samples and scale > 0:
+            z_scores = np.where(valid, (arr - center) / scale, 0.0)
+        else:
+            z_scores = np.zeros_like(arr)
+        mask = np.abs(z_scores) > self.threshold_sigma
+        indices = np.flatnonzero(mask)
+
+        if update:
+            if self.update_on_anomaly:
+                state.update_batch(arr[valid])
+            else:
+                self._merge_batch(state, arr, valid, mask, z_scores, center, scale)
+        self.samples += int(valid.sum())
+        self.anomalies += len(indices)
+        return BatchScores(
+            mask=mask,
+            indices=indices,
+            z_scores=z_scores,
+            severity_codes=severity_codes(z_scores),
+            center=center,
+            scale=scale,
+        )
+
+    def reset(self, device_code: Optional[str] = None) -> None:
+        """清除全部或指定设备的状态"""
+        if device_code is None:
+            self._states.clear()
+            return
+        for key in [key for key in self._states if key[0] == device_code]:
+            del self._states[key]
+
+    def get_state(self, device_code: str, metric: str) -> Optional[Dict[str, Any]]:
+        state = self._states.get((device_code, metric))
+        if state is None:
+            return None
+        return {
+            "mode": state.mode,
+            "count": state.count,
+            "center": state.center,
+            "scale": state.scale,
+            "updated_at": state.updated_at,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "series": len(self._states),
+            "max_series": self.max_series,
+            "samples": self.samples,
+            "anomalies": self.anomalies,
+            "threshold_sigma": self.threshold_sigma,
+            "min_samples": self.min_samples,
+        }
+
+
+# 创建全局实例（接入设备数据流，每帧更新）
+streaming_anomaly_detector = StreamingAnomalyDetector(mode=MODE_EWMA)
@@ -8,10 +8,11 @@ from app.settings.config import settings
 from datetime import datetime
 import json
 import pandas as pd
-import numpy as np
 import os
+import time
 from app.services.ai.factory import TrainerFactory
 from app.services.ai.data_loader import TDengineLoader
+from app.services.ai.sklearn_trainer import UNSUPERVISED_ALGORITHMS
 
 @app.task(bind=True)
 def train_model(self, model_id: int, train_config: dict):
@@ -26,6 +27,7 @@ async def run_training(task, model_id: int, train_config: dict):
         await Tortoise.init(config=settings.TORTOISE_ORM)
     
     model = None
+    loader = None
     try:
         # Retry logic for fetching the model (handle transaction latency)
         for i in range(5):
@@ -52,7 +54,7 @@ async def run_training(task, model_id: int, train_config: dict):
         model.progress = 5.0
         await model.save()
         
-        # 1. Load Data
+        # 1. Resolve dataset
         loader = TDengineLoader()
         dataset_config = train_config.get('training_dataset')
         
@@ -65,65 +67,70 @@ async def run_training(task, model_id: int, train_config: dict):
         if not isinstance(dataset_config, dict):
             dataset_config = {}
 
-        device_id = dataset_config.get('device_id')
+        device_codes = dataset_config.get('device_codes') or dataset_config.get('device_ids') or []
+        if isinstance(device_codes, str):
+            device_codes = [code.strip() for code in device_codes.split(',') if code.strip()]
+        if not device_codes and dataset_config.get('device_id'):
+            device_codes = [dataset_config['device_id']]
         start_time = dataset_config.get('start_time')
         end_time = dataset_config.get('end_time')
-        
-        df = pd.DataFrame()
-        if device_id and start_time and end_time:
-             try:
-                 df = await loader.load(device_id, start_time, end_time)
-             except Exception as load_error:
-                 logger.warning(f"Failed to load data from TDengine: {load_error}")
-        
-        if df.empty:
-             logger.warning("Using dummy data for training due to empty result or missing config")
-             # Dummy data
-             df = pd.DataFrame({
-                 'feature1': np.random.rand(100),
-                 'feature2': np.random.rand(100),
-                 'label': np.random.randint(0, 2, 100)
-             })
-
-        model.progress = 20.0
-        await model.save()
+        if not (device_codes and start_time and end_time):
+            raise ValueError("training_dataset requires device_id(s), start_time and end_time")
+
+        params = dict(train_config.get('training_parameters') or {})
+        params['algorithm'] = model.algorithm
+        feature_cols = params.get('feature_cols') or dataset_config.get('feature_cols')
+        if feature_cols:
+            params['feature_cols'] = list(feature_cols)
+        if dataset_config.get('target_col'):
+            params.setdefault('target_col', dataset_config['target_col'])
+        target_col = params.get('target_col', 'label')
+        columns = None
+        if feature_cols:
+            columns = list(feature_cols)
+            if model.algorithm not in UNSUPERVISED_ALGORITHMS and target_col not in columns:
+                columns.append(target_col)
+        if 'chunk_size' in dataset_config:
+            loader.chunk_size = int(dataset_config['chunk_size'])
+
+        resolutions = await loader.resolve_tables(device_codes)
+        total_rows = await loader.count_rows(device_codes, start_time, end_time, resolutions)
+        if total_rows == 0:
+            raise ValueError(f"No training data in TDengine for devices {device_codes} between {start_time} and {end_time}")
 
         # 2. Initialize Trainer
         loop = asyncio.get_running_loop()
         logger.info(f"Task {model_id}: Starting training with loop {loop}")
-        
-        def progress_callback(p):
-            # Scale trainer progress (0-100) to overall task progress (20-90)
-            # Trainer reports 0-100, we map it to 20-90 range
-            scaled_p = 20.0 + (p * 0.7)
-            logger.info(f"Task {model_id}: Progress callback p={p}, scaled={scaled_p}")
-            
-            # Update Celery state
+
+        def publish_progress(value):
+            # Safe from the event loop and from executor threads
+            value = round(value, 2)
             if task.request.id:
                 try:
-                    task.update_state(state='PROGRESS', meta={'progress': scaled_p})
+                    task.update_state(state='PROGRESS', meta={'progress': value})
                 except Exception as e:
                     logger.warning(f"Failed to update task state: {e}")
-            
-            # Update DB safely from thread
+
             async def update_db_progress():
                 try:
-                    logger.info(f"Task {model_id}: Updating DB progress to {scaled_p}")
-                    # Re-fetch model to avoid staleness, or just update
-                    await AIModel.filter(id=model_id).update(progress=scaled_p)
+                    await AIModel.filter(id=model_id).update(progress=value)
                 except Exception as e:
                     logger.error(f"Failed to update progress in DB: {e}")
-            
+
             try:
-                # Use call_soon_threadsafe instead of run_coroutine_threadsafe to ensure it runs in the loop
-                # But call_soon_threadsafe expects a callback, not a coroutine.
-                # So we use create_task inside the callback.
                 def schedule_update():
                     loop.create_task(update_db_progress())
-                
+
                 loop.call_soon_threadsafe(schedule_update)
             except Exception as e:
                 logger.error(f"Failed to schedule DB update: {e}")
+
+        # Overall progress window the trainer's own 0-100 is mapped into
+        fit_window = [40.0, 90.0]
+
+        def progress_callback(p):
+            low, high = fit_window
+            publish_progress(low + p * (high - low) / 100.0)
             
         def log_callback(msg):
             # Update DB safely from thread
@@ -156,21 +163,73 @@ async def run_training(task, model_id: int, train_config: dict):
             progress_callback=progress_callback,
             log_callback=log_callback
         )
-        
-        # 3. Train
-        params = train_config.get('training_parameters', {})
-        params['algorithm'] = model.algorithm
-        
-        # Add real-time log simulation (or implement real logging if trainer supports it)
-        # For now we just log start
-        model.error_log = "Starting training...\n"
+
+        model.error_log = (
+            f"Starting training on {len(resolutions)}/{len(device_codes)} devices, {total_rows} rows...\n"
+        )
         await model.save()
+
+        # 3. Stream chunks from TDengine and train
+        incremental = trainer.supports_partial_fit(model.algorithm)
+        eval_rows = int(params.get('eval_rows', 50000))
+        frames = []
+        rows_loaded = 0
+        chunk_count = 0
+        load_seconds = 0.0
+        started = time.perf_counter()
+        trained_model = None
+        if incremental:
+            trained_model = trainer.create_model(
+                model.algorithm, params.get('hyperparameters', {}), params.get('n_jobs', -1)
+            )
+
+        chunk_started = time.perf_counter()
+        async for chunk in loader.iter_chunks(device_codes, start_time, end_time, columns, resolutions):
+            load_seconds += time.perf_counter() - chunk_started
+            chunk_count += 1
+            rows_loaded += len(chunk)
+            feature_list, target = trainer.resolve_columns(chunk, params)
+            keep = feature_list + ([target] if target in chunk.columns else [])
+            chunk = chunk.reindex(columns=keep).ffill().dropna()
+
+            if incremental:
+                # Load and fit interleave: progress follows rows consumed
+                if not chunk.empty:
+                    await loop.run_in_executor(None, trainer.partial_fit, trained_model, chunk, params)
+                    frames.append(chunk)
+                    # Only a bounded tail is kept for evaluation
+                    while len(frames) > 1 and sum(len(f) for f in frames[1:]) >= eval_rows:
+                        frames.pop(0)
+                publish_progress(5.0 + 85.0 * min(rows_loaded / total_rows, 1.0))
+            else:
+                frames.append(chunk.astype({c: 'float32' for c in feature_list}))
+                publish_progress(5.0 + 35.0 * min(rows_loaded / total_rows, 1.0))
+            chunk_started = time.perf_counter()
+
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        del frames
+        if df.empty:
+            raise ValueError("No usable training rows after dropping incomplete records")
+        log_callback(f"Loaded {rows_loaded} rows in {chunk_count} chunks ({load_seconds:.2f}s)")
+
+        if not incremental:
+            trained_model = await loop.run_in_executor(None, trainer.train, df, params)
+        else:
+            df = df.tail(eval_rows)
+
+        training_stats = {
+            **trainer.stats,
+            'rows_loaded': rows_loaded,
+            'devices': len(resolutions),
+            'chunks': chunk_count,
+            'load_seconds': round(load_seconds, 3),
+            'total_seconds': round(time.perf_counter() - started, 3),
+        }
+        training_stats['rows_per_sec'] = (
+            round(rows_loaded / training_stats['total_seconds'], 1) if training_stats['total_seconds'] > 0 else None
+        )
         
-        # Run synchronous training code in thread pool
-        # loop is already defined above
-        trained_model = await loop.run_in_executor(None, trainer.train, df, params)
-        
-        model.error_log += "Training completed.\nStarting evaluation...\n"
+        model.error_log = (model.error_log or "") + "Training completed.\nStarting evaluation...\n"
         await model.save()
         
         # 4. Evaluate
@@ -192,6 +251,7 @@ async def run_training(task, model_id: int, train_config: dict):
         model.training_metrics = metrics
         model.model_file_path = saved_path
         model.model_file_size = os.path.getsize(saved_path)
+        model.resource_usage = {**(model.resource_usage or {}), 'training': training_stats}
         await model.save()
         
     except Exception as e:
@@ -203,3 +263,6 @@ async def run_training(task, model_id: int, train_config: dict):
             model.error_log = str(e)
             await model.save()
         raise e
+    finally:
+        if loader is not None:
+            await loader.close()
@@ -11,9 +11,23 @@ from datetime import datetime
 
 from app.services.alarm_detection import check_and_trigger_alarms, alarm_engine
 from app.services.alarm_websocket import broadcast_new_alarms
+from app.services.ai.streaming_anomaly import streaming_anomaly_detector
+from app.settings.ai_settings import ai_settings
 from app.log import logger
 
 
+def observe_streaming_anomalies(device_code: str, data: Dict[str, Any]) -> None:
+    """流式异常检测：每帧以 O(1) 代价更新 (设备, 指标) 的增量统计并评分"""
+    if not ai_settings.is_feature_enabled('anomaly_detection'):
+        return
+    try:
+        anomalies = streaming_anomaly_detector.observe_frame(device_code, data)
+        if anomalies:
+            logger.debug(f"设备 {device_code} 流式检测到异常指标: {list(anomalies)}")
+    except Exception as e:
+        logger.warning(f"设备 {device_code} 流式异常检测失败: {str(e)}")
+
+
 async def process_device_data_for_alarms(
     devices_data: List[Dict[str, Any]],
     device_type_code: str
@@ -63,6 +77,8 @@ async def process_device_data_for_alarms(
             if not monitoring_data:
                 continue
             
+            observe_streaming_anomalies(device_code, monitoring_data)
+            
             # 检测报警
             alarms = await check_and_trigger_alarms(
                 device_code=device_code,
@@ -103,6 +119,8 @@ async def check_single_device_alarms(
     Returns:
         触发的报警列表
     """
+    observe_streaming_anomalies(device_code, data)
+    
     alarms = await check_and_trigger_alarms(
         device_code=device_code,
         device_name=device_name,
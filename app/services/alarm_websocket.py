@@ -8,7 +8,7 @@
 import asyncio
 import json
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set, Tuple
 from datetime import datetime
 from fastapi import WebSocket, WebSocketDisconnect, Query
 import jwt
@@ -18,12 +18,70 @@ from app.settings import settings
 from app.log import logger
 
 
+class _Client:
+    """单个连接：订阅信息 + 有界发送队列 + 独立发送协程"""
+    
+    __slots__ = ("websocket", "user_id", "device_types", "connected_at", "queue", "writer")
+    
+    def __init__(self, websocket: WebSocket, user_id: int, device_types: Optional[List[str]], queue_size: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.device_types = list(device_types or [])  # 空列表表示订阅所有类型
+        self.connected_at = datetime.now().isoformat()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+    
+    @property
+    def subscription_key(self) -> Optional[frozenset]:
+        return frozenset(self.device_types) if self.device_types else None
+
+
 class AlarmWebSocketManager:
-    """报警WebSocket连接管理器"""
+    """
+    报警WebSocket连接管理器
     
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.subscriptions: Dict[WebSocket, Dict] = {}  # {websocket: {device_types: [], user_id: int}}
+    - 订阅者按设备类型建立索引，广播只遍历相关连接
+    - 每条报警只序列化一次，同一推送周期内的报警合并为一帧，
+      订阅相同的连接共享同一帧
+    - 每个连接有独立的有界发送队列和发送协程，慢连接不影响其他连接；
+      队列满或发送超时的连接会被断开，由客户端重连
+    """
+    
+    def __init__(self, flush_interval: float = 0.05, send_queue_size: int = 256, send_timeout: float = 10.0):
+        """
+        Args:
+            flush_interval: 报警合并推送周期（秒）
+            send_queue_size: 每个连接最多积压的帧数
+            send_timeout: 单帧发送超时（秒）
+        """
+        self.flush_interval = flush_interval
+        self.send_queue_size = send_queue_size
+        self.send_timeout = send_timeout
+        self.clients: Dict[WebSocket, _Client] = {}
+        self._all_types: Set[WebSocket] = set()           # 订阅全部类型的连接
+        self._by_type: Dict[str, Set[WebSocket]] = {}     # 设备类型 -> 订阅该类型的连接
+        self._pending_alarms: List[Tuple[Optional[str], str]] = []  # (设备类型, 已序列化的报警)
+        self._pending_statistics = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"alarms": 0, "frames": 0, "dropped_connections": 0}
+    
+    # ---------- 连接与订阅 ----------
+    
+    def _index(self, client: _Client) -> None:
+        if client.device_types:
+            for device_type in client.device_types:
+                self._by_type.setdefault(device_type, set()).add(client.websocket)
+        else:
+            self._all_types.add(client.websocket)
+    
+    def _unindex(self, client: _Client) -> None:
+        self._all_types.discard(client.websocket)
+        for device_type in client.device_types:
+            subscribers = self._by_type.get(device_type)
+            if subscribers is not None:
+                subscribers.discard(client.websocket)
+                if not subscribers:
+                    del self._by_type[device_type]
     
     async def connect(
         self, 
@@ -33,92 +91,183 @@ class AlarmWebSocketManager:
     ):
         """建立WebSocket连接"""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        self.subscriptions[websocket] = {
-            "user_id": user_id,
-            "device_types": device_types or [],  # 空列表表示订阅所有类型
-            "connected_at": datetime.now().isoformat()
-        }
+        client = _Client(websocket, user_id, device_types, self.send_queue_size)
+        client.writer = asyncio.create_task(self._writer(client))
+        self.clients[websocket] = client
+        self._index(client)
         logger.info(f"报警WebSocket连接已建立，用户ID: {user_id}, 订阅类型: {device_types or '全部'}")
     
     def disconnect(self, websocket: WebSocket):
         """断开WebSocket连接"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if websocket in self.subscriptions:
-            sub = self.subscriptions[websocket]
-            logger.info(f"报警WebSocket连接已断开，用户ID: {sub.get('user_id')}")
-            del self.subscriptions[websocket]
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        self._unindex(client)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        logger.info(f"报警WebSocket连接已断开，用户ID: {client.user_id}")
     
-    async def send_alarm(self, websocket: WebSocket, alarm: Dict):
-        """发送报警消息到单个连接"""
+    def update_subscription(self, websocket: WebSocket, device_types: Optional[List[str]]):
+        """更新连接订阅的设备类型"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        self._unindex(client)
+        client.device_types = list(device_types or [])
+        self._index(client)
+    
+    # ---------- 发送 ----------
+    
+    async def _writer(self, client: _Client):
+        """连接的发送协程：按顺序发送队列中的帧"""
         try:
-            message = json.dumps({
-                "type": "alarm",
-                "timestamp": datetime.now().isoformat(),
-                "data": alarm
-            }, ensure_ascii=False, default=str)
-            await websocket.send_text(message)
+            while True:
+                message = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(message), self.send_timeout)
+                self.stats["frames"] += 1
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
-            logger.error(f"发送报警消息失败: {str(e)}")
-            self.disconnect(websocket)
+            logger.warning(f"报警WebSocket发送失败，断开连接，用户ID: {client.user_id}: {str(e)}")
+            self.disconnect(client.websocket)
+            await self._close(client.websocket)
+    
+    async def _close(self, websocket: WebSocket, code: int = 1011):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+    
+    def _enqueue(self, client: _Client, message: str) -> bool:
+        try:
+            client.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            # 积压过多的慢连接直接断开，避免无限占用内存
+            self.stats["dropped_connections"] += 1
+            logger.warning(f"报警WebSocket发送队列已满，断开连接，用户ID: {client.user_id}")
+            self.disconnect(client.websocket)
+            asyncio.create_task(self._close(client.websocket, code=1013))
+            return False
+    
+    async def send_text(self, websocket: WebSocket, message: str) -> bool:
+        """经发送队列向单个连接发送文本（与广播共用同一发送顺序）"""
+        client = self.clients.get(websocket)
+        return client is not None and self._enqueue(client, message)
+    
+    @staticmethod
+    def _encode_alarm(alarm: Dict) -> str:
+        return json.dumps(alarm, ensure_ascii=False, default=str)
+    
+    @staticmethod
+    def _alarm_frame(encoded: List[str]) -> str:
+        """由已序列化的报警拼接推送帧：单条沿用 alarm 格式，多条合并为 alarms"""
+        timestamp = datetime.now().isoformat()
+        if len(encoded) == 1:
+            return f'{{"type": "alarm", "timestamp": "{timestamp}", "data": {encoded[0]}}}'
+        return f'{{"type": "alarms", "timestamp": "{timestamp}", "data": [{", ".join(encoded)}]}}'
+    
+    async def send_alarm(self, websocket: WebSocket, alarm: Dict):
+        """发送报警消息到单个连接"""
+        await self.send_text(websocket, self._alarm_frame([self._encode_alarm(alarm)]))
     
     async def broadcast_alarm(self, alarm: Dict):
         """广播报警消息到所有相关订阅者"""
-        device_type = alarm.get("device_type_code")
-        disconnected = []
-        
-        for websocket, subscription in self.subscriptions.items():
-            try:
-                subscribed_types = subscription.get("device_types", [])
-                
-                # 检查是否订阅了该设备类型
-                if not subscribed_types or device_type in subscribed_types:
-                    await self.send_alarm(websocket, alarm)
-                    
-            except Exception as e:
-                logger.error(f"广播报警失败: {str(e)}")
-                disconnected.append(websocket)
-        
-        # 清理断开的连接
-        for ws in disconnected:
-            self.disconnect(ws)
+        await self.broadcast_alarms([alarm])
     
     async def broadcast_alarms(self, alarms: List[Dict]):
-        """批量广播报警消息"""
+        """批量广播报警消息：序列化后进入本周期的合并缓冲，由 flush 统一推送"""
         for alarm in alarms:
-            await self.broadcast_alarm(alarm)
+            self._pending_alarms.append((alarm.get("device_type_code"), self._encode_alarm(alarm)))
+        self.stats["alarms"] += len(alarms)
+        self._schedule_flush()
     
     async def send_statistics_update(self):
-        """发送统计更新通知"""
-        message = json.dumps({
-            "type": "statistics_update",
-            "timestamp": datetime.now().isoformat(),
-        }, ensure_ascii=False)
+        """发送统计更新通知（与本周期报警一起推送，排在报警之后）"""
+        self._pending_statistics = True
+        self._schedule_flush()
+    
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after())
+    
+    async def _flush_after(self):
+        await asyncio.sleep(self.flush_interval)
+        self.flush()
+    
+    def flush(self):
+        """推送本周期积压的报警与统计更新"""
+        pending, self._pending_alarms = self._pending_alarms, []
+        statistics, self._pending_statistics = self._pending_statistics, False
         
-        disconnected = []
-        for websocket in self.active_connections:
-            try:
-                await websocket.send_text(message)
-            except Exception:
-                disconnected.append(websocket)
+        if pending:
+            by_type: Dict[Optional[str], List[str]] = {}
+            for device_type, encoded in pending:
+                by_type.setdefault(device_type, []).append(encoded)
+            
+            targets = set(self._all_types)
+            for device_type in by_type:
+                targets.update(self._by_type.get(device_type, ()))
+            
+            # 订阅相同的连接共享同一帧
+            frames: Dict[Optional[frozenset], Optional[str]] = {}
+            for websocket in targets:
+                client = self.clients.get(websocket)
+                if client is None:
+                    continue
+                key = client.subscription_key
+                if key not in frames:
+                    if key is None:
+                        encoded = [encoded for _, encoded in pending]
+                    else:
+                        encoded = [encoded for device_type, encoded in pending if device_type in key]
+                    frames[key] = self._alarm_frame(encoded) if encoded else None
+                if frames[key] is not None:
+                    self._enqueue(client, frames[key])
         
-        for ws in disconnected:
-            self.disconnect(ws)
+        if statistics:
+            message = json.dumps({
+                "type": "statistics_update",
+                "timestamp": datetime.now().isoformat(),
+            }, ensure_ascii=False)
+            for client in list(self.clients.values()):
+                self._enqueue(client, message)
+    
+    async def send_unread_counts(self, counts: Dict[int, Dict[str, int]]):
+        """推送未读通知数量，每个用户的消息只序列化一次"""
+        messages = {
+            user_id: json.dumps({
+                "type": "unread_count",
+                "timestamp": datetime.now().isoformat(),
+                "data": count
+            }, ensure_ascii=False)
+            for user_id, count in counts.items()
+        }
+        for client in list(self.clients.values()):
+            message = messages.get(client.user_id)
+            if message is not None:
+                self._enqueue(client, message)
+    
+    # ---------- 查询 ----------
+    
+    def get_online_user_ids(self) -> set:
+        """获取当前在线的用户ID"""
+        return {client.user_id for client in self.clients.values()}
     
     def get_connection_count(self) -> int:
         """获取当前连接数"""
-        return len(self.active_connections)
+        return len(self.clients)
     
     def get_connection_info(self) -> List[Dict]:
         """获取所有连接信息"""
         return [
             {
-                "user_id": sub.get("user_id"),
-                "device_types": sub.get("device_types"),
-                "connected_at": sub.get("connected_at")
+                "user_id": client.user_id,
+                "device_types": client.device_types,
+                "connected_at": client.connected_at,
+                "queued_frames": client.queue.qsize()
             }
-            for sub in self.subscriptions.values()
+            for client in self.clients.values()
         ]
 
 
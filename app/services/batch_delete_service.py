@@ -1,10 +1,13 @@
 """
 批量删除服务 - 提供统一的批量删除逻辑和用户友好的错误提示
 """
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 from abc import ABC, abstractmethod
 import logging
 
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
 from app.schemas.base import BatchDeleteResponse, BatchDeleteFailedItem, BatchDeleteSuccessItem
 
 logger = logging.getLogger(__name__)
@@ -73,6 +76,53 @@ class UserFriendlyErrorMessages:
             return template
 
 
+async def count_by(queryset, field: str) -> Dict[int, int]:
+    """按字段分组计数：SELECT field, COUNT(id) ... GROUP BY field"""
+    rows = await queryset.annotate(count=Count("id")).group_by(field).values(field, "count")
+    return {row[field]: row["count"] for row in rows}
+
+
+async def children_by_parent(queryset) -> Dict[int, Set[int]]:
+    """查询子节点，返回 {父ID: 子ID集合}"""
+    children: Dict[int, Set[int]] = {}
+    for child_id, parent_id in await queryset.values_list("id", "parent_id"):
+        children.setdefault(parent_id, set()).add(child_id)
+    return children
+
+
+def resolve_tree_rules(
+    items: List,
+    children: Dict[int, Set[int]],
+    message_for: Callable[[Any, int], Optional[str]],
+) -> Dict[int, str]:
+    """
+    树形数据的批量规则判定
+
+    同批删除的子节点不再阻止父节点删除；子节点自身被拒绝时父节点随之被拒绝，
+    反复判定直至可删除集合不再变化。
+
+    Args:
+        items: 待删除项目
+        children: {父ID: 子ID集合}
+        message_for: (项目, 剩余子节点数) -> 错误消息或None
+
+    Returns:
+        {项目ID: 错误消息}
+    """
+    deletable = {item.id for item in items}
+    while True:
+        errors = {}
+        for item in items:
+            remaining = sum(1 for child_id in children.get(item.id, ()) if child_id not in deletable)
+            message = message_for(item, remaining)
+            if message:
+                errors[item.id] = message
+        allowed = deletable - errors.keys()
+        if allowed == deletable:
+            return errors
+        deletable = allowed
+
+
 class BatchDeleteBusinessRules:
     """批量删除业务规则检查器"""
     
@@ -110,14 +160,22 @@ class BatchDeleteBusinessRules:
     async def check_role_deletion_rules(role) -> Optional[str]:
         """检查角色删除业务规则"""
         # 检查是否为系统内置角色
+        if getattr(role, 'is_system', False):
+            return BatchDeleteBusinessRules.role_message(role, 0)
+        
+        # 检查是否有关联用户
+        user_count = await role.users.all().count()
+        return BatchDeleteBusinessRules.role_message(role, user_count)
+    
+    @staticmethod
+    def role_message(role, user_count: int) -> Optional[str]:
+        """根据关联用户数生成角色删除错误消息"""
         if getattr(role, 'is_system', False):
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.ROLE_IS_SYSTEM,
                 name=role.role_name
             )
         
-        # 检查是否有关联用户
-        user_count = await role.users.all().count()
         if user_count > 0:
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.ROLE_HAS_USERS,
@@ -127,6 +185,19 @@ class BatchDeleteBusinessRules:
         
         return None
     
+    @staticmethod
+    async def check_role_deletion_rules_bulk(roles: List) -> Dict[int, str]:
+        """批量检查角色删除业务规则：关联用户数按角色分组统计"""
+        from app.models.admin import UserRole
+        
+        user_counts = await count_by(UserRole.filter(role_id__in=[role.id for role in roles]), "role_id")
+        errors = {}
+        for role in roles:
+            message = BatchDeleteBusinessRules.role_message(role, user_counts.get(role.id, 0))
+            if message:
+                errors[role.id] = message
+        return errors
+    
     @staticmethod
     async def check_department_deletion_rules(department) -> Optional[str]:
         """检查部门删除业务规则"""
@@ -138,6 +209,11 @@ class BatchDeleteBusinessRules:
         # 检查关联用户
         user_count = await User.filter(dept_id=department.id).count()
         
+        return BatchDeleteBusinessRules.department_message(department, sub_dept_count, user_count)
+    
+    @staticmethod
+    def department_message(department, sub_dept_count: int, user_count: int) -> Optional[str]:
+        """根据子部门数与用户数生成部门删除错误消息"""
         if sub_dept_count > 0 and user_count > 0:
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.DEPARTMENT_HAS_CHILDREN_AND_USERS,
@@ -160,20 +236,44 @@ class BatchDeleteBusinessRules:
         
         return None
     
+    @staticmethod
+    async def check_department_deletion_rules_bulk(departments: List) -> Dict[int, str]:
+        """批量检查部门删除业务规则：子部门一次查出，用户数按部门分组统计"""
+        from app.models.admin import User, Dept
+        
+        ids = [department.id for department in departments]
+        children = await children_by_parent(Dept.filter(parent_id__in=ids, del_flag="0"))
+        user_counts = await count_by(User.filter(dept_id__in=ids), "dept_id")
+        return resolve_tree_rules(
+            departments,
+            children,
+            lambda department, sub_dept_count: BatchDeleteBusinessRules.department_message(
+                department, sub_dept_count, user_counts.get(department.id, 0)
+            ),
+        )
+    
     @staticmethod
     async def check_api_group_deletion_rules(api_group) -> Optional[str]:
         """检查API分组删除业务规则"""
         from app.models.admin import SysApiEndpoint
         
         # 检查是否为系统内置
+        if getattr(api_group, 'is_system', False):
+            return BatchDeleteBusinessRules.api_group_message(api_group, 0)
+        
+        # 检查关联API
+        api_count = await SysApiEndpoint.filter(group_id=api_group.id).count()
+        return BatchDeleteBusinessRules.api_group_message(api_group, api_count)
+    
+    @staticmethod
+    def api_group_message(api_group, api_count: int) -> Optional[str]:
+        """根据关联API数生成API分组删除错误消息"""
         if getattr(api_group, 'is_system', False):
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.API_IS_SYSTEM,
                 name=api_group.group_name
             )
         
-        # 检查关联API
-        api_count = await SysApiEndpoint.filter(group_id=api_group.id).count()
         if api_count > 0:
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.API_GROUP_HAS_APIS,
@@ -183,20 +283,43 @@ class BatchDeleteBusinessRules:
         
         return None
     
+    @staticmethod
+    async def check_api_group_deletion_rules_bulk(api_groups: List) -> Dict[int, str]:
+        """批量检查API分组删除业务规则：关联API数按分组统计"""
+        from app.models.admin import SysApiEndpoint
+        
+        api_counts = await count_by(
+            SysApiEndpoint.filter(group_id__in=[api_group.id for api_group in api_groups]), "group_id"
+        )
+        errors = {}
+        for api_group in api_groups:
+            message = BatchDeleteBusinessRules.api_group_message(api_group, api_counts.get(api_group.id, 0))
+            if message:
+                errors[api_group.id] = message
+        return errors
+    
     @staticmethod
     async def check_menu_deletion_rules(menu) -> Optional[str]:
         """检查菜单删除业务规则"""
         from app.models.admin import Menu
         
         # 检查是否为系统内置
+        if getattr(menu, 'is_system', False):
+            return BatchDeleteBusinessRules.menu_message(menu, 0)
+        
+        # 检查子菜单
+        child_count = await Menu.filter(parent_id=menu.id).count()
+        return BatchDeleteBusinessRules.menu_message(menu, child_count)
+    
+    @staticmethod
+    def menu_message(menu, child_count: int) -> Optional[str]:
+        """根据子菜单数生成菜单删除错误消息"""
         if getattr(menu, 'is_system', False):
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.MENU_IS_SYSTEM,
                 name=menu.name
             )
         
-        # 检查子菜单
-        child_count = await Menu.filter(parent_id=menu.id).count()
         if child_count > 0:
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.MENU_HAS_CHILDREN,
@@ -206,19 +329,35 @@ class BatchDeleteBusinessRules:
         
         return None
     
+    @staticmethod
+    async def check_menu_deletion_rules_bulk(menus: List) -> Dict[int, str]:
+        """批量检查菜单删除业务规则：同批删除的子菜单不计入"""
+        from app.models.admin import Menu
+        
+        children = await children_by_parent(Menu.filter(parent_id__in=[menu.id for menu in menus]))
+        return resolve_tree_rules(menus, children, BatchDeleteBusinessRules.menu_message)
+    
     @staticmethod
     async def check_dict_type_deletion_rules(dict_type) -> Optional[str]:
         """检查字典类型删除业务规则"""
         # 检查是否为系统内置
+        if getattr(dict_type, 'is_system', False):
+            return BatchDeleteBusinessRules.dict_type_message(dict_type, 0)
+        
+        # 检查关联字典数据
+        from app.models.system import SysDictData as DictData
+        data_count = await DictData.filter(dict_type_id=dict_type.id).count()
+        return BatchDeleteBusinessRules.dict_type_message(dict_type, data_count)
+    
+    @staticmethod
+    def dict_type_message(dict_type, data_count: int) -> Optional[str]:
+        """根据字典数据项数生成字典类型删除错误消息"""
         if getattr(dict_type, 'is_system', False):
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.DICT_TYPE_IS_SYSTEM,
                 name=dict_type.type_name
             )
         
-        # 检查关联字典数据
-        from app.models.system import SysDictData as DictData
-        data_count = await DictData.filter(dict_type_id=dict_type.id).count()
         if data_count > 0:
             return UserFriendlyErrorMessages.format_message(
                 UserFriendlyErrorMessages.DICT_TYPE_HAS_DATA,
@@ -228,6 +367,21 @@ class BatchDeleteBusinessRules:
         
         return None
     
+    @staticmethod
+    async def check_dict_type_deletion_rules_bulk(dict_types: List) -> Dict[int, str]:
+        """批量检查字典类型删除业务规则：字典数据项数按类型分组统计"""
+        from app.models.system import SysDictData as DictData
+        
+        data_counts = await count_by(
+            DictData.filter(dict_type_id__in=[dict_type.id for dict_type in dict_types]), "dict_type_id"
+        )
+        errors = {}
+        for dict_type in dict_types:
+            message = BatchDeleteBusinessRules.dict_type_message(dict_type, data_counts.get(dict_type.id, 0))
+            if message:
+                errors[dict_type.id] = message
+        return errors
+    
     @staticmethod
     async def check_dict_data_deletion_rules(dict_data) -> Optional[str]:
         """检查字典数据删除业务规则"""
@@ -263,7 +417,13 @@ class BatchDeleteBusinessRules:
 
 
 class BaseBatchDeleteService(ABC):
-    """批量删除服务基类"""
+    """
+    批量删除服务基类
+    
+    子类实现 get_model 后默认走集合模式：一次查询加载全部候选项，业务规则用按ID集合分组的
+    COUNT 查询判定，允许删除的项目在同一事务内以单条 DELETE ... WHERE id IN 删除；
+    未实现 get_model 或 bulk=False 时逐条查询、检查、删除。
+    """
     
     def __init__(self, resource_name: str):
         self.resource_name = resource_name
@@ -288,8 +448,87 @@ class BaseBatchDeleteService(ABC):
         """删除项目"""
         pass
     
-    async def batch_delete(self, ids: List[int], **kwargs) -> BatchDeleteResponse:
-        """执行批量删除操作"""
+    def get_model(self):
+        """返回模型类；返回None时仅支持逐条删除"""
+        return None
+    
+    async def load_items(self, ids: List[int]) -> Dict[int, Any]:
+        """一次查询加载候选项目，返回 {ID: 项目}"""
+        items = await self.get_model().filter(id__in=ids)
+        return {item.id: item for item in items}
+    
+    async def check_business_rules_bulk(self, items: List, **kwargs) -> Dict[int, str]:
+        """批量检查业务规则，返回 {项目ID: 错误消息}；默认逐项调用 check_business_rules"""
+        errors = {}
+        for item in items:
+            error_message = await self.check_business_rules(item, **kwargs)
+            if error_message:
+                errors[item.id] = error_message
+        return errors
+    
+    async def delete_items(self, items: List, connection, **kwargs):
+        """在事务连接上删除允许删除的项目"""
+        await self.get_model().filter(id__in=[item.id for item in items]).using_db(connection).delete()
+    
+    async def batch_delete(self, ids: List[int], bulk: bool = True, **kwargs) -> BatchDeleteResponse:
+        """
+        执行批量删除操作
+        
+        Args:
+            ids: 要删除的ID列表
+            bulk: 是否使用集合模式（子类未实现 get_model 时自动退回逐条模式）
+            **kwargs: 传给业务规则检查的参数（current_user、force等）
+        """
+        if bulk and self.get_model() is not None:
+            return await self._batch_delete_bulk(ids, **kwargs)
+        return await self._batch_delete_each(ids, **kwargs)
+    
+    async def _batch_delete_bulk(self, ids: List[int], **kwargs) -> BatchDeleteResponse:
+        """集合模式：加载、规则判定、删除各一轮查询，失败原因仍逐项返回"""
+        unique_ids = list(dict.fromkeys(ids))
+        items = await self.load_items(unique_ids) if unique_ids else {}
+        candidates = [items[item_id] for item_id in unique_ids if item_id in items]
+        errors = await self.check_business_rules_bulk(candidates, **kwargs) if candidates else {}
+        allowed = [item for item in candidates if item.id not in errors]
+        
+        delete_error = None
+        if allowed:
+            try:
+                async with in_transaction("default") as connection:
+                    await self.delete_items(allowed, connection, **kwargs)
+            except Exception as e:
+                # 事务整体回滚，允许删除的项目全部记为失败
+                logger.error(f"Error deleting {self.resource_name} {[item.id for item in allowed]}: {str(e)}")
+                delete_error = f"删除失败: {str(e)}"
+        
+        deleted_items = []
+        failed_items = []
+        for item_id in unique_ids:
+            item = items.get(item_id)
+            if item is None:
+                failed_items.append(BatchDeleteFailedItem(
+                    id=item_id,
+                    name=None,
+                    reason=UserFriendlyErrorMessages.ITEM_NOT_FOUND
+                ))
+                continue
+            
+            item_name = await self.get_item_name(item)
+            reason = errors.get(item_id) or delete_error
+            if reason:
+                failed_items.append(BatchDeleteFailedItem(id=item_id, name=item_name, reason=reason))
+            else:
+                deleted_items.append(BatchDeleteSuccessItem(id=item_id, name=item_name))
+        
+        return BatchDeleteResponse(
+            deleted_count=len(deleted_items),
+            failed_count=len(failed_items),
+            deleted=deleted_items,
+            failed=failed_items
+        )
+    
+    async def _batch_delete_each(self, ids: List[int], **kwargs) -> BatchDeleteResponse:
+        """逐条模式"""
         deleted_items = []
         failed_items = []
         
@@ -347,6 +586,10 @@ class UserBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("用户")
     
+    def get_model(self):
+        from app.models.admin import User
+        return User
+
     async def get_item_by_id(self, item_id: int):
         from app.models.admin import User
         return await User.get_or_none(id=item_id)
@@ -367,6 +610,10 @@ class RoleBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("角色")
     
+    def get_model(self):
+        from app.models.admin import Role
+        return Role
+
     async def get_item_by_id(self, item_id: int):
         from app.models.admin import Role
         return await Role.get_or_none(id=item_id)
@@ -377,11 +624,21 @@ class RoleBatchDeleteService(BaseBatchDeleteService):
     async def check_business_rules(self, item, **kwargs) -> Optional[str]:
         return await BatchDeleteBusinessRules.check_role_deletion_rules(item)
     
+    async def check_business_rules_bulk(self, items: List, **kwargs) -> Dict[int, str]:
+        return await BatchDeleteBusinessRules.check_role_deletion_rules_bulk(items)
+    
     async def delete_item(self, item):
         # 清理关联关系
         await item.apis.clear()
         await item.menus.clear()
         await item.delete()
+    
+    async def delete_items(self, items: List, connection, **kwargs):
+        # 关联表按角色ID集合一次清理（ID来自已加载的模型，均为整数）
+        role_ids = ",".join(str(int(item.id)) for item in items)
+        for table in ("t_sys_role_api", "t_sys_role_menu"):
+            await connection.execute_query(f'DELETE FROM "{table}" WHERE "role_id" IN ({role_ids})')
+        await super().delete_items(items, connection, **kwargs)
 
 
 class DepartmentBatchDeleteService(BaseBatchDeleteService):
@@ -390,6 +647,10 @@ class DepartmentBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("部门")
     
+    def get_model(self):
+        from app.models.admin import Dept
+        return Dept
+
     async def get_item_by_id(self, item_id: int):
         from app.models.admin import Dept
         return await Dept.get_or_none(id=item_id)
@@ -402,10 +663,20 @@ class DepartmentBatchDeleteService(BaseBatchDeleteService):
             return None  # 强制删除时跳过业务规则检查
         return await BatchDeleteBusinessRules.check_department_deletion_rules(item)
     
+    async def check_business_rules_bulk(self, items: List, force=False, **kwargs) -> Dict[int, str]:
+        if force:
+            return {}
+        return await BatchDeleteBusinessRules.check_department_deletion_rules_bulk(items)
+    
     async def delete_item(self, item):
         # 软删除
         item.del_flag = "2"
         await item.save()
+    
+    async def delete_items(self, items: List, connection, **kwargs):
+        from app.models.admin import Dept
+        # 软删除
+        await Dept.filter(id__in=[item.id for item in items]).using_db(connection).update(del_flag="2")
 
 
 class ApiGroupBatchDeleteService(BaseBatchDeleteService):
@@ -414,6 +685,10 @@ class ApiGroupBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("API分组")
     
+    def get_model(self):
+        from app.models.admin import SysApiGroup
+        return SysApiGroup
+
     async def get_item_by_id(self, item_id: int):
         from app.models.admin import SysApiGroup
         return await SysApiGroup.get_or_none(id=item_id)
@@ -424,6 +699,9 @@ class ApiGroupBatchDeleteService(BaseBatchDeleteService):
     async def check_business_rules(self, item, **kwargs) -> Optional[str]:
         return await BatchDeleteBusinessRules.check_api_group_deletion_rules(item)
     
+    async def check_business_rules_bulk(self, items: List, **kwargs) -> Dict[int, str]:
+        return await BatchDeleteBusinessRules.check_api_group_deletion_rules_bulk(items)
+    
     async def delete_item(self, item):
         await item.delete()
 
@@ -434,6 +712,10 @@ class MenuBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("菜单")
     
+    def get_model(self):
+        from app.models.admin import Menu
+        return Menu
+
     async def get_item_by_id(self, item_id: int):
         from app.models.admin import Menu
         return await Menu.get_or_none(id=item_id)
@@ -451,8 +733,21 @@ class MenuBatchDeleteService(BaseBatchDeleteService):
             return None
         return await BatchDeleteBusinessRules.check_menu_deletion_rules(item)
     
+    async def check_business_rules_bulk(self, items: List, force=False, **kwargs) -> Dict[int, str]:
+        if force:
+            return {}  # 子菜单在 delete_items 的同一事务中删除
+        return await BatchDeleteBusinessRules.check_menu_deletion_rules_bulk(items)
+    
     async def delete_item(self, item):
         await item.delete()
+    
+    async def delete_items(self, items: List, connection, force=False, **kwargs):
+        from app.models.admin import Menu
+        ids = [item.id for item in items]
+        if force:
+            # 强制删除时先删除子菜单
+            await Menu.filter(parent_id__in=ids).using_db(connection).delete()
+        await Menu.filter(id__in=ids).using_db(connection).delete()
 
 
 class DictTypeBatchDeleteService(BaseBatchDeleteService):
@@ -461,6 +756,10 @@ class DictTypeBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("字典类型")
     
+    def get_model(self):
+        from app.models.system import SysDictType as DictType
+        return DictType
+
     async def get_item_by_id(self, item_id: int):
         from app.models.system import SysDictType as DictType
         return await DictType.get_or_none(id=item_id)
@@ -471,6 +770,9 @@ class DictTypeBatchDeleteService(BaseBatchDeleteService):
     async def check_business_rules(self, item, **kwargs) -> Optional[str]:
         return await BatchDeleteBusinessRules.check_dict_type_deletion_rules(item)
     
+    async def check_business_rules_bulk(self, items: List, **kwargs) -> Dict[int, str]:
+        return await BatchDeleteBusinessRules.check_dict_type_deletion_rules_bulk(items)
+    
     async def delete_item(self, item):
         await item.delete()
 
@@ -481,6 +783,10 @@ class DictDataBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("字典数据")
     
+    def get_model(self):
+        from app.models.system import SysDictData as DictData
+        return DictData
+
     async def get_item_by_id(self, item_id: int):
         from app.models.system import SysDictData as DictData
         return await DictData.get_or_none(id=item_id)
@@ -501,6 +807,10 @@ class SystemParamBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("系统参数")
     
+    def get_model(self):
+        from app.models.system import TSysConfig as SystemParam
+        return SystemParam
+
     async def get_item_by_id(self, item_id: int):
         from app.models.system import TSysConfig as SystemParam
         return await SystemParam.get_or_none(id=item_id)
@@ -521,6 +831,10 @@ class ApiBatchDeleteService(BaseBatchDeleteService):
     def __init__(self):
         super().__init__("API")
     
+    def get_model(self):
+        from app.models.admin import SysApiEndpoint
+        return SysApiEndpoint
+
     async def get_item_by_id(self, item_id: int):
         from app.models.admin import SysApiEndpoint
         return await SysApiEndpoint.get_or_none(id=item_id)
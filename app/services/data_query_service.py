@@ -24,6 +24,14 @@ from app.services.transform_engine import transform_engine
 from app.core.tdengine_connector import TDengineConnector
 from app.core.dependency import get_tdengine_connector
 from app.core.exceptions import APIException
+from app.core.tdengine_pagination import (
+    COUNT_ESTIMATE,
+    COUNT_EXACT,
+    TimeCursor,
+    estimate_row_count,
+    normalize_count_mode,
+    split_page,
+)
 from app.settings.config import settings
 import logging
 
@@ -58,11 +66,18 @@ class DataQueryService:
         page: int = 1,
         page_size: int = 100,
         apply_transform: bool = True,
-        log_execution: bool = True
+        log_execution: bool = True,
+        cursor: Optional[str] = None,
+        count_mode: Optional[str] = None,
+        max_points: Optional[int] = None,
+        resolution: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         查询实时数据
         
+        按时间排序时使用时间游标分页：结果中的 next_cursor 作为下一次请求的 cursor，
+        续页以键集条件代替 OFFSET，代价与页深无关；未提供 cursor 时仍兼容 page 分页。
+        
         Args:
             model_code: 模型代码
             device_code: 设备编码（可选）
@@ -75,6 +90,10 @@ class DataQueryService:
             page_size: 每页记录数
             apply_transform: 是否应用数据转换
             log_execution: 是否记录执行日志
+            cursor: 上一页返回的续页游标
+            count_mode: 总数统计方式 exact/estimate/none，续页默认 none
+            max_points: 图表最大点数，提供时返回时间范围内降采样后的数据（忽略分页）
+            resolution: 降采样方式 auto/raw/lttb/minmax/interval
         
         Returns:
             查询结果字典
@@ -114,7 +133,17 @@ class DataQueryService:
                     message=f"模型类型错误，期望 'realtime'，实际 '{data_model.model_type}'"
                 )
             
-            # 2. 构建查询 SQL
+            # 2. 构建查询 SQL（按时间排序时使用游标分页，多取一行判断是否有下一页）
+            keyset = order_by in (None, '', 'ts')
+            time_cursor = TimeCursor.decode(cursor) if cursor else None
+            if time_cursor and not keyset:
+                raise APIException(code=400, message="游标分页仅支持按时间(ts)排序")
+            if time_cursor:
+                order_direction = time_cursor.order
+            elif keyset:
+                order_direction = 'asc' if str(order_direction).lower() == 'asc' else 'desc'
+            count_mode = normalize_count_mode(count_mode, has_cursor=time_cursor is not None)
+
             offset = (page - 1) * page_size
             sql_result = await sql_builder.build_query_sql(
                 model_config=data_model,
@@ -124,8 +153,10 @@ class DataQueryService:
                 end_time=end_time,
                 order_by=order_by,
                 order_direction=order_direction,
-                limit=page_size,
-                offset=offset
+                limit=page_size + 1 if keyset else page_size,
+                offset=offset,
+                keyset=keyset,
+                cursor=time_cursor
             )
             
             query_sql = sql_result['sql']
@@ -139,15 +170,33 @@ class DataQueryService:
             # Fix: Use query_data with explicit database name to ensure correct context
             db_name = settings.TDENGINE_DATABASE
             
-            # 查询总记录数
-            # Fix: Use query_data instead of execute_query and parse response
-            count_res = await self.tdengine_connector.query_data(count_sql, db_name=db_name)
-            count_result = self._parse_tdengine_response(count_res)
-            total_count = count_result[0]['total'] if count_result else 0
+            # 查询总记录数（可精确统计、按块元数据估算或跳过）
+            total_count = None
+            total_estimated = False
+            next_cursor = None
+            downsample_info = None
+            if max_points:
+                raw_data, total_count, downsample_info = await self._query_downsampled(
+                    sql_result, device_code, max_points, resolution, db_name
+                )
+                query_sql = downsample_info.pop('sql')
+            elif count_mode == COUNT_EXACT:
+                # Fix: Use query_data instead of execute_query and parse response
+                count_res = await self.tdengine_connector.query_data(count_sql, db_name=db_name)
+                count_result = self._parse_tdengine_response(count_res)
+                total_count = count_result[0]['total'] if count_result else 0
+            elif count_mode == COUNT_ESTIMATE:
+                total_count = await self._estimate_total(
+                    sql_result, device_code, filters, start_time, end_time, db_name
+                )
+                total_estimated = total_count is not None
             
             # 查询数据
-            raw_res = await self.tdengine_connector.query_data(query_sql, db_name=db_name)
-            raw_data = self._parse_tdengine_response(raw_res)
+            if not max_points:
+                raw_res = await self.tdengine_connector.query_data(query_sql, db_name=db_name)
+                raw_data = self._parse_tdengine_response(raw_res)
+                if keyset:
+                    raw_data, next_cursor = split_page(raw_data, page_size, order_direction, with_tbname=True)
             
             # 4. 应用数据转换
             transformed_data = []
@@ -191,7 +240,9 @@ class DataQueryService:
                     'start_time': start_time.isoformat() if start_time else None,
                     'end_time': end_time.isoformat() if end_time else None,
                     'page': page,
-                    'page_size': page_size
+                    'page_size': page_size,
+                    'cursor': bool(cursor),
+                    'count_mode': count_mode
                 },
                 status='success',
                 result_summary={
@@ -213,9 +264,13 @@ class DataQueryService:
             return {
                 'data': transformed_data,
                 'total': total_count,
+                'total_estimated': total_estimated,
                 'page': page,
                 'page_size': page_size,
-                'total_pages': (total_count + page_size - 1) // page_size,
+                'total_pages': (total_count + page_size - 1) // page_size if total_count is not None else None,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'downsample': downsample_info,
                 'execution_time_ms': exec_time_ms,
                 'generated_sql': query_sql,
                 'model_info': {
@@ -451,6 +506,65 @@ class DataQueryService:
                 message=f"统计查询失败: {str(e)}"
             )
     
+    async def _query_downsampled(
+        self,
+        sql_result: Dict[str, Any],
+        device_code: Optional[str],
+        max_points: int,
+        resolution: Optional[str],
+        db_name: str
+    ):
+        """
+        按 max_points 查询降采样数据
+
+        auto 模式先统计原始点数：不超过 max_points 原样返回，不超过原始数据上限时
+        取回原始数据做 LTTB，否则由 TDengine INTERVAL 聚合每个窗口的 MIN/MAX 包络。
+        未指定设备时按设备分别降采样，返回点数总计不超过 max_points。
+
+        Returns:
+            (行数据, 原始点数, 降采样信息)
+        """
+        from app.services.downsampling_service import downsampling_service
+
+        device_column = sql_result['device_id_column']
+        rows, info = await downsampling_service.query(
+            self.tdengine_connector,
+            f"{sql_result['database']}.{sql_result['stable']}",
+            sql_result['where_clause'][len("WHERE "):],
+            max_points,
+            resolution,
+            select_columns=sql_result['select_columns'],
+            numeric_columns=sql_result['numeric_columns'],
+            group_column=None if device_code else device_column,
+            extra={device_column: device_code} if device_code else None,
+            db_name=db_name,
+        )
+        logger.info(f"[数据查询] 降采样: {info['source_points']} -> {len(rows)} 点，方式 {info['method']}")
+        return rows, info['source_points'], info
+    
+    async def _estimate_total(
+        self,
+        sql_result: Dict[str, Any],
+        device_code: Optional[str],
+        filters: Optional[Dict[str, Any]],
+        start_time: Optional[datetime],
+        end_time: Optional[datetime],
+        db_name: str
+    ) -> Optional[int]:
+        """按块元数据估算总行数；仅按时间筛选时可估算，无法估算时返回None"""
+        if filters:
+            return None
+        table = f"{sql_result['database']}.{sql_result['stable']}"
+        if device_code:
+            # 超级表的块元数据无法按标签区分设备，需定位到设备子表
+            from app.services.tdengine_table_resolver import tdengine_table_resolver
+
+            resolution = await tdengine_table_resolver.resolve(device_code, include_tags=False)
+            if not resolution or resolution.needs_device_filter or resolution.stable != sql_result['stable']:
+                return None
+            table = f"{sql_result['database']}.{resolution.from_clause}"
+        return await estimate_row_count(self.tdengine_connector, table, start_time, end_time, db_name=db_name)
+    
     async def _get_field_mappings(
         self,
         device_type_code: str,
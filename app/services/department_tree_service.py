@@ -0,0 +1,203 @@
+"""
+部门树服务
+
+部门层级（层级深度、直接子部门数、后代部门数）由一次全量查询在内存中计算，
+物化结果缓存在Redis中，部门增删改时按标签失效；用户数通过一次分组COUNT查询获取，
+不随层级缓存，因此用户调整部门无需失效缓存。
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from tortoise.functions import Count
+
+from app.core.redis_cache import redis_cache_manager
+from app.models.admin import Dept, User
+
+logger = logging.getLogger(__name__)
+
+# 与原 get_dept_level 保持一致的最大层级
+MAX_DEPT_LEVEL = 10
+
+
+def build_tree(depts: List[dict], parent_id: Optional[int] = 0) -> List[dict]:
+    """按 parent_id 索引一次遍历构建部门树（O(n)），保持输入顺序"""
+    children_map: Dict[Any, List[dict]] = defaultdict(list)
+    for dept in depts:
+        children_map[dept.get("parent_id")].append(dept)
+
+    for dept in depts:
+        children = children_map.get(dept["id"])
+        if children:
+            dept["children"] = children
+
+    return children_map.get(parent_id, [])
+
+
+def compute_hierarchy(rows: Iterable[dict]) -> Dict[int, Dict[str, int]]:
+    """根据 (id, parent_id, del_flag) 计算每个部门的层级、直接子部门数和后代部门数
+
+    子部门与后代只统计未删除（del_flag="0"）的部门，与原逐条查询的语义一致。
+    """
+    rows = list(rows)
+    by_id = {row["id"]: row for row in rows}
+    active_children: Dict[int, List[int]] = defaultdict(list)
+    for row in rows:
+        if row.get("del_flag") == "0" and row.get("parent_id") is not None:
+            active_children[row["parent_id"]].append(row["id"])
+
+    # 后代数量：迭代后序遍历，visiting 集合防止脏数据中的环导致死循环
+    descendants: Dict[int, int] = {}
+    for root_id in by_id:
+        if root_id in descendants:
+            continue
+        stack = [(root_id, False)]
+        visiting = set()
+        while stack:
+            node_id, expanded = stack.pop()
+            if expanded:
+                visiting.discard(node_id)
+                descendants[node_id] = sum(
+                    1 + descendants.get(child_id, 0) for child_id in active_children.get(node_id, [])
+                )
+                continue
+            if node_id in descendants or node_id in visiting:
+                continue
+            visiting.add(node_id)
+            stack.append((node_id, True))
+            for child_id in active_children.get(node_id, []):
+                if child_id not in descendants and child_id not in visiting:
+                    stack.append((child_id, False))
+
+    hierarchy = {}
+    for dept_id in by_id:
+        # 层级：沿父链向上计数，直到根（parent_id=0）或父部门不存在
+        level = 0
+        current_id = dept_id
+        while current_id:
+            dept = by_id.get(current_id)
+            if not dept or dept.get("parent_id") == 0:
+                break
+            current_id = dept.get("parent_id")
+            level += 1
+            if level > MAX_DEPT_LEVEL:
+                break
+
+        hierarchy[dept_id] = {
+            "level": level,
+            "children_count": len(active_children.get(dept_id, [])),
+            "total_descendants": descendants.get(dept_id, 0),
+        }
+    return hierarchy
+
+
+class DepartmentTreeService:
+    """部门树服务"""
+
+    cache_key = "dept_tree:snapshot"
+    cache_tag = "dept_tree"
+
+    def __init__(self, cache_ttl: int = 600):
+        self.cache_ttl = cache_ttl
+
+    async def _load_snapshot(self) -> Dict[str, Any]:
+        """从数据库加载全部部门并计算层级信息（一次查询）"""
+        depts = await Dept.all().order_by("parent_id", "order_num")
+        dept_dicts = [await dept.to_dict() for dept in depts]
+        hierarchy = compute_hierarchy(dept_dicts)
+        return {
+            "depts": dept_dicts,
+            "hierarchy": [
+                [dept_id, info["level"], info["children_count"], info["total_descendants"]]
+                for dept_id, info in hierarchy.items()
+            ],
+        }
+
+    async def get_snapshot(self) -> Dict[str, Any]:
+        """获取物化的部门层级快照（Redis缓存，未命中时重建）"""
+        snapshot = await redis_cache_manager.get(self.cache_key)
+        if not isinstance(snapshot, dict) or "depts" not in snapshot:
+            snapshot = await self._load_snapshot()
+            await redis_cache_manager.set(self.cache_key, snapshot, ttl=self.cache_ttl, tags=[self.cache_tag])
+        return snapshot
+
+    async def get_hierarchy(self) -> Dict[int, Dict[str, int]]:
+        """获取 {部门ID: {level, children_count, total_descendants}}"""
+        snapshot = await self.get_snapshot()
+        return {
+            row[0]: {"level": row[1], "children_count": row[2], "total_descendants": row[3]}
+            for row in snapshot["hierarchy"]
+        }
+
+    @staticmethod
+    async def get_user_counts(dept_ids: Optional[List[int]] = None) -> Dict[int, int]:
+        """一次分组COUNT获取各部门用户数"""
+        query = User.filter(dept_id__in=dept_ids) if dept_ids is not None else User.filter(dept_id__not_isnull=True)
+        rows = await query.annotate(count=Count("id")).group_by("dept_id").values("dept_id", "count")
+        return {row["dept_id"]: row["count"] for row in rows}
+
+    async def get_stats_map(self, dept_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """批量获取部门统计信息和层级，替代逐部门的COUNT查询"""
+        if not dept_ids:
+            return {}
+        hierarchy = await self.get_hierarchy()
+        if any(dept_id not in hierarchy for dept_id in dept_ids):
+            # 快照早于部门的新增写入（如并发创建），重建一次
+            await self.invalidate()
+            hierarchy = await self.get_hierarchy()
+        user_counts = await self.get_user_counts(dept_ids)
+        empty = {"level": 0, "children_count": 0, "total_descendants": 0}
+        return {
+            dept_id: {**hierarchy.get(dept_id, empty), "users_count": user_counts.get(dept_id, 0)}
+            for dept_id in dept_ids
+        }
+
+    @staticmethod
+    def apply_stats(dept_dict: dict, stats: Dict[str, int]) -> dict:
+        """按v2响应格式写入 stats 与 level 字段"""
+        dept_dict["stats"] = {
+            "children_count": stats["children_count"],
+            "users_count": stats["users_count"],
+            "total_descendants": stats["total_descendants"],
+        }
+        dept_dict["level"] = stats["level"]
+        return dept_dict
+
+    async def get_dept_dicts(
+        self,
+        include_deleted: bool = False,
+        include_stats: bool = True,
+        name: Optional[str] = None,
+        parent_id: Optional[int] = None,
+    ) -> List[dict]:
+        """从快照中筛选部门，按需附加统计信息"""
+        snapshot = await self.get_snapshot()
+        depts = snapshot["depts"]
+        if not include_deleted:
+            depts = [dept for dept in depts if dept.get("del_flag") == "0"]
+        if name:
+            keyword = name.lower()
+            depts = [dept for dept in depts if keyword in (dept.get("dept_name") or "").lower()]
+        if parent_id is not None:
+            depts = [dept for dept in depts if dept.get("parent_id") == parent_id]
+
+        if include_stats:
+            hierarchy = {row[0]: row for row in snapshot["hierarchy"]}
+            user_counts = await self.get_user_counts()
+            for dept in depts:
+                row = hierarchy.get(dept["id"], [dept["id"], 0, 0, 0])
+                self.apply_stats(dept, {
+                    "level": row[1],
+                    "children_count": row[2],
+                    "total_descendants": row[3],
+                    "users_count": user_counts.get(dept["id"], 0),
+                })
+        return depts
+
+    async def invalidate(self) -> None:
+        """部门新增、删除、调整层级后失效物化快照"""
+        await redis_cache_manager.invalidate_tags([self.cache_tag])
+        logger.debug("部门树缓存已失效")
+
+
+department_tree_service = DepartmentTreeService()
@@ -9,7 +9,7 @@ import asyncio
 import aiohttp
 import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from dataclasses import dataclass
 from concurrent.futures import ThreadPoolExecutor
 
@@ -35,6 +35,15 @@ class DeviceCollectionResult:
             self.timestamp = datetime.now()
 
 
+@dataclass
+class ActiveDevice:
+    """采集所需的设备字段快照（可安全缓存，不携带ORM对象）"""
+    id: int
+    device_code: str
+    device_name: Optional[str]
+    online_address: str
+
+
 class OptimizedDeviceCollector:
     """优化的设备数据采集器"""
     
@@ -133,7 +142,7 @@ class OptimizedDeviceCollector:
             logger.error(f"设备数据采集失败: {str(e)}")
             raise
     
-    async def _get_active_devices(self) -> List[DeviceInfo]:
+    async def _get_active_devices(self) -> List[ActiveDevice]:
         """获取活跃设备列表"""
         # 尝试从缓存获取
         cache_key = "active_devices_list"
@@ -141,25 +150,25 @@ class OptimizedDeviceCollector:
         
         if cached_devices:
             logger.debug("从缓存获取活跃设备列表")
-            return cached_devices
+            return [ActiveDevice(**row) for row in cached_devices]
         
-        # 从数据库查询
-        devices = await DeviceInfo.filter(
-            is_locked=False
-        ).prefetch_related('realtime_data').all()
+        # 从数据库查询（只取采集需要的列）
+        rows = await DeviceInfo.filter(is_locked=False).values(
+            'id', 'device_code', 'device_name', 'online_address'
+        )
         
         # 过滤有在线地址的设备
-        active_devices = [
-            device for device in devices 
-            if device.online_address and device.online_address.strip()
+        active_rows = [
+            row for row in rows
+            if row['online_address'] and row['online_address'].strip()
         ]
         
-        # 缓存结果
-        await redis_cache_manager.set(cache_key, active_devices, ttl=self.device_cache_ttl)
+        # 缓存纯数据行，而不是ORM对象
+        await redis_cache_manager.set(cache_key, active_rows, ttl=self.device_cache_ttl)
         
-        return active_devices
+        return [ActiveDevice(**row) for row in active_rows]
     
-    async def _collect_devices_batch(self, devices: List[DeviceInfo]) -> List[DeviceCollectionResult]:
+    async def _collect_devices_batch(self, devices: List[Union[DeviceInfo, ActiveDevice]]) -> List[DeviceCollectionResult]:
         """批量采集设备数据"""
         results = []
         
@@ -200,14 +209,14 @@ class OptimizedDeviceCollector:
     
     async def _collect_single_device_with_semaphore(
         self, 
-        device: DeviceInfo, 
+        device: Union[DeviceInfo, ActiveDevice], 
         semaphore: asyncio.Semaphore
     ) -> DeviceCollectionResult:
         """使用信号量控制的单设备数据采集"""
         async with semaphore:
             return await self._collect_single_device(device)
     
-    async def _collect_single_device(self, device: DeviceInfo) -> DeviceCollectionResult:
+    async def _collect_single_device(self, device: Union[DeviceInfo, ActiveDevice]) -> DeviceCollectionResult:
         """采集单个设备数据"""
         start_time = time.time()
         
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图表降采样服务
+
+为历史曲线类接口提供服务端降采样：
+1. raw      - 点数不超过 max_points 时原样返回
+2. lttb     - 取回原始数据后按 LTTB（Largest-Triangle-Three-Buckets）选点，保留视觉形态
+3. minmax   - 取回原始数据后每个桶保留最小值与最大值所在的行，保证峰谷不丢失
+4. interval - 数据量过大时由 TDengine INTERVAL 窗口聚合 MIN/MAX，仅返回每个窗口的包络
+
+返回行数总计不超过 max_points：多字段数据对每个数值字段分别选点后取并集，并按比例收缩每字段点数使并集不超限；
+未指定设备时按设备分别降采样（点数按各设备原始点数分配），不会把多台设备的数据混在一起选点。
+原始点数超过 raw_fetch_limit 时显式指定的 lttb/minmax 同样改用窗口聚合，保证覆盖整个时间范围。
+"""
+
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.log import logger
+
+
+RESOLUTION_AUTO = "auto"
+RESOLUTION_RAW = "raw"
+RESOLUTION_LTTB = "lttb"
+RESOLUTION_MINMAX = "minmax"
+RESOLUTION_INTERVAL = "interval"
+RESOLUTIONS = (RESOLUTION_AUTO, RESOLUTION_RAW, RESOLUTION_LTTB, RESOLUTION_MINMAX, RESOLUTION_INTERVAL)
+
+# TDengine 数值列类型
+_NUMERIC_TYPES = {
+    "TINYINT", "SMALLINT", "INT", "INTEGER", "BIGINT", "FLOAT", "DOUBLE",
+    "TINYINT UNSIGNED", "SMALLINT UNSIGNED", "INT UNSIGNED", "BIGINT UNSIGNED",
+}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets 选点，返回保留点的下标
+
+    桶之间存在顺序依赖（依赖上一个桶选中的点），因此按桶循环，
+    每个桶内的三角形面积计算完全向量化，总复杂度 O(n)。NaN 点不会被选中（除非整桶为空值）。
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = end, max(edges[i + 2] if i + 2 < len(edges) else n, end + 1)
+        next_end = min(next_end, n)
+
+        # 下一个桶的平均点作为三角形第三个顶点
+        avg_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end]
+        avg_y = np.nanmean(next_y) if np.any(~np.isnan(next_y)) else y[a]
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs((x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a]))
+        if np.all(np.isnan(areas)):
+            a = start
+        else:
+            a = start + int(np.nanargmax(areas))
+        selected[i + 1] = a
+
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """每个桶保留最小值和最大值所在行的下标（完全向量化），保证峰谷不丢失"""
+    n = len(y)
+    if n_buckets * 2 >= n or n_buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    width = int(np.max(np.diff(edges)))
+    idx = edges[:-1, None] + np.arange(width)[None, :]
+    valid = idx < edges[1:, None]
+    idx = np.minimum(idx, n - 1)
+
+    values = y[idx]
+    nan_mask = ~valid | np.isnan(values)
+    lows = np.where(nan_mask, np.inf, values)
+    highs = np.where(nan_mask, -np.inf, values)
+    rows = np.arange(n_buckets)
+    picked = np.concatenate([idx[rows, lows.argmin(axis=1)], idx[rows, highs.argmax(axis=1)]])
+    return np.unique(np.concatenate([picked, [0, n - 1]]))
+
+
+def timestamps_to_numeric(values: Sequence[Any]) -> np.ndarray:
+    """将时间戳转换为毫秒数值作为x轴，无法解析时退化为行号（等间隔采样）"""
+    try:
+        parsed = []
+        for value in values:
+            if isinstance(value, (int, float)):
+                parsed.append(float(value))
+            elif isinstance(value, datetime):
+                parsed.append(value.timestamp() * 1000)
+            else:
+                parsed.append(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+        return np.asarray(parsed, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.arange(len(values), dtype=np.float64)
+
+
+def numeric_series(rows: List[Dict[str, Any]], exclude: Sequence[str] = ()) -> Dict[str, np.ndarray]:
+    """提取行数据中的数值列（None 视为 NaN，布尔值与字符串列忽略）"""
+    if not rows:
+        return {}
+    excluded = set(exclude)
+    series = {}
+    for key in rows[0].keys():
+        if key in excluded:
+            continue
+        column = [row.get(key) for row in rows]
+        sample = next((value for value in column if value is not None), None)
+        if sample is None or isinstance(sample, bool) or not isinstance(sample, (int, float)):
+            continue
+        try:
+            series[key] = np.asarray([np.nan if value is None else value for value in column], dtype=np.float64)
+        except (TypeError, ValueError):
+            continue
+    return series
+
+
+def uniform_indices(n: int, n_out: int) -> np.ndarray:
+    """按行号均匀抽取 n_out 个下标（包含首尾）"""
+    if n_out >= n:
+        return np.arange(n)
+    if n_out <= 1:
+        return np.zeros(max(n_out, 0), dtype=np.int64)
+    return np.unique(np.linspace(0, n - 1, n_out).astype(np.int64))
+
+
+def select_indices(
+    x: np.ndarray,
+    series: Dict[str, np.ndarray],
+    budget: int,
+    method: str = RESOLUTION_LTTB,
+    max_rounds: int = 3,
+) -> np.ndarray:
+    """多字段选点，返回保留行下标，总数不超过 budget
+
+    每个字段按相同点数选点后取并集；并集超过 budget 时按比例收缩每字段点数重选（最多 max_rounds 轮），
+    仍超出时在并集中均匀抽取。
+    """
+    n = len(x)
+    if n <= budget:
+        return np.arange(n)
+    if not series or budget < 3:
+        return uniform_indices(n, budget)
+
+    def pick(per_field: int) -> np.ndarray:
+        keep_mask = np.zeros(n, dtype=bool)
+        for y in series.values():
+            if method == RESOLUTION_MINMAX:
+                keep_mask[minmax_indices(y, max(1, per_field // 2))] = True
+            else:
+                keep_mask[lttb_indices(x, y, max(3, per_field))] = True
+        return np.flatnonzero(keep_mask)
+
+    per_field = budget
+    selected = pick(per_field)
+    for _ in range(max_rounds - 1):
+        if len(selected) <= budget or per_field <= 3:
+            break
+        # 并集大小近似与每字段点数成正比
+        per_field = max(3, int(per_field * budget / len(selected) * 0.98))
+        selected = pick(per_field)
+    if len(selected) > budget:
+        selected = selected[uniform_indices(len(selected), budget)]
+    return selected
+
+
+def allocate_budget(sizes: Sequence[int], total: int) -> List[int]:
+    """按各组原始点数分配总点数（最大余数法），每组至少 1 点"""
+    count = sum(sizes)
+    if count <= total:
+        return list(sizes)
+    shares = [size * total / count for size in sizes]
+    budgets = [max(1, int(share)) for share in shares]
+    remaining = total - sum(budgets)
+    for i in sorted(range(len(sizes)), key=lambda i: shares[i] - int(shares[i]), reverse=True):
+        if remaining <= 0:
+            break
+        if budgets[i] < sizes[i]:
+            budgets[i] += 1
+            remaining -= 1
+    return [min(budget, size) for budget, size in zip(budgets, sizes)]
+
+
+def downsample_rows(
+    rows: List[Dict[str, Any]],
+    max_points: int,
+    method: str = RESOLUTION_LTTB,
+    ts_key: str = "ts",
+    group_key: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """对按时间排序的行数据降采样，返回行数不超过 max_points
+
+    提供 group_key 时按该列（设备标识）分组，各组按原始点数分配点数后分别选点，结果保持原有行序。
+    """
+    if len(rows) <= max_points or method == RESOLUTION_RAW:
+        return rows
+
+    if group_key:
+        groups: Dict[Any, List[int]] = {}
+        for i, row in enumerate(rows):
+            groups.setdefault(row.get(group_key), []).append(i)
+    else:
+        groups = {None: list(range(len(rows)))}
+
+    budgets = allocate_budget([len(indices) for indices in groups.values()], max_points)
+    keep: List[int] = []
+    for indices, budget in zip(groups.values(), budgets):
+        group_rows = [rows[i] for i in indices] if group_key else rows
+        series = numeric_series(group_rows, exclude=(ts_key, group_key) if group_key else (ts_key,))
+        x = timestamps_to_numeric([row.get(ts_key) for row in group_rows])
+        keep.extend(indices[i] for i in select_indices(x, series, budget, method))
+    keep.sort()
+    return [rows[i] for i in keep]
+
+
+def interval_window_ms(start_ms: float, end_ms: float, max_points: int) -> int:
+    """计算 INTERVAL 窗口长度：每个窗口输出最小、最大两个点
+
+    窗口按时间对齐，时间范围可能多跨一个窗口，因此预留一个窗口。
+    """
+    n_windows = max(1, max_points // 2 - 1)
+    return max(1, int(math.ceil((end_ms - start_ms) / n_windows)))
+
+
+def build_minmax_interval_sql(
+    table: str,
+    where_clause: str,
+    columns: Sequence[str],
+    window_ms: int,
+    partition_by: Optional[str] = None,
+) -> str:
+    """构建按窗口聚合 MIN/MAX 的 TDengine SQL，列别名按序号生成避免与原列冲突
+
+    提供 partition_by 时按该列（设备标识）分别开窗，结果带上该列。
+    """
+    aggregates = []
+    for i, column in enumerate(columns):
+        aggregates.append(f"MIN(`{column}`) AS mn_{i}")
+        aggregates.append(f"MAX(`{column}`) AS mx_{i}")
+    return _interval_sql(table, where_clause, aggregates, window_ms, partition_by)
+
+
+def build_first_interval_sql(
+    table: str,
+    where_clause: str,
+    columns: Sequence[str],
+    window_ms: int,
+    partition_by: Optional[str] = None,
+) -> str:
+    """构建每个窗口取首行值的 TDengine SQL，用于没有数值列时按时间均匀抽样"""
+    aggregates = [f"FIRST(`{column}`) AS fs_{i}" for i, column in enumerate(columns)]
+    return _interval_sql(table, where_clause, aggregates, window_ms, partition_by)
+
+
+def _interval_sql(
+    table: str,
+    where_clause: str,
+    aggregates: List[str],
+    window_ms: int,
+    partition_by: Optional[str],
+) -> str:
+    selects = ["_wstart AS ts"] + ([partition_by] if partition_by else []) + aggregates
+    where = f" WHERE {where_clause}" if where_clause else ""
+    partition = f" PARTITION BY {partition_by}" if partition_by else ""
+    return f"SELECT {', '.join(selects)} FROM {table}{where}{partition} INTERVAL({window_ms}a)"
+
+
+def expand_minmax_rows(
+    rows: List[Dict[str, Any]],
+    columns: Sequence[str],
+    extra: Optional[Dict[str, Any]] = None,
+    partition_by: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """将窗口聚合结果展开为每窗口两行（最小值行、最大值行），保持原字段名便于前端直接绘制"""
+    expanded = []
+    for row in rows:
+        low = {"ts": row.get("ts"), **(extra or {})}
+        if partition_by:
+            low[partition_by] = row.get(partition_by)
+        high = dict(low)
+        for i, column in enumerate(columns):
+            low[column] = row.get(f"mn_{i}")
+            high[column] = row.get(f"mx_{i}")
+        expanded.append(low)
+        if high != low:
+            expanded.append(high)
+    return expanded
+
+
+def expand_first_rows(
+    rows: List[Dict[str, Any]],
+    columns: Sequence[str],
+    extra: Optional[Dict[str, Any]] = None,
+    partition_by: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """将窗口首行聚合结果还原为原字段名"""
+    expanded = []
+    for row in rows:
+        item = {"ts": row.get("ts"), **(extra or {})}
+        if partition_by:
+            item[partition_by] = row.get(partition_by)
+        for i, column in enumerate(columns):
+            item[column] = row.get(f"fs_{i}")
+        expanded.append(item)
+    return expanded
+
+
+def to_epoch_ms(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp() * 1000
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000
+    except ValueError:
+        return None
+
+
+class DownsamplingService:
+    """图表降采样服务"""
+
+    def __init__(self, raw_fetch_limit: int = 200_000, column_cache_ttl: float = 300.0):
+        # 原始数据超过该行数时改用 TDengine INTERVAL 聚合，避免把海量原始点拉到应用层
+        self.raw_fetch_limit = raw_fetch_limit
+        self.column_cache_ttl = column_cache_ttl
+        self._column_cache: Dict[str, Tuple[float, List[Tuple[str, str]]]] = {}
+
+    @staticmethod
+    def normalize_resolution(resolution: Optional[str]) -> str:
+        resolution = (resolution or RESOLUTION_AUTO).lower()
+        if resolution not in RESOLUTIONS:
+            from app.core.exceptions import APIException
+
+            raise APIException(message=f"不支持的降采样方式: {resolution}，可选 {', '.join(RESOLUTIONS)}", code=400)
+        return resolution
+
+    def choose_method(self, resolution: str, max_points: int, raw_count: Optional[int]) -> str:
+        """根据原始点数选择降采样方式"""
+        if resolution != RESOLUTION_AUTO:
+            return resolution
+        if raw_count is not None and raw_count <= max_points:
+            return RESOLUTION_RAW
+        if raw_count is not None and raw_count <= self.raw_fetch_limit:
+            return RESOLUTION_LTTB
+        return RESOLUTION_INTERVAL
+
+    async def describe_columns(self, connector, table: str, db_name: Optional[str] = None) -> List[Tuple[str, str]]:
+        """DESCRIBE 表结构获取普通列 (列名, 类型)（不含 ts 与标签），按表缓存"""
+        cached = self._column_cache.get(table)
+        if cached and time.monotonic() - cached[0] < self.column_cache_ttl:
+            return cached[1]
+
+        result = await connector.query_data(f"DESCRIBE {table}", db_name=db_name)
+        columns = []
+        for row in (result or {}).get("data") or []:
+            name, col_type = row[0], str(row[1]).upper()
+            note = str(row[3]).upper() if len(row) > 3 and row[3] else ""
+            if name == "ts" or note == "TAG":
+                continue
+            columns.append((name, col_type))
+        self._column_cache[table] = (time.monotonic(), columns)
+        return columns
+
+    async def numeric_columns(self, connector, table: str, db_name: Optional[str] = None) -> List[str]:
+        """数值列（不含标签）"""
+        columns = await self.describe_columns(connector, table, db_name=db_name)
+        return [name for name, col_type in columns if col_type in _NUMERIC_TYPES]
+
+    async def query_interval_envelope(
+        self,
+        connector,
+        table: str,
+        where_clause: str,
+        columns: Sequence[str],
+        start_ms: float,
+        end_ms: float,
+        max_points: int,
+        extra: Optional[Dict[str, Any]] = None,
+        db_name: Optional[str] = None,
+        partition_by: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """执行 INTERVAL MIN/MAX 聚合并展开为包络点，返回 (行数据, 窗口毫秒数)
+
+        max_points 为每个分组（设备）的点数。
+        """
+        window_ms = interval_window_ms(start_ms, end_ms, max_points)
+        sql = build_minmax_interval_sql(table, where_clause, columns, window_ms, partition_by)
+        logger.info(f"降采样窗口聚合: {sql}")
+        rows = result_rows(await connector.query_data(sql, db_name=db_name))
+        return expand_minmax_rows(rows, columns, extra, partition_by), window_ms
+
+    async def query(
+        self,
+        connector,
+        table: str,
+        where_clause: str,
+        max_points: int,
+        resolution: Optional[str] = None,
+        select_columns: Optional[Sequence[str]] = None,
+        numeric_columns: Optional[Sequence[str]] = None,
+        group_column: Optional[str] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        db_name: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """查询时间范围内降采样后的全部数据，返回 (行数据, 降采样信息)
+
+        先用一次 COUNT/FIRST/LAST（提供 group_column 时按设备 PARTITION BY）统计原始点数选择方式：
+        不超过 max_points 原样返回；不超过 raw_fetch_limit 时取回原始数据在应用层选点；
+        否则（包括显式指定 raw/lttb/minmax 的情况）由 TDengine INTERVAL 聚合，保证覆盖整个时间范围。
+
+        Args:
+            where_clause: 不含 WHERE 关键字的条件
+            select_columns: 取回原始数据时的列，默认 *
+            numeric_columns: 可聚合的数值列，默认 DESCRIBE 表结构获取
+            group_column: 未指定设备时的设备标识列，按设备分别降采样
+            extra: 聚合结果中补充的固定字段（如 device_code）
+        """
+        requested = self.normalize_resolution(resolution)
+        where = f" WHERE {where_clause}" if where_clause else ""
+        group_select = f", {group_column}" if group_column else ""
+        partition = f" PARTITION BY {group_column}" if group_column else ""
+        span_sql = (
+            f"SELECT COUNT(*) AS total, FIRST(ts) AS first_ts, LAST(ts) AS last_ts{group_select} "
+            f"FROM {table}{where}{partition}"
+        )
+        spans = [row for row in result_rows(await connector.query_data(span_sql, db_name=db_name)) if row.get("total")]
+        raw_count = sum(row["total"] for row in spans)
+        n_groups = max(1, len(spans))
+
+        method = self.choose_method(requested, max_points, raw_count)
+        if raw_count > self.raw_fetch_limit and method != RESOLUTION_INTERVAL:
+            # 超出原始数据上限时只取部分原始数据会丢失时间范围末尾，改用窗口聚合
+            method = RESOLUTION_INTERVAL
+        if raw_count > max_points and method != RESOLUTION_RAW and n_groups * 2 > max_points:
+            from app.core.exceptions import APIException
+
+            raise APIException(
+                message=f"共有 {n_groups} 台设备的数据，max_points 至少需要 {n_groups * 2}，或指定设备后查询",
+                code=400,
+            )
+
+        info: Dict[str, Any] = {
+            "method": method,
+            "source_points": raw_count,
+            "window_ms": None,
+            "sql": span_sql,
+        }
+        if method != requested and requested != RESOLUTION_AUTO:
+            info["requested_method"] = requested
+
+        if raw_count == 0:
+            rows: List[Dict[str, Any]] = []
+        elif method == RESOLUTION_INTERVAL:
+            start_ms = min((to_epoch_ms(row.get("first_ts")) or 0) for row in spans)
+            end_ms = max((to_epoch_ms(row.get("last_ts")) or start_ms) for row in spans)
+            per_group = max_points // n_groups
+            if numeric_columns is None:
+                numeric_columns = await self.numeric_columns(connector, table, db_name=db_name)
+            if numeric_columns:
+                window_ms = interval_window_ms(start_ms, end_ms, per_group)
+                info["sql"] = build_minmax_interval_sql(table, where_clause, numeric_columns, window_ms, group_column)
+                rows = expand_minmax_rows(
+                    result_rows(await connector.query_data(info["sql"], db_name=db_name)),
+                    numeric_columns, extra, group_column,
+                )
+            else:
+                # 没有数值列可聚合时每个窗口取首行，按时间均匀抽样
+                if select_columns:
+                    columns = [col for col in select_columns if col not in ("ts", "tbname", group_column)]
+                else:
+                    columns = [name for name, _ in await self.describe_columns(connector, table, db_name=db_name)]
+                window_ms = max(1, int(math.ceil((end_ms - start_ms) / max(1, per_group - 1))))
+                info["sql"] = build_first_interval_sql(table, where_clause, columns, window_ms, group_column)
+                rows = expand_first_rows(
+                    result_rows(await connector.query_data(info["sql"], db_name=db_name)),
+                    columns, extra, group_column,
+                )
+            info["window_ms"] = window_ms
+            if group_column:
+                rows.sort(key=lambda row: to_epoch_ms(row.get("ts")) or 0)
+            if len(rows) > max_points:
+                rows = downsample_rows(rows, max_points, RESOLUTION_MINMAX, group_key=group_column)
+        else:
+            columns_sql = ", ".join(col for col in select_columns if col != "tbname") if select_columns else "*"
+            info["sql"] = (
+                f"SELECT {columns_sql} FROM {table}{where} ORDER BY ts ASC LIMIT {self.raw_fetch_limit}"
+            )
+            rows = result_rows(await connector.query_data(info["sql"], db_name=db_name))
+            rows = downsample_rows(rows, max_points, method, group_key=group_column)
+
+        info["returned_points"] = len(rows)
+        if group_column:
+            info["devices"] = len(spans)
+        logger.info(f"降采样: {raw_count} -> {len(rows)} 点，方式 {method}")
+        return rows, info
+
+
+def result_rows(result: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """TDengine REST 响应转为行字典"""
+    column_names = [col[0] for col in (result or {}).get("column_meta") or []]
+    return [dict(zip(column_names, record)) for record in (result or {}).get("data") or []]
+
+
+downsampling_service = DownsamplingService()
@@ -14,6 +14,7 @@ from app.models.admin import Menu, User, Role
 from app.schemas.menus import MenuType
 from app.core.unified_logger import get_logger
 from app.core.permission_cache import permission_cache_manager
+from app.services.menu_tree_service import MENU_FIELDS, filter_menu_rows, menu_tree_service, normalize_menu_row
 
 logger = get_logger(__name__)
 
@@ -25,51 +26,21 @@ class MenuPermissionService:
         self.cache_ttl = 300  # 缓存5分钟
     
     async def get_user_menus(self, user_id: int, include_hidden: bool = False) -> List[Dict[str, Any]]:
-        """获取用户可访问的菜单列表"""
+        """获取用户可访问的菜单列表（各角色菜单缓存的并集）"""
         try:
             logger.debug(f"获取用户菜单: user_id={user_id}, include_hidden={include_hidden}")
             
-            user = await User.get_or_none(id=user_id).prefetch_related('roles')
+            user = await User.get_or_none(id=user_id)
             if not user:
                 logger.warning(f"用户不存在: user_id={user_id}")
                 return []
             
-            # 检查缓存
-            cache_key = f"user_menus:{user_id}:{include_hidden}"
-            cached_menus = await permission_cache_manager.get_cached_data(cache_key)
-            if cached_menus:
-                logger.debug(f"从缓存获取用户菜单: user_id={user_id}")
-                return cached_menus
-            
-            menus = []
-            
-            if user.is_superuser:
-                # 超级用户获取所有菜单
-                query = Menu.filter(del_flag='0', status=True)
-                if not include_hidden:
-                    query = query.filter(visible=True)
-                menus = await query.order_by('order_num', 'id')
-            else:
-                # 普通用户通过角色获取菜单
-                roles = await user.roles.filter(del_flag='0', status='0')
-                menu_set = set()
-                
-                for role in roles:
-                    role_menus = await role.menus.filter(del_flag='0', status=True)
-                    if not include_hidden:
-                        role_menus = role_menus.filter(visible=True)
-                    menu_set.update(role_menus)
-                
-                menus = sorted(list(menu_set), key=lambda x: (x.order_num, x.id))
-            
-            # 转换为字典格式
-            menu_list = []
-            for menu in menus:
-                menu_dict = await self._menu_to_dict(menu)
-                menu_list.append(menu_dict)
-            
-            # 缓存结果
-            await permission_cache_manager.cache_data(cache_key, menu_list, self.cache_ttl)
+            # 超级用户获取所有菜单，普通用户取有效角色菜单的并集（按角色缓存）
+            rows = await menu_tree_service.get_user_menu_rows(user, role_filter={'del_flag': '0', 'status': '0'})
+            menu_list = [
+                self._serialize_menu_row(row)
+                for row in filter_menu_rows(rows, active_only=True, visible_only=not include_hidden)
+            ]
             
             logger.info(f"获取用户菜单成功: user_id={user_id}, menu_count={len(menu_list)}")
             return menu_list
@@ -116,7 +87,7 @@ class MenuPermissionService:
                            parent_id: Optional[int] = None) -> List[Dict[str, Any]]:
         """获取所有菜单列表"""
         try:
-            query = Menu.filter(del_flag='0')
+            query = Menu.all()
             
             # 菜单类型过滤
             if menu_type:
@@ -134,14 +105,9 @@ class MenuPermissionService:
             if parent_id is not None:
                 query = query.filter(parent_id=parent_id)
             
-            menus = await query.order_by('order_num', 'id')
-            
-            menu_list = []
-            for menu in menus:
-                menu_dict = await self._menu_to_dict(menu)
-                menu_list.append(menu_dict)
-            
-            return menu_list
+            # 一次查询批量取出字段，不再逐个对象序列化
+            rows = await query.order_by('order_num', 'id').values(*MENU_FIELDS)
+            return [self._serialize_menu_row(row) for row in rows]
         
         except Exception as e:
             logger.error(f"获取菜单列表失败: error={e}")
@@ -409,14 +375,8 @@ class MenuPermissionService:
     async def refresh_user_menu_cache(self, user_id: int) -> bool:
         """刷新用户菜单缓存"""
         try:
-            # 清理用户菜单缓存
-            cache_keys = [
-                f"user_menus:{user_id}:True",
-                f"user_menus:{user_id}:False"
-            ]
-            
-            for cache_key in cache_keys:
-                await permission_cache_manager.delete_cached_data(cache_key)
+            # 清理用户菜单缓存（角色菜单缓存由角色变更事件失效）
+            await permission_cache_manager.clear_user_cache(user_id)
             
             logger.info(f"刷新用户菜单缓存成功: user_id={user_id}")
             return True
@@ -446,6 +406,11 @@ class MenuPermissionService:
             'updated_at': menu.updated_at.isoformat() if menu.updated_at else None
         }
     
+    @staticmethod
+    def _serialize_menu_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """将 values() 查询行转换为与 _menu_to_dict 相同的字典结构"""
+        return normalize_menu_row({field: row.get(field) for field in MENU_FIELDS})
+    
     def _build_menu_tree(self, menus: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """构建菜单树结构"""
         try:
@@ -484,8 +449,8 @@ class MenuPermissionService:
     async def _clear_menu_cache(self) -> None:
         """清理菜单相关缓存"""
         try:
-            # 清理所有用户菜单缓存
-            await permission_cache_manager.clear_pattern("user_menus:*")
+            # 清理所有用户菜单缓存（按menu标签失效）
+            await permission_cache_manager.clear_menu_cache()
             logger.debug("清理菜单缓存成功")
         
         except Exception as e:
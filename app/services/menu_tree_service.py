@@ -0,0 +1,204 @@
+"""
+菜单树服务
+
+菜单以 values() 一次查询批量序列化为行字典，按角色缓存在Redis中（超级用户使用全量菜单快照），
+用户菜单为其各角色菜单的并集，再以父ID索引一次遍历构建树（O(n)）。
+角色菜单缓存登记 role:ID 与 menu 标签，角色授权变更、菜单增删改时经权限事件按标签失效。
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from tortoise.functions import Count
+
+from app.core.permission_cache import permission_cache_manager
+from app.core.redis_cache import redis_cache_manager
+from app.models.admin import Menu, User
+
+logger = logging.getLogger(__name__)
+
+# 与原 get_menu_level 保持一致的最大层级
+MAX_MENU_LEVEL = 10
+
+MENU_FIELDS = (
+    "id", "name", "path", "component", "menu_type", "icon", "order_num", "parent_id",
+    "perms", "visible", "status", "is_frame", "is_cache", "query", "created_at", "updated_at",
+)
+
+
+def build_menu_tree(menus: List[dict], parent_id: Optional[int] = 0, parent_key: str = "parent_id") -> List[dict]:
+    """按父ID索引一次遍历构建菜单树（O(n)），保持输入顺序，只为有子节点的菜单写入 children"""
+    children_map: Dict[Any, List[dict]] = defaultdict(list)
+    for menu in menus:
+        children_map[menu.get(parent_key)].append(menu)
+
+    for menu in menus:
+        children = children_map.get(menu["id"])
+        if children:
+            menu["children"] = children
+
+    return children_map.get(parent_id, [])
+
+
+def normalize_menu_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """values() 行转换为可缓存的纯JSON结构（枚举取值、时间转ISO字符串）"""
+    menu_type = row.get("menu_type")
+    row["menu_type"] = getattr(menu_type, "value", menu_type)
+    for key in ("created_at", "updated_at"):
+        value = row.get(key)
+        if isinstance(value, datetime):
+            row[key] = value.isoformat()
+    return row
+
+
+def merge_menu_rows(row_groups: Iterable[List[dict]]) -> List[dict]:
+    """合并多个角色的菜单（按ID去重），按 (order_num, id) 排序"""
+    merged: Dict[int, dict] = {}
+    for rows in row_groups:
+        for row in rows:
+            merged.setdefault(row["id"], row)
+    return sorted(merged.values(), key=lambda row: (row.get("order_num") or 0, row["id"]))
+
+
+def filter_menu_rows(
+    rows: Iterable[dict],
+    active_only: bool = False,
+    visible_only: bool = False,
+    menu_type: Optional[str] = None,
+) -> List[dict]:
+    """按状态、可见性与类型筛选菜单行，返回副本（缓存行不被调用方修改）"""
+    return [
+        dict(row) for row in rows
+        if (not active_only or row.get("status"))
+        and (not visible_only or row.get("visible"))
+        and (menu_type is None or row.get("menu_type") == menu_type)
+    ]
+
+
+def compute_menu_hierarchy(rows: Iterable[dict]) -> Dict[int, Dict[str, int]]:
+    """根据 (id, parent_id) 计算每个菜单的层级与直接子菜单数，语义与原逐条查询一致"""
+    parents = {row["id"]: row.get("parent_id") for row in rows}
+    children_count: Dict[Any, int] = defaultdict(int)
+    for parent_id in parents.values():
+        children_count[parent_id] += 1
+
+    hierarchy = {}
+    for menu_id in parents:
+        level = 0
+        current_id = menu_id
+        while current_id:
+            if current_id not in parents or parents[current_id] == 0:
+                break
+            current_id = parents[current_id]
+            level += 1
+            if level > MAX_MENU_LEVEL:
+                break
+        hierarchy[menu_id] = {"level": level, "children_count": children_count.get(menu_id, 0)}
+    return hierarchy
+
+
+class MenuTreeService:
+    """菜单树服务"""
+
+    cache_prefix = "menu_tree"
+
+    def __init__(self, cache_ttl: int = 1200):
+        self.cache_ttl = cache_ttl
+
+    @property
+    def all_menus_key(self) -> str:
+        return f"{self.cache_prefix}:all"
+
+    def role_menus_key(self, role_id: int) -> str:
+        return f"{self.cache_prefix}:role:{role_id}"
+
+    def _tags(self, role_id: Optional[int] = None) -> List[str]:
+        tags = [permission_cache_manager.all_permissions_tag, permission_cache_manager.menu_tag]
+        if role_id is not None:
+            tags.append(f"role:{role_id}")
+        return tags
+
+    async def get_all_menu_rows(self) -> List[dict]:
+        """全部菜单（超级用户与管理视图使用），一次查询批量序列化"""
+        rows = await redis_cache_manager.get(self.all_menus_key)
+        if isinstance(rows, list):
+            return rows
+        rows = [normalize_menu_row(row) for row in await Menu.all().order_by("order_num", "id").values(*MENU_FIELDS)]
+        await redis_cache_manager.set(self.all_menus_key, rows, ttl=self.cache_ttl, tags=self._tags())
+        return rows
+
+    async def get_role_menu_rows(self, role_ids: Iterable[int]) -> Dict[int, List[dict]]:
+        """按角色获取菜单行，未缓存的角色通过一次关联查询批量加载并逐角色缓存"""
+        role_ids = list(dict.fromkeys(role_ids))
+        if not role_ids:
+            return {}
+
+        cached = await asyncio.gather(*(redis_cache_manager.get(self.role_menus_key(rid)) for rid in role_ids))
+        result = {rid: rows for rid, rows in zip(role_ids, cached) if isinstance(rows, list)}
+
+        missing = [rid for rid in role_ids if rid not in result]
+        if missing:
+            loaded: Dict[int, List[dict]] = {rid: [] for rid in missing}
+            rows = await Menu.filter(role_menus__id__in=missing).order_by("order_num", "id").values(
+                "role_menus__id", *MENU_FIELDS
+            )
+            for row in rows:
+                loaded[row.pop("role_menus__id")].append(normalize_menu_row(row))
+            for rid, role_rows in loaded.items():
+                await redis_cache_manager.set(
+                    self.role_menus_key(rid), role_rows, ttl=self.cache_ttl, tags=self._tags(rid)
+                )
+            result.update(loaded)
+            logger.debug(f"角色菜单已加载: 角色数={len(missing)}, 菜单行数={len(rows)}")
+        return result
+
+    async def get_user_menu_rows(self, user: User, role_filter: Optional[Dict[str, str]] = None) -> List[dict]:
+        """用户可访问的菜单行：超级用户为全部菜单，其余为各角色菜单的并集
+
+        role_filter 为角色筛选条件（如只取有效角色 status='0', del_flag='0'），默认不筛选。
+        """
+        if user.is_superuser:
+            return await self.get_all_menu_rows()
+        query = user.roles.filter(**role_filter) if role_filter else user.roles.all()
+        return await self.get_roles_menu_rows(await query.values_list("id", flat=True))
+
+    async def get_roles_menu_rows(self, role_ids: Iterable[int]) -> List[dict]:
+        """多个角色菜单的并集"""
+        role_rows = await self.get_role_menu_rows(role_ids)
+        return merge_menu_rows(role_rows.values())
+
+    @staticmethod
+    async def get_menu_stats_map() -> Dict[int, Dict[str, int]]:
+        """批量获取菜单层级、子菜单数与关联角色数（两次查询），替代逐菜单的COUNT与父链查询"""
+        hierarchy = compute_menu_hierarchy(await Menu.all().values("id", "parent_id"))
+        role_counts = {
+            row["id"]: row["roles_count"]
+            for row in await Menu.annotate(roles_count=Count("role_menus")).values("id", "roles_count")
+        }
+        return {
+            menu_id: {**info, "roles_count": role_counts.get(menu_id, 0)}
+            for menu_id, info in hierarchy.items()
+        }
+
+    @staticmethod
+    def apply_stats(menu_dict: dict, stats: Optional[Dict[str, int]]) -> dict:
+        """按v2响应格式写入 stats 与 level 字段"""
+        stats = stats or {"level": 0, "children_count": 0, "roles_count": 0}
+        menu_dict["stats"] = {
+            "children_count": stats["children_count"],
+            "roles_count": stats["roles_count"],
+        }
+        menu_dict["level"] = stats["level"]
+        return menu_dict
+
+    async def invalidate(self, role_id: Optional[int] = None) -> None:
+        """失效菜单缓存：指定角色时只失效该角色，否则失效全部菜单缓存"""
+        if role_id is not None:
+            await permission_cache_manager.clear_role_cache(role_id)
+        else:
+            await permission_cache_manager.clear_menu_cache()
+
+
+menu_tree_service = MenuTreeService()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户未读通知计数
+在内存中维护有效通知索引与每个用户已读/已删除的通知ID集合，
+未读数 = 有效通知数 - 用户已处理且仍有效的通知数，查询不再访问数据库。
+
+发布、撤回、删除、已读、删除用户通知时增量更新，并通过报警WebSocket推送
+{"type": "unread_count"} 给在线用户；短时间内的多次变化合并为一次推送。
+
+计数器按进程维护。多 worker 部署时通过 Redis 发布订阅（start_sync）把变化通知其他 worker，
+收到后失效对应缓存并推送给连在该 worker 上的用户；Redis 不可用时其他 worker 在 ttl 到期重新加载后生效。
+"""
+
+import asyncio
+import bisect
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from tortoise.expressions import Q
+
+from app.models.notification import Notification, UserNotification
+from app.log import logger
+
+NEVER_EXPIRE = float("inf")
+SYNC_CHANNEL = "notification:unread_sync"
+
+
+def _expire_ts(expire_time: Optional[datetime]) -> float:
+    """过期时间转时间戳；列为无时区时间，按本地时间解释"""
+    if expire_time is None:
+        return NEVER_EXPIRE
+    return expire_time.replace(tzinfo=None).timestamp()
+
+
+class UnreadCounter:
+    """未读通知计数器"""
+
+    def __init__(self, ttl: float = 300.0, push_delay: float = 0.2):
+        """
+        Args:
+            ttl: 内存索引与用户集合的重新加载周期（秒）
+            push_delay: 推送合并窗口（秒）
+        """
+        self.ttl = ttl
+        self.push_delay = push_delay
+        self._visible: Dict[int, float] = {}           # 有效通知ID -> 过期时间戳
+        self._expiry: List[Tuple[float, int]] = []      # 按过期时间排序，用于淘汰
+        self._loaded_at = 0.0
+        self._consumed: Dict[int, Set[int]] = {}        # 用户ID -> 已读或已删除的通知ID
+        self._consumed_at: Dict[int, float] = {}
+        self._load_lock = asyncio.Lock()
+        self._pending_users: Set[int] = set()
+        self._pending_all = False
+        self._push_task: Optional[asyncio.Task] = None
+        self._origin = uuid.uuid4().hex
+        self._redis = None
+        self._sync_task: Optional[asyncio.Task] = None
+
+    # ---------- 加载 ----------
+
+    async def _ensure_visible(self) -> None:
+        if time.monotonic() - self._loaded_at < self.ttl:
+            return
+        async with self._load_lock:
+            if time.monotonic() - self._loaded_at < self.ttl:
+                return
+            # 过期判断在内存中完成，避免 expire_time 比较的时区转换问题
+            rows = await Notification.filter(is_published=True).values_list("id", "expire_time")
+            now = time.time()
+            self._visible = {}
+            for notification_id, expire_time in rows:
+                expire_ts = _expire_ts(expire_time)
+                if expire_ts > now:
+                    self._visible[notification_id] = expire_ts
+            self._expiry = sorted(
+                (expire_ts, notification_id)
+                for notification_id, expire_ts in self._visible.items()
+                if expire_ts != NEVER_EXPIRE
+            )
+            self._loaded_at = time.monotonic()
+
+    async def _ensure_users(self, user_ids: Iterable[int]) -> None:
+        now = time.monotonic()
+        stale = [uid for uid in user_ids if now - self._consumed_at.get(uid, float("-inf")) >= self.ttl]
+        if not stale:
+            return
+        rows = await UserNotification.filter(user_id__in=stale).filter(
+            Q(is_read=True) | Q(is_deleted=True)
+        ).values_list("user_id", "notification_id")
+        consumed: Dict[int, Set[int]] = {uid: set() for uid in stale}
+        for user_id, notification_id in rows:
+            consumed[user_id].add(notification_id)
+        self._consumed.update(consumed)
+        self._consumed_at.update({uid: now for uid in stale})
+
+    def _expire(self) -> None:
+        now = time.time()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, notification_id = self._expiry.pop(0)
+            self._visible.pop(notification_id, None)
+
+    def _count(self, user_id: int) -> Dict[str, int]:
+        visible = self._visible
+        consumed = sum(1 for notification_id in self._consumed.get(user_id, ()) if notification_id in visible)
+        return {"unread_count": len(visible) - consumed, "total": len(visible)}
+
+    # ---------- 查询 ----------
+
+    async def get(self, user_id: int) -> Dict[str, int]:
+        """获取用户未读数与有效通知总数"""
+        await self._ensure_visible()
+        await self._ensure_users([user_id])
+        self._expire()
+        return self._count(user_id)
+
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+        user_ids = list(user_ids)
+        await self._ensure_visible()
+        await self._ensure_users(user_ids)
+        self._expire()
+        return {uid: self._count(uid) for uid in user_ids}
+
+    # ---------- 通知变化 ----------
+
+    def on_published(self, notifications: Iterable[Notification]) -> None:
+        """通知已发布（新建或重新发布）"""
+        changed = False
+        for notification in notifications:
+            if notification.id is None:
+                # 批量插入未回填主键时整体重新加载
+                self._loaded_at = 0.0
+                changed = True
+                continue
+            if not notification.is_published:
+                continue
+            expire_ts = _expire_ts(notification.expire_time)
+            if expire_ts <= time.time():
+                continue
+            self._remove(notification.id)
+            self._visible[notification.id] = expire_ts
+            if expire_ts != NEVER_EXPIRE:
+                bisect.insort(self._expiry, (expire_ts, notification.id))
+            changed = True
+        if changed:
+            self._schedule_push()
+        self._publish_change()
+
+    def on_withdrawn(self, notification_ids: Iterable[int]) -> None:
+        """通知已撤回或删除"""
+        changed = False
+        for notification_id in notification_ids:
+            changed = self._remove(notification_id) or changed
+        if changed:
+            self._schedule_push()
+        self._publish_change()
+
+    def _remove(self, notification_id: int) -> bool:
+        expire_ts = self._visible.pop(notification_id, None)
+        if expire_ts is None:
+            return False
+        if expire_ts != NEVER_EXPIRE:
+            index = bisect.bisect_left(self._expiry, (expire_ts, notification_id))
+            if index < len(self._expiry) and self._expiry[index] == (expire_ts, notification_id):
+                self._expiry.pop(index)
+        return True
+
+    # ---------- 用户操作 ----------
+
+    def on_consumed(self, user_id: int, notification_ids: Iterable[int]) -> None:
+        """用户已读或删除了通知"""
+        consumed = self._consumed.get(user_id)
+        if consumed is not None:
+            consumed.update(notification_ids)
+        self._schedule_push([user_id])
+        self._publish_change(user_id)
+
+    def on_all_read(self, user_id: int) -> None:
+        """用户全部标记已读：所有有效通知均已处理"""
+        consumed = self._consumed.get(user_id)
+        if consumed is not None:
+            consumed.update(self._visible)
+        self._schedule_push([user_id])
+        self._publish_change(user_id)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """使缓存失效，下次查询时重新加载"""
+        if user_id is None:
+            self._loaded_at = 0.0
+            self._consumed_at.clear()
+        else:
+            self._consumed_at.pop(user_id, None)
+
+    # ---------- 推送 ----------
+
+    def _schedule_push(self, user_ids: Optional[Iterable[int]] = None) -> None:
+        if user_ids is None:
+            self._pending_all = True
+        else:
+            self._pending_users.update(user_ids)
+        if self._push_task is None or self._push_task.done():
+            try:
+                self._push_task = asyncio.get_running_loop().create_task(self._flush())
+            except RuntimeError:
+                # 无事件循环（脚本调用）时不推送
+                pass
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(self.push_delay)
+        from app.services.alarm_websocket import alarm_ws_manager
+
+        online = alarm_ws_manager.get_online_user_ids()
+        if self._pending_all:
+            user_ids = online
+        else:
+            user_ids = self._pending_users & online
+        self._pending_all = False
+        self._pending_users = set()
+        if not user_ids:
+            return
+        try:
+            counts = await self.get_many(user_ids)
+            await alarm_ws_manager.send_unread_counts(counts)
+        except Exception as e:
+            logger.error(f"推送未读通知数量失败: {str(e)}")
+
+    # ---------- 跨 worker 同步 ----------
+
+    async def start_sync(self) -> bool:
+        """订阅 Redis 同步频道；Redis 不可用时返回 False（退化为 ttl 到期重新加载）"""
+        from app.core.redis import get_redis_client
+
+        client = await get_redis_client()
+        if client.redis is None:
+            logger.warning("Redis不可用，未读通知计数不做跨worker同步")
+            return False
+        pubsub = client.redis.pubsub()
+        await pubsub.subscribe(SYNC_CHANNEL)
+        self._redis = client.redis
+        self._sync_task = asyncio.get_running_loop().create_task(self._listen(pubsub))
+        return True
+
+    async def stop_sync(self) -> None:
+        self._redis = None
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+
+    def _publish_change(self, user_id: Optional[int] = None) -> None:
+        """通知其他 worker：user_id 为空表示有效通知集合变化，否则为该用户的已读/删除状态变化"""
+        if self._redis is None:
+            return
+        message = json.dumps({"origin": self._origin, "user_id": user_id})
+        try:
+            asyncio.get_running_loop().create_task(self._publish(message))
+        except RuntimeError:
+            pass
+
+    async def _publish(self, message: str) -> None:
+        try:
+            await self._redis.publish(SYNC_CHANNEL, message)
+        except Exception as e:
+            logger.warning(f"发布未读通知同步消息失败: {str(e)}")
+
+    async def _listen(self, pubsub) -> None:
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    event = json.loads(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                if event.get("origin") == self._origin:
+                    continue
+                user_id = event.get("user_id")
+                if user_id is None:
+                    self._loaded_at = 0.0
+                    self._schedule_push()
+                else:
+                    self._consumed_at.pop(user_id, None)
+                    self._schedule_push([user_id])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"未读通知同步订阅中断，退化为 ttl 重新加载: {str(e)}")
+        finally:
+            try:
+                await pubsub.unsubscribe(SYNC_CHANNEL)
+                await pubsub.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "visible_notifications": len(self._visible),
+            "cached_users": len(self._consumed),
+            "cross_worker_sync": self._sync_task is not None and not self._sync_task.done(),
+        }
+
+
+# 全局单例
+unread_counter = UnreadCounter()
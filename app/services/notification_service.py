@@ -6,9 +6,10 @@
 """
 
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from app.models.notification import Notification, UserNotification
+from app.services.notification_counter import unread_counter
 from app.log import logger
 
 
@@ -23,6 +24,9 @@ class NotificationService:
         "info": "info"
     }
     
+    # 报警通知有效期（天）
+    ALARM_EXPIRE_DAYS = 7
+    
     @classmethod
     async def create_notification(
         cls,
@@ -57,7 +61,6 @@ class NotificationService:
         try:
             expire_time = None
             if expire_days:
-                from datetime import timedelta
                 expire_time = datetime.now() + timedelta(days=expire_days)
 
             notification = await Notification.create(
@@ -75,6 +78,9 @@ class NotificationService:
                 created_by=created_by
             )
             
+            if auto_publish:
+                unread_counter.on_published([notification])
+            
             logger.info(f"创建通知成功: {title}, ID: {notification.id}")
             return notification
             
@@ -82,6 +88,44 @@ class NotificationService:
             logger.error(f"创建通知失败: {str(e)}", exc_info=True)
             return None
     
+    @classmethod
+    def _alarm_notification_fields(cls, alarm_data: Dict[str, Any]) -> Dict[str, Any]:
+        """根据报警数据构建通知字段"""
+        rule_name = alarm_data.get("rule_name", "未知规则")
+        device_code = alarm_data.get("device_code", "未知设备")
+        device_name = alarm_data.get("device_name") or device_code
+        alarm_level = alarm_data.get("alarm_level", "warning")
+        alarm_content = alarm_data.get("alarm_content", "")
+        field_name = alarm_data.get("field_name", "")
+        trigger_value = alarm_data.get("trigger_value", "")
+        alarm_id = alarm_data.get("id")
+        
+        # 构建通知标题和内容
+        level_text = {
+            "emergency": "🚨 紧急",
+            "critical": "⚠️ 严重",
+            "warning": "⚡ 警告"
+        }.get(alarm_level, "📢 提示")
+        
+        title = f"{level_text} {rule_name}"
+        content = f"设备 [{device_name}] 触发报警\n"
+        content += f"参数: {field_name}\n"
+        content += f"当前值: {trigger_value}\n"
+        content += f"详情: {alarm_content}"
+        
+        # 构建跳转链接
+        link_url = f"/alarm/alarm-records?alarm_id={alarm_id}" if alarm_id else "/alarm/alarm-records"
+        
+        return {
+            "title": title,
+            "content": content,
+            "notification_type": "alarm",
+            "level": cls.ALARM_LEVEL_MAP.get(alarm_level, "warning"),  # 映射通知级别
+            "scope": "all",  # 报警通知发送给所有用户
+            "link_url": link_url,
+            "expire_days": cls.ALARM_EXPIRE_DAYS,
+        }
+    
     @classmethod
     async def create_alarm_notification(
         cls,
@@ -96,45 +140,10 @@ class NotificationService:
             auto_publish: 是否自动发布
         """
         try:
-            rule_name = alarm_data.get("rule_name", "未知规则")
-            device_code = alarm_data.get("device_code", "未知设备")
-            device_name = alarm_data.get("device_name") or device_code
-            alarm_level = alarm_data.get("alarm_level", "warning")
-            alarm_content = alarm_data.get("alarm_content", "")
-            field_name = alarm_data.get("field_name", "")
-            trigger_value = alarm_data.get("trigger_value", "")
-            alarm_id = alarm_data.get("id")
-            
-            # 构建通知标题和内容
-            level_text = {
-                "emergency": "🚨 紧急",
-                "critical": "⚠️ 严重",
-                "warning": "⚡ 警告"
-            }.get(alarm_level, "📢 提示")
-            
-            title = f"{level_text} {rule_name}"
-            content = f"设备 [{device_name}] 触发报警\n"
-            content += f"参数: {field_name}\n"
-            content += f"当前值: {trigger_value}\n"
-            content += f"详情: {alarm_content}"
-            
-            # 构建跳转链接
-            link_url = f"/alarm/alarm-records?alarm_id={alarm_id}" if alarm_id else "/alarm/alarm-records"
-            
-            # 映射通知级别
-            notification_level = cls.ALARM_LEVEL_MAP.get(alarm_level, "warning")
-            
             return await cls.create_notification(
-                title=title,
-                content=content,
-                notification_type="alarm",
-                level=notification_level,
-                scope="all",  # 报警通知发送给所有用户
-                link_url=link_url,
-                expire_days=7,  # 报警通知7天后过期
+                **cls._alarm_notification_fields(alarm_data),
                 auto_publish=auto_publish
             )
-            
         except Exception as e:
             logger.error(f"创建报警通知失败: {str(e)}", exc_info=True)
             return None
@@ -145,16 +154,40 @@ class NotificationService:
         alarms: List[Dict[str, Any]]
     ) -> List[Notification]:
         """
-        批量创建报警通知
+        批量创建报警通知（单次批量插入）
         
         Args:
             alarms: 报警数据列表
         """
+        now = datetime.now()
         notifications = []
         for alarm in alarms:
-            notification = await cls.create_alarm_notification(alarm)
-            if notification:
-                notifications.append(notification)
+            try:
+                fields = cls._alarm_notification_fields(alarm)
+            except Exception as e:
+                logger.error(f"构建报警通知失败: {str(e)}")
+                continue
+            expire_days = fields.pop("expire_days")
+            notifications.append(Notification(
+                **fields,
+                target_roles=[],
+                target_users=[],
+                expire_time=now + timedelta(days=expire_days),
+                is_published=True,
+                publish_time=now
+            ))
+        
+        if not notifications:
+            return []
+        
+        try:
+            await Notification.bulk_create(notifications)
+        except Exception as e:
+            logger.error(f"批量创建报警通知失败: {str(e)}", exc_info=True)
+            return []
+        
+        unread_counter.on_published(notifications)
+        logger.info(f"批量创建报警通知成功: {len(notifications)} 条")
         return notifications
     
     @classmethod
@@ -176,6 +209,7 @@ class NotificationService:
                 un.read_time = datetime.now()
                 await un.save()
             
+            unread_counter.on_consumed(user_id, [notification_id])
             return True
         except Exception as e:
             logger.error(f"标记已读失败: {str(e)}")
@@ -183,28 +217,10 @@ class NotificationService:
     
     @classmethod
     async def get_unread_count(cls, user_id: int) -> int:
-        """获取用户未读通知数量"""
+        """获取用户未读通知数量（内存计数，不查询通知表）"""
         try:
-            from tortoise.expressions import Q
-            now = datetime.now()
-            
-            # 获取有效通知总数
-            total = await Notification.filter(is_published=True).filter(
-                Q(expire_time__isnull=True) | Q(expire_time__gt=now)
-            ).count()
-            
-            # 获取已读数量
-            read_count = await UserNotification.filter(
-                user_id=user_id, is_read=True, is_deleted=False
-            ).count()
-            
-            # 获取已删除数量
-            deleted_count = await UserNotification.filter(
-                user_id=user_id, is_deleted=True
-            ).count()
-            
-            return max(0, total - read_count - deleted_count)
-            
+            count = await unread_counter.get(user_id)
+            return count["unread_count"]
         except Exception as e:
             logger.error(f"获取未读数量失败: {str(e)}")
             return 0
@@ -7,6 +7,7 @@ from typing import List, Dict, Any, Optional, Set, Tuple
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from app.core.instrumentation import metrics
 from app.core.unified_logger import get_logger
 
 logger = get_logger(__name__)
@@ -45,6 +46,9 @@ class PermissionPerformanceService:
     
     def __init__(self):
         self.metrics = PerformanceMetrics()
+        self.batch_latency = metrics.histogram(
+            "permission_batch_check_duration_seconds", "批量权限检查耗时"
+        )
         self.batch_queue = []
         self.batch_processing = False
         self.batch_size = 50
@@ -103,6 +107,7 @@ class PermissionPerformanceService:
             self.metrics.batch_queries += 1
             self.metrics.total_time += query_time
             self.metrics.avg_response_time = self.metrics.total_time / self.metrics.batch_queries
+            self.batch_latency.observe(query_time)
             
             logger.debug(f"批量权限检查完成: {len(user_permission_pairs)}项, 耗时{query_time:.3f}s")
             
@@ -405,6 +410,7 @@ class PermissionPerformanceService:
             "cache_misses": self.metrics.cache_misses,
             "cache_hit_rate": f"{self.metrics.cache_hit_rate:.2f}%",
             "avg_response_time": f"{self.metrics.avg_response_time:.3f}s",
+            "latency_distribution": self.batch_latency.labels().snapshot(),
             "batch_queries": self.metrics.batch_queries,
             "total_time": f"{self.metrics.total_time:.3f}s",
             "top_query_patterns": dict(
@@ -415,6 +421,7 @@ class PermissionPerformanceService:
     def reset_metrics(self):
         """重置性能指标"""
         self.metrics = PerformanceMetrics()
+        self.batch_latency.clear()
         self.query_patterns.clear()
         logger.info("权限系统性能指标已重置")
     
@@ -5,13 +5,15 @@
 实现用户权限查询、权限检查、角色权限继承等核心功能
 """
 
-import re
-from typing import List, Dict, Set, Optional, Tuple, Any
+import asyncio
+from typing import Iterable, List, Dict, Set, Optional, Tuple, Any
 from datetime import datetime, timedelta
 
-from app.models.admin import User, Role, Menu, SysApiEndpoint
+from app.models.admin import User, Role, SysApiEndpoint
 from app.core.unified_logger import get_logger
 from app.core.permission_cache import permission_cache_manager
+from app.core.permission_matcher import API_PERMISSION_PATTERN, PermissionGrants, compiled_matcher_cache
+from app.services.menu_tree_service import filter_menu_rows, menu_tree_service
 
 logger = get_logger(__name__)
 
@@ -19,13 +21,42 @@ logger = get_logger(__name__)
 # 权限缓存管理器已移至 app.core.permission_cache 模块
 
 
+def compute_role_closures(
+    role_ids: Iterable[int], parents: Dict[int, Optional[int]], active: Optional[Set[int]] = None
+) -> Dict[int, List[int]]:
+    """
+    根据内存中的角色图（角色ID -> 父角色ID）计算每个角色的继承链
+    
+    继承链包含角色自身及其所有有效祖先，遇到无效（已停用/删除，不在 active 中）或不在图中的
+    父角色即停止，与原逐级查询父角色的语义一致；角色自身无效时继承链为空；
+    active 为None时不按状态截断，得到沿 parent_id 的完整祖先链。脏数据中的环不会导致死循环。
+    """
+    closures = {}
+    for role_id in role_ids:
+        chain = []
+        current = role_id
+        while (
+            current is not None and current in parents and current not in chain
+            and (active is None or current in active)
+        ):
+            chain.append(current)
+            current = parents[current]
+        closures[role_id] = chain
+    return closures
+
+
 class PermissionService:
     """权限服务核心类"""
     
     def __init__(self):
         self.cache = permission_cache_manager
         self.superuser_types = ["01"]  # 超级用户类型
-        self.api_permission_pattern = re.compile(r'^(GET|POST|PUT|DELETE|PATCH)\s+(.+)$')
+        self.api_permission_pattern = API_PERMISSION_PATTERN
+        self.matcher_cache = compiled_matcher_cache
+        self.menu_fields = (
+            'id', 'name', 'path', 'component', 'icon', 'order_num', 'parent_id', 'menu_type',
+            'visible', 'perms', 'query', 'is_frame', 'is_cache'
+        )
     
     async def get_user_permissions(self, user_id: int) -> List[str]:
         """
@@ -37,48 +68,57 @@ class PermissionService:
         Returns:
             List[str]: 用户权限列表，格式为 "METHOD /path"
         """
+        return (await self.get_user_grants(user_id)).permissions
+    
+    async def get_user_grants(self, user_id: int) -> PermissionGrants:
+        """
+        获取带版本的用户权限列表（版本在加载时计算一次，供编译匹配器缓存判断是否过期）
+        
+        Args:
+            user_id: 用户ID
+            
+        Returns:
+            PermissionGrants: 权限版本与权限列表
+        """
         try:
             # 尝试从缓存获取
-            cached_permissions = await self.cache.get_user_permissions(user_id)
-            if cached_permissions is not None:
+            cached_grants = await self.cache.get_user_grants(user_id)
+            if cached_grants is not None:
                 logger.debug(f"从缓存获取用户权限: user_id={user_id}")
-                return cached_permissions
+                return cached_grants
             
             # 从数据库获取用户信息
-            user = await User.get_or_none(id=user_id).prefetch_related('roles')
+            user = await User.get_or_none(id=user_id)
             if not user:
                 logger.warning(f"用户不存在: user_id={user_id}")
-                return []
+                return PermissionGrants.build([])
             
             # 超级用户拥有所有权限
             if user.is_superuser:
                 all_apis = await SysApiEndpoint.filter(status='active').all()
-                permissions = [f"{api.http_method} {api.api_path}" for api in all_apis]
+                grants = PermissionGrants.build(f"{api.http_method} {api.api_path}" for api in all_apis)
                 
-                # 缓存权限
-                await self.cache.set_user_permissions(user_id, permissions)
-                logger.info(f"超级用户权限加载完成: user_id={user_id}, 权限数量={len(permissions)}")
-                return permissions
-            
-            # 获取用户角色权限（支持角色继承）
-            permissions = set()
-            roles = await user.roles.filter(status='0', del_flag='0').all()
+                # 缓存权限（超级用户不受角色变更影响）
+                await self.cache.set_user_permissions(user_id, grants, role_ids=[])
+                logger.info(f"超级用户权限加载完成: user_id={user_id}, 权限数量={len(grants.permissions)}")
+                return grants
             
-            # 获取所有角色权限（包括继承的权限）
-            all_role_permissions = await self._get_inherited_role_permissions(roles)
-            permissions.update(all_role_permissions)
+            # 获取用户角色权限（支持角色继承），按角色缓存的有效权限取并集；
+            # 已停用/删除的角色有效权限为空，但仍参与缓存标签，重新启用时能失效该用户缓存
+            role_ids = await user.roles.all().values_list('id', flat=True)
+            role_permissions, ancestor_ids = await self._resolve_role_permissions(role_ids)
             
-            permissions_list = list(permissions)
+            grants = PermissionGrants.build(set().union(*role_permissions.values()))
             
-            # 缓存权限
-            await self.cache.set_user_permissions(user_id, permissions_list)
+            # 缓存权限（登记完整祖先链上所有角色的标签，任一角色变更时只失效相关用户）
+            await self.cache.set_user_permissions(user_id, grants, role_ids=ancestor_ids)
             
-            logger.info(f"用户权限加载完成: user_id={user_id}, 角色数量={len(roles)}, 权限数量={len(permissions_list)}")
-            return permissions_list
+            logger.info(f"用户权限加载完成: user_id={user_id}, 角色数量={len(role_ids)}, 权限数量={len(grants.permissions)}")
+            return grants
             
         except Exception as e:
             logger.error(f"获取用户权限失败: user_id={user_id}, error={e}")
-            return []
+            return PermissionGrants.build([])
     
     async def has_permission(self, user_id: int, permission: str) -> bool:
         """
@@ -97,20 +137,62 @@ class PermissionService:
                 logger.debug(f"超级用户权限检查通过: user_id={user_id}, permission={permission}")
                 return True
             
-            # 获取用户权限列表
-            user_permissions = await self.get_user_permissions(user_id)
-            
-            # 直接匹配
-            if permission in user_permissions:
-                return True
-            
-            # 模糊匹配（支持路径参数）
-            return await self._match_permission_pattern(permission, user_permissions)
+            # 获取用户权限列表，使用编译后的路径前缀树匹配（精确匹配 + 路径参数）
+            user_grants = await self.get_user_grants(user_id)
+            return self.matcher_cache.get(f"user:{user_id}", user_grants).matches(permission)
             
         except Exception as e:
             logger.error(f"权限检查失败: user_id={user_id}, permission={permission}, error={e}")
             return False
     
+    async def get_role_permissions(self, role_id: int) -> List[str]:
+        """
+        获取角色权限列表（包含继承的父角色权限）
+        
+        Args:
+            role_id: 角色ID
+            
+        Returns:
+            List[str]: 角色权限列表，格式为 "METHOD /path"
+        """
+        return (await self.get_role_grants(role_id)).permissions
+    
+    async def get_role_grants(self, role_id: int) -> PermissionGrants:
+        """
+        获取带版本的角色权限列表（包含继承的父角色权限）
+        
+        Args:
+            role_id: 角色ID
+            
+        Returns:
+            PermissionGrants: 权限版本与权限列表
+        """
+        try:
+            cached_grants = await self.cache.get_role_grants(role_id)
+            if cached_grants is not None:
+                return cached_grants
+            
+            role_permissions, _ = await self._resolve_role_permissions([role_id])
+            return PermissionGrants.build(role_permissions.get(role_id, ()))
+            
+        except Exception as e:
+            logger.error(f"获取角色权限失败: role_id={role_id}, error={e}")
+            return PermissionGrants.build([])
+    
+    async def role_has_permission(self, role_id: int, permission: str) -> bool:
+        """
+        检查角色是否有特定权限（使用编译后的路径前缀树匹配）
+        
+        Args:
+            role_id: 角色ID
+            permission: 权限字符串，格式为 "METHOD /path"
+            
+        Returns:
+            bool: 是否有权限
+        """
+        role_grants = await self.get_role_grants(role_id)
+        return self.matcher_cache.get(f"role:{role_id}", role_grants).matches(permission)
+    
     async def _match_permission_pattern(self, target_permission: str, user_permissions: List[str]) -> bool:
         """
         权限模式匹配
@@ -159,33 +241,72 @@ class PermissionService:
         Returns:
             Set[str]: 继承的权限集合
         """
-        permissions = set()
-        processed_roles = set()
+        role_permissions, _ = await self._resolve_role_permissions([role.id for role in roles])
+        return set().union(*role_permissions.values())
+    
+    async def _load_role_graph(self) -> Tuple[Dict[int, Optional[int]], Set[int]]:
+        """一次查询加载所有角色（含停用/删除）的父子关系，以及有效角色ID集合"""
+        rows = await Role.all().values('id', 'parent_id', 'status', 'del_flag')
+        parents = {row['id']: row['parent_id'] for row in rows}
+        active = {row['id'] for row in rows if row['status'] == '0' and row['del_flag'] == '0'}
+        return parents, active
+    
+    async def _fetch_role_grants(self, role_ids: Iterable[int]) -> Dict[int, Set[str]]:
+        """一次关联查询获取多个角色直接授予的有效API权限"""
+        role_ids = list(role_ids)
+        grants: Dict[int, Set[str]] = {role_id: set() for role_id in role_ids}
+        if not role_ids:
+            return grants
         
-        async def collect_role_permissions(role: Role):
-            """递归收集角色权限"""
-            if role.id in processed_roles:
-                return
-            
-            processed_roles.add(role.id)
-            
-            # 获取当前角色的API权限
-            role_apis = await role.apis.filter(status='active').all()
-            for api in role_apis:
-                permission = f"{api.http_method} {api.api_path}"
-                permissions.add(permission)
-            
-            # 如果有父角色，递归获取父角色权限
-            if role.parent_id:
-                parent_role = await Role.get_or_none(id=role.parent_id, status='0', del_flag='0')
-                if parent_role:
-                    await collect_role_permissions(parent_role)
+        rows = await SysApiEndpoint.filter(roles__id__in=role_ids, status='active').values(
+            'roles__id', 'http_method', 'api_path'
+        )
+        for row in rows:
+            grants[row['roles__id']].add(f"{row['http_method']} {row['api_path']}")
+        return grants
+    
+    async def _resolve_role_permissions(self, role_ids: Iterable[int]) -> Tuple[Dict[int, Set[str]], List[int]]:
+        """
+        批量解析角色的有效权限（含继承）
         
-        # 收集所有角色的权限
-        for role in roles:
-            await collect_role_permissions(role)
+        角色图一次查询加载并在内存中求继承链；已缓存的角色直接使用缓存，
+        未缓存角色的继承链上所有角色的授权通过一次关联查询取回，按角色展平后写入缓存。
+        权限只沿有效角色合并（遇到停用/删除的祖先即停止），但缓存标签登记沿 parent_id 的
+        完整祖先链（含停用/删除的角色），祖先重新启用时能失效受影响的角色与用户缓存。
         
-        return permissions
+        Returns:
+            (角色ID -> 有效权限集合, 所有角色完整祖先链的并集)
+        """
+        role_ids = list(dict.fromkeys(role_ids))
+        if not role_ids:
+            return {}, []
+        
+        parents, active = await self._load_role_graph()
+        closures = compute_role_closures(role_ids, parents, active)
+        ancestry = compute_role_closures(role_ids, parents)
+        ancestor_ids = list(dict.fromkeys(
+            rid for role_id in role_ids for rid in (ancestry[role_id] or [role_id])
+        ))
+        
+        cached = await asyncio.gather(*(self.cache.get_role_permissions(role_id) for role_id in role_ids))
+        role_permissions = {
+            role_id: set(permissions)
+            for role_id, permissions in zip(role_ids, cached)
+            if permissions is not None
+        }
+        
+        missing = [role_id for role_id in role_ids if role_id not in role_permissions]
+        if missing:
+            grants = await self._fetch_role_grants(
+                dict.fromkeys(rid for role_id in missing for rid in closures[role_id])
+            )
+            for role_id in missing:
+                effective = set().union(*(grants.get(rid, set()) for rid in closures[role_id]))
+                role_permissions[role_id] = effective
+                await self.cache.set_role_permissions(role_id, list(effective), ancestor_ids=ancestry[role_id])
+            logger.debug(f"角色有效权限已计算: 角色数={len(missing)}, 继承链角色数={len(grants)}")
+        
+        return role_permissions, ancestor_ids
     
     def _match_path_pattern(self, target_path: str, pattern_path: str) -> bool:
         """
@@ -287,74 +408,26 @@ class PermissionService:
                 return cached_menus
             
             # 从数据库获取用户信息
-            user = await User.get_or_none(id=user_id).prefetch_related('roles')
+            user = await User.get_or_none(id=user_id)
             if not user:
                 return []
             
-            # 超级用户获取所有菜单
+            # 超级用户获取所有菜单，普通用户取有效角色菜单的并集（按角色缓存，批量加载）
             if user.is_superuser:
-                all_menus = await Menu.filter(status=True, visible=True).order_by('order_num', 'id').all()
-                menus_data = []
-                
-                for menu in all_menus:
-                    menus_data.append({
-                        'id': menu.id,
-                        'name': menu.name,
-                        'path': menu.path,
-                        'component': menu.component,
-                        'icon': menu.icon,
-                        'order_num': menu.order_num,
-                        'parent_id': menu.parent_id,
-                        'menu_type': menu.menu_type,
-                        'visible': menu.visible,
-                        'perms': menu.perms,
-                        'query': menu.query,
-                        'is_frame': menu.is_frame,
-                        'is_cache': menu.is_cache
-                    })
-                
-                # 缓存菜单信息
-                await self.cache.set_user_menus(user_id, menus_data)
-                logger.info(f"超级用户菜单加载完成: user_id={user_id}, 菜单数量={len(menus_data)}")
-                return menus_data
-            
-            # 获取用户角色菜单权限
-            menu_ids = set()
-            roles = await user.roles.filter(status='0', del_flag='0').all()
-            
-            for role in roles:
-                role_menus = await role.menus.filter(status=True, visible=True).all()
-                for menu in role_menus:
-                    menu_ids.add(menu.id)
-            
-            if not menu_ids:
-                return []
-            
-            # 获取菜单详细信息
-            user_menus = await Menu.filter(id__in=menu_ids).order_by('order_num', 'id').all()
-            menus_data = []
-            
-            for menu in user_menus:
-                menus_data.append({
-                    'id': menu.id,
-                    'name': menu.name,
-                    'path': menu.path,
-                    'component': menu.component,
-                    'icon': menu.icon,
-                    'order_num': menu.order_num,
-                    'parent_id': menu.parent_id,
-                    'menu_type': menu.menu_type,
-                    'visible': menu.visible,
-                    'perms': menu.perms,
-                    'query': menu.query,
-                    'is_frame': menu.is_frame,
-                    'is_cache': menu.is_cache
-                })
+                role_ids = []
+                rows = await menu_tree_service.get_all_menu_rows()
+            else:
+                role_ids = await user.roles.filter(status='0', del_flag='0').values_list('id', flat=True)
+                rows = await menu_tree_service.get_roles_menu_rows(role_ids)
+            menus_data = [
+                {field: row.get(field) for field in self.menu_fields}
+                for row in filter_menu_rows(rows, active_only=True, visible_only=True)
+            ]
             
             # 缓存菜单信息
-            await self.cache.set_user_menus(user_id, menus_data)
+            await self.cache.set_user_menus(user_id, menus_data, role_ids=list(role_ids))
             
-            logger.info(f"用户菜单加载完成: user_id={user_id}, 角色数量={len(roles)}, 菜单数量={len(menus_data)}")
+            logger.info(f"用户菜单加载完成: user_id={user_id}, 角色数量={len(role_ids)}, 菜单数量={len(menus_data)}")
             return menus_data
             
         except Exception as e:
@@ -609,16 +682,10 @@ class PermissionService:
                 return {perm: True for perm in permissions}
             
             # 获取用户权限列表
-            user_permissions = await self.get_user_permissions(user_id)
-            
-            results = {}
-            for permission in permissions:
-                if permission in user_permissions:
-                    results[permission] = True
-                else:
-                    results[permission] = await self._match_permission_pattern(permission, user_permissions)
+            user_grants = await self.get_user_grants(user_id)
+            matcher = self.matcher_cache.get(f"user:{user_id}", user_grants)
             
-            return results
+            return {permission: matcher.matches(permission) for permission in permissions}
             
         except Exception as e:
             logger.error(f"批量权限检查失败: user_id={user_id}, error={e}")
@@ -537,13 +537,9 @@ class RoleManagementService:
             raise
     
     async def _clear_role_users_cache(self, role_id: int) -> None:
-        """清理角色相关用户的权限缓存"""
+        """清理角色、子角色及相关用户的权限缓存（按角色标签失效）"""
         try:
-            role = await Role.get_or_none(id=role_id).prefetch_related('users')
-            if role:
-                for user in await role.users.all():
-                    await permission_cache_manager.clear_user_permissions(user.id)
-                    logger.debug(f"清理用户权限缓存: user_id={user.id}")
+            await permission_cache_manager.clear_role_cache(role_id)
         
         except Exception as e:
             logger.error(f"清理角色用户缓存失败: role_id={role_id}, error={e}")
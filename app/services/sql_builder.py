@@ -16,6 +16,7 @@ from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
 from app.core.exceptions import APIException
 from app.models.device import DeviceDataModel, DeviceField, DeviceType, DeviceFieldMapping
+from app.core.tdengine_pagination import TimeCursor, keyset_condition, keyset_order_clause
 from app.settings.config import settings
 import logging
 
@@ -52,10 +53,15 @@ class SQLBuilder:
         order_by: Optional[str] = None,
         order_direction: str = 'desc',
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        keyset: bool = False,
+        cursor: Optional[TimeCursor] = None
     ) -> Dict[str, Any]:
         """
         构建基础查询 SQL
+
+        keyset=True 时按 ts（及 tbname）排序并附带 tbname 列，用于时间游标分页；
+        提供 cursor 时追加续页条件且忽略 offset。COUNT SQL 不包含续页条件。
         """
         logger.info(f"[SQL构建器] 构建查询SQL: model={model_config.model_code}, device={device_code}")
         
@@ -96,6 +102,10 @@ class SQLBuilder:
 
         if device_id_col not in select_columns:
             select_columns.insert(1, device_id_col)
+
+        # 游标分页需要 tbname 区分超级表中相同时间戳的行
+        if keyset and 'tbname' not in select_columns:
+            select_columns.append('tbname')
         
         select_clause = f"SELECT {', '.join(select_columns)}"
         
@@ -136,10 +146,18 @@ class SQLBuilder:
                     where_conditions.append(f"{field} IN ({', '.join(escaped_values)})")
         
         where_clause = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
+        page_where_clause = where_clause
+        if keyset and cursor:
+            page_where_clause = f"WHERE {' AND '.join(where_conditions + [keyset_condition(cursor, with_tbname=True)])}"
         
         # 6. 构建 ORDER BY 子句
         order_clause = ""
-        if order_by:
+        if keyset:
+            direction = order_direction.lower()
+            if direction not in self.ALLOWED_ORDER_DIRECTIONS:
+                direction = 'desc'
+            order_clause = keyset_order_clause(direction, with_tbname=True)
+        elif order_by:
             if re.match(r'^[a-zA-Z0-9_]+$', order_by):
                 direction = order_direction.lower()
                 if direction not in self.ALLOWED_ORDER_DIRECTIONS:
@@ -150,10 +168,10 @@ class SQLBuilder:
         
         # 7. 构建 LIMIT 和 OFFSET
         limit = max(1, min(limit, 10000))
-        offset = max(0, offset)
-        limit_clause = f"LIMIT {limit} OFFSET {offset}"
+        offset = 0 if cursor else max(0, offset)
+        limit_clause = f"LIMIT {limit} OFFSET {offset}" if offset else f"LIMIT {limit}"
         
-        sql_parts = [select_clause, from_clause, where_clause, order_clause, limit_clause]
+        sql_parts = [select_clause, from_clause, page_where_clause, order_clause, limit_clause]
         sql = ' '.join(part for part in sql_parts if part)
         
         logger.info(f"[SQL构建器] SQL生成成功: {sql}")
@@ -163,6 +181,14 @@ class SQLBuilder:
             'database': tdengine_database,
             'stable': tdengine_stable,
             'select_columns': select_columns,
+            'numeric_columns': [
+                mapping['tdengine_column'] for mapping in field_mappings
+                if mapping.get('field_type') in ('integer', 'float')
+                and mapping['tdengine_column'] in select_columns
+                and mapping['tdengine_column'] not in ('ts', device_id_col)
+            ],
+            'device_id_column': device_id_col,
+            'where_clause': where_clause,
             'row_count_sql': self._build_count_sql(tdengine_database, tdengine_stable, where_clause)
         }
 
@@ -392,7 +418,8 @@ class SQLBuilder:
                 'tdengine_database': tdengine_database,
                 'tdengine_stable': tdengine_stable,
                 'tdengine_column': tdengine_column,
-                'aggregation_method': field.aggregation_method or 'avg'
+                'aggregation_method': field.aggregation_method or 'avg',
+                'field_type': field.field_type
             })
         
         return field_mappings
@@ -0,0 +1,306 @@
+"""
+TDengine 表解析服务
+
+将设备编号解析为其数据所在的 TDengine 物理表（子表，或超级表 + device_code 标签过滤）。
+映射通过一次 information_schema.ins_tables 全量扫描批量生成，缓存在进程内存与Redis中，
+设备新增、删除、变更类型或设备类型变更超级表时按标签失效。
+历史数据查询因此无需再逐个执行 SHOW STABLES / SHOW TABLES LIKE 探测。
+
+快照中没有的设备只按该设备的候选表名单独解析，解析不到的结果做短期负缓存，
+不会因为一个未知设备触发全量重建。查询需要标签列（如 device_code）时
+应查询子表所属的超级表，见 TableResolution.with_tags()。
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from app.core.redis_cache import redis_cache_manager
+from app.core.tdengine_connector import TDengineConnector
+from app.log import logger
+from app.models.device import DeviceInfo, DeviceType
+
+
+KIND_SUBTABLE = "subtable"
+KIND_STABLE = "stable"
+KIND_TABLE = "table"
+
+
+@dataclass(frozen=True)
+class TableResolution:
+    """设备数据所在的物理表"""
+
+    table: str
+    kind: str
+    stable: Optional[str] = None
+
+    @property
+    def from_clause(self) -> str:
+        """FROM 子句中的表名，使用反引号防止大小写与特殊字符问题"""
+        return f"`{self.table}`"
+
+    @property
+    def needs_device_filter(self) -> bool:
+        """超级表查询需要按 device_code 标签过滤"""
+        return self.kind == KIND_STABLE
+
+    def with_tags(self) -> "TableResolution":
+        """需要标签列时改查所属超级表 + device_code 标签过滤（子表 SELECT * 不含标签列）"""
+        if self.kind == KIND_SUBTABLE and self.stable:
+            return TableResolution(table=self.stable, kind=KIND_STABLE, stable=self.stable)
+        return self
+
+    def device_condition(self, device_code: str) -> Optional[str]:
+        if not self.needs_device_filter:
+            return None
+        return f"device_code = '{device_code}'"
+
+    def to_row(self) -> List[Optional[str]]:
+        return [self.table, self.kind, self.stable]
+
+    @classmethod
+    def from_row(cls, row: List[Optional[str]]) -> "TableResolution":
+        return cls(table=row[0], kind=row[1], stable=row[2] if len(row) > 2 else None)
+
+
+def candidate_table_names(device_code: str) -> List[str]:
+    """设备子表的候选命名，顺序与原探测逻辑一致"""
+    names = [
+        f"device_{device_code}",
+        f"device_{device_code.lower()}",
+        f"tb_{device_code.lower()}",
+        f"record_{device_code}",
+        device_code.lower(),
+        device_code,
+    ]
+    return list(dict.fromkeys(names))
+
+
+def guess_stable(stables: Iterable[str]) -> Optional[str]:
+    """未配置超级表时的回退：优先名称包含 meters 的超级表，否则取第一个"""
+    stables = sorted(stables)
+    for name in stables:
+        if "meters" in name:
+            return name
+    return stables[0] if stables else None
+
+
+def resolve_device_table(
+    device_code: str,
+    configured_stable: Optional[str],
+    table_index: Dict[str, Optional[str]],
+    fallback_stable: Optional[str] = None,
+) -> Optional[TableResolution]:
+    """根据表索引（表名 -> 所属超级表）解析单个设备的物理表
+
+    优先使用隶属于设备类型超级表的设备子表；其次使用设备类型配置的超级表 + 标签过滤；
+    未配置超级表时依次尝试任意命名匹配的子表/普通表与推测的超级表。
+    需要标签列的查询应再调用 TableResolution.with_tags()。
+    """
+    for name in candidate_table_names(device_code):
+        if name not in table_index:
+            continue
+        stable = table_index[name]
+        if configured_stable is None or stable == configured_stable:
+            return TableResolution(table=name, kind=KIND_SUBTABLE if stable else KIND_TABLE, stable=stable)
+
+    if configured_stable:
+        return TableResolution(table=configured_stable, kind=KIND_STABLE, stable=configured_stable)
+    if fallback_stable:
+        return TableResolution(table=fallback_stable, kind=KIND_STABLE, stable=fallback_stable)
+    return None
+
+
+class TDengineTableResolver:
+    """设备 -> TDengine 表解析器"""
+
+    cache_prefix = "tdengine_table"
+    cache_tag = "tdengine_table"
+
+    def __init__(self, cache_ttl: int = 3600, memory_ttl: float = 30.0, negative_ttl: float = 60.0):
+        self.cache_ttl = cache_ttl
+        self.memory_ttl = memory_ttl
+        self.negative_ttl = negative_ttl
+        self._connector: Optional[TDengineConnector] = None
+        self._database: Optional[str] = None
+        self._mapping: Dict[str, TableResolution] = {}
+        self._missing: Dict[str, float] = {}
+        self._loaded_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    def get_connector(self) -> TDengineConnector:
+        """共享的TDengine连接器（复用HTTP连接池，不要在调用方关闭）"""
+        if self._connector is None:
+            from app.settings.config import TDengineCredentials
+
+            creds = TDengineCredentials()
+            self._connector = TDengineConnector(
+                host=creds.host,
+                port=creds.port,
+                user=creds.user,
+                password=creds.password,
+                database=creds.database,
+            )
+            self._database = creds.database
+        return self._connector
+
+    @property
+    def database(self) -> str:
+        if self._database is None:
+            self.get_connector()
+        return self._database
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.cache_prefix}:{self.database}:snapshot"
+
+    def device_cache_key(self, device_code: str) -> str:
+        return f"{self.cache_prefix}:{self.database}:device:{device_code}"
+
+    async def _scan_tables(self, names: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+        """扫描 information_schema.ins_tables，返回 {表名: 所属超级表}；names 限定只查这些表名"""
+        sql = (
+            "SELECT table_name, stable_name FROM information_schema.ins_tables "
+            f"WHERE db_name = '{self.database}'"
+        )
+        if names:
+            sql += " AND table_name IN ({})".format(", ".join(f"'{name}'" for name in names))
+        try:
+            result = await self.get_connector().query_data(sql)
+        except Exception as e:
+            logger.warning(f"扫描TDengine表清单失败，仅使用设备类型配置的超级表: {e}")
+            return {}
+        return {row[0]: row[1] or None for row in (result or {}).get("data") or [] if row}
+
+    async def _scan_stables(self) -> List[str]:
+        """列出数据库中的超级表（用于设备类型未配置超级表时的回退推测）"""
+        sql = f"SELECT stable_name FROM information_schema.ins_stables WHERE db_name = '{self.database}'"
+        try:
+            result = await self.get_connector().query_data(sql)
+        except Exception as e:
+            logger.warning(f"查询TDengine超级表清单失败: {e}")
+            return []
+        return [row[0] for row in (result or {}).get("data") or [] if row]
+
+    async def _build_mapping(self) -> Dict[str, TableResolution]:
+        table_index = await self._scan_tables()
+        fallback = guess_stable({stable for stable in table_index.values() if stable})
+
+        type_stables = {
+            row["type_code"]: row["tdengine_stable_name"] or None
+            for row in await DeviceType.all().values("type_code", "tdengine_stable_name")
+        }
+        devices = await DeviceInfo.all().values("device_code", "device_type")
+
+        mapping = {}
+        for device in devices:
+            code = device["device_code"]
+            if not code:
+                continue
+            resolution = resolve_device_table(code, type_stables.get(device["device_type"]), table_index, fallback)
+            if resolution:
+                mapping[code] = resolution
+        logger.info(f"TDengine表映射已刷新: {len(mapping)} 个设备, {len(table_index)} 张表")
+        return mapping
+
+    async def _resolve_single(self, device_code: str) -> Optional[TableResolution]:
+        """只针对单个设备解析：查询该设备的类型配置与候选表名，不重建全量映射"""
+        device = await DeviceInfo.filter(device_code=device_code).first().values("device_type")
+        if not device:
+            return None
+
+        configured_stable = None
+        if device["device_type"]:
+            device_type = await DeviceType.filter(type_code=device["device_type"]).first().values(
+                "tdengine_stable_name"
+            )
+            configured_stable = (device_type or {}).get("tdengine_stable_name") or None
+
+        table_index = await self._scan_tables(candidate_table_names(device_code))
+        fallback = None if configured_stable else guess_stable(await self._scan_stables())
+        return resolve_device_table(device_code, configured_stable, table_index, fallback)
+
+    def _set_memory(self, mapping: Dict[str, TableResolution]) -> None:
+        self._mapping = mapping
+        self._loaded_at = time.monotonic()
+
+    async def refresh(self) -> Dict[str, TableResolution]:
+        """重建全部设备的表映射并写入Redis"""
+        async with self._refresh_lock:
+            mapping = await self._build_mapping()
+            self._set_memory(mapping)
+            await redis_cache_manager.set(
+                self.cache_key,
+                {code: resolution.to_row() for code, resolution in mapping.items()},
+                ttl=self.cache_ttl,
+                tags=[self.cache_tag],
+            )
+            return mapping
+
+    async def _get_mapping(self) -> Dict[str, TableResolution]:
+        if self._mapping and time.monotonic() - self._loaded_at < self.memory_ttl:
+            return self._mapping
+
+        snapshot = await redis_cache_manager.get(self.cache_key)
+        if isinstance(snapshot, dict):
+            mapping = {code: TableResolution.from_row(row) for code, row in snapshot.items()}
+            self._set_memory(mapping)
+            return mapping
+        return await self.refresh()
+
+    async def _resolve_missing(self, device_code: str) -> Optional[TableResolution]:
+        """快照中没有的设备（如其他进程新建）：单独解析并缓存，解析不到时负缓存"""
+        expires_at = self._missing.get(device_code)
+        if expires_at is not None:
+            if time.monotonic() < expires_at:
+                return None
+            del self._missing[device_code]
+
+        row = await redis_cache_manager.get(self.device_cache_key(device_code))
+        if isinstance(row, list):
+            resolution = TableResolution.from_row(row)
+        else:
+            resolution = await self._resolve_single(device_code)
+            if resolution is None:
+                self._missing[device_code] = time.monotonic() + self.negative_ttl
+                return None
+            await redis_cache_manager.set(
+                self.device_cache_key(device_code),
+                resolution.to_row(),
+                ttl=self.cache_ttl,
+                tags=[self.cache_tag],
+            )
+        self._mapping[device_code] = resolution
+        return resolution
+
+    async def resolve(self, device_code: str, include_tags: bool = True) -> Optional[TableResolution]:
+        """解析设备数据所在的表，设备不存在或没有可查询的表时返回None
+
+        Args:
+            device_code: 设备编号
+            include_tags: 查询是否需要标签列（如 SELECT * 返回 device_code）；
+                为True时子表解析为所属超级表 + 标签过滤，为False时可直接使用子表
+        """
+        mapping = await self._get_mapping()
+        resolution = mapping.get(device_code)
+        if resolution is None:
+            resolution = await self._resolve_missing(device_code)
+        if resolution is not None and include_tags:
+            resolution = resolution.with_tags()
+        return resolution
+
+    async def invalidate(self) -> None:
+        """设备新增、删除、变更类型或设备类型超级表变更后失效映射"""
+        self._mapping = {}
+        self._missing = {}
+        self._loaded_at = 0.0
+        await redis_cache_manager.invalidate_tags([self.cache_tag])
+        logger.debug("TDengine表映射缓存已失效")
+
+    async def close(self) -> None:
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+
+tdengine_table_resolver = TDengineTableResolver()
@@ -31,6 +31,28 @@ class AIModuleSettings(BaseSettings):
     ai_max_cpu_percent: int = Field(default=50, ge=1, le=100, env='AI_MAX_CPU_PERCENT')
     ai_worker_threads: int = Field(default=2, ge=1, env='AI_WORKER_THREADS')
     
+    # 在线推理
+    ai_model_cache_size: int = Field(default=8, ge=1, env='AI_MODEL_CACHE_SIZE')
+    ai_predict_max_batch_rows: int = Field(default=4096, ge=1, env='AI_PREDICT_MAX_BATCH_ROWS')
+    ai_predict_max_wait_ms: float = Field(default=5.0, ge=0, env='AI_PREDICT_MAX_WAIT_MS')
+    
+    # CPU密集计算进程池
+    ai_cpu_workers: int = Field(default=2, ge=1, env='AI_CPU_WORKERS')
+    ai_cpu_max_queue: int = Field(default=32, ge=0, env='AI_CPU_MAX_QUEUE')
+    ai_cpu_task_timeout: float = Field(default=60.0, gt=0, env='AI_CPU_TASK_TIMEOUT')
+    ai_cpu_share_threshold_kb: int = Field(default=1024, ge=0, env='AI_CPU_SHARE_THRESHOLD_KB')
+    ai_cpu_start_method: str = Field(default='spawn', env='AI_CPU_START_METHOD')
+    
+    # 趋势预测模型缓存
+    ai_forecast_cache_size: int = Field(default=5000, ge=1, env='AI_FORECAST_CACHE_SIZE')
+    ai_forecast_max_history: int = Field(default=2000, ge=10, env='AI_FORECAST_MAX_HISTORY')
+    ai_forecast_refit_ratio: float = Field(default=0.25, gt=0, env='AI_FORECAST_REFIT_RATIO')
+    ai_forecast_order_selection_interval_minutes: int = Field(default=360, ge=1, env='AI_FORECAST_ORDER_SELECTION_INTERVAL_MINUTES')
+    
+    # 设备群健康评分
+    ai_health_scoring_interval_minutes: int = Field(default=60, ge=1, env='AI_HEALTH_SCORING_INTERVAL_MINUTES')
+    ai_health_scoring_window_hours: float = Field(default=24.0, gt=0, env='AI_HEALTH_SCORING_WINDOW_HOURS')
+    
     # 路径配置
     ai_models_path: str = Field(default='./data/ai_models', env='AI_MODELS_PATH')
     
@@ -245,6 +245,11 @@ class Settings(BaseSettings):
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=60 * 24 * 7)  # 7 day default
     DATETIME_FORMAT: str = Field(default="%Y-%m-%d %H:%M:%S")
     
+    # 性能埋点配置
+    METRICS_ENABLED: bool = Field(default=True, description="是否记录路由与查询耗时直方图")
+    METRICS_MAX_SERIES: int = Field(default=500, description="每个指标的标签组合上限")
+    METRICS_TOKEN: str = Field(default="", description="Prometheus抓取用的静态Bearer令牌，为空时仅超级管理员可访问")
+    
 
     
     @property
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+权限匹配基准测试
+
+对比逐条正则+分段比较的原匹配方式与编译型路径前缀树，
+覆盖 1,000 / 5,000 / 20,000 条API授权的用户，并校验两者结果一致。
+
+用法:
+    python scripts/benchmarks/bench_permission_matcher.py [--grants 1000 5000] [--checks 2000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.core.permission_matcher import CompiledMatcherCache, PermissionGrants, compile_permissions  # noqa: E402
+
+METHODS = ["GET", "POST", "PUT", "DELETE", "PATCH"]
+_PATTERN = re.compile(r'^(GET|POST|PUT|DELETE|PATCH)\s+(.+)$')
+
+
+def legacy_match_path(target_path: str, pattern_path: str) -> bool:
+    """原 PermissionService._match_path_pattern 逻辑"""
+    if target_path == pattern_path:
+        return True
+    pattern_parts = pattern_path.split('/')
+    target_parts = target_path.split('/')
+    if len(pattern_parts) != len(target_parts):
+        if pattern_path.endswith('/*'):
+            return target_path.startswith(pattern_path[:-2])
+        return False
+    for pattern_part, target_part in zip(pattern_parts, target_parts):
+        if pattern_part.startswith('{') and pattern_part.endswith('}'):
+            continue
+        elif pattern_part == '*':
+            continue
+        elif pattern_part != target_part:
+            return False
+    return True
+
+
+def legacy_has_permission(permission: str, user_permissions) -> bool:
+    """原 has_permission：列表精确匹配 + 逐条正则模式匹配"""
+    if permission in user_permissions:
+        return True
+    match = _PATTERN.match(permission)
+    if not match:
+        return False
+    target_method, target_path = match.groups()
+    for user_perm in user_permissions:
+        perm_match = _PATTERN.match(user_perm)
+        if not perm_match:
+            continue
+        perm_method, perm_path = perm_match.groups()
+        if target_method != perm_method:
+            continue
+        if legacy_match_path(target_path, perm_path):
+            return True
+    return False
+
+
+def generate_grants(count: int, rng: random.Random):
+    """生成与系统API形态相近的授权：资源/子资源/{id}/动作，少量 /* 前缀授权"""
+    grants = set()
+    while len(grants) < count:
+        module = f"m{rng.randrange(40)}"
+        resource = f"r{rng.randrange(60)}"
+        method = rng.choice(METHODS)
+        shape = rng.random()
+        if shape < 0.35:
+            path = f"/api/v2/{module}/{resource}"
+        elif shape < 0.7:
+            path = f"/api/v2/{module}/{resource}/{{id}}"
+        elif shape < 0.95:
+            path = f"/api/v2/{module}/{resource}/{{id}}/a{rng.randrange(8)}"
+        else:
+            path = f"/api/v2/{module}/{resource}/*"
+        grants.add(f"{method} {path}")
+    return list(grants)
+
+
+def generate_checks(count: int, grants, rng: random.Random):
+    """一半来自授权（参数替换为具体值），一半为随机请求（多数无权限）"""
+    checks = []
+    for i in range(count):
+        if i % 2 == 0:
+            method, path = rng.choice(grants).split(" ", 1)
+            path = path.replace("{id}", str(rng.randrange(1, 100000))).replace("*", f"x{rng.randrange(9)}")
+        else:
+            method = rng.choice(METHODS)
+            path = f"/api/v2/m{rng.randrange(50)}/r{rng.randrange(70)}/{rng.randrange(1000)}"
+        checks.append(f"{method} {path}")
+    return checks
+
+
+def bench(label: str, func, checks, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for check in checks:
+            func(check)
+    elapsed = time.perf_counter() - start
+    per_check_us = elapsed / (repeat * len(checks)) * 1e6
+    print(f"  {label:<28} {per_check_us:>10.2f} µs/次")
+    return per_check_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="权限匹配基准测试")
+    parser.add_argument("--grants", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--checks", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for count in args.grants:
+        grants = generate_grants(count, rng)
+        checks = generate_checks(args.checks, grants, rng)
+        print(f"授权数量 {count}，检查 {len(checks)} 次 × {args.repeat}")
+
+        start = time.perf_counter()
+        matcher = compile_permissions(grants)
+        print(f"  {'编译耗时':<28} {(time.perf_counter() - start) * 1000:>10.2f} ms")
+
+        mismatches = [c for c in checks if matcher.matches(c) != legacy_has_permission(c, grants)]
+        if mismatches:
+            print(f"  结果不一致 {len(mismatches)} 条，例如: {mismatches[:3]}")
+            sys.exit(1)
+
+        legacy = bench("原实现（逐条正则）", lambda c: legacy_has_permission(c, grants), checks, args.repeat)
+        compiled = bench("编译前缀树", matcher.matches, checks, args.repeat)
+
+        cache = CompiledMatcherCache()
+        versioned = PermissionGrants.build(grants)
+        cache.get("user:1", versioned)
+        cached = bench("前缀树 + 版本校验", lambda c: cache.get("user:1", versioned).matches(c), checks, args.repeat)
+        print(f"  加速比: {legacy / compiled:.1f}x（含每次版本校验 {legacy / cached:.1f}x）\n")
+
+
+if __name__ == "__main__":
+    main()
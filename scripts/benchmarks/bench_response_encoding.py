@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+v2 响应编码基准测试
+
+对比原 ResponseFormatterV2.success 的三次编码
+（model_dump → json.dumps(default) → json.loads → JSONResponse 再次 json.dumps）
+与当前 orjson 单次编码，数据为含 datetime / Decimal 字段的设备列表，
+输出每次响应的耗时、CPU时间与响应体大小，并校验两者解码结果一致。
+
+用法:
+    python scripts/benchmarks/bench_response_encoding.py [--rows 1000 10000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.core.response_formatter_v2 import APIv2Response, ResponseFormatterV2  # noqa: E402
+
+
+def generate_devices(count: int, rng: random.Random):
+    """生成与设备列表接口形态相近的行"""
+    base = datetime(2024, 1, 1)
+    return [
+        {
+            "id": i,
+            "device_code": f"DEV{i:06d}",
+            "device_name": f"焊机-{i}",
+            "device_type": rng.choice(["welding", "cutting", "press"]),
+            "status": rng.choice(["online", "offline", "fault"]),
+            "rated_power": Decimal(f"{rng.uniform(1, 50):.2f}"),
+            "voltage": round(rng.uniform(200, 240), 2),
+            "location": None if i % 7 == 0 else f"车间{i % 12}",
+            "install_date": base - timedelta(days=rng.randrange(2000)),
+            "created_at": base + timedelta(seconds=i),
+            "updated_at": base + timedelta(seconds=i * 3),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_success(formatter: ResponseFormatterV2, data) -> bytes:
+    """原 success 实现（去掉请求相关部分）"""
+    response_data = APIv2Response(
+        success=True, code=200, message="操作成功", data=data, meta=formatter.create_meta()
+    )
+
+    def datetime_serializer(obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        if isinstance(obj, Decimal):
+            return float(obj)
+        raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+    content = response_data.model_dump(exclude_none=True)
+    return JSONResponse(content=json.loads(json.dumps(content, default=datetime_serializer))).body
+
+
+def current_success(formatter: ResponseFormatterV2, data) -> bytes:
+    return formatter.success(data=data).body
+
+
+def bench(label: str, func, repeat: int) -> float:
+    func()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        body = func()
+    wall_ms = (time.perf_counter() - wall_start) / repeat * 1000
+    cpu_ms = (time.process_time() - cpu_start) / repeat * 1000
+    print(f"  {label:<24} {wall_ms:>9.2f} ms/次  CPU {cpu_ms:>9.2f} ms  {len(body) / 1024:>9.1f} KiB")
+    return wall_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="v2 响应编码基准测试")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    formatter = ResponseFormatterV2()
+    for count in args.rows:
+        devices = generate_devices(count, rng)
+        print(f"设备行数 {count}，重复 {args.repeat} 次")
+
+        legacy_body = json.loads(legacy_success(formatter, devices))
+        current_body = json.loads(current_success(formatter, devices))
+        for body in (legacy_body, current_body):
+            body.pop("meta")
+        if legacy_body != current_body:
+            print("  结果不一致")
+            sys.exit(1)
+
+        legacy = bench("原实现（三次编码）", lambda: legacy_success(formatter, devices), args.repeat)
+        current = bench("orjson 单次编码", lambda: current_success(formatter, devices), args.repeat)
+        print(f"  加速比: {legacy / current:.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+遥测主链路基准测试：采集 → 转换 → 报警检测 → 报警记录 → WebSocket 广播
+
+每个周期（tick）模拟 N 台设备 × M 个字段的一帧数据：
+  1. fetch      经 TDengineConnector 向本地伪造的 TDengine REST 服务查询最新一帧并解析
+  2. transform  TransformEngine.batch_transform 逐设备应用字段转换规则
+  3. detect     AlarmDetectionEngine.check_device_data 逐设备检测（不含报警记录创建）
+  4. record     报警记录与报警通知写库（check_device_data 内部的 _create_alarm_record）
+  5. broadcast  broadcast_new_alarms 经 AlarmWebSocketManager 推送，直至所有模拟连接收到报警帧
+
+Postgres 默认以进程内 SQLite（sqlite://:memory:）代替，也可通过 --db-url 指向临时 Postgres 库；
+伪造的 TDengine 服务运行在独立线程的事件循环中，响应体在启动时预先生成，不计入被测耗时。
+
+输出各阶段吞吐、每周期 p50/p99 延迟，以及单独一轮 tracemalloc 测得的每周期内存分配峰值。
+与已保存的基线比较：延迟或分配增长、吞吐下降超过容差时以退出码 1 结束，供 CI 使用。
+基线不存在时以退出码 3 结束（避免CI在无基线时静默通过），只有 --update-baseline 才会写入基线。
+
+基线与机器相关，不随仓库提供默认值，需在 CI 机器上以 CI 使用的同一组参数生成并提交：
+    python scripts/benchmarks/bench_telemetry_pipeline.py --update-baseline
+    git add scripts/benchmarks/baselines/telemetry_pipeline.json
+硬件、Python 版本或被测链路有意变化后，同样用 --update-baseline 重新生成。
+
+退出码: 0 无退化 / 已更新基线；1 性能回归；2 参数与基线不一致；3 基线不存在
+
+用法:
+    python scripts/benchmarks/bench_telemetry_pipeline.py [--devices 200] [--fields 20] [--ticks 30]
+        [--clients 50] [--alarm-ratio 0.005] [--rate 0] [--db-url sqlite://:memory:]
+        [--baseline scripts/benchmarks/baselines/telemetry_pipeline.json] [--update-baseline] [--tolerance 0.3]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ.setdefault("SECRET_KEY", "telemetry-benchmark")
+
+from loguru import logger as loguru_logger  # noqa: E402
+from tortoise import Tortoise  # noqa: E402
+
+from app.core.instrumentation import LatencyHistogram  # noqa: E402
+from app.core.tdengine_connector import TDengineConnector  # noqa: E402
+from app.models.alarm import AlarmRecord, AlarmRule  # noqa: E402
+from app.models.device import DeviceField  # noqa: E402
+from app.services.alarm_detection import AlarmDetectionEngine  # noqa: E402
+from app.services.alarm_websocket import alarm_ws_manager, broadcast_new_alarms  # noqa: E402
+from app.services.transform_engine import TransformEngine  # noqa: E402
+from app.settings.config import settings  # noqa: E402
+
+DEVICE_TYPE = "bench_welder"
+DATABASE = "bench"
+WARNING_MAX = 100.0
+STAGES = ("fetch", "transform", "detect", "record", "broadcast")
+# 基线比较的指标：(名称, 方向) —— higher 表示越大越差
+COMPARED = (("p99_ms", "higher"), ("throughput", "lower"), ("alloc_peak_kib", "higher"))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "telemetry_pipeline.json")
+
+# 字段转换规则按列轮换，覆盖常见转换类型；系数为 1 以保持报警阈值含义不变
+TRANSFORM_RULES = [
+    None,
+    {"type": "expression", "expression": "value * 1.0"},
+    {"type": "range_limit", "min": 0, "max": 1000},
+    {"type": "unit", "from_unit": "A", "to_unit": "A", "factor": 1.0},
+    {"type": "round"},
+]
+
+
+# ---------- 伪造的 TDengine REST 服务 ----------
+
+class FakeTDengineServer:
+    """本地 TDengine REST 替身：每次查询按顺序返回预生成的一帧（N 台设备的最新一行）"""
+
+    def __init__(self, devices: int, fields: int, alarm_ratio: float, seed: int, frames: int = 16):
+        rng = random.Random(seed)
+        column_meta = [["ts", "TIMESTAMP", 8], ["device_code", "VARCHAR", 64]]
+        column_meta += [[f"col_{j}", "DOUBLE", 8] for j in range(fields)]
+        self.payloads: List[bytes] = []
+        for frame in range(frames):
+            ts = datetime.now().isoformat(timespec="milliseconds")
+            data = []
+            for i in range(devices):
+                row: List[Any] = [ts, f"BENCH{i:05d}"]
+                for _ in range(fields):
+                    if rng.random() < alarm_ratio:
+                        row.append(round(rng.uniform(WARNING_MAX + 1, WARNING_MAX * 1.2), 4))
+                    else:
+                        row.append(round(rng.uniform(20, 80), 4))
+                data.append(row)
+            body = json.dumps({"code": 0, "column_meta": column_meta, "data": data, "rows": len(data)})
+            self.payloads.append(body.encode())
+        self.requests = 0
+        self.port: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fake-tdengine", daemon=True)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        server.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+                payload = self.payloads[self.requests % len(self.payloads)]
+                self.requests += 1
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> int:
+        self._thread.start()
+        self._ready.wait()
+        return self.port
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+def parse_rows(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """TDengine REST 响应转为行字典（与 DataQueryService._parse_tdengine_response 一致）"""
+    if not response or response.get("code") != 0:
+        return []
+    columns = [column[0] for column in response.get("column_meta", [])]
+    return [dict(zip(columns, row)) for row in response.get("data", [])]
+
+
+# ---------- 模拟 WebSocket 连接 ----------
+
+class FrameTracker:
+    """统计本周期报警帧送达情况：所有连接都收到后置位"""
+
+    def __init__(self, clients: int):
+        self.clients = clients
+        self.received = 0
+        self.done = asyncio.Event()
+
+    def reset(self) -> None:
+        self.received = 0
+        self.done.clear()
+
+    def on_frame(self) -> None:
+        self.received += 1
+        if self.received >= self.clients:
+            self.done.set()
+
+
+class FakeWebSocket:
+    """只记录报警帧的 WebSocket 替身"""
+
+    def __init__(self, tracker: FrameTracker):
+        self.tracker = tracker
+        self.bytes_received = 0
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, message: str) -> None:
+        self.bytes_received += len(message)
+        if message.startswith('{"type": "alarm'):
+            self.tracker.on_frame()
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+# ---------- 链路 ----------
+
+class StageStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.seconds = 0.0
+        self.items = 0
+        self.alloc_peak = 0
+
+    def record(self, seconds: float, items: int) -> None:
+        self.latency.record(seconds)
+        self.seconds += seconds
+        self.items += items
+
+    def summary(self) -> Dict[str, float]:
+        p50, p99 = self.latency.quantiles((0.5, 0.99))
+        return {
+            "items": self.items,
+            "throughput": round(self.items / self.seconds, 1) if self.seconds else 0.0,
+            "p50_ms": round(p50 * 1000, 3),
+            "p99_ms": round(p99 * 1000, 3),
+            "alloc_peak_kib": round(self.alloc_peak / 1024, 1),
+        }
+
+
+class Pipeline:
+    def __init__(self, args: argparse.Namespace, port: int):
+        self.args = args
+        self.connector = TDengineConnector(host="127.0.0.1", port=port, database=DATABASE)
+        self.transform_engine = TransformEngine()
+        self.alarm_engine = AlarmDetectionEngine()
+        self.field_mappings = [
+            {
+                "field_code": f"field_{j}",
+                "tdengine_column": f"col_{j}",
+                "transform_rule": TRANSFORM_RULES[j % len(TRANSFORM_RULES)],
+            }
+            for j in range(args.fields)
+        ]
+        self.sql = f"SELECT LAST_ROW(*) FROM {DATABASE}.{DEVICE_TYPE} GROUP BY device_code"
+        self.tracker = FrameTracker(args.clients)
+        self.stats = {stage: StageStats() for stage in STAGES}
+        self.alarms_total = 0
+        self._record_seconds = 0.0
+        self._record_count = 0
+
+        # 报警记录创建在 check_device_data 内部，单独计时后从检测阶段扣除
+        create_alarm_record = self.alarm_engine._create_alarm_record
+
+        async def timed_create_alarm_record(**kwargs):
+            started = time.perf_counter()
+            try:
+                return await create_alarm_record(**kwargs)
+            finally:
+                self._record_seconds += time.perf_counter() - started
+                self._record_count += 1
+
+        self.alarm_engine._create_alarm_record = timed_create_alarm_record
+
+    async def seed(self) -> None:
+        await AlarmRecord.filter(device_type_code=DEVICE_TYPE).delete()
+        await AlarmRule.filter(device_type_code=DEVICE_TYPE).delete()
+        await DeviceField.filter(device_type_code=DEVICE_TYPE).delete()
+        # bulk_create 不经过 TimestampMixin.save，时间戳需显式赋值
+        now = datetime.now()
+        await DeviceField.bulk_create([
+            DeviceField(
+                device_type_code=DEVICE_TYPE,
+                field_code=f"field_{j}",
+                field_name=f"字段{j}",
+                field_type="float",
+                is_alarm_enabled=True,
+                created_at=now,
+                updated_at=now,
+            )
+            for j in range(self.args.fields)
+        ])
+        await AlarmRule.bulk_create([
+            AlarmRule(
+                rule_name=f"基准规则{j}",
+                rule_code=f"bench_rule_{j}",
+                device_type_code=DEVICE_TYPE,
+                field_code=f"field_{j}",
+                field_name=f"字段{j}",
+                threshold_config={"type": "upper", "warning": {"max": WARNING_MAX}},
+                trigger_condition={"consecutive_count": 1},
+                trigger_config={"auto_recover": True, "auto_recovery_count": 3},
+                notification_config={"silent_period": 0},
+                created_at=now,
+                updated_at=now,
+            )
+            for j in range(self.args.fields)
+        ])
+        await self.alarm_engine.load_rules(force=True)
+
+    async def connect_clients(self) -> None:
+        for user_id in range(1, self.args.clients + 1):
+            await alarm_ws_manager.connect(FakeWebSocket(self.tracker), user_id=user_id)
+
+    async def _stage(self, name: str, func: Callable, trace_alloc: bool):
+        if trace_alloc:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        result = await func()
+        elapsed = time.perf_counter() - started
+        if trace_alloc:
+            peak = tracemalloc.get_traced_memory()[1] - base
+            self.stats[name].alloc_peak = max(self.stats[name].alloc_peak, peak)
+        return result, elapsed
+
+    async def tick(self, record: bool = True, trace_alloc: bool = False) -> None:
+        async def fetch():
+            return parse_rows(await self.connector.query_data(self.sql, db_name=DATABASE))
+
+        rows, fetch_seconds = await self._stage("fetch", fetch, trace_alloc)
+
+        async def transform():
+            return [
+                (row["device_code"], self.transform_engine.batch_transform(row, self.field_mappings))
+                for row in rows
+            ]
+
+        frames, transform_seconds = await self._stage("transform", transform, trace_alloc)
+
+        async def detect():
+            alarms = []
+            for device_code, data in frames:
+                alarms.extend(await self.alarm_engine.check_device_data(
+                    device_code=device_code,
+                    device_name=device_code,
+                    device_type_code=DEVICE_TYPE,
+                    data=data,
+                ))
+            return alarms
+
+        self._record_seconds = 0.0
+        self._record_count = 0
+        alarms, detect_seconds = await self._stage("detect", detect, trace_alloc)
+        for alarm in alarms:
+            alarm["device_type_code"] = DEVICE_TYPE
+
+        async def broadcast():
+            if not alarms:
+                return 0
+            self.tracker.reset()
+            await broadcast_new_alarms(alarms)
+            await asyncio.wait_for(self.tracker.done.wait(), timeout=10)
+            return len(alarms)
+
+        _, broadcast_seconds = await self._stage("broadcast", broadcast, trace_alloc)
+
+        if not record:
+            return
+        self.alarms_total += len(alarms)
+        values = len(rows) * self.args.fields
+        self.stats["fetch"].record(fetch_seconds, len(rows))
+        self.stats["transform"].record(transform_seconds, values)
+        self.stats["detect"].record(detect_seconds - self._record_seconds, values)
+        if self._record_count:
+            self.stats["record"].record(self._record_seconds, self._record_count)
+        if alarms:
+            self.stats["broadcast"].record(broadcast_seconds, len(alarms))
+
+    async def close(self) -> None:
+        for websocket in list(alarm_ws_manager.clients):
+            alarm_ws_manager.disconnect(websocket)
+        await self.connector.close()
+
+
+# ---------- 基线 ----------
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """返回超出容差的回归项"""
+    regressions = []
+    for stage in STAGES:
+        now, before = current["stages"].get(stage), baseline["stages"].get(stage)
+        if not now or not before or not now["items"] or not before["items"]:
+            continue
+        for metric, direction in COMPARED:
+            old, new = before.get(metric, 0), now.get(metric, 0)
+            if not old:
+                continue
+            change = (new - old) / old
+            if (direction == "higher" and change > tolerance) or (direction == "lower" and -change > tolerance):
+                regressions.append(f"{stage}.{metric}: {old} → {new} ({change:+.1%})")
+    return regressions
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    params = result["params"]
+    print(
+        f"设备 {params['devices']} × 字段 {params['fields']}，{params['ticks']} 个周期，"
+        f"{params['clients']} 个WebSocket连接，共触发报警 {result['alarms']} 条"
+    )
+    print(f"  {'阶段':<10} {'处理量':>9} {'吞吐/秒':>12} {'p50 ms':>10} {'p99 ms':>10} {'分配峰值 KiB':>14}")
+    for stage in STAGES:
+        summary = result["stages"][stage]
+        line = (
+            f"  {stage:<12} {summary['items']:>9} {summary['throughput']:>12.1f} "
+            f"{summary['p50_ms']:>10.3f} {summary['p99_ms']:>10.3f} {summary['alloc_peak_kib']:>14.1f}"
+        )
+        before = (baseline or {}).get("stages", {}).get(stage)
+        if before and before.get("p99_ms"):
+            line += f"   基线 p99 {before['p99_ms']:.3f}"
+        print(line)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server = FakeTDengineServer(args.devices, args.fields, args.alarm_ratio, args.seed)
+    port = server.start()
+
+    model_modules = [module for module in settings.tortoise_orm.apps.models.models if module != "aerich.models"]
+    await Tortoise.init(
+        db_url=args.db_url,
+        modules={"models": model_modules},
+        use_tz=settings.tortoise_orm.use_tz,
+        timezone=settings.tortoise_orm.timezone,
+    )
+    await Tortoise.generate_schemas(safe=True)
+
+    pipeline = Pipeline(args, port)
+    try:
+        await pipeline.seed()
+        await pipeline.connect_clients()
+
+        for _ in range(args.warmup):
+            await pipeline.tick(record=False)
+
+        interval = 1.0 / args.rate if args.rate else 0.0
+        lagging = 0
+        for _ in range(args.ticks):
+            started = time.perf_counter()
+            await pipeline.tick()
+            if interval:
+                remaining = interval - (time.perf_counter() - started)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                else:
+                    lagging += 1
+
+        # 分配统计单独运行，避免 tracemalloc 的开销影响耗时数据
+        if args.alloc_ticks:
+            tracemalloc.start()
+            try:
+                for _ in range(args.alloc_ticks):
+                    await pipeline.tick(record=False, trace_alloc=True)
+            finally:
+                tracemalloc.stop()
+    finally:
+        await pipeline.close()
+        await Tortoise.close_connections()
+        server.stop()
+
+    return {
+        "params": {
+            "devices": args.devices,
+            "fields": args.fields,
+            "ticks": args.ticks,
+            "clients": args.clients,
+            "alarm_ratio": args.alarm_ratio,
+            "rate": args.rate,
+            "seed": args.seed,
+            "db": args.db_url.split(":", 1)[0],
+        },
+        "environment": environment(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "alarms": pipeline.alarms_total,
+        "lagging_ticks": lagging,
+        "stages": {stage: pipeline.stats[stage].summary() for stage in STAGES},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="遥测主链路基准测试")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--ticks", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--alloc-ticks", type=int, default=5, help="tracemalloc 分配统计的周期数，0 关闭")
+    parser.add_argument("--clients", type=int, default=50, help="模拟的 WebSocket 连接数")
+    parser.add_argument("--alarm-ratio", type=float, default=0.005, help="单个字段值超出报警阈值的概率")
+    parser.add_argument("--rate", type=float, default=0, help="每秒周期数；0 表示不限速连续运行")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-url", default="sqlite://:memory:", help="Postgres 替身，可指向临时 Postgres 库")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="以本次结果写入/覆盖基线（基线不存在时必须指定）")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="允许的相对退化比例")
+    parser.add_argument("--json", help="另存本次结果的路径")
+    parser.add_argument("--verbose", action="store_true", help="输出应用日志")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        loguru_logger.remove()
+        loguru_logger.add(sys.stderr, level="ERROR")
+        logging.basicConfig(level=logging.ERROR)
+
+    baseline = None
+    if not args.update_baseline:
+        if not os.path.exists(args.baseline):
+            print(f"基线不存在: {args.baseline}\n请在CI机器上使用 --update-baseline 生成并提交基线")
+            sys.exit(3)
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    result = asyncio.run(run(args))
+
+    print_report(result, baseline)
+    if result["lagging_ticks"]:
+        print(f"  {result['lagging_ticks']} 个周期超出 {1 / args.rate:.3f}s 的节拍")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n已记录基线: {args.baseline}")
+        return
+
+    if baseline["params"] != result["params"]:
+        print(f"\n参数与基线不一致，无法比较：基线 {baseline['params']}")
+        sys.exit(2)
+    if baseline.get("environment") != result["environment"]:
+        print(f"\n警告：运行环境与基线不同（基线 {baseline.get('environment')}），结果仅供参考")
+
+    regressions = compare(result, baseline, args.tolerance)
+    if regressions:
+        print(f"\n性能回归（容差 {args.tolerance:.0%}）:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\n与基线相比无超过 {args.tolerance:.0%} 的退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+批量删除服务测试：集合模式（bulk=True）与逐条模式的结果对比
+
+每次运行使用全新的 SQLite 内存库，按相同数据与相同ID列表分别执行两种模式，
+比较返回的成功/失败项目（含失败原因）以及删除后的数据状态。
+"""
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import pytest  # noqa: E402
+from tortoise import Tortoise  # noqa: E402
+
+from app.models.admin import Dept, Menu, Role, SysApiEndpoint, SysApiGroup, User  # noqa: E402
+from app.models.system import SysDictData, SysDictType, TSysConfig  # noqa: E402
+from app.services.batch_delete_service import (  # noqa: E402
+    UserFriendlyErrorMessages,
+    api_batch_delete_service,
+    api_group_batch_delete_service,
+    department_batch_delete_service,
+    dict_data_batch_delete_service,
+    dict_type_batch_delete_service,
+    menu_batch_delete_service,
+    role_batch_delete_service,
+    system_param_batch_delete_service,
+    user_batch_delete_service,
+)
+
+MISSING_ID = 9999
+
+
+def _run(seed, snapshot, service, names, bulk, **kwargs):
+    """在全新数据库中初始化数据并执行一次批量删除，返回 (结果, 删除后状态)"""
+
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models"]})
+        try:
+            await Tortoise.generate_schemas()
+            refs = await seed()
+            ids = [refs.get(name, MISSING_ID) for name in names]
+            if callable(kwargs.get("current_user")):
+                kwargs["current_user"] = kwargs["current_user"](refs)
+            result = await service.batch_delete(ids, bulk=bulk, **kwargs)
+            return result, await snapshot()
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(main())
+
+
+def _summary(result):
+    return (
+        [(item.id, item.name) for item in result.deleted],
+        [(item.id, item.name, item.reason) for item in result.failed],
+    )
+
+
+def _compare(seed, snapshot, service, names, **kwargs):
+    """两种模式的返回与最终数据一致，返回集合模式的结果"""
+    bulk_result, bulk_state = _run(seed, snapshot, service, names, bulk=True, **kwargs)
+    each_result, each_state = _run(seed, snapshot, service, names, bulk=False, **kwargs)
+    assert _summary(bulk_result) == _summary(each_result)
+    assert bulk_result.deleted_count == each_result.deleted_count
+    assert bulk_result.failed_count == each_result.failed_count
+    assert bulk_state == each_state
+    return bulk_result, bulk_state
+
+
+def _ids_of(model, **filters):
+    async def snapshot():
+        return sorted(await model.filter(**filters).values_list("id", flat=True))
+    return snapshot
+
+
+def _reasons(result):
+    return {item.name: item.reason for item in result.failed}
+
+
+# ---------------------------------------------------------------- 用户
+
+async def _seed_users():
+    refs = {}
+    for name, user_type in [("current", "00"), ("admin", "00"), ("root", "01"), ("alice", "00"), ("bob", "00")]:
+        user = await User.create(username=name, email=f"{name}@example.com", user_type=user_type)
+        refs[name] = user.id
+    return refs
+
+
+def test_user_bulk_matches_per_item():
+    result, remaining = _compare(
+        _seed_users,
+        _ids_of(User),
+        user_batch_delete_service,
+        ["current", "admin", "root", "alice", "missing", "bob"],
+        current_user=lambda refs: SimpleNamespace(id=refs["current"]),
+    )
+    assert [item.name for item in result.deleted] == ["alice", "bob"]
+    assert _reasons(result) == {
+        "current": UserFriendlyErrorMessages.CURRENT_USER_PROTECTION,
+        "admin": UserFriendlyErrorMessages.ADMIN_USER_PROTECTION,
+        "root": UserFriendlyErrorMessages.SUPERUSER_PROTECTION,
+        None: UserFriendlyErrorMessages.ITEM_NOT_FOUND,
+    }
+    assert len(remaining) == 3
+
+
+# ---------------------------------------------------------------- 角色
+
+async def _seed_roles():
+    api = await SysApiEndpoint.create(api_code="a1", api_name="接口", api_path="/api/v2/x", http_method="GET")
+    menu = await Menu.create(name="菜单")
+    refs = {}
+    for name in ["in_use", "free", "linked"]:
+        role = await Role.create(role_name=name)
+        refs[name] = role.id
+    user = await User.create(username="member", email="member@example.com")
+    await user.roles.add(await Role.get(id=refs["in_use"]))
+    linked = await Role.get(id=refs["linked"])
+    await linked.apis.add(api)
+    await linked.menus.add(menu)
+    return refs
+
+
+async def _role_state():
+    linked = await Role.filter(role_name="linked").first()
+    return {
+        "roles": sorted(await Role.all().values_list("role_name", flat=True)),
+        "linked_apis": await linked.apis.all().count() if linked else 0,
+        "api_rows": (await Tortoise.get_connection("default").execute_query_dict(
+            'SELECT COUNT(*) AS n FROM "t_sys_role_api"'))[0]["n"],
+        "menu_rows": (await Tortoise.get_connection("default").execute_query_dict(
+            'SELECT COUNT(*) AS n FROM "t_sys_role_menu"'))[0]["n"],
+    }
+
+
+def test_role_bulk_matches_per_item():
+    result, state = _compare(_seed_roles, _role_state, role_batch_delete_service, ["in_use", "free", "linked"])
+    assert _reasons(result) == {
+        "in_use": UserFriendlyErrorMessages.format_message(
+            UserFriendlyErrorMessages.ROLE_HAS_USERS, name="in_use", count=1
+        ),
+    }
+    assert state == {"roles": ["in_use"], "linked_apis": 0, "api_rows": 0, "menu_rows": 0}
+
+
+# ---------------------------------------------------------------- 部门
+
+async def _seed_departments():
+    root = await Dept.create(dept_name="总部")
+    child = await Dept.create(dept_name="研发部", parent_id=root.id)
+    grandchild = await Dept.create(dept_name="平台组", parent_id=child.id)
+    staffed = await Dept.create(dept_name="销售部", parent_id=root.id)
+    await User.create(username="seller", email="seller@example.com", dept_id=staffed.id)
+    empty = await Dept.create(dept_name="空部门")
+    return {"root": root.id, "child": child.id, "grandchild": grandchild.id, "staffed": staffed.id, "empty": empty.id}
+
+
+async def _department_state():
+    return sorted(await Dept.filter(del_flag="0").values_list("dept_name", flat=True))
+
+
+def test_department_bulk_matches_per_item_with_children_first():
+    # 子部门在前时逐条模式也能删除父部门，两种模式结果一致
+    result, state = _compare(
+        _seed_departments, _department_state, department_batch_delete_service,
+        ["grandchild", "child", "staffed", "empty", "missing"],
+    )
+    assert [item.name for item in result.deleted] == ["平台组", "研发部", "空部门"]
+    assert _reasons(result)["销售部"] == UserFriendlyErrorMessages.format_message(
+        UserFriendlyErrorMessages.DEPARTMENT_HAS_USERS, name="销售部", count=1
+    )
+    assert state == ["总部", "销售部"]
+
+
+def test_department_bulk_deletes_parent_listed_before_its_children():
+    result, state = _run(
+        _seed_departments, _department_state, department_batch_delete_service,
+        ["child", "grandchild"], bulk=True,
+    )
+    assert result.deleted_count == 2 and result.failed_count == 0
+    assert state == ["总部", "空部门", "销售部"]
+
+    # 子部门自身被拒绝时父部门随之被拒绝
+    result, state = _run(
+        _seed_departments, _department_state, department_batch_delete_service,
+        ["root", "child", "grandchild"], bulk=True,
+    )
+    assert [item.name for item in result.deleted] == ["研发部", "平台组"]
+    assert _reasons(result) == {
+        "总部": UserFriendlyErrorMessages.format_message(
+            UserFriendlyErrorMessages.DEPARTMENT_HAS_CHILDREN, name="总部", count=1
+        ),
+    }
+
+
+def test_department_force_matches_per_item():
+    result, state = _compare(
+        _seed_departments, _department_state, department_batch_delete_service,
+        ["root", "staffed"], force=True,
+    )
+    assert result.deleted_count == 2
+    assert state == ["平台组", "研发部", "空部门"]
+
+
+# ---------------------------------------------------------------- 菜单
+
+async def _seed_menus():
+    parent = await Menu.create(name="系统管理")
+    child = await Menu.create(name="用户管理", parent_id=parent.id)
+    other = await Menu.create(name="监控", parent_id=None)
+    other_child = await Menu.create(name="告警", parent_id=other.id)
+    leaf = await Menu.create(name="关于")
+    return {"parent": parent.id, "child": child.id, "other": other.id, "other_child": other_child.id, "leaf": leaf.id}
+
+
+def test_menu_bulk_matches_per_item():
+    result, state = _compare(
+        _seed_menus, _ids_of(Menu), menu_batch_delete_service, ["child", "parent", "other", "leaf"],
+    )
+    assert [item.name for item in result.deleted] == ["用户管理", "系统管理", "关于"]
+    assert _reasons(result) == {
+        "监控": UserFriendlyErrorMessages.format_message(UserFriendlyErrorMessages.MENU_HAS_CHILDREN, name="监控", count=1),
+    }
+    assert len(state) == 2
+
+
+def test_menu_bulk_deletes_parent_listed_before_its_children():
+    result, state = _run(_seed_menus, _ids_of(Menu), menu_batch_delete_service, ["parent", "child"], bulk=True)
+    assert result.deleted_count == 2 and len(state) == 3
+
+
+def test_forced_menu_delete_matches_per_item():
+    result, state = _compare(_seed_menus, _ids_of(Menu), menu_batch_delete_service, ["parent", "other"], force=True)
+    assert result.deleted_count == 2 and result.failed_count == 0
+    # 子菜单随父菜单一起删除
+    assert len(state) == 1
+
+
+# ---------------------------------------------------------------- API分组 / API
+
+async def _seed_api_groups():
+    used = await SysApiGroup.create(group_code="used", group_name="设备接口")
+    empty = await SysApiGroup.create(group_code="empty", group_name="空分组")
+    for i in range(2):
+        await SysApiEndpoint.create(
+            api_code=f"api{i}", api_name=f"接口{i}", api_path=f"/api/v2/d/{i}", http_method="GET", group_id=used.id
+        )
+    return {"used": used.id, "empty": empty.id}
+
+
+def test_api_group_bulk_matches_per_item():
+    result, _ = _compare(_seed_api_groups, _ids_of(SysApiGroup), api_group_batch_delete_service, ["used", "empty"])
+    assert _reasons(result) == {
+        "设备接口": UserFriendlyErrorMessages.format_message(
+            UserFriendlyErrorMessages.API_GROUP_HAS_APIS, name="设备接口", count=2
+        ),
+    }
+
+
+async def _seed_apis():
+    refs = {}
+    for i in range(3):
+        api = await SysApiEndpoint.create(api_code=f"api{i}", api_name=f"接口{i}", api_path=f"/x/{i}", http_method="GET")
+        refs[f"api{i}"] = api.id
+    return refs
+
+
+def test_api_bulk_matches_per_item():
+    result, state = _compare(_seed_apis, _ids_of(SysApiEndpoint), api_batch_delete_service, ["api0", "missing", "api2"])
+    assert result.deleted_count == 2 and result.failed_count == 1
+    assert len(state) == 1
+
+
+# ---------------------------------------------------------------- 字典 / 系统参数
+
+async def _seed_dicts():
+    used = await SysDictType.create(type_code="status", type_name="状态")
+    empty = await SysDictType.create(type_code="empty", type_name="空类型")
+    data = await SysDictData.create(dict_type_id=used.id, data_label="启用", data_value="1")
+    return {"used": used.id, "empty": empty.id, "data": data.id}
+
+
+def test_dict_type_bulk_matches_per_item():
+    result, _ = _compare(_seed_dicts, _ids_of(SysDictType), dict_type_batch_delete_service, ["used", "empty"])
+    assert _reasons(result) == {
+        "状态": UserFriendlyErrorMessages.format_message(UserFriendlyErrorMessages.DICT_TYPE_HAS_DATA, name="状态", count=1),
+    }
+
+
+def test_dict_data_bulk_matches_per_item():
+    result, state = _compare(_seed_dicts, _ids_of(SysDictData), dict_data_batch_delete_service, ["data", "missing"])
+    assert result.deleted_count == 1 and state == []
+
+
+async def _seed_params():
+    refs = {}
+    for key, is_system, is_editable in [("site", False, True), ("core", True, True), ("locked", False, False)]:
+        param = await TSysConfig.create(
+            param_key=key, param_name=key, param_type="string", is_system=is_system, is_editable=is_editable
+        )
+        refs[key] = param.id
+    return refs
+
+
+def test_system_param_bulk_matches_per_item():
+    result, _ = _compare(_seed_params, _ids_of(TSysConfig), system_param_batch_delete_service, ["site", "core", "locked"])
+    assert [item.name for item in result.deleted] == ["site"]
+    assert set(_reasons(result)) == {"core", "locked"}
+
+
+# ---------------------------------------------------------------- 事务回滚
+
+class _FailingMenuService(type(menu_batch_delete_service)):
+    """删除过程中途失败的菜单服务"""
+
+    async def delete_items(self, items, connection, **kwargs):
+        await super().delete_items(items, connection, **kwargs)
+        raise RuntimeError("磁盘已满")
+
+
+def test_failed_transaction_reports_every_allowed_item_and_rolls_back():
+    result, state = _run(
+        _seed_menus, _ids_of(Menu), _FailingMenuService(), ["child", "parent", "other", "leaf"], bulk=True,
+    )
+    assert result.deleted_count == 0
+    assert _reasons(result) == {
+        "用户管理": "删除失败: 磁盘已满",
+        "系统管理": "删除失败: 磁盘已满",
+        "关于": "删除失败: 磁盘已满",
+        # 业务规则拒绝的项目保留原因
+        "监控": UserFriendlyErrorMessages.format_message(UserFriendlyErrorMessages.MENU_HAS_CHILDREN, name="监控", count=1),
+    }
+    # 事务回滚，所有菜单仍在
+    assert len(state) == 5
+
+
+def test_duplicate_ids_are_reported_once_in_bulk_mode():
+    result, _ = _run(_seed_apis, _ids_of(SysApiEndpoint), api_batch_delete_service, ["api0", "api0"], bulk=True)
+    assert result.deleted_count == 1 and result.failed_count == 0
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_empty_id_list(bulk):
+    result, state = _run(_seed_apis, _ids_of(SysApiEndpoint), api_batch_delete_service, [], bulk=bulk)
+    assert result.deleted_count == 0 and result.failed_count == 0 and len(state) == 3
@@ -0,0 +1,118 @@
+"""
+缓存编解码器往返测试：逐类型校验 msgpack / orjson 两种格式的还原结果
+"""
+
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time, timezone
+from decimal import Decimal
+from enum import Enum, IntEnum
+from uuid import UUID
+
+import pytest
+
+from app.core.cache_codec import CacheCodec, CacheCodecError, msgpack
+
+FORMATS = ["orjson", pytest.param("msgpack", marks=pytest.mark.skipif(msgpack is None, reason="未安装msgpack"))]
+
+SAMPLE_UUID = UUID("12345678-1234-5678-1234-567812345678")
+SAMPLE_DATETIME = datetime(2024, 5, 1, 8, 30, 15, tzinfo=timezone.utc)
+
+
+class Color(Enum):
+    RED = "red"
+
+
+class Level(IntEnum):
+    HIGH = 3
+
+
+class Opaque:
+    def __str__(self):
+        return "opaque-value"
+
+
+def _round_trip(codec_format, value):
+    codec = CacheCodec(prefer=codec_format, compression="none")
+    return codec.decode(codec.encode(value, key="test:1"))
+
+
+# 两种格式结果一致的类型
+@pytest.mark.parametrize("codec_format", FORMATS)
+@pytest.mark.parametrize("value, expected", [
+    (None, None),
+    (True, True),
+    (42, 42),
+    (2 ** 40, 2 ** 40),
+    (3.25, 3.25),
+    ("文本", "文本"),
+    ([1, "a", None], [1, "a", None]),
+    ({"a": {"b": [1, 2]}}, {"a": {"b": [1, 2]}}),
+    (OrderedDict([("x", 1)]), {"x": 1}),
+    (Decimal("12.50"), "12.50"),
+    (SAMPLE_UUID, str(SAMPLE_UUID)),
+    (SAMPLE_DATETIME, SAMPLE_DATETIME.isoformat()),
+    (date(2024, 5, 1), "2024-05-01"),
+    (dt_time(8, 30), "08:30:00"),
+    (Color.RED, "red"),
+    (Level.HIGH, 3),
+    (Opaque(), "opaque-value"),
+    ({"amount": Decimal("1.5"), "id": SAMPLE_UUID}, {"amount": "1.5", "id": str(SAMPLE_UUID)}),
+])
+def test_round_trip(codec_format, value, expected):
+    assert _round_trip(codec_format, value) == expected
+
+
+@pytest.mark.skipif(msgpack is None, reason="未安装msgpack")
+@pytest.mark.parametrize("value", [
+    (1, "a", None),
+    {1, 2, 3},
+    frozenset({"a", "b"}),
+    {"pair": (1, 2), "tags": {"x"}},
+    {(1, 2): "tuple-key", 3: "int-key"},
+    [(1, (2, 3)), {frozenset({4})}],
+    (),
+])
+def test_msgpack_preserves_tuple_and_set(value):
+    result = _round_trip("msgpack", value)
+    assert result == value
+    assert type(result) is type(value)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ((1, 2), [1, 2]),
+    ({"pair": (1, 2)}, {"pair": [1, 2]}),
+    ({1: "int-key"}, {"1": "int-key"}),
+])
+def test_orjson_follows_json_types(value, expected):
+    assert _round_trip("orjson", value) == expected
+
+
+def test_orjson_decodes_set_as_list():
+    assert sorted(_round_trip("orjson", {3, 1, 2})) == [1, 2, 3]
+
+
+def test_text_and_pickle_round_trip():
+    codec = CacheCodec(compression="none")
+    assert codec.decode(codec.encode(123, "str")) == "123"
+    assert codec.decode(codec.encode({"a": (1, {2})}, "pickle")) == {"a": (1, {2})}
+
+
+@pytest.mark.parametrize("codec_format", FORMATS)
+def test_compressed_round_trip(codec_format):
+    codec = CacheCodec(prefer=codec_format, compress_threshold=64)
+    value = {"rows": [{"id": i, "value": i * 0.5} for i in range(200)]}
+    assert codec.decode(codec.encode(value)) == value
+
+
+def test_legacy_json_values_still_decode():
+    codec = CacheCodec()
+    assert codec.decode(b'{"a": [1, 2]}') == {"a": [1, 2]}
+    assert codec.decode('["GET /api"]') == ["GET /api"]
+
+
+@pytest.mark.parametrize("codec_format", FORMATS)
+def test_orm_instances_are_rejected(codec_format):
+    from app.models.admin import User
+
+    with pytest.raises(CacheCodecError):
+        CacheCodec(prefer=codec_format).encode({"user": User(username="u")})
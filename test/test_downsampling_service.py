@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""图表降采样：总点数上限、按设备分组与超出原始数据上限时的窗口聚合"""
+
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.services.downsampling_service import (
+    RESOLUTION_INTERVAL,
+    RESOLUTION_LTTB,
+    RESOLUTION_MINMAX,
+    DownsamplingService,
+    allocate_budget,
+    downsample_rows,
+)
+
+START = datetime(2024, 1, 1)
+
+
+def make_rows(n, fields=3, device="D1", seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(n, fields)).cumsum(axis=0)
+    return [
+        {
+            "ts": (START + timedelta(seconds=i)).isoformat(),
+            "device_code": device,
+            **{f"f{j}": float(values[i, j]) for j in range(fields)},
+        }
+        for i in range(n)
+    ]
+
+
+class FakeConnector:
+    """按 SQL 前缀返回预设结果的 TDengine 连接器替身"""
+
+    def __init__(self, spans, rows=None, columns=None):
+        self.spans = spans
+        self.rows = rows or []
+        self.columns = columns or []
+        self.sqls = []
+
+    async def query_data(self, sql, db_name=None):
+        self.sqls.append(sql)
+        if sql.startswith("SELECT COUNT(*)"):
+            names = ["total", "first_ts", "last_ts"] + (["device_code"] if "PARTITION BY" in sql else [])
+            return {"code": 0, "column_meta": [[name] for name in names], "data": self.spans}
+        if sql.startswith("DESCRIBE"):
+            return {"code": 0, "data": [[name, "DOUBLE", 8, ""] for name in self.columns]}
+        if "INTERVAL(" in sql:
+            window = int(re.search(r"INTERVAL\((\d+)a\)", sql).group(1))
+            aliases = re.findall(r" AS (mn_\d+|mx_\d+|fs_\d+)", sql)
+            start = datetime.fromisoformat(self.spans[0][1])
+            end = datetime.fromisoformat(self.spans[0][2])
+            data, ts = [], start
+            while ts <= end:
+                data.append([ts.isoformat()] + [1.0] * len(aliases))
+                ts += timedelta(milliseconds=window)
+            return {"code": 0, "column_meta": [["ts"]] + [[alias] for alias in aliases], "data": data}
+        names = list(self.rows[0].keys()) if self.rows else []
+        return {"code": 0, "column_meta": [[name] for name in names], "data": [list(r.values()) for r in self.rows]}
+
+
+@pytest.mark.parametrize("method", [RESOLUTION_LTTB, RESOLUTION_MINMAX])
+@pytest.mark.parametrize("fields", [1, 5, 20])
+def test_multi_field_output_is_capped_at_max_points(method, fields):
+    rows = make_rows(5000, fields=fields)
+    result = downsample_rows(rows, 200, method)
+    assert len(result) <= 200
+    assert result[0] is rows[0] and result[-1] is rows[-1]
+
+
+def test_rows_are_downsampled_per_device():
+    rows = sorted(
+        make_rows(3000, device="A", seed=1) + make_rows(1000, device="B", seed=2),
+        key=lambda row: row["ts"],
+    )
+    result = downsample_rows(rows, 400, RESOLUTION_LTTB, group_key="device_code")
+    per_device = {code: sum(1 for row in result if row["device_code"] == code) for code in ("A", "B")}
+    assert sum(per_device.values()) <= 400
+    # 点数按原始点数 3:1 分配
+    assert 250 <= per_device["A"] <= 300 and 80 <= per_device["B"] <= 100
+    # 每台设备都保留各自的首尾点
+    for code in ("A", "B"):
+        device_rows = [row for row in rows if row["device_code"] == code]
+        kept = [row for row in result if row["device_code"] == code]
+        assert kept[0] is device_rows[0] and kept[-1] is device_rows[-1]
+
+
+def test_allocate_budget_gives_each_group_a_share():
+    assert allocate_budget([10, 20], 100) == [10, 20]
+    budgets = allocate_budget([900, 90, 10], 100)
+    assert sum(budgets) == 100 and min(budgets) >= 1
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax", "raw"])
+def test_explicit_method_over_fetch_limit_covers_whole_range(method):
+    service = DownsamplingService(raw_fetch_limit=1000)
+    end = START + timedelta(hours=10)
+    connector = FakeConnector([[36000, START.isoformat(), end.isoformat()]], columns=["f0", "f1"])
+    rows, info = asyncio.run(service.query(connector, "db.t", "device_code = 'D1'", 500, method))
+    assert info["method"] == RESOLUTION_INTERVAL and info["requested_method"] == method
+    assert not any("ORDER BY ts ASC LIMIT" in sql for sql in connector.sqls)
+    assert 0 < len(rows) <= 500
+    assert rows[-1]["ts"] >= (end - timedelta(milliseconds=info["window_ms"])).isoformat()
+
+
+def test_without_device_interval_is_partitioned_by_device():
+    service = DownsamplingService(raw_fetch_limit=1000)
+    end = START + timedelta(hours=1)
+    connector = FakeConnector(
+        [[5000, START.isoformat(), end.isoformat(), "A"], [5000, START.isoformat(), end.isoformat(), "B"]],
+        columns=["f0"],
+    )
+    _, info = asyncio.run(service.query(connector, "db.t", "", 400, group_column="device_code"))
+    assert info["devices"] == 2
+    assert "PARTITION BY device_code INTERVAL" in info["sql"]
+
+
+def test_raw_fetch_downsamples_each_device():
+    service = DownsamplingService(raw_fetch_limit=10_000)
+    rows = sorted(make_rows(2000, device="A", seed=1) + make_rows(2000, device="B", seed=2), key=lambda r: r["ts"])
+    spans = [[2000, rows[0]["ts"], rows[-1]["ts"], "A"], [2000, rows[0]["ts"], rows[-1]["ts"], "B"]]
+    connector = FakeConnector(spans, rows=rows)
+    result, info = asyncio.run(service.query(connector, "db.t", "", 300, group_column="device_code"))
+    assert info["method"] == RESOLUTION_LTTB
+    assert len(result) <= 300
+    assert {row["device_code"] for row in result} == {"A", "B"}
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""健康评分趋势接口测试：趋势方向按请求的 period_days 周期计算"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from tortoise import Tortoise  # noqa: E402
+
+from app.api.v2.ai.health_scores import get_health_score_trends  # noqa: E402
+from app.models.ai_monitoring import AIHealthScore, HealthScoreStatus  # noqa: E402
+
+
+async def _seed(now: datetime) -> None:
+    # 30天内评分持续上升；最近7天回落，评分任务预计算的7天趋势为下降
+    for day in range(30, 0, -1):
+        score = 60 + (30 - day) * 1.5 if day > 7 else 100 - (8 - day) * 2
+        await AIHealthScore.create(
+            score_name="设备健康评分",
+            target_type="device",
+            target_id=1,
+            scoring_algorithm="fleet",
+            overall_score=score,
+            status=HealthScoreStatus.COMPLETED,
+            calculated_at=now - timedelta(days=day, hours=-1),
+            trend_direction="decreasing",
+            trend_confidence=0.9,
+        )
+
+
+def _trends(period_days: int):
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models"]})
+        try:
+            await Tortoise.generate_schemas()
+            await _seed(datetime.now())
+            response = await get_health_score_trends(target_type="device", target_ids="1", period_days=period_days)
+            return json.loads(response.body)["data"]
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(main())
+
+
+def test_trend_direction_follows_requested_period():
+    long_term = _trends(30)
+    assert len(long_term) == 1
+    assert len(long_term[0]["trend_data"]) == 30
+    assert long_term[0]["trend_direction"] == "increasing"
+
+    short_term = _trends(7)
+    assert len(short_term[0]["trend_data"]) == 7
+    assert short_term[0]["trend_direction"] == "decreasing"
@@ -0,0 +1,124 @@
+"""
+编译型权限匹配器测试
+
+与 PermissionService._match_path_pattern（原逐条匹配逻辑）做随机等价性对比：
+编译匹配器只允许在"前缀通配按整段匹配"这一处收窄，任何情况下都不能比原逻辑放宽。
+"""
+
+import random
+
+import pytest
+
+from app.core.permission_matcher import (
+    API_PERMISSION_PATTERN,
+    CompiledMatcherCache,
+    PermissionGrants,
+    compile_permissions,
+    permission_version,
+)
+from app.services.permission_service import PermissionService
+
+_legacy_match_path = PermissionService._match_path_pattern
+
+
+def legacy_has_permission(permission, grants, match_path=_legacy_match_path):
+    """原 has_permission 逻辑：精确匹配 + 同方法逐条路径模式匹配"""
+    if permission in grants:
+        return True
+    method, path = API_PERMISSION_PATTERN.match(permission).groups()
+    for grant in grants:
+        grant_method, grant_path = API_PERMISSION_PATTERN.match(grant).groups()
+        if grant_method == method and match_path(None, path, grant_path):
+            return True
+    return False
+
+
+def _segment_prefix_match_path(self, target_path, pattern_path):
+    """原逻辑，但 /* 前缀只按整段匹配（编译匹配器文档说明的唯一差异）"""
+    if len(pattern_path.split('/')) != len(target_path.split('/')) and pattern_path.endswith('/*'):
+        prefix = pattern_path[:-2]
+        if target_path.startswith(prefix) and not (target_path == prefix or target_path.startswith(prefix + '/')):
+            return False
+    return _legacy_match_path(self, target_path, pattern_path)
+
+
+SEGMENTS = ["a", "b", "ab", "{id}", "*", "1", ""]
+
+
+def _random_path(rng, max_depth=4):
+    return "/" + "/".join(rng.choice(SEGMENTS) for _ in range(rng.randint(0, max_depth)))
+
+
+def _random_grant(rng):
+    path = _random_path(rng)
+    if rng.random() < 0.4:
+        path = path.rstrip("/") + "/*"
+    return f"{rng.choice(['GET', 'POST'])} {path}"
+
+
+def _random_target(rng):
+    path = "/" + "/".join(rng.choice(["a", "b", "ab", "abc", "1", "{id}", "*", ""]) for _ in range(rng.randint(0, 5)))
+    return f"{rng.choice(['GET', 'POST'])} {path}"
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_matches_legacy_on_random_grants(seed):
+    rng = random.Random(seed)
+    pairs = 0
+    for _ in range(400):
+        grants = list({_random_grant(rng) for _ in range(rng.randint(1, 6))})
+        matcher = compile_permissions(grants)
+        for _ in range(20):
+            target = _random_target(rng)
+            compiled = matcher.matches(target)
+            legacy = legacy_has_permission(target, grants)
+            assert not compiled or legacy, f"编译匹配器放宽了权限: {target} / {grants}"
+            assert compiled == legacy_has_permission(target, grants, _segment_prefix_match_path), (target, grants)
+            pairs += 1
+    assert pairs == 8000
+
+
+@pytest.mark.parametrize("grant, target, expected", [
+    # 前缀中的参数占位符/通配符按字面匹配（与原逻辑的字符串前缀一致）
+    ("GET /api/users/{id}/*", "GET /api/users/5/posts/7", False),
+    ("GET /api/users/{id}/*", "GET /api/users/{id}/posts/7", True),
+    ("GET /api/*/*", "GET /api/users/5/posts", False),
+    ("GET /api/*/*", "GET /api/*/5/posts", True),
+    # 同段数时 {id}、* 仍按单段通配
+    ("GET /api/users/{id}/*", "GET /api/users/5/posts", True),
+    ("GET /api/*/*", "GET /api/users/5", True),
+    # 普通前缀通配
+    ("GET /api/users/*", "GET /api/users", True),
+    ("GET /api/users/*", "GET /api/users/5/posts/7", True),
+    ("GET /api/users/*", "POST /api/users/5", False),
+    # 已知收窄：不再跨段做字符串前缀匹配
+    ("GET /api/users/*", "GET /api/usersX/5/posts", False),
+])
+def test_tail_wildcard_cases(grant, target, expected):
+    assert compile_permissions([grant]).matches(target) is expected
+    assert legacy_has_permission(target, [grant]) or not expected
+
+
+def test_permission_version_ignores_order_and_duplicates():
+    assert permission_version(["GET /a", "POST /b"]) == permission_version(["POST /b", "GET /a", "GET /a"])
+    assert permission_version(["GET /a"]) != permission_version(["GET /a", "GET /b"])
+    assert PermissionGrants.build(["GET /a"]).version == permission_version(["GET /a"])
+
+
+def test_cache_reuses_matcher_until_version_changes():
+    cache = CompiledMatcherCache(maxsize=2)
+    grants = PermissionGrants.build(["GET /api/users/{id}"])
+
+    first = cache.get("user:1", grants)
+    assert cache.get("user:1", PermissionGrants(grants.version, list(grants.permissions))) is first
+    assert cache.compiles == 1 and cache.hits == 1
+
+    # 其他进程写入新权限后读到新版本，重新编译
+    updated = PermissionGrants.build(["GET /api/users/{id}", "DELETE /api/users/{id}"])
+    second = cache.get("user:1", updated)
+    assert second is not first and second.matches("DELETE /api/users/3")
+    assert cache.compiles == 2
+
+    cache.get("user:2", grants)
+    cache.get("user:3", grants)
+    assert cache.stats()["size"] == 2
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""权限性能优化器统计测试：每次权限查找只计一次命中或未命中"""
+
+import asyncio
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from app.core.permission_performance_optimizer import LRUTTLCache, PermissionPerformanceOptimizer  # noqa: E402
+
+
+class _FakeCacheManager:
+    def __init__(self, stored):
+        self.stored = stored
+
+    async def get_permission_validation_cache(self, user_id, permission):
+        return self.stored.get((user_id, permission))
+
+    async def set_permission_validation_cache(self, user_id, permission, has_permission):
+        self.stored[(user_id, permission)] = has_permission
+
+
+def test_peek_does_not_touch_stats_or_order():
+    cache = LRUTTLCache(maxsize=2, ttl=30)
+    cache.set("a", True)
+    cache.set("b", False)
+
+    assert cache.peek("a") is True
+    assert cache.peek("missing") is None
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+    # peek 不刷新LRU顺序，"a" 仍最先被淘汰
+    cache.set("c", True)
+    assert "a" not in cache
+
+
+def test_batch_check_counts_each_request_once(monkeypatch):
+    optimizer = PermissionPerformanceOptimizer()
+    optimizer.cache_manager = _FakeCacheManager({(1, "GET /b"): True})
+    optimizer._set_to_l1_cache(f"perm_1_{hash('GET /a')}", True)
+
+    async def fake_batch(user_id, permissions):
+        return {(user_id, permission): False for permission in permissions}
+
+    monkeypatch.setattr(optimizer, "_batch_check_user_permissions", fake_batch)
+
+    results = asyncio.run(optimizer.batch_permission_check([(1, "GET /a"), (1, "GET /b"), (1, "GET /c")]))
+
+    assert results == {(1, "GET /a"): True, (1, "GET /b"): True, (1, "GET /c"): False}
+    assert optimizer.metrics.total_requests == 3
+    assert optimizer.metrics.cache_hits == 2
+    assert optimizer.metrics.cache_misses == 1
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""redis_cache 缓存键测试：同类型的不同参数对象不能合并成同一个键"""
+
+import asyncio
+
+import pytest
+
+from app.core import redis_cache as redis_cache_module
+from app.core.redis_cache import UncacheableArgumentError, make_cache_key, redis_cache
+
+
+class Query:
+    def __init__(self, device_code):
+        self.device_code = device_code
+
+
+class KeyedQuery(Query):
+    def __cache_key__(self):
+        return {"device_code": self.device_code}
+
+
+class _MemoryCache:
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key, default=None):
+        return self.store.get(key, default)
+
+    async def set(self, key, value, ttl=None, serialize_method="json", tags=None):
+        self.store[key] = value
+        return True
+
+    async def delete(self, key):
+        return self.store.pop(key, None) is not None
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    cache = _MemoryCache()
+    monkeypatch.setattr(redis_cache_module, "redis_cache_manager", cache)
+    return cache
+
+
+async def load(query):
+    return query.device_code
+
+
+class Service:
+    async def load(self, device_code):
+        return device_code
+
+
+def test_plain_instances_are_not_collapsed_into_one_key():
+    with pytest.raises(UncacheableArgumentError):
+        make_cache_key(load, (Query("D1"),), {})
+
+    keyed = [make_cache_key(load, (KeyedQuery(code),), {}) for code in ("D1", "D2")]
+    assert keyed[0] != keyed[1]
+
+
+def test_bound_self_is_keyed_by_type():
+    assert make_cache_key(Service.load, (Service(), "D1"), {}) == make_cache_key(Service.load, (Service(), "D1"), {})
+    assert make_cache_key(Service.load, (Service(), "D1"), {}) != make_cache_key(Service.load, (Service(), "D2"), {})
+
+
+def test_decorator_skips_cache_for_unkeyable_arguments(memory_cache):
+    cached_load = redis_cache(ttl=60)(load)
+
+    async def main():
+        return await cached_load(Query("D1")), await cached_load(Query("D2"))
+
+    assert asyncio.run(main()) == ("D1", "D2")
+    assert memory_cache.store == {}
+
+
+def test_key_func_gives_distinct_keys_for_distinct_instances(memory_cache):
+    cached_load = redis_cache(ttl=60, key_func=lambda query: query.device_code)(load)
+    first, second = Query("D1"), Query("D2")
+
+    assert cached_load.cache_key(first) != cached_load.cache_key(second)
+
+    async def main():
+        return await cached_load(first), await cached_load(second)
+
+    assert asyncio.run(main()) == ("D1", "D2")
+    assert len(memory_cache.store) == 2
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""角色继承缓存失效测试：停用的父角色也登记在子角色与用户缓存的标签中，重新启用后立即生效"""
+
+import asyncio
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import pytest  # noqa: E402
+from tortoise import Tortoise  # noqa: E402
+
+from app.core.permission_cache import permission_cache_manager  # noqa: E402
+from app.models.admin import Role, SysApiEndpoint, User  # noqa: E402
+from app.services.permission_service import PermissionService, compute_role_closures  # noqa: E402
+
+
+class _TaggedMemoryCache:
+    """带标签失效的内存缓存，行为与 RedisCacheManager 的 get/set/invalidate_tags 一致"""
+
+    key_prefix = ""
+
+    def __init__(self):
+        self.store = {}
+        self.tags = {}
+
+    async def get(self, key, default=None):
+        return self.store.get(key, default)
+
+    async def set(self, key, value, ttl=None, tags=None):
+        self.store[key] = value
+        for tag in tags or []:
+            self.tags.setdefault(tag, set()).add(key)
+        return True
+
+    async def delete(self, key):
+        return self.store.pop(key, None) is not None
+
+    async def invalidate_tags(self, tags):
+        deleted = 0
+        for tag in tags:
+            for key in self.tags.pop(tag, set()):
+                deleted += self.store.pop(key, None) is not None
+        return deleted
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    cache = _TaggedMemoryCache()
+    monkeypatch.setattr(permission_cache_manager, "cache_manager", cache)
+    return cache
+
+
+def test_compute_role_closures_stops_at_inactive_only_when_requested():
+    parents = {1: None, 2: 1, 3: 2}
+    assert compute_role_closures([3], parents, active={2, 3}) == {3: [3, 2]}
+    assert compute_role_closures([3], parents) == {3: [3, 2, 1]}
+
+
+def test_reactivated_parent_invalidates_child_and_user_caches(memory_cache):
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models"]})
+        try:
+            await Tortoise.generate_schemas()
+            service = PermissionService()
+
+            grandparent = await Role.create(role_name="grandparent")
+            parent = await Role.create(role_name="parent", parent_id=grandparent.id, status="1")
+            child = await Role.create(role_name="child", parent_id=parent.id)
+            api = await SysApiEndpoint.create(
+                api_code="devices.list", api_name="设备列表", api_path="/api/v2/devices", http_method="GET"
+            )
+            await parent.apis.add(api)
+            user = await User.create(username="operator", email="operator@example.com", user_type="00")
+            await user.roles.add(child)
+
+            # 父角色停用时预热子角色与用户缓存
+            assert not await service.role_has_permission(child.id, "GET /api/v2/devices")
+            assert not await service.has_permission(user.id, "GET /api/v2/devices")
+
+            # 重新启用父角色并按角色失效缓存
+            parent.status = "0"
+            await parent.save()
+            await permission_cache_manager.clear_role_cache(parent.id)
+
+            return (
+                await service.role_has_permission(child.id, "GET /api/v2/devices"),
+                await service.has_permission(user.id, "GET /api/v2/devices"),
+            )
+        finally:
+            await Tortoise.close_connections()
+
+    role_allowed, user_allowed = asyncio.run(main())
+    assert role_allowed
+    assert user_allowed
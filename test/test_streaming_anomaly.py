@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""流式异常检测：离群点不污染统计，工况阶跃后能重新适应"""
+
+import numpy as np
+import pytest
+
+from app.services.ai.streaming_anomaly import STREAM_MODES, StreamingAnomalyDetector
+
+
+def step_series(seed=0, before=300, after=300, low=50.0, high=80.0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([rng.normal(low, 1.0, before), rng.normal(high, 1.0, after)])
+
+
+@pytest.mark.parametrize("mode", STREAM_MODES)
+def test_observe_adapts_after_step_change(mode):
+    detector = StreamingAnomalyDetector(mode=mode)
+    values = step_series()
+    flags = [detector.observe("D1", "current", float(v)).is_anomaly for v in values]
+
+    # 正常数据下仅有 3σ 阈值（MAD 为近似分位数）对应的少量误报
+    assert sum(flags[50:300]) <= 10
+    # 阶跃本身被判为异常
+    assert flags[300]
+    # 适应新工况后不再持续报异常（未适应时此段会全部判为异常）
+    assert sum(flags[330:]) <= 10
+    assert detector.get_state("D1", "current")["center"] == pytest.approx(80.0, abs=1.0)
+
+
+@pytest.mark.parametrize("mode", STREAM_MODES)
+def test_score_batch_adapts_after_step_change(mode):
+    detector = StreamingAnomalyDetector(mode=mode)
+    values = step_series(seed=1)
+    flagged = [
+        int(detector.score_batch("D1", "current", values[i:i + 10]).mask.sum())
+        for i in range(0, len(values), 10)
+    ]
+
+    assert sum(flagged[5:30]) <= 10
+    assert flagged[30] > 0
+    assert sum(flagged[35:]) <= 10
+
+
+@pytest.mark.parametrize("mode", STREAM_MODES)
+def test_isolated_spike_is_flagged_without_shifting_state(mode):
+    detector = StreamingAnomalyDetector(mode=mode)
+    rng = np.random.default_rng(2)
+    for v in rng.normal(50.0, 1.0, 300):
+        detector.observe("D1", "current", float(v))
+    before = detector.get_state("D1", "current")
+
+    assert detector.observe("D1", "current", 500.0).is_anomaly
+    after = detector.get_state("D1", "current")
+    assert after["center"] == pytest.approx(before["center"], abs=0.5)
+    assert after["scale"] < before["scale"] * 2
+
+    # 回到正常值后不再判为异常
+    assert not any(detector.observe("D1", "current", float(v)).is_anomaly for v in rng.normal(50.0, 1.0, 50))
+
+
+def test_alternating_outliers_do_not_trigger_rebuild():
+    detector = StreamingAnomalyDetector(mode="welford", shift_after=5)
+    rng = np.random.default_rng(3)
+    for v in rng.normal(50.0, 1.0, 300):
+        detector.observe("D1", "current", float(v))
+    for i in range(20):
+        detector.observe("D1", "current", 100.0 if i % 2 else 0.0)
+    assert detector.get_state("D1", "current")["center"] == pytest.approx(50.0, abs=1.0)
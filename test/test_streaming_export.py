@@ -0,0 +1,82 @@
+"""
+流式导出 Parquet/Arrow 编码测试：首批全为空的列不能把后续批次的写入模式固定为 null 类型
+"""
+
+import asyncio
+import io
+from datetime import datetime, timezone
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.ipc as pa_ipc  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+from app.core.streaming_export import arrow_schema_for_model, encode_arrow  # noqa: E402
+
+
+async def _batches(*batches):
+    for batch in batches:
+        yield batch
+
+
+def _encode(*batches, parquet=False, **kwargs):
+    async def collect():
+        return b"".join([chunk async for chunk in encode_arrow(_batches(*batches), parquet=parquet, **kwargs)])
+
+    data = asyncio.run(collect())
+    if parquet:
+        return pq.read_table(io.BytesIO(data))
+    return pa_ipc.open_stream(io.BytesIO(data)).read_all()
+
+
+@pytest.mark.parametrize("parquet", [False, True])
+def test_null_first_batch_takes_type_from_later_batch(parquet):
+    table = _encode(
+        [{"ts": 1, "temperature": None}, {"ts": 2, "temperature": None}],
+        [{"ts": 3, "temperature": 21.5}],
+        parquet=parquet,
+    )
+    assert table.schema.field("temperature").type == pa.float64()
+    assert table.column("temperature").to_pylist() == [None, None, 21.5]
+    assert table.column("ts").to_pylist() == [1, 2, 3]
+
+
+def test_column_empty_beyond_pending_limit_is_written_as_string():
+    table = _encode(
+        [{"id": 1, "note": None}],
+        [{"id": 2, "note": None}],
+        [{"id": 3, "note": 7}, {"id": 4, "note": "text"}],
+        max_pending_rows=2,
+    )
+    assert table.schema.field("note").type == pa.string()
+    assert table.column("note").to_pylist() == [None, None, "7", "text"]
+
+
+def test_column_empty_for_whole_export():
+    table = _encode([{"id": 1, "note": None}], [{"id": 2, "note": None}])
+    assert table.num_rows == 2
+    assert table.schema.field("note").type == pa.string()
+
+
+@pytest.mark.parametrize("parquet", [False, True])
+def test_model_schema_is_used_for_columns(parquet):
+    from app.models.ai_monitoring import AIHealthScore
+
+    fields = ["id", "overall_score", "dimension_scores", "calculated_at"]
+    schema = arrow_schema_for_model(AIHealthScore, fields)
+    assert schema.field("overall_score").type == pa.float64()
+    assert schema.field("dimension_scores").type == pa.string()
+    assert pa.types.is_timestamp(schema.field("calculated_at").type)
+
+    calculated = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+    table = _encode(
+        [{"id": 1, "overall_score": None, "dimension_scores": None, "calculated_at": None}],
+        [{"id": 2, "overall_score": 88.5, "dimension_scores": {"temp": 90}, "calculated_at": calculated}],
+        columns=fields,
+        parquet=parquet,
+        schema=schema,
+    )
+    assert table.column("overall_score").to_pylist() == [None, 88.5]
+    assert table.column("dimension_scores").to_pylist() == [None, '{"temp":90}']
+    assert table.column("calculated_at").to_pylist()[1] == calculated
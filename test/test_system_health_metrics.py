@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""系统埋点接口（/system/metrics、/system/metrics/summary、/system/profile）访问控制测试"""
+
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import pytest  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.api.v2.system_health import router  # noqa: E402
+from app.core.auth_dependencies import optional_auth  # noqa: E402
+from app.settings.config import settings  # noqa: E402
+
+
+_NO_OVERRIDE = object()
+
+
+def _client(user=_NO_OVERRIDE) -> TestClient:
+    """user 为替换后的认证结果；不传时走真实的可选认证依赖"""
+    app = FastAPI()
+    app.include_router(router)
+    if user is not _NO_OVERRIDE:
+        app.dependency_overrides[optional_auth] = lambda: user
+    return TestClient(app)
+
+
+@pytest.fixture
+def superuser_client():
+    return _client(SimpleNamespace(id=1, username="admin", is_superuser=True))
+
+
+def test_superuser_can_read_prometheus_metrics(superuser_client):
+    response = superuser_client.get("/system/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+
+def test_superuser_can_read_metrics_summary(superuser_client):
+    response = superuser_client.get("/system/metrics/summary", params={"top": 5})
+    assert response.status_code == 200
+    assert response.json()["success"] is True
+
+
+def test_superuser_can_profile_worker(superuser_client):
+    response = superuser_client.post("/system/profile", params={"seconds": 1, "mode": "cprofile", "top": 5})
+    assert response.status_code == 200
+    assert "stats" in response.json()["data"]
+
+
+@pytest.mark.parametrize(
+    "method, path",
+    [("get", "/system/metrics"), ("get", "/system/metrics/summary"), ("post", "/system/profile")],
+)
+def test_anonymous_request_is_rejected_without_server_error(method, path):
+    response = getattr(_client(), method)(path, params={"seconds": 1})
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize(
+    "method, path",
+    [("get", "/system/metrics"), ("get", "/system/metrics/summary"), ("post", "/system/profile")],
+)
+def test_regular_user_is_forbidden(method, path):
+    client = _client(SimpleNamespace(id=2, username="user", is_superuser=False))
+    response = getattr(client, method)(path, params={"seconds": 1})
+    assert response.status_code == 403
+
+
+def test_prometheus_token_grants_scrape_access(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+    # 静态令牌不是 JWT，可选认证解析为匿名
+    client = _client(None)
+    assert client.get("/system/metrics", headers={"Authorization": "Bearer scrape-token"}).status_code == 200
+    assert client.get("/system/metrics/summary", headers={"Authorization": "Bearer scrape-token"}).status_code == 401
+
+
+def test_prometheus_token_passes_real_optional_auth(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+    # 不替换认证依赖：非 JWT 令牌在 OptionalAuth 中解析失败后按匿名处理，再由静态令牌放行
+    client = _client()
+    assert client.get("/system/metrics", headers={"Authorization": "Bearer scrape-token"}).status_code == 200
+    assert client.get("/system/metrics", headers={"Authorization": "Bearer wrong-token"}).status_code in (401, 403)
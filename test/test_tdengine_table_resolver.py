@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""TDengine表解析测试：需要标签列时查询超级表；未知设备单独解析并负缓存，不触发全量重建"""
+
+import asyncio
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import pytest  # noqa: E402
+from tortoise import Tortoise  # noqa: E402
+
+from app.models.device import DeviceInfo, DeviceType  # noqa: E402
+from app.services import tdengine_table_resolver as resolver_module  # noqa: E402
+from app.services.tdengine_table_resolver import (  # noqa: E402
+    KIND_STABLE,
+    KIND_SUBTABLE,
+    TableResolution,
+    TDengineTableResolver,
+)
+
+TABLES = {"device_d1": "welder_meters", "device_d2": "welder_meters"}
+
+
+class _FakeConnector:
+    """按SQL返回表清单的TDengine连接器，记录执行过的语句"""
+
+    def __init__(self):
+        self.sql = []
+
+    async def query_data(self, sql):
+        self.sql.append(sql)
+        if "ins_stables" in sql:
+            return {"data": [["welder_meters"]]}
+        rows = [[name, stable] for name, stable in TABLES.items() if "IN (" not in sql or f"'{name}'" in sql]
+        return {"data": rows}
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key, default=None):
+        return self.store.get(key, default)
+
+    async def set(self, key, value, ttl=None, tags=None):
+        self.store[key] = value
+        return True
+
+    async def invalidate_tags(self, tags):
+        count = len(self.store)
+        self.store.clear()
+        return count
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = _FakeRedis()
+    monkeypatch.setattr(resolver_module, "redis_cache_manager", redis)
+    return redis
+
+
+def _resolver(connector):
+    resolver = TDengineTableResolver()
+    resolver._connector = connector
+    resolver._database = "devicemonitor"
+    return resolver
+
+
+def _run(scenario):
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models"]})
+        try:
+            await Tortoise.generate_schemas()
+            await DeviceType.create(type_name="焊机", type_code="welder", tdengine_stable_name="welder_meters")
+            await DeviceInfo.create(device_code="d1", device_name="焊机1", device_type="welder")
+            return await scenario()
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(main())
+
+
+def test_with_tags_queries_super_table():
+    subtable = TableResolution(table="device_d1", kind=KIND_SUBTABLE, stable="welder_meters")
+    assert subtable.with_tags() == TableResolution(table="welder_meters", kind=KIND_STABLE, stable="welder_meters")
+    assert subtable.with_tags().device_condition("d1") == "device_code = 'd1'"
+
+    plain = TableResolution(table="d1", kind="table")
+    assert plain.with_tags() is plain
+
+
+def test_resolve_uses_super_table_when_tags_are_requested(fake_redis):
+    connector = _FakeConnector()
+    resolver = _resolver(connector)
+
+    async def scenario():
+        return await resolver.resolve("d1"), await resolver.resolve("d1", include_tags=False)
+
+    with_tags, without_tags = _run(scenario)
+    assert with_tags.from_clause == "`welder_meters`"
+    assert with_tags.needs_device_filter
+    assert without_tags.from_clause == "`device_d1`"
+    assert not without_tags.needs_device_filter
+
+
+def test_unknown_device_is_resolved_alone_and_negatively_cached(fake_redis):
+    connector = _FakeConnector()
+    resolver = _resolver(connector)
+
+    async def scenario():
+        await resolver.resolve("d1")
+        full_scans = len(connector.sql)
+
+        # 其他进程新增的设备：只按候选表名单独查询
+        await DeviceInfo.create(device_code="d2", device_name="焊机2", device_type="welder")
+        d2 = await resolver.resolve("d2", include_tags=False)
+        single_sql = connector.sql[full_scans:]
+
+        # 不存在的设备：解析一次后负缓存，重复请求不再查询
+        assert await resolver.resolve("ghost") is None
+        queries_after_ghost = len(connector.sql)
+        assert await resolver.resolve("ghost") is None
+        return d2, single_sql, queries_after_ghost, len(connector.sql)
+
+    d2, single_sql, queries_after_ghost, final_queries = _run(scenario)
+    assert d2.table == "device_d2"
+    assert len(single_sql) == 1 and "IN (" in single_sql[0]
+    assert final_queries == queries_after_ghost
+    assert fake_redis.store[resolver.device_cache_key("d2")] == ["device_d2", KIND_SUBTABLE, "welder_meters"]
+    assert "ghost" in resolver._missing
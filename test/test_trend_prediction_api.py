@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""趋势预测接口测试：参数错误返回400，ARIMA模型缓存按设备+指标区分"""
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.api.v2.ai import trend_prediction  # noqa: E402
+from app.core.dependency import AuthControl  # noqa: E402
+from app.core.exceptions import APIException, api_exception_handler  # noqa: E402
+from app.services.ai import forecast_service as forecast_module  # noqa: E402
+from app.services.ai.forecast_service import ForecastService  # noqa: E402
+
+
+async def _run_inline(fn, *args, timeout=None, **kwargs):
+    return fn(*args, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def inline_cpu(monkeypatch):
+    """进程池替换为当前进程内执行"""
+    monkeypatch.setattr(forecast_module, "run_cpu", _run_inline)
+    monkeypatch.setattr(trend_prediction, "run_cpu", _run_inline)
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(trend_prediction.router)
+    app.add_exception_handler(APIException, api_exception_handler)
+    app.dependency_overrides[AuthControl.is_authed] = lambda: SimpleNamespace(id=1, username="tester")
+    return TestClient(app)
+
+
+def _series(seed, n=60, slope=0.5):
+    rng = np.random.default_rng(seed)
+    return (np.arange(n) * slope + rng.normal(0, 1, n)).tolist()
+
+
+def test_predict_rejects_unknown_method(client):
+    response = client.post(
+        "/predictions/execute/predict",
+        json={"data": _series(1, 20), "steps": 3, "method": "magic"},
+    )
+    assert response.status_code == 400
+    assert "无效的预测方法" in response.json()["msg"]
+
+
+def test_batch_predict_rejects_unknown_method(client):
+    response = client.post(
+        "/predictions/execute/predict/batch",
+        json={"dataset": {"D1": _series(1, 20)}, "steps": 3, "method": "magic"},
+    )
+    assert response.status_code == 400
+    assert response.json()["msg"] == "无效的预测方法: magic"
+
+
+def test_batch_predict_rejects_empty_dataset(client):
+    response = client.post("/predictions/execute/predict/batch", json={"dataset": {}, "steps": 3})
+    assert response.status_code == 400
+    assert response.json()["msg"] == "数据集不能为空"
+
+
+def test_batch_predict_succeeds(client, monkeypatch):
+    monkeypatch.setattr(trend_prediction, "forecast_service", ForecastService(concurrency=2))
+    response = client.post(
+        "/predictions/execute/predict/batch",
+        json={
+            "dataset": {"D1": _series(1), "D2": _series(2), "D3": [1.0, 2.0]},
+            "metric_name": "temperature",
+            "steps": 3,
+            "method": "arima",
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["success_count"] == 2
+    assert data["failed_devices"] == ["D3"]
+
+
+def test_model_cache_is_keyed_by_metric():
+    service = ForecastService(concurrency=2)
+    temperature = _series(1, slope=0.5)
+    pressure = _series(2, slope=-2.0)
+
+    asyncio.run(service.predict_many({("D1", "temperature"): temperature, ("D1", "pressure"): pressure}, steps=3))
+    assert {key[:2] for key in service._models} == {("D1", "temperature"), ("D1", "pressure")}
+
+    # 同一指标的延续序列复用缓存
+    result = asyncio.run(service.predict("D1", "temperature", temperature + [30.0], steps=3))
+    assert result["model"]["mode"] != "fit"
+
+
+def test_unnamed_metric_does_not_use_model_cache():
+    service = ForecastService(concurrency=2)
+    outputs = asyncio.run(service.predict_many({("D1", None): _series(1), ("D2", None): _series(2)}, steps=3))
+
+    assert all(result["success"] for result in outputs.values())
+    assert all(result["model"]["mode"] == "fit" for result in outputs.values())
+    assert service.stats()["cached_models"] == 0
@@ -11,8 +11,10 @@ export function useAlarmWebSocket(options = {}) {
   const {
     deviceTypes = null, // 订阅的设备类型，null表示全部
     autoConnect = true,
+    notify = true, // 是否弹出报警通知
     onAlarm = null, // 报警回调
     onStatisticsUpdate = null, // 统计更新回调
+    onUnreadCount = null, // 未读通知数量回调
   } = options
 
   const message = useMessage()
@@ -103,6 +105,17 @@ export function useAlarmWebSocket(options = {}) {
         handleAlarm(data.data)
         break
 
+      case 'alarms':
+        // 同一推送周期内的多条报警合并为一帧
+        data.data.forEach(handleAlarm)
+        break
+
+      case 'unread_count':
+        if (onUnreadCount) {
+          onUnreadCount(data.data)
+        }
+        break
+
       case 'statistics_update':
         if (onStatisticsUpdate) {
           onStatisticsUpdate()
@@ -134,7 +147,9 @@ export function useAlarmWebSocket(options = {}) {
     }
 
     // 显示通知
-    showAlarmNotification(alarm)
+    if (notify) {
+      showAlarmNotification(alarm)
+    }
 
     // 调用回调
     if (onAlarm) {